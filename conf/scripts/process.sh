@@ -15,4 +15,4 @@ trap cleanup EXIT
 
 # to avoid pushing too many dirs into PYTHONPATH
 [[ -z "$( echo $PYTHONPATH |  grep xpython )" ]] && export PYTHONPATH="$PYTHONPATH:$XPYTHON_PATH"
-source "$PYENV_ACTIVATE" && python "processor/processor.py" "$*"
+source "$PYENV_ACTIVATE" && python -m "processor.processor" "$*"
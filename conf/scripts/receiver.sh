@@ -21,3 +21,6 @@ trap cleanup EXIT   # register the cleanup function to be called on the EXIT sig
 # gst-launch-1.0 udpsrc blocksize=2304 port=$PORT_FORWARD ! rawvideoparse use-sink-caps=false width=32 height=24 format=rgb framerate=16/1 ! videoconvert ! videoscale ! video/x-raw,width=640,height=480 ! autovideosink
 
 gst-launch-1.0 udpsrc blocksize=2304 port=$PORT_RX ! rawvideoparse use-sink-caps=false width=32 height=24 format=rgb framerate=16/1 ! videoconvert ! videoscale ! video/x-raw,width=640,height=480 ! autovideosink
+
+# Framed stream (rawrgb $FPS both): reassembles the frames, counts drops and reordering and records the RAW frames
+# python -m processor.receiver -p $PORT_RX -o "$DATALOG"
@@ -10,3 +10,7 @@ logger "[info, $0] Launching streamer to <$HOST:$PORT> with fps ($FPS)"
 #  gst-launch-1.0 fdsrc blocksize=2304 ! udpsink host=$HOST port=$PORT
 
 /usr/local/bin/rawrgb $FPS 2>"$DATASETBIN" | gst-launch-1.0 fdsrc blocksize=2304 ! udpsink host=$HOST port=$PORT
+
+# Framed stream (sequence numbers, capture timestamps, RGB and/or raw float32 payloads), so that the receiver
+# can detect lost and reordered frames; to be received with <python -m processor.receiver>
+# /usr/local/bin/rawrgb $FPS both 2>"$DATASETBIN" | gst-launch-1.0 fdsrc blocksize=1044 ! udpsink host=$HOST port=$PORT
@@ -0,0 +1,103 @@
+"""Vectorized analysis of complete datasets with frames from MLX90640."""
+
+import numpy as np
+
+from xpython.common import logger
+
+
+class MLX90640Analysis(logger.LoggingClass):
+    """Whole-dataset analysis
+    This class analyzes all the frames of a dataset at once. The frames are given as a single block of
+    (N, PIXELS_Y, PIXELS_X) float32 values and the results are calculated for all of them with array
+    reductions, instead of creating and processing one MLX90640Frame object per frame.
+    """
+
+    FIELDS = ('t0', 't1', 't2', 'diff', 'min', 'max', 'min_pixel', 'max_pixel')
+    CHUNK_FRAMES = 4096
+
+    def __init__(self, frames, ref_pixels):
+        """Default constructor
+        frames      - (N, PIXELS_Y, PIXELS_X) array with the temperatures of all the frames, None to restore()
+                        the results from a file or to process_dataset() instead
+        ref_pixels  - (REF_PIXEL_0, REF_PIXEL_1, REF_PIXEL_2), with the (x, y) coordinates of each pixel
+        """
+        super(MLX90640Analysis, self).__init__()
+
+        self.ref_pixels = ref_pixels
+        if frames is not None:
+            self.process(frames)
+
+    @property
+    def no_frames(self):
+        """Number of analyzed frames"""
+        return self.diff.shape[0]
+
+    def process(self, frames):
+        """
+        This method calculates, for all the given frames at once, the temperatures of the reference pixels,
+        the difference of temperature in between pixels 1 and 2, and the minimum and maximum temperatures
+        together with the coordinates of the pixels where they were found.
+        """
+        no_frames, pixels_y, pixels_x = frames.shape
+        self._l.debug(f"> Analyzing {no_frames} frames")
+
+        xs = [pixel[0] for pixel in self.ref_pixels]
+        ys = [pixel[1] for pixel in self.ref_pixels]
+        refs = frames[:, ys, xs]
+
+        self.t0 = refs[:, 0]
+        self.t1 = refs[:, 1]
+        self.t2 = refs[:, 2]
+        self.diff = np.abs(self.t1 - self.t2)
+
+        pixels = frames.reshape(no_frames, pixels_x * pixels_y)
+        rows = np.arange(no_frames)
+
+        # argmin/argmax return the first occurrence in row-major order, as np.where(...)[0] did per frame
+        index = np.argmin(pixels, axis=1)
+        self.min = pixels[rows, index]
+        self.min_pixel = np.stack([index % pixels_x, index // pixels_x], axis=1)
+
+        index = np.argmax(pixels, axis=1)
+        self.max = pixels[rows, index]
+        self.max_pixel = np.stack([index % pixels_x, index // pixels_x], axis=1)
+
+    def process_dataset(self, dataset, chunk_frames=CHUNK_FRAMES):
+        """
+        This method analyzes all the frames of the given dataset (RawDataset, CompressedDataset or any other
+        object that can be sliced as them) in blocks of chunk_frames, so that the memory needed does not
+        depend on the number of frames: a compressed dataset is decoded one block at a time.
+        """
+        blocks = []
+        for start in range(0, len(dataset), chunk_frames):
+            self.process(np.asarray(dataset[start:start + chunk_frames]))
+            blocks.append({name: getattr(self, name) for name in self.FIELDS})
+
+        if not blocks:
+            self.process(np.asarray(dataset[0:0]))
+            return
+        for name in self.FIELDS:
+            setattr(self, name, np.concatenate([block[name] for block in blocks]))
+
+    def select(self, indexes):
+        """
+        This method keeps only the results for the frames with the given indexes, discarding the rest.
+        """
+        for name in self.FIELDS:
+            setattr(self, name, getattr(self, name)[indexes])
+
+    def save(self, filepath, **arrays):
+        """
+        This method saves the results into a .npz file, together with any other given arrays.
+        """
+        np.savez(filepath, **{name: getattr(self, name) for name in self.FIELDS}, **arrays)
+
+    def restore(self, filepath):
+        """
+        This method restores the results from a .npz file written by save(), returning a dictionary with
+        the rest of the arrays that were saved together with them.
+        """
+        with np.load(filepath) as data:
+            for name in self.FIELDS:
+                setattr(self, name, data[name])
+            return {name: data[name] for name in data.files if name not in self.FIELDS}
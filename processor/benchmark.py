@@ -0,0 +1,345 @@
+"""Benchmark of each stage of the processor over the bundled datasets and over synthetic datasets."""
+
+import argparse
+import concurrent.futures
+import json
+import matplotlib
+import multiprocessing
+import numpy as np
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from xpython.common import logger
+
+from processor import analysis, heatmap, processor, profiling, rawdataset, renderer, video
+
+
+STAGES = ('read', 'analysis', 'render', 'overall', 'video', 'heatmap')
+
+
+def _render_jobs(dataset, indexes, ref_pixels, outdir=None):
+    """Jobs (see renderer.iter_frames) for the given frames as the processor renders them, saved into outdir"""
+    a = analysis.MLX90640Analysis(dataset[indexes], ref_pixels)
+    return [
+        (
+            index, os.path.join(outdir, f"{i:04d}.png") if outdir is not None else None, f"benchmark@{i}",
+            [(pixel, t, "") for pixel, t in zip(ref_pixels, (a.t0[i], a.t1[i], a.t2[i]))] + [
+                (tuple(a.min_pixel[i]), a.min[i], "min"), (tuple(a.max_pixel[i]), a.max[i], "max")
+            ]
+        )
+        for i, index in enumerate(indexes)
+    ]
+
+
+def _run_stage(stage, raw_filepath, fps, distance_mm, render_frames, video_frames, workers):
+    """
+    Executes a single stage for the given dataset and returns a (frames, elapsed_s, peak_rss_mb) tuple. This
+    function is executed in a fresh process per stage, so that the peak memory only accounts for it; the
+    preparation of the inputs of the stage is not timed.
+    """
+    dataset = rawdataset.RawDataset(raw_filepath, fps=fps)
+    _, _, ref_pixels = processor.MLX90640Processor.reference_pixels(distance_mm, 20)
+    outdir = tempfile.mkdtemp()
+
+    try:
+        if stage == 'read':
+            start = time.perf_counter()
+            valid = dataset.valid()
+            frames = int(valid.size)
+
+        elif stage == 'analysis':
+            start = time.perf_counter()
+            analysis.MLX90640Analysis(dataset.frames, ref_pixels)
+            frames = len(dataset)
+
+        elif stage == 'render':
+            indexes = np.linspace(0, len(dataset) - 1, num=min(render_frames, len(dataset))).astype(int)
+            jobs = _render_jobs(dataset, indexes, ref_pixels, outdir)
+            start = time.perf_counter()
+            renderer.render_frames(
+                raw_filepath, jobs, workers=workers,
+                shape=processor.MLX90640Processor.FRAME_SHAPE, t_min=processor.MLX90640Processor.T_MIN_C,
+                t_max=processor.MLX90640Processor.T_MAX_C
+            )
+            frames = len(jobs)
+
+        elif stage == 'overall':
+            linked_filepath = os.path.join(outdir, os.path.basename(raw_filepath))
+            os.symlink(os.path.abspath(raw_filepath), linked_filepath)
+            p = processor.MLX90640Processor(
+                fps, distance_mm, linked_filepath, plot_frames=False, plot_general=False, use_cache=False
+            )
+            start = time.perf_counter()
+            p.plot()
+            frames = p.no_frames
+
+        elif stage == 'video':
+            # as the processor encodes the video by default, with the figures streamed into ffmpeg
+            indexes = np.linspace(0, len(dataset) - 1, num=min(video_frames, len(dataset))).astype(int)
+            jobs = _render_jobs(dataset, indexes, ref_pixels)
+            start = time.perf_counter()
+            with video.VideoEncoder(os.path.join(outdir, 'benchmark.mp4'), fps) as encoder:
+                for rgb in renderer.iter_frames(
+                    raw_filepath, jobs, workers=workers, rgb=True,
+                    shape=processor.MLX90640Processor.FRAME_SHAPE, t_min=processor.MLX90640Processor.T_MIN_C,
+                    t_max=processor.MLX90640Processor.T_MAX_C
+                ):
+                    encoder.write(rgb)
+            frames = len(jobs)
+
+        elif stage == 'heatmap':
+            # as the processor encodes the video with the heatmaps of the streamer (heatmap), in batches
+            indexes = np.linspace(0, len(dataset) - 1, num=min(video_frames, len(dataset))).astype(int)
+            heatmap_renderer = heatmap.HeatmapRenderer(flip=False)
+            batch = processor.MLX90640Processor.HEATMAP_BATCH
+            start = time.perf_counter()
+            with video.VideoEncoder(os.path.join(outdir, 'benchmark.mp4'), fps) as encoder:
+                for i in range(0, indexes.size, batch):
+                    for image in heatmap_renderer.render(dataset[indexes[i:i + batch]]):
+                        encoder.write(image)
+            frames = indexes.size
+
+        else:
+            raise ValueError(f"Unknown stage <{stage}>, choose one of {STAGES}")
+
+        return frames, time.perf_counter() - start, profiling.peak_rss_mb()
+
+    finally:
+        dataset.close()
+        shutil.rmtree(outdir, ignore_errors=True)
+
+
+class MLX90640Benchmark(logger.LoggingClass):
+    """Benchmark of the processor
+    This class times each stage of the processor (reading the RAW file, analysis, rendering of the frames,
+    overall plot, video encoding with the figures and with the heatmaps) for a set of datasets: the ones
+    bundled with the repository plus synthetic datasets with hours of frames at 16, 32 and 64 FPS. Each
+    stage is executed in its own fresh process, the results are given in frames/s and peak RSS (MB), and
+    they can be stored as a JSON baseline to be compared against later runs, flagging the regressions.
+
+    The rendering, video and heatmap stages are only executed for a sample of RENDER_FRAMES and VIDEO_FRAMES
+    frames, evenly distributed over the dataset, since their throughput does not depend on its length.
+    """
+
+    VERSION         = 1
+    SYNTHETIC_FPS   = (16, 32, 64)
+    SYNTHETIC_HOURS = 1.
+    DISTANCE_MM     = 55
+    RENDER_FRAMES   = 64
+    VIDEO_FRAMES    = 256
+    THRESHOLD       = 0.1
+
+    def __init__(
+        self,
+        datasets_dirpath=None, workdir=None,
+        synthetic_fps=SYNTHETIC_FPS, synthetic_hours=SYNTHETIC_HOURS,
+        stages=STAGES, render_frames=RENDER_FRAMES, video_frames=VIDEO_FRAMES, workers=None
+    ):
+        """Default constructor
+        datasets_dirpath=None   - directory with the bundled datasets, None to skip them
+        workdir=None            - directory for the synthetic datasets, reused in between runs, temporary if None
+        synthetic_fps           - FPS of each synthetic dataset, empty to skip them
+        synthetic_hours         - hours of frames of each synthetic dataset
+        stages=STAGES           - stages to be benchmarked
+        render_frames           - number of frames rendered for the rendering stage
+        video_frames            - number of frames encoded for the video and heatmap stages
+        workers=None            - number of processes for rendering the frames, None for one per CPU
+        """
+        super(MLX90640Benchmark, self).__init__()
+
+        self.datasets_dirpath = datasets_dirpath
+        self.workdir = workdir or tempfile.mkdtemp()
+        self.synthetic_fps = synthetic_fps
+        self.synthetic_hours = synthetic_hours
+        self.stages = stages
+        self.render_frames = render_frames
+        self.video_frames = video_frames
+        self.workers = workers
+
+        os.makedirs(self.workdir, exist_ok=True)
+
+    def datasets(self):
+        """List with a (name, fps, raw_filepath) tuple per dataset to benchmark, synthesizing the missing ones"""
+        datasets = []
+        if self.datasets_dirpath is not None:
+            datasets += [
+                # as the DatasetsManager, all the bundled datasets are processed with FPS = 1
+                (os.path.splitext(f)[0], 1, os.path.join(self.datasets_dirpath, f))
+                for f in sorted(os.listdir(self.datasets_dirpath)) if f.endswith('.raw')
+            ]
+
+        for fps in self.synthetic_fps:
+            name = f"ds-{fps}-{self.DISTANCE_MM}-00000000-synthetic{self.synthetic_hours:g}h"
+            raw_filepath = os.path.join(self.workdir, name + '.raw')
+            no_frames = int(self.synthetic_hours * 3600 * fps)
+            size = no_frames * rawdataset.RawDataset.SIZE_FRAME
+            if not os.path.exists(raw_filepath) or os.path.getsize(raw_filepath) != size:
+                self.synthesize(raw_filepath, no_frames, fps)
+            datasets.append((name, fps, raw_filepath))
+
+        return datasets
+
+    @staticmethod
+    def synthesize(raw_filepath, no_frames, fps, seed=0):
+        """
+        This method writes a synthetic dataset: a hot spot in the center of the frame that heats up
+        exponentially over a 20 degC background, plus gaussian noise. The frames are generated in chunks.
+        """
+        rng = np.random.default_rng(seed)
+        ys, xs = np.mgrid[0:rawdataset.RawDataset.PIXELS_Y, 0:rawdataset.RawDataset.PIXELS_X]
+        spot = np.exp(-((xs - 16.) ** 2 + (ys - 12.) ** 2) / 50.).astype(np.float32)
+        tau_s = no_frames / fps / 5.
+
+        with open(raw_filepath, 'wb') as f:
+            for start in range(0, no_frames, rawdataset.RawDataset.CHUNK_FRAMES):
+                t = np.arange(start, min(start + rawdataset.RawDataset.CHUNK_FRAMES, no_frames)) / fps
+                heating = (40. * (1. - np.exp(-t / tau_s))).astype(np.float32)
+                frames = 20. + heating[:, np.newaxis, np.newaxis] * spot
+                frames += rng.normal(0., 0.1, frames.shape).astype(np.float32)
+                f.write(frames.astype(rawdataset.RawDataset.DTYPE).tobytes())
+
+    def run(self):
+        """
+        This method benchmarks every stage for every dataset, returning the results as a dictionary that
+        can be stored as a baseline.
+        """
+        report = dict(
+            version=self.VERSION, created=time.time(),
+            machine=dict(
+                platform=platform.platform(), processor=platform.processor(), cpus=os.cpu_count(),
+                python=platform.python_version(), numpy=np.__version__, matplotlib=matplotlib.__version__
+            ),
+            results={}
+        )
+
+        context = multiprocessing.get_context('spawn')
+        for name, fps, raw_filepath in self.datasets():
+            report['results'][name] = {}
+            for stage in self.stages:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    frames, elapsed_s, peak_rss_mb = executor.submit(
+                        _run_stage, stage, raw_filepath, fps, self.DISTANCE_MM,
+                        self.render_frames, self.video_frames, self.workers
+                    ).result()
+                report['results'][name][stage] = dict(
+                    frames=frames, elapsed_s=elapsed_s, frames_s=frames / max(elapsed_s, 1e-9),
+                    peak_rss_mb=peak_rss_mb
+                )
+                self._l.info(
+                    f"{name:50} {stage:10} {frames:8} frames {frames / max(elapsed_s, 1e-9):12.1f} frames/s " +
+                    f"{peak_rss_mb:8.1f} MB"
+                )
+
+        return report
+
+    @staticmethod
+    def compare(baseline, current, threshold=THRESHOLD):
+        """
+        This method compares two reports, returning a list with a (dataset, stage, metric, baseline, current,
+        change) tuple per regression: a frames/s decrease or a peak RSS increase larger than the threshold
+        (relative). Only the stages of the datasets present in both reports are compared, and only the metrics
+        with a positive value in the baseline (a stage without frames has no throughput).
+        """
+        regressions = []
+        for name, stages in current['results'].items():
+            for stage, result in stages.items():
+                reference = baseline['results'].get(name, {}).get(stage)
+                if reference is None:
+                    continue
+
+                if reference['frames_s'] > 0:
+                    change = result['frames_s'] / reference['frames_s'] - 1.
+                    if change < -threshold:
+                        regressions.append(
+                            (name, stage, 'frames_s', reference['frames_s'], result['frames_s'], change)
+                        )
+                if reference['peak_rss_mb'] <= 0:
+                    continue
+                change = result['peak_rss_mb'] / reference['peak_rss_mb'] - 1.
+                if change > threshold:
+                    regressions.append(
+                        (name, stage, 'peak_rss_mb', reference['peak_rss_mb'], result['peak_rss_mb'], change)
+                    )
+        return regressions
+
+    @staticmethod
+    def create(argv):
+        """Factory method to instantiate the class using the arguments from the CLI"""
+
+        parser = argparse.ArgumentParser(description="Benchmarks each stage of the processor")
+        parser.add_argument(
+            "-d", "--directory", type=str, required=False,
+            help="Directory with the bundled datasets, not benchmarked unless given"
+        )
+        parser.add_argument(
+            "-w", "--workdir", type=str, required=False,
+            help="Directory where the synthetic datasets are generated, and reused in later runs"
+        )
+        parser.add_argument(
+            "-f", "--fps", type=int, nargs='*', required=False, default=list(MLX90640Benchmark.SYNTHETIC_FPS),
+            help="FPS of the synthetic datasets, none to skip them"
+        )
+        parser.add_argument(
+            "-H", "--hours", type=float, required=False, default=MLX90640Benchmark.SYNTHETIC_HOURS,
+            help="Hours of frames of each synthetic dataset"
+        )
+        parser.add_argument(
+            "-s", "--stages", choices=STAGES, nargs='+', required=False, default=list(STAGES),
+            help="Stages to be benchmarked"
+        )
+        parser.add_argument(
+            "-j", "--workers", type=int, required=False,
+            help="Number of processes for rendering the frames, one per CPU by default"
+        )
+        parser.add_argument(
+            "-o", "--output", type=str, metavar="FILE", required=False,
+            help="Path to the JSON file where the results are stored, to be used as a baseline"
+        )
+        parser.add_argument(
+            "-b", "--baseline", type=str, metavar="FILE", required=False,
+            help="Path to a JSON file with a baseline, the results are compared against it"
+        )
+        parser.add_argument(
+            "-c", "--current", type=str, metavar="FILE", required=False,
+            help="Path to a JSON file with results to compare against the baseline, instead of running"
+        )
+        parser.add_argument(
+            "-t", "--threshold", type=float, required=False, default=MLX90640Benchmark.THRESHOLD,
+            help="Relative change of frames/s or peak RSS flagged as a regression"
+        )
+
+        args = parser.parse_args(argv)
+        benchmark = MLX90640Benchmark(
+            datasets_dirpath=args.directory, workdir=args.workdir, synthetic_fps=args.fps,
+            synthetic_hours=args.hours, stages=args.stages, workers=args.workers
+        )
+
+        if args.current is not None:
+            with open(args.current) as f:
+                report = json.load(f)
+        else:
+            report = benchmark.run()
+            if args.output is not None:
+                with open(args.output, 'w') as f:
+                    json.dump(report, f, indent=1)
+
+        if args.baseline is None:
+            return 0
+
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = MLX90640Benchmark.compare(baseline, report, threshold=args.threshold)
+        for name, stage, metric, reference, result, change in regressions:
+            benchmark._l.error(
+                f"REGRESSION {name} {stage} {metric}: {reference:.1f} -> {result:.1f} ({change * 100.:+.1f} %)"
+            )
+        benchmark._l.info(f"{len(regressions)} regressions over the baseline {args.baseline}")
+        return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(MLX90640Benchmark.create(sys.argv[1:]))
@@ -0,0 +1,120 @@
+"""Content addressed cache for the results of the analysis of a dataset."""
+
+import hashlib
+import json
+import os
+
+from xpython.common import logger
+
+
+class ResultsCache(logger.LoggingClass):
+    """Results cache
+    The results of a dataset are generated in stages (analysis, frames, overall plot, video). This cache
+    keeps a manifest in the output directory of the dataset with, for each stage, the key of the inputs
+    that were used to generate its results and the files that it generated. The keys are hashes of the
+    content of the RAW file plus the parameters that each stage depends on, hence a stage only needs to
+    be executed again when any of its inputs change or any of its files is missing.
+
+    The hash of the RAW file is kept in the manifest together with its size and modification time, so
+    that the file is only read again to calculate the hash when any of them change.
+    """
+
+    MANIFEST    = 'cache.json'
+    VERSION     = 1
+    BLOCK_SIZE  = 1 << 20
+
+    def __init__(self, dirpath, raw_filepath):
+        """Default constructor
+        dirpath         - output directory of the dataset, where the manifest is kept
+        raw_filepath    - path to the binary file with the RAW frames
+        """
+        super(ResultsCache, self).__init__()
+
+        self.dirpath = dirpath
+        self.raw_filepath = raw_filepath
+        self.manifest_filepath = os.path.join(self.dirpath, self.MANIFEST)
+
+        self.manifest = self.read()
+        self._content_hash = None
+
+    def exists(self):
+        """Whether there is a manifest for this dataset"""
+        return os.path.exists(self.manifest_filepath)
+
+    def read(self):
+        """Reads the manifest, returns an empty one if it does not exist, is corrupt or is outdated"""
+        try:
+            with open(self.manifest_filepath) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {'version': self.VERSION, 'raw': {}, 'stages': {}}
+
+        if manifest.get('version') != self.VERSION:
+            self._l.warning(f"Discarding cache with version {manifest.get('version')}, {self.manifest_filepath}")
+            return {'version': self.VERSION, 'raw': {}, 'stages': {}}
+        return manifest
+
+    def write(self):
+        """Writes the manifest, replacing the previous one atomically"""
+        tmp_filepath = self.manifest_filepath + '.tmp'
+        with open(tmp_filepath, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(tmp_filepath, self.manifest_filepath)
+
+    @property
+    def content_hash(self):
+        """SHA-256 of the content of the RAW file, only calculated when its size or mtime changed"""
+        if self._content_hash is not None:
+            return self._content_hash
+
+        stat = os.stat(self.raw_filepath)
+        raw = self.manifest['raw']
+        if raw.get('size') == stat.st_size and raw.get('mtime_ns') == stat.st_mtime_ns and 'sha256' in raw:
+            self._content_hash = raw['sha256']
+            return self._content_hash
+
+        self._content_hash = self.sha256(self.raw_filepath)
+        self.manifest['raw'] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': self._content_hash}
+        self._l.debug(f"Content hash of {self.raw_filepath} = {self._content_hash}")
+        return self._content_hash
+
+    @staticmethod
+    def sha256(filepath):
+        """SHA-256 of the content of the given file, read in blocks of BLOCK_SIZE"""
+        sha256 = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(ResultsCache.BLOCK_SIZE), b''):
+                sha256.update(block)
+        return sha256.hexdigest()
+
+    def key(self, **params):
+        """Key for a stage, given the parameters that it depends on (besides the content of the RAW file)"""
+        params['raw'] = self.content_hash
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+    def files(self, stage):
+        """Paths to the files generated by the given stage"""
+        entry = self.manifest['stages'].get(stage, {})
+        return [os.path.join(self.dirpath, name) for name in entry.get('files', [])]
+
+    def valid(self, stage, key):
+        """Whether the results of the given stage were generated with the given key and still exist"""
+        entry = self.manifest['stages'].get(stage)
+        if entry is None or entry['key'] != key:
+            return False
+        return all(os.path.exists(filepath) for filepath in self.files(stage))
+
+    def invalidate(self, stage):
+        """Removes the entry of the given stage from the manifest, together with the files it generated"""
+        for filepath in self.files(stage):
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        if self.manifest['stages'].pop(stage, None) is not None:
+            self.write()
+
+    def update(self, stage, key, filepaths):
+        """Records that the given stage generated the given files with the given key"""
+        self.manifest['stages'][stage] = {
+            'key': key, 'files': [os.path.relpath(filepath, self.dirpath) for filepath in filepaths]
+        }
+        self.write()
@@ -0,0 +1,375 @@
+"""Batched port of the calibration of MLX90640 (lib/MLX90640_API.cpp), to convert the words from the sensor offline."""
+
+import argparse
+import numpy as np
+import os
+import sys
+import time
+
+from xpython.common import files, logger
+
+from processor import rawdataset
+
+
+EEPROM_WORDS = 832
+FRAME_WORDS = 834
+PIXELS = 768
+
+# words recorded by rawrgb, see src/rawrgb.cpp
+MAGIC = b'MLXW'
+VERSION = 1
+HEADER = np.dtype([('magic', 'S4'), ('version', '<u2'), ('fps', '<u2'), ('eeprom', '<u2', (EEPROM_WORDS,))])
+RECORD = np.dtype([('timestamp_us', '<u8'), ('words', '<u2', (FRAME_WORDS,))])
+
+# the emissivity that rawrgb uses
+EMISSIVITY = 0.8
+
+
+def signed(words, bits=16):
+    """Two's complement value of the given unsigned fields of the given number of bits"""
+    words = np.asarray(words, dtype=np.int64)
+    return np.where(words >= 1 << (bits - 1), words - (1 << bits), words)
+
+
+def nibbles(words):
+    """Signed 4 bit fields of the given words, the least significant one first"""
+    words = np.asarray(words, dtype=np.int64)
+    return signed(((words[:, None] >> np.array([0, 4, 8, 12])) & 0xF).ravel(), 4)
+
+
+class MLX90640Calibration(logger.LoggingClass):
+    """Calibration of MLX90640
+    This class extracts the calibration parameters out of the 832 words of the EEPROM of a sensor, as
+    MLX90640_ExtractParameters does, and calculates the ambient temperature (MLX90640_GetTa) and the
+    temperatures of the pixels (MLX90640_CalculateTo) out of the 834 words of its frames. The frames are
+    converted in batches, given as (N, 834) arrays, with one row per frame; the parameters of every pixel
+    are kept as vectors of PIXELS values, in the order of the sensor (not flipped).
+
+    The calculations are done in double precision, the C implementation mixes single and double precision
+    and the results differ by a few thousandths of a degree at most.
+    """
+
+    def __init__(self, eeprom):
+        """Default constructor
+        eeprom  - the 832 words of the EEPROM, as dumped by MLX90640_DumpEE
+        """
+        super(MLX90640Calibration, self).__init__()
+
+        ee = np.asarray(eeprom, dtype=np.int64)
+        if ee.shape != (EEPROM_WORDS,):
+            raise ValueError(f"The EEPROM has {EEPROM_WORDS} words, not {ee.size}")
+        if ee[10] & 0x0040:
+            raise ValueError("Invalid EEPROM, the device select bit is set")
+        self.eeprom = ee
+
+        pixels = np.arange(PIXELS)
+        rows, columns = pixels // 32, pixels % 32
+        words = ee[64:64 + PIXELS]
+
+        # vdd and ptat
+        self.kVdd = 32 * signed(ee[51] >> 8, 8)
+        self.vdd25 = ((int(ee[51] & 0xFF) - 256) << 5) - 8192
+        self.KvPTAT = signed(ee[50] >> 10, 6) / 4096.
+        self.KtPTAT = signed(ee[50] & 0x3FF, 10) / 8.
+        self.vPTAT25 = int(ee[49])
+        self.alphaPTAT = (ee[16] & 0xF000) / 2. ** 14 + 8.
+
+        self.gainEE = signed(ee[48])
+        self.tgc = signed(ee[60] & 0xFF, 8) / 32.
+        self.resolutionEE = int((ee[56] & 0x3000) >> 12)
+        self.KsTa = signed(ee[60] >> 8, 8) / 8192.
+
+        # ksTo and corner temperatures
+        step = ((ee[63] & 0x3000) >> 12) * 10
+        ct2 = ((ee[63] & 0x00F0) >> 4) * step
+        self.ct = np.array([-40, 0, ct2, ct2 + ((ee[63] & 0x0F00) >> 8) * step], dtype=np.float64)
+        scale = 1 << int((ee[63] & 0x000F) + 8)
+        self.ksTo = signed([ee[61] & 0xFF, ee[61] >> 8, ee[62] & 0xFF, ee[62] >> 8], 8) / scale
+
+        # alpha
+        acc_rem_scale = ee[32] & 0xF
+        acc_column_scale = (ee[32] & 0xF0) >> 4
+        acc_row_scale = (ee[32] & 0xF00) >> 8
+        alpha_scale = ((ee[32] & 0xF000) >> 12) + 30
+        acc_rows, acc_columns = nibbles(ee[34:40]), nibbles(ee[40:48])
+        alpha = signed((words & 0x03F0) >> 4, 6) * (1 << int(acc_rem_scale))
+        alpha = ee[33] + (acc_rows[rows] << acc_row_scale) + (acc_columns[columns] << acc_column_scale) + alpha
+        self.alpha = alpha / 2. ** alpha_scale
+
+        # offsets
+        occ_rem_scale = ee[16] & 0xF
+        occ_column_scale = (ee[16] & 0xF0) >> 4
+        occ_row_scale = (ee[16] & 0xF00) >> 8
+        occ_rows, occ_columns = nibbles(ee[18:24]), nibbles(ee[24:32])
+        offset = signed((words & 0xFC00) >> 10, 6) * (1 << int(occ_rem_scale))
+        self.offset = (
+            signed(ee[17]) + (occ_rows[rows] << occ_row_scale) + (occ_columns[columns] << occ_column_scale) + offset
+        ).astype(np.float64)
+
+        # kta and kv, per row and column parity
+        split = 2 * (rows % 2) + pixels % 2
+        kta_scale1 = ((ee[56] & 0xF0) >> 4) + 8
+        kta_scale2 = ee[56] & 0xF
+        kta_rc = signed([ee[54] >> 8, ee[55] >> 8, ee[54] & 0xFF, ee[55] & 0xFF], 8)
+        kta = signed((words & 0x000E) >> 1, 3) * (1 << int(kta_scale2))
+        self.kta = (kta_rc[split] + kta) / 2. ** kta_scale1
+        kv_scale = (ee[56] & 0xF00) >> 8
+        kv_t = signed([ee[52] >> 12, (ee[52] >> 4) & 0xF, (ee[52] >> 8) & 0xF, ee[52] & 0xF], 4)
+        self.kv = kv_t[split] / 2. ** kv_scale
+
+        # compensation pixels
+        alpha_scale_cp = ((ee[32] & 0xF000) >> 12) + 27
+        offset_cp0 = signed(ee[58] & 0x3FF, 10)
+        self.cpOffset = np.array([offset_cp0, offset_cp0 + signed(ee[58] >> 10, 6)], dtype=np.float64)
+        alpha_cp0 = signed(ee[57] & 0x3FF, 10) / 2. ** alpha_scale_cp
+        self.cpAlpha = np.array([alpha_cp0, (1 + signed(ee[57] >> 10, 6) / 128.) * alpha_cp0])
+        self.cpKta = signed(ee[59] & 0xFF, 8) / 2. ** kta_scale1
+        self.cpKv = signed(ee[59] >> 8, 8) / 2. ** kv_scale
+
+        # interleaved / chess patterns
+        self.calibrationModeEE = int(((ee[10] & 0x0800) >> 4) ^ 0x80)
+        self.ilChessC = np.array([
+            signed(ee[53] & 0x3F, 6) / 16., signed((ee[53] & 0x7C0) >> 6, 5) / 2., signed(ee[53] >> 11, 5) / 8.
+        ])
+        self.il_pattern = rows % 2
+        self.chess_pattern = self.il_pattern ^ (pixels % 2)
+        self.conversion_pattern = (
+            (pixels + 2) // 4 - (pixels + 3) // 4 + (pixels + 1) // 4 - pixels // 4
+        ) * (1 - 2 * self.il_pattern)
+
+        self.broken = np.flatnonzero(words == 0)
+        self.outliers = np.flatnonzero((words != 0) & (words & 0x0001 != 0))
+        if self.broken.size + self.outliers.size > 4:
+            self._l.warning(f"Too many deviating pixels, broken = {self.broken}, outliers = {self.outliers}")
+
+    @staticmethod
+    def _frames(frames):
+        frames = np.asarray(frames)
+        return frames.reshape((-1, FRAME_WORDS)).astype(np.int64)
+
+    def interpolate_outliers(self, frames):
+        """
+        This method returns a copy of the given (N, 834) frames with the words of the broken pixels replaced
+        by the average of their diagonal neighbours, as MLX90640_InterpolateOutliers does (outliers included,
+        only the broken pixels are replaced).
+        """
+        frames = np.array(frames, dtype=np.uint16).reshape((-1, FRAME_WORDS))
+        for x in self.broken:
+            neighbours = []
+            if x - 33 > 0:
+                neighbours += [x - 33, x - 31]
+            elif x - 31 > 0:
+                neighbours += [x - 31]
+            if x + 33 < PIXELS:
+                neighbours += [x + 33, x + 31]
+            elif x + 31 < PIXELS:
+                neighbours += [x + 31]
+            average = frames[:, neighbours].astype(np.float32).sum(axis=1) / np.float32(len(neighbours))
+            frames[:, x] = (average.astype(np.float64) * 1.0003).astype(np.uint16)
+        return frames
+
+    def vdd(self, frames):
+        """Supply voltage of the sensor for each of the given (N, 834) frames, as MLX90640_GetVdd does"""
+        frames = self._frames(frames)
+        resolution_ram = (frames[:, 832] & 0x0C00) >> 10
+        correction = 2. ** self.resolutionEE / 2. ** resolution_ram
+        return (correction * signed(frames[:, 810]) - self.vdd25) / self.kVdd + 3.3
+
+    def ta(self, frames, vdd=None):
+        """Ambient temperature of the sensor for each of the given (N, 834) frames, as MLX90640_GetTa does"""
+        frames = self._frames(frames)
+        vdd = self.vdd(frames) if vdd is None else vdd
+        ptat = signed(frames[:, 800])
+        ptat_art = (ptat / (ptat * self.alphaPTAT + signed(frames[:, 768]))) * 2. ** 18
+        return (ptat_art / (1 + self.KvPTAT * (vdd - 3.3)) - self.vPTAT25) / self.KtPTAT + 25
+
+    def calculate(self, frames, emissivity=EMISSIVITY, tr=None):
+        """
+        This method calculates the temperatures of the pixels of the subpage of each of the given (N, 834)
+        frames, as MLX90640_CalculateTo does, with the given emissivity and reflected temperature (the
+        ambient temperature of each frame when None, as rawrgb does). Returns the (N, PIXELS) temperatures
+        and the (N, PIXELS) mask with the pixels of the subpage of each frame, the rest are not calculated
+        (NaN).
+        """
+        frames = self._frames(frames)
+        vdd = self.vdd(frames)
+        ta = self.ta(frames, vdd=vdd)
+        tr = ta if tr is None else tr
+        ta4 = (ta + 273.15) ** 4
+        tr4 = (tr + 273.15) ** 4
+        ta_tr = tr4 - (tr4 - ta4) / emissivity
+
+        ks_to = self.ksTo
+        alpha_corr_r = np.array([1 / (1 + ks_to[0] * 40), 1, 1 + ks_to[2] * self.ct[2], 0.])
+        alpha_corr_r[3] = alpha_corr_r[2] * (1 + ks_to[3] * (self.ct[3] - self.ct[2]))
+
+        gain = self.gainEE / signed(frames[:, 778])
+        mode = (frames[:, 832] & 0x1000) >> 5
+        calibrated = mode == self.calibrationModeEE
+        subpage = frames[:, 833]
+        ta_comp = (1 + self.cpKta * (ta - 25)) * (1 + self.cpKv * (vdd - 3.3))
+        ir_cp = signed(frames[:, [776, 808]]) * gain[:, None]
+        ir_cp[:, 0] -= self.cpOffset[0] * ta_comp
+        ir_cp[:, 1] -= (self.cpOffset[1] + np.where(calibrated, 0., self.ilChessC[0])) * ta_comp
+        # the subpage is either 0 or 1, as read from the status register
+        ir_cp = ir_cp[np.arange(frames.shape[0]), subpage & 1]
+
+        # only the pixels of the subpage of each frame are calculated, as (frame, pixel) pairs
+        pattern = np.where((mode == 0)[:, None], self.il_pattern, self.chess_pattern)
+        mask = pattern == subpage[:, None]
+        rows, pixels = np.nonzero(mask)
+        ta = ta[rows]
+
+        ir = signed(frames[rows, pixels]) * gain[rows]
+        ir -= self.offset[pixels] * (1 + self.kta[pixels] * (ta - 25)) * (1 + self.kv[pixels] * (vdd[rows] - 3.3))
+        il_chess = self.ilChessC[2] * (2 * self.il_pattern - 1) - self.ilChessC[1] * self.conversion_pattern
+        ir += np.where(calibrated[rows], 0., il_chess[pixels])
+        ir = ir / emissivity - self.tgc * ir_cp[rows]
+
+        alpha = (self.alpha[pixels] - self.tgc * self.cpAlpha[subpage[rows] & 1]) * (1 + self.KsTa * (ta - 25))
+        ta_tr = ta_tr[rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            sx = np.sqrt(np.sqrt(alpha * alpha * alpha * (ir + alpha * ta_tr))) * ks_to[1]
+            to = np.sqrt(np.sqrt(ir / (alpha * (1 - ks_to[1] * 273.15) + sx) + ta_tr)) - 273.15
+            # NaN falls into the last range, as in C
+            ranges = np.digitize(to, self.ct[1:])
+            to = np.sqrt(np.sqrt(
+                ir / (alpha * alpha_corr_r[ranges] * (1 + ks_to[ranges] * (to - self.ct[ranges]))) + ta_tr
+            )) - 273.15
+
+        result = np.full(mask.shape, np.nan)
+        result[rows, pixels] = to
+        return result, mask
+
+    def temperatures(self, frames, emissivity=EMISSIVITY, tr=None, previous=None, interpolate=True, flip=True):
+        """
+        This method converts the given (N, 834) frames into (N, PIXELS_Y, PIXELS_X) float32 temperatures,
+        as rawrgb does: the broken pixels are interpolated first (interpolate) and every frame only updates
+        the pixels of its subpage, keeping the rest from the previous frames (previous, with the last PIXELS
+        temperatures of the previous batch, zeros when None). The frames are flipped upside down (flip), as
+        in the RAW files that rawrgb writes.
+        """
+        frames = self.interpolate_outliers(frames) if interpolate else self._frames(frames)
+        to, mask = self.calculate(frames, emissivity=emissivity, tr=tr)
+
+        # last frame (within the batch, -1 for the previous ones) where each pixel was updated
+        updated = np.where(mask, np.arange(to.shape[0])[:, None], -1)
+        np.maximum.accumulate(updated, axis=0, out=updated)
+        previous = np.zeros(PIXELS) if previous is None else np.asarray(previous).reshape(PIXELS)
+        to = np.where(updated >= 0, to[np.maximum(updated, 0), np.arange(PIXELS)], previous)
+
+        shape = (rawdataset.RawDataset.PIXELS_Y, rawdataset.RawDataset.PIXELS_X)
+        to = to.astype(rawdataset.RawDataset.DTYPE).reshape((-1,) + shape)
+        return to[:, ::-1] if flip else to
+
+
+class WordsRecording(logger.LoggingClass):
+    """Recording of the words from the sensor
+    This class maps a file with the words recorded by rawrgb (see src/rawrgb.cpp): a header with the EEPROM
+    and a record per frame, with its timestamp and its 834 words. An incomplete record at the end of the file
+    is discarded. The frames are converted into temperatures in chunks, for any emissivity.
+    """
+
+    CHUNK_FRAMES = 4096
+
+    def __init__(self, filepath):
+        """Default constructor
+        filepath    - path to the file with the words recorded by rawrgb
+        """
+        super(WordsRecording, self).__init__()
+
+        self.filepath = filepath
+        header = np.fromfile(filepath, dtype=HEADER, count=1)
+        if header.size == 0 or header['magic'][0] != MAGIC:
+            raise ValueError(f"Not a recording of the words from the sensor, {filepath}")
+        if header['version'][0] != VERSION:
+            raise ValueError(f"Unsupported version of the recording {header['version'][0]}, {filepath}")
+
+        self.fps = int(header['fps'][0])
+        self.eeprom = header['eeprom'][0]
+        self.calibration = MLX90640Calibration(self.eeprom)
+
+        size = os.path.getsize(filepath) - HEADER.itemsize
+        self.no_frames = size // RECORD.itemsize
+        if size % RECORD.itemsize:
+            self._l.warning(f"Discarding an incomplete record at the end of {filepath}")
+        self.records = np.memmap(
+            filepath, dtype=RECORD, mode='r', offset=HEADER.itemsize, shape=(self.no_frames,)
+        ) if self.no_frames else np.zeros(0, dtype=RECORD)
+
+    def __len__(self):
+        return self.no_frames
+
+    @property
+    def timestamps_us(self):
+        return self.records['timestamp_us']
+
+    @property
+    def words(self):
+        """(N, 834) words of the frames"""
+        return self.records['words']
+
+    def iter_temperatures(self, emissivity=EMISSIVITY, tr=None, chunk_frames=CHUNK_FRAMES):
+        """
+        This method yields the (n, PIXELS_Y, PIXELS_X) temperatures of all the frames, in chunks of up to
+        chunk_frames frames, carrying the pixels of the other subpage in between the chunks.
+        """
+        previous = None
+        for start in range(0, self.no_frames, chunk_frames):
+            to = self.calibration.temperatures(
+                self.words[start:start + chunk_frames], emissivity=emissivity, tr=tr, previous=previous
+            )
+            previous = to[-1, ::-1]
+            yield to
+
+    def convert(self, raw_filepath, emissivity=EMISSIVITY, tr=None, chunk_frames=CHUNK_FRAMES):
+        """
+        This method writes the temperatures of all the frames into a RAW file, as rawrgb would have with the
+        given emissivity. Returns the number of frames per second converted.
+        """
+        start = time.perf_counter()
+        with open(raw_filepath, 'wb') as f:
+            for to in self.iter_temperatures(emissivity=emissivity, tr=tr, chunk_frames=chunk_frames):
+                f.write(to.tobytes())
+        elapsed_s = time.perf_counter() - start
+        fps = self.no_frames / elapsed_s if elapsed_s > 0 else float('inf')
+        self._l.info(
+            f"Converted {self.no_frames} frames with emissivity {emissivity} into {raw_filepath}, "
+            f"{elapsed_s:.3f} (s), {fps:.0f} frames/s"
+        )
+        return fps
+
+    @staticmethod
+    def create(argv):
+        """Factory method to convert a recording using the arguments from the CLI"""
+
+        parser = argparse.ArgumentParser(description="Converts the words recorded from MLX90640 into a RAW file")
+        parser.add_argument(
+            "-w", "--words", type=files.is_readable_file, metavar="FILE", required=True,
+            help="File with the words recorded by rawrgb"
+        )
+        parser.add_argument(
+            "-o", "--output", type=str, metavar="FILE", required=True,
+            help="RAW file to write the temperatures into"
+        )
+        parser.add_argument(
+            "-e", "--emissivity", type=float, required=False, default=EMISSIVITY,
+            help="Emissivity of the target material"
+        )
+        parser.add_argument(
+            "-t", "--tr", type=float, required=False,
+            help="Reflected temperature in degC, the ambient temperature of the sensor by default"
+        )
+        parser.add_argument(
+            "-c", "--chunk", type=int, required=False, default=WordsRecording.CHUNK_FRAMES,
+            help="Number of frames converted at once"
+        )
+
+        args = parser.parse_args(argv)
+        recording = WordsRecording(args.words)
+        recording.convert(args.output, emissivity=args.emissivity, tr=args.tr, chunk_frames=args.chunk)
+        return recording
+
+
+if __name__ == "__main__":
+    WordsRecording.create(sys.argv[1:])
@@ -0,0 +1,236 @@
+"""Persistent catalog of the datasets under one or several directories."""
+
+import json
+import numpy as np
+import os
+
+from xpython.common import logger
+
+from processor import cache, container, rawdataset, results
+
+
+RAW_EXT = '.raw'
+DATASET_EXTS = (RAW_EXT, container.EXTENSION)
+
+
+def parse_name(filepath):
+    """
+    This function decomposes the name of a dataset file into its fields (name, fps, distance_mm, date and
+    description), as per the naming convention ds-$FPS-$DMM-$DATE-$SEQ-$DESCRIPTION. The sequential number
+    is optional, some datasets do not include it.
+    """
+    name = os.path.splitext(os.path.basename(filepath))[0]
+    fields = name.split('-')
+    # the description may contain dashes itself
+    description = fields[5:] if len(fields) > 5 and fields[4].isdigit() else fields[4:]
+    return dict(
+        name=name, fps=int(fields[1]), distance_mm=int(fields[2]), date=fields[3], description='-'.join(description)
+    )
+
+
+def is_dataset(dirpath, filename):
+    """
+    This function checks whether the given file is a dataset: a RAW file or a compressed container whose
+    RAW file is not under the same directory, since both would be analyzed into the same directory.
+    """
+    filepath = os.path.join(dirpath, filename)
+    if not (filename.endswith(DATASET_EXTS) and os.path.isfile(filepath)):
+        return False
+    stem, ext = os.path.splitext(filepath)
+    return ext == RAW_EXT or not os.path.isfile(stem + RAW_EXT)
+
+
+class DatasetCatalog(logger.LoggingClass):
+    """Datasets catalog
+    This class keeps, for every directory with datasets, an index with an entry per dataset as a sidecar
+    file (INDEX_FILENAME) in that same directory. Each entry has the fields parsed from the name of the
+    dataset, the size, modification time, number of frames and SHA-256 of its file, whether it has already
+    been analyzed and the summary values of its results (max_dT_value, diff_fit_tau_s...).
+
+    The indexes are refreshed incrementally: the files whose size and modification time did not change
+    are neither read nor hashed again, and neither are the results of the datasets that were not analyzed
+    again. Listing and filtering the datasets only needs the indexes.
+
+    The frames per second of each dataset are DEFAULT_FPS, unless overridden for that dataset; the
+    overrides are kept in the index too.
+    """
+
+    INDEX_FILENAME  = '.catalog.json'
+    VERSION         = 1
+    # due to an issue with the driver, all datasets are taken at 1 fps whatever their names say
+    DEFAULT_FPS     = 1
+
+    def __init__(self, dirpaths, hashes=True, refresh=True):
+        """Default constructor
+        dirpaths        - directory or list of directories with datasets
+        hashes=True     - whether to calculate the SHA-256 of the new or modified datasets
+        refresh=True    - whether to refresh the indexes, instead of using them as they are
+        """
+        super(DatasetCatalog, self).__init__()
+
+        self.dirpaths = [dirpaths] if isinstance(dirpaths, str) else list(dirpaths)
+        self.hashes = hashes
+        self.indexes = {dirpath: self.read(dirpath) for dirpath in self.dirpaths}
+
+        if refresh:
+            self.refresh()
+
+    def index_filepath(self, dirpath):
+        return os.path.join(dirpath, self.INDEX_FILENAME)
+
+    def read(self, dirpath):
+        """Reads the index of the given directory, returns an empty one if it does not exist or is outdated"""
+        try:
+            with open(self.index_filepath(dirpath)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {'version': self.VERSION, 'fps': {}, 'datasets': {}}
+
+        if index.get('version') != self.VERSION:
+            self._l.warning(f"Discarding catalog with version {index.get('version')}, {self.index_filepath(dirpath)}")
+            return {'version': self.VERSION, 'fps': index.get('fps', {}), 'datasets': {}}
+        return index
+
+    def write(self, dirpath):
+        """Writes the index of the given directory, replacing the previous one atomically"""
+        filepath = self.index_filepath(dirpath)
+        try:
+            with open(filepath + '.tmp', 'w') as f:
+                json.dump(self.indexes[dirpath], f, indent=1)
+            os.replace(filepath + '.tmp', filepath)
+        except OSError as ex:
+            self._l.warning(f"Could not write the catalog {filepath}, msg = {ex}")
+
+    def refresh(self):
+        """
+        This method updates the indexes with the datasets that were added, modified, removed or analyzed
+        since the last refresh, and writes the indexes that changed. Returns the number of entries updated.
+        """
+        updated = 0
+        for dirpath in self.dirpaths:
+            index = self.indexes[dirpath]
+            previous = index['datasets']
+            datasets = {}
+
+            for filename in sorted(os.listdir(dirpath)):
+                if not is_dataset(dirpath, filename):
+                    continue
+                filepath = os.path.join(dirpath, filename)
+                stat = os.stat(filepath)
+                entry = dict(previous[filename]) if filename in previous else None
+                try:
+                    if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+                        entry = self.scan(filepath, stat)
+                        updated += 1
+                    updated += self.scan_results(filepath, entry)
+                except (ValueError, IndexError) as ex:
+                    self._l.warning(f"Skipping {filepath}, msg = {ex}")
+                    continue
+                datasets[filename] = entry
+
+            updated += len(set(previous) - set(datasets))
+            if datasets != previous or not os.path.isfile(self.index_filepath(dirpath)):
+                index['datasets'] = datasets
+                self.write(dirpath)
+
+        self._l.debug(f"Catalog refreshed, {updated} entries updated")
+        return updated
+
+    def scan(self, filepath, stat):
+        """This method creates the entry of the given dataset, reading (and hashing) its file"""
+        fields = parse_name(filepath)
+        if filepath.endswith(container.EXTENSION):
+            dataset = container.open_dataset(filepath)
+            no_frames = len(dataset)
+            dataset.close()
+        else:
+            no_frames = stat.st_size // rawdataset.RawDataset.SIZE_FRAME
+
+        return dict(
+            name=fields['name'], name_fps=fields['fps'], distance_mm=fields['distance_mm'], date=fields['date'],
+            description=fields['description'],
+            size=stat.st_size, mtime_ns=stat.st_mtime_ns, no_frames=no_frames,
+            sha256=cache.ResultsCache.sha256(filepath) if self.hashes else None,
+            processed=False, results_mtime_ns=None, summary={}
+        )
+
+    def scan_results(self, filepath, entry):
+        """
+        This method updates whether the given dataset was analyzed and the summary values of its results,
+        only reading them when they changed. Returns 1 if the entry changed, 0 otherwise.
+        """
+        results_filepath = os.path.join(os.path.splitext(filepath)[0], results.DatasetResults.FILENAME)
+        try:
+            mtime_ns = os.stat(results_filepath).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+
+        if mtime_ns == entry['results_mtime_ns']:
+            return 0
+
+        summary = {}
+        if mtime_ns is not None:
+            with np.load(results_filepath) as data:
+                for name in data.files:
+                    value = data[name]
+                    if value.ndim == 0 and np.issubdtype(value.dtype, np.number):
+                        summary[name] = None if np.isnan(value) else value.item()
+        entry.update(processed=mtime_ns is not None, results_mtime_ns=mtime_ns, summary=summary)
+        return 1
+
+    def fps(self, dirpath, name):
+        """Frames per second of the dataset with the given name: its override or DEFAULT_FPS"""
+        return self.indexes[dirpath]['fps'].get(name, self.DEFAULT_FPS)
+
+    def set_fps(self, name, fps):
+        """
+        This method overrides the frames per second of the dataset with the given name (None to go back to
+        DEFAULT_FPS), in the index of the directory where it is. Returns whether the dataset was found.
+        """
+        for dirpath, index in self.indexes.items():
+            if any(entry['name'] == name for entry in index['datasets'].values()):
+                if fps is None:
+                    index['fps'].pop(name, None)
+                else:
+                    index['fps'][name] = fps
+                self.write(dirpath)
+                return True
+        return False
+
+    def entries(self):
+        """
+        This method returns all the entries, sorted by directory (as given) and by name, each of them with
+        the path to its file (filepath) and its frames per second (fps).
+        """
+        return [
+            dict(entry, filepath=os.path.join(dirpath, filename), fps=self.fps(dirpath, entry['name']))
+            for dirpath in self.dirpaths
+            for filename, entry in sorted(self.indexes[dirpath]['datasets'].items())
+        ]
+
+    def filter(self, date=None, distance_mm=None, description=None, processed=None):
+        """
+        This method returns the entries that meet all the given conditions:
+        date=None           - date (or its beginning, as '202005') or a (first, last) tuple with a range
+        distance_mm=None    - distance
+        description=None    - beginning of the description
+        processed=None      - whether the dataset was analyzed
+        """
+        def selected(entry):
+            if date is not None:
+                if isinstance(date, str) and not entry['date'].startswith(date):
+                    return False
+                if not isinstance(date, str) and not date[0] <= entry['date'] <= date[1]:
+                    return False
+            if distance_mm is not None and entry['distance_mm'] != distance_mm:
+                return False
+            if description is not None and not entry['description'].startswith(description):
+                return False
+            return processed is None or entry['processed'] == processed
+
+        return [entry for entry in self.entries() if selected(entry)]
+
+    @staticmethod
+    def datasets(entries):
+        """Datasets for the given entries, as the (fps, distance_mm, filepath) tuples of DatasetsManager"""
+        return [(entry['fps'], entry['distance_mm'], entry['filepath']) for entry in entries]
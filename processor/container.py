@@ -0,0 +1,398 @@
+"""Compressed container for the frames from MLX90640, with random access and per-frame timestamps."""
+
+import argparse
+import numpy as np
+import os
+import struct
+import sys
+import zlib
+
+from xpython.common import logger
+
+from processor import rawdataset
+
+
+EXTENSION = '.mlxz'
+
+MAGIC = b'MLXZ'
+VERSION = 1
+# magic, version, pixels y, pixels x, chunk frames, scale (units per degree), fps
+HEADER = struct.Struct('<4sHHHIff')
+
+CHUNK_MAGIC = b'CHNK'
+# magic, number of frames, size of the compressed timestamps, size of the compressed frames
+CHUNK_HEADER = struct.Struct('<4sIII')
+
+INDEX_MAGIC = b'MLXI'
+# offset of the index, number of chunks, magic
+FOOTER = struct.Struct('<QI4s')
+
+SCALE = 100.
+NAN_VALUE = np.iinfo(np.int16).min
+MAX_VALUE = np.iinfo(np.int16).max
+CHUNK_FRAMES = 256
+
+
+def quantize(frames, scale=SCALE):
+    """
+    This function quantizes the given temperatures (in degrees) as int16 fixed point numbers, with <scale>
+    units per degree. NaN values are stored as NAN_VALUE and the rest are clipped to +/-MAX_VALUE.
+    """
+    frames = np.asarray(frames, dtype=np.float32)
+    values = np.rint(np.nan_to_num(frames, nan=0.) * scale)
+    values = np.clip(values, -MAX_VALUE, MAX_VALUE).astype(np.int16)
+    values[np.isnan(frames)] = NAN_VALUE
+    return values
+
+
+def dequantize(values, scale=SCALE):
+    """Inverse of quantize, the NaN values are restored"""
+    frames = values.astype(np.float32) / np.float32(scale)
+    frames[values == NAN_VALUE] = np.nan
+    return frames
+
+
+def encode_chunk(values, timestamps_us, level=6):
+    """
+    This function encodes a chunk of quantized frames: the first frame is kept as is and the rest as the
+    (wrapping) difference with the previous one, since consecutive frames hardly change. The high and the
+    low bytes of the differences are stored separately, before being compressed with zlib, because the
+    high bytes are mostly zero. The timestamps are delta encoded too, in a separate zlib stream.
+    """
+    deltas = values.copy()
+    deltas[1:] -= values[:-1]
+    planes = deltas.astype('<i2').view(np.uint8).reshape(-1, 2).T
+    data = zlib.compress(np.ascontiguousarray(planes).tobytes(), level)
+
+    timestamps = np.asarray(timestamps_us, dtype='<i8')
+    timestamps = np.diff(timestamps, prepend=0)
+    ts_data = zlib.compress(timestamps.tobytes(), level)
+
+    return CHUNK_HEADER.pack(CHUNK_MAGIC, len(values), len(ts_data), len(data)) + ts_data + data
+
+
+def decode_chunk(no_frames, data, shape):
+    """Inverse of encode_chunk for the compressed frames, returns the quantized (no_frames, *shape) frames"""
+    planes = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(2, -1)
+    deltas = np.ascontiguousarray(planes.T).view('<i2').reshape((no_frames,) + shape)
+    return np.cumsum(deltas, axis=0, dtype=np.int16)
+
+
+class CompressedWriter(logger.LoggingClass):
+    """Writer of compressed containers
+    The frames are quantized, split in chunks with a fixed number of frames and encoded as explained at
+    encode_chunk. The file starts with a header (HEADER) and, once closed, ends with an index with the
+    offset of each chunk, so that any frame can be read by decoding only the chunk that contains it.
+    A container that was not closed (the recording was interrupted) can still be read, since the chunks
+    can also be found by scanning the file.
+    """
+
+    def __init__(self, filepath, fps=1, chunk_frames=CHUNK_FRAMES, scale=SCALE, level=6):
+        """Default constructor
+        filepath                    - path to the container to be written
+        fps=1                       - frames per second, used for the timestamps when not given
+        chunk_frames=CHUNK_FRAMES   - number of frames per chunk, the unit for random access
+        scale=SCALE                 - units per degree of the quantized temperatures (0.01 degrees)
+        level=6                     - zlib compression level
+        """
+        super(CompressedWriter, self).__init__()
+
+        self.filepath = filepath
+        self.fps = fps
+        self.chunk_frames = chunk_frames
+        self.scale = scale
+        self.level = level
+
+        self.no_frames = 0
+        self.offsets = []
+        self._values = []
+        self._timestamps = []
+
+        self._file = open(self.filepath, 'wb')
+        self._file.write(HEADER.pack(
+            MAGIC, VERSION, rawdataset.RawDataset.PIXELS_Y, rawdataset.RawDataset.PIXELS_X,
+            self.chunk_frames, self.scale, self.fps
+        ))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, frames, timestamps_us=None):
+        """
+        This method appends the given (N, PIXELS_Y, PIXELS_X) frames to the container, with their
+        timestamps (in microseconds). When no timestamps are given, they are derived from the fps.
+        """
+        frames = np.asarray(frames).reshape(-1, rawdataset.RawDataset.PIXELS_Y, rawdataset.RawDataset.PIXELS_X)
+        if timestamps_us is None:
+            indexes = np.arange(self.no_frames, self.no_frames + len(frames))
+            timestamps_us = np.rint(indexes * 1e6 / self.fps).astype(np.int64)
+
+        self._values.append(quantize(frames, self.scale))
+        self._timestamps.append(np.asarray(timestamps_us, dtype=np.int64))
+        self.no_frames += len(frames)
+
+        if sum(len(v) for v in self._values) >= self.chunk_frames:
+            values, timestamps = np.concatenate(self._values), np.concatenate(self._timestamps)
+            full = len(values) - len(values) % self.chunk_frames
+            for start in range(0, full, self.chunk_frames):
+                chunk = slice(start, start + self.chunk_frames)
+                self._write_chunk(values[chunk], timestamps[chunk])
+            self._values, self._timestamps = [values[full:]], [timestamps[full:]]
+
+    def _write_chunk(self, values, timestamps):
+        """Encodes and writes the given chunk, keeping its offset for the index"""
+        self.offsets.append(self._file.tell())
+        self._file.write(encode_chunk(values, timestamps, self.level))
+
+    def close(self):
+        """Writes the pending frames and the index, and closes the file"""
+        if self._file.closed:
+            return
+
+        values = np.concatenate(self._values) if self._values else np.empty(0)
+        if len(values):
+            self._write_chunk(values, np.concatenate(self._timestamps))
+
+        index_offset = self._file.tell()
+        self._file.write(np.asarray(self.offsets, dtype='<u8').tobytes())
+        self._file.write(FOOTER.pack(index_offset, len(self.offsets), INDEX_MAGIC))
+        self._file.close()
+
+
+class CompressedDataset(rawdataset.RawDataset):
+    """Compressed dataset
+    Reader of the compressed containers with the same interface as RawDataset. Since all the chunks but
+    the last one have the same number of frames, the chunk with a given frame is found in constant time
+    and only that chunk is decompressed. The last decoded chunk is kept, so that sequential accesses
+    decode each chunk once. The whole block of frames (frames) is only decoded when it is requested, which
+    the processor never does: the analysis, the regions of interest and the replay go chunk by chunk.
+    """
+
+    def __init__(self, raw_filepath, fps=None):
+        """Default constructor
+        raw_filepath    - path to the compressed container
+        fps=None        - frames per second, the ones stored in the container when None
+        """
+        # RawDataset maps a RAW file, hence only the logger is initialized
+        super(rawdataset.RawDataset, self).__init__()
+
+        self.raw_filepath = raw_filepath
+        self.size = os.path.getsize(self.raw_filepath)
+        self.tail = 0
+
+        self._file = open(self.raw_filepath, 'rb')
+        magic, version, pixels_y, pixels_x, self.chunk_frames, self.scale, stored_fps = HEADER.unpack(
+            self._file.read(HEADER.size)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.raw_filepath} is not a compressed container (version {VERSION})")
+
+        self.fps = fps or stored_fps
+        self.shape = (pixels_y, pixels_x)
+        self.chunks = self._read_index() or self._scan()
+        self.no_frames = sum(no_frames for _, no_frames, _, _ in self.chunks)
+
+        self._frames = None
+        self._timestamps = None
+        self._chunk = (None, None)
+
+    def _read_index(self):
+        """
+        This method reads the index at the end of the file, returns a list with the (offset, frames,
+        timestamps size, frames size) of each chunk, or None if the container was not closed.
+        """
+        if self.size < HEADER.size + FOOTER.size:
+            return None
+        self._file.seek(self.size - FOOTER.size)
+        index_offset, no_chunks, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+        if magic != INDEX_MAGIC or index_offset + 8 * no_chunks + FOOTER.size != self.size:
+            return None
+
+        self._file.seek(index_offset)
+        chunks = []
+        for offset in np.frombuffer(self._file.read(8 * no_chunks), dtype='<u8'):
+            self._file.seek(int(offset))
+            _, no_frames, ts_size, size = CHUNK_HEADER.unpack(self._file.read(CHUNK_HEADER.size))
+            chunks.append((int(offset), no_frames, ts_size, size))
+        return chunks
+
+    def _scan(self):
+        """
+        This method finds the chunks of a container without an index by following their headers, an
+        incomplete chunk at the end of the file is ignored.
+        """
+        chunks = []
+        offset = HEADER.size
+        while offset + CHUNK_HEADER.size <= self.size:
+            self._file.seek(offset)
+            magic, no_frames, ts_size, size = CHUNK_HEADER.unpack(self._file.read(CHUNK_HEADER.size))
+            end = offset + CHUNK_HEADER.size + ts_size + size
+            if magic != CHUNK_MAGIC or end > self.size:
+                break
+            chunks.append((offset, no_frames, ts_size, size))
+            offset = end
+
+        self.tail = self.size - offset
+        self._l.warning(f"No index in {self.raw_filepath}, {len(chunks)} chunks found, ignoring {self.tail} bytes")
+        return chunks
+
+    def _read_chunk(self, chunk, timestamps=False):
+        """Reads the compressed timestamps or the compressed frames of the chunk with the given index"""
+        offset, no_frames, ts_size, size = self.chunks[chunk]
+        if timestamps:
+            self._file.seek(offset + CHUNK_HEADER.size)
+            return self._file.read(ts_size)
+        self._file.seek(offset + CHUNK_HEADER.size + ts_size)
+        return self._file.read(size)
+
+    def chunk(self, chunk):
+        """Decoded (dequantized) frames of the chunk with the given index"""
+        if self._chunk[0] != chunk:
+            values = decode_chunk(self.chunks[chunk][1], self._read_chunk(chunk), self.shape)
+            self._chunk = (chunk, dequantize(values, self.scale))
+        return self._chunk[1]
+
+    @property
+    def frames(self):
+        """Block with all the decoded frames, (N, PIXELS_Y, PIXELS_X)"""
+        if self._frames is None:
+            self._frames = np.empty((self.no_frames,) + self.shape, dtype=self.DTYPE)
+            for chunk in range(len(self.chunks)):
+                start = chunk * self.chunk_frames
+                self._frames[start:start + self.chunks[chunk][1]] = self.chunk(chunk)
+        return self._frames
+
+    @property
+    def timestamps_us(self):
+        """Timestamps of the frames (in microseconds), only the timestamps are decompressed"""
+        if self._timestamps is None:
+            # the first delta of each chunk is the absolute timestamp
+            self._timestamps = np.concatenate([np.empty(0, dtype=np.int64)] + [
+                np.frombuffer(zlib.decompress(self._read_chunk(chunk, timestamps=True)), dtype='<i8').cumsum()
+                for chunk in range(len(self.chunks))
+            ])
+        return self._timestamps
+
+    def __getitem__(self, key):
+        """
+        Frames at the given index, slice or array of indexes. Unlike RawDataset, these are copies: only
+        the chunks with the requested frames are decoded, unless all the frames were already decoded.
+        """
+        if self._frames is not None:
+            return self._frames[key]
+
+        if isinstance(key, (int, np.integer)):
+            index = range(self.no_frames)[key]
+            return self.chunk(index // self.chunk_frames)[index % self.chunk_frames]
+
+        indexes = np.arange(self.no_frames)[key]
+        frames = np.empty(indexes.shape + self.shape, dtype=self.DTYPE)
+        chunks = indexes // self.chunk_frames
+        for chunk in np.unique(chunks):
+            selected = chunks == chunk
+            frames[selected] = self.chunk(int(chunk))[indexes[selected] % self.chunk_frames]
+        return frames
+
+    def __iter__(self):
+        for chunk in range(len(self.chunks)):
+            yield from self.chunk(chunk)
+
+    def close(self):
+        """Releases the decoded frames and closes the file"""
+        self._frames = None
+        self._chunk = (None, None)
+        self._file.close()
+
+    def valid(self):
+        """Same as RawDataset.valid, decoding one chunk at a time"""
+        valid = np.empty(self.no_frames, dtype=bool)
+        for chunk in range(len(self.chunks)):
+            start = chunk * self.chunk_frames
+            valid[start:start + self.chunks[chunk][1]] = ~np.isnan(self.chunk(chunk)).any(axis=(1, 2))
+        return valid
+
+
+def open_dataset(filepath, fps=None):
+    """
+    This function opens the given dataset, either a RAW file or a compressed container (EXTENSION). The
+    fps given for a compressed container override the ones stored in it, RAW files default to 1 fps.
+    """
+    if filepath.endswith(EXTENSION):
+        return CompressedDataset(filepath, fps=fps)
+    return rawdataset.RawDataset(filepath, fps=fps or 1)
+
+
+def convert(raw_filepath, filepath=None, fps=1, chunk_frames=CHUNK_FRAMES, level=6):
+    """
+    This function converts the given RAW file into a compressed container, at the same path with the
+    EXTENSION when no filepath is given. The RAW files have no timestamps, these are derived from the fps.
+    Returns the path to the container.
+    """
+    filepath = filepath or os.path.splitext(raw_filepath)[0] + EXTENSION
+    dataset = rawdataset.RawDataset(raw_filepath, fps=fps)
+    with CompressedWriter(filepath, fps=fps, chunk_frames=chunk_frames, level=level) as writer:
+        for start in range(0, dataset.no_frames, dataset.CHUNK_FRAMES):
+            writer.write(dataset[start:start + dataset.CHUNK_FRAMES])
+    dataset.close()
+    return filepath
+
+
+class CompressedConverter(logger.LoggingClass):
+    """Command line converter from RAW files to compressed containers"""
+
+    def __init__(self, raw_filepaths, fps=1, level=6, verify=False):
+        """Default constructor
+        raw_filepaths   - list with the RAW files to be converted
+        fps=1           - frames per second of the RAW files
+        level=6         - zlib compression level
+        verify=False    - whether to compare the decoded frames with the RAW ones
+        """
+        super(CompressedConverter, self).__init__()
+
+        for raw_filepath in raw_filepaths:
+            filepath = convert(raw_filepath, fps=fps, level=level)
+            ratio = os.path.getsize(raw_filepath) / max(os.path.getsize(filepath), 1)
+            self._l.info(f"{raw_filepath} > {filepath}, ratio = {ratio:.2f}")
+
+            if verify:
+                raw, compressed = rawdataset.RawDataset(raw_filepath, fps=fps), CompressedDataset(filepath)
+                error = 0.
+                for start in range(0, raw.no_frames, raw.CHUNK_FRAMES):
+                    chunk = slice(start, start + raw.CHUNK_FRAMES)
+                    error = max(error, float(np.nanmax(np.abs(compressed[chunk] - raw[chunk]), initial=0.)))
+                self._l.info(f"{filepath}, frames = {compressed.no_frames}, max error = {error:.4f} (degrees)")
+                raw.close()
+                compressed.close()
+
+    @staticmethod
+    def create(argv):
+        """Factory method to instantiate the class using the arguments from the CLI"""
+
+        parser = argparse.ArgumentParser(description="Converts RAW files from MLX90640 into compressed containers")
+        parser.add_argument(
+            "-r", "--raw-file", type=str, nargs='+', metavar="FILE", required=True,
+            help="RAW files to be converted"
+        )
+        parser.add_argument(
+            "-f", "--fps", type=float, required=False, default=1,
+            help="Frames per second of the RAW files"
+        )
+        parser.add_argument(
+            "-l", "--level", type=int, required=False, default=6,
+            help="zlib compression level (1-9)"
+        )
+        parser.add_argument(
+            "-v", "--verify",
+            action='store_true', required=False,
+            help="Compares the decoded frames with the RAW ones"
+        )
+
+        args = parser.parse_args(argv)
+        return CompressedConverter(args.raw_file, fps=args.fps, level=args.level, verify=args.verify)
+
+
+if __name__ == "__main__":
+    converter = CompressedConverter.create(sys.argv[1:])
@@ -2,26 +2,52 @@
 @author rtpardavila[at]gmail[dot]com
 """
 
-import argparse, os, sys
+import argparse, concurrent.futures, json, os, sys, time
 
-import processor
+from processor import catalog, processor, profiling, results
 from xpython.common import logger, files
 
 
+def _analyze(ds, update=False, workers=None, profile=False, profile_stage=None):
+    """
+    Analyzes the given dataset, isolating any error. This function is defined at module level so that it
+    can be executed by the processes of a pool.
+    Returns a (ds, error, elapsed_s, profile) tuple, where error is None when the analysis succeeded and
+    profile is the report of the time spent on each stage, None if not profiled or failed.
+    """
+    start = time.perf_counter()
+    report = None
+    try:
+        p = processor.MLX90640Processor(
+            *ds, update=update, workers=workers, profile=profile, profile_stage=profile_stage
+        )
+        report = p.profile_report
+        error = None
+    except Exception as ex:
+        error = str(ex)
+    return ds, error, time.perf_counter() - start, report
+
+
 class DatasetsManager(logger.LoggingClass):
     """
-    This class facilitates the reading of the available datasets under a given directory.
+    This class facilitates the reading of the available datasets under a given directory (or directories).
+    The datasets are read from the catalog of each directory (see catalog.DatasetCatalog), which is
+    refreshed incrementally, so that the files are only read when they are new or were modified.
     """
 
-    DATASET_EXT = '.raw'
+    DATASET_EXT = catalog.RAW_EXT
+    DATASET_EXTS = catalog.DATASET_EXTS
 
-    def __init__(self, basedir):
+    def __init__(self, basedir, hashes=True):
         """Default constructor
         Reads all the dataset available files directly under the given directory. It assumes that those
         files meet the following naming convention:
 
                 ds-$FPS-$DMM-$DATE-$SEQ-$DESCRIPTION.raw
 
+        Compressed containers (.mlxz) are read as well, unless the RAW file they were converted from is
+        still there, since both would be analyzed into the same directory.
+
         The filename is decomposed using split assuming that '-' is always used as a separator among those
         fields. The definition of those fields is as follows:
 
@@ -33,40 +59,169 @@ class DatasetsManager(logger.LoggingClass):
             d) $SEQ ~ sequential number of the experiment, REQUIRED but not USED
             e) $DESCRIPTION ~ human readable brief descripiton to easily identify the experiment
 
+        Due to an issue with the driver, the datasets are analyzed at catalog.DatasetCatalog.DEFAULT_FPS
+        (1 fps) and not at $FPS, unless the fps of the dataset are overridden in the catalog.
+
         The arguments for this constructor are the following ones:
 
-            basedir - path to the base directory under which the dataset files are kept.
+            basedir - path to the base directory under which the dataset files are kept, or list of them
+            hashes  - whether the catalog calculates the SHA-256 of the new or modified datasets
         """
         super(DatasetsManager, self).__init__()
 
-        self.basedir = basedir
+        self.catalog = catalog.DatasetCatalog(basedir, hashes=hashes)
+        self.basedir = self.catalog.dirpaths[0]
+        self.entries = self.catalog.entries()
+        self.datasets = self.catalog.datasets(self.entries)
 
-        self.datasets = [(
-            1, # int(f.split('-')[1]), # Due to an issue with the driver, all datasets are FPS=1
-            int(f.split('-')[2]),
-            os.path.join(self.basedir, f)
+    def select(self, date=None, distance_mm=None, description=None, processed=None):
+        """
+        This method restricts the datasets to those that meet the given conditions, as per
+        catalog.DatasetCatalog.filter. Returns the number of selected datasets.
+        """
+        self.entries = self.catalog.filter(
+            date=date, distance_mm=distance_mm, description=description, processed=processed
         )
-            for f in sorted(os.listdir(self.basedir))
-                if os.path.isfile(os.path.join(self.basedir, f))
-                    and f.endswith(DatasetsManager.DATASET_EXT)
-        ]
+        self.datasets = self.catalog.datasets(self.entries)
+        return len(self.datasets)
+
+    @staticmethod
+    def is_dataset(basedir, filename):
+        """Whether the given file is a dataset, see catalog.is_dataset"""
+        return catalog.is_dataset(basedir, filename)
+
+    @staticmethod
+    def parse_name(filepath):
+        """Fields of the name of a dataset file, see catalog.parse_name"""
+        return catalog.parse_name(filepath)
+
+    def results(self):
+        """
+        This method returns a query over the stored results of the datasets that were already analyzed.
+        Only the names of the datasets are parsed, the files with the results are opened lazily.
+        """
+        return results.ResultsQuery([
+            results.DatasetResults(filepath, **dict(self.parse_name(ds[2]), fps=ds[0]))
+            for ds in self.datasets
+            for filepath in [os.path.join(os.path.splitext(ds[2])[0], results.DatasetResults.FILENAME)]
+                if os.path.isfile(filepath)
+        ])
+
+    def query(self, name, distance_mm=None, description=None):
+        """
+        This method logs the value with the given name for each analyzed dataset, optionally filtered by
+        distance and by (the beginning of) the description.
+        """
+        query = self.results()
+        if distance_mm is not None:
+            query = query.filter(distance_mm=distance_mm)
+        if description is not None:
+            query = query.filter(description=lambda d: d.startswith(description))
+
+        values = query.values(name)
+        self._l.info(f"{name} = \n\t" + "\n\t".join([
+            "{:40} {}".format(ds_name, value) for ds_name, value in values.items()
+        ]))
+        return values
 
     def __str__(self):
         return "\n\t".join(["FPS = {:2}, file = {}".format(ds[0], ds[2]) for ds in self.datasets])
 
     def list(self):
-        self._l.info(f"datasets = \n\t{str(self)}")
+        """This method logs the datasets with what the catalog knows about them"""
+        self._l.info("datasets = \n\t" + "\n\t".join(["{:>4} {:3} {:>10} {:>10} {:9} {}".format(
+            'fps', 'dmm', 'frames', 'max dT', 'processed', 'file'
+        )] + [
+            "{:4} {:3} {:10} {:>10} {:9} {}".format(
+                entry['fps'], entry['distance_mm'], entry['no_frames'],
+                "{:.3f}".format(entry['summary']['max_dT_value']) if 'max_dT_value' in entry['summary'] else '-',
+                'yes' if entry['processed'] else 'no', entry['filepath']
+            )
+            for entry in self.entries
+        ]))
 
-    def analyze(self, index, update=False):
+    def analyze(self, index, update=False, profile=False, profile_stage=None):
         ds = self.datasets[index]
-        processor.MLX90640Processor(*ds, update=update)
+        processor.MLX90640Processor(*ds, update=update, profile=profile, profile_stage=profile_stage)
+
+    def analyze_all(self, update=False, workers=1, profile=False, profile_stage=None):
+        """
+        This method analyzes all the datasets, one per process of a pool with the given number of workers
+        (sequentially with 1 worker). Errors are isolated per dataset and, at the end, a summary with the
+        result and the time spent on each dataset is logged. When profiled, the reports of all the datasets
+        are also aggregated per stage, into profile.json under the base directory.
+        """
+        start = time.perf_counter()
+
+        if workers == 1:
+            results = [
+                _analyze(ds, update=update, profile=profile, profile_stage=profile_stage) for ds in self.datasets
+            ]
+        else:
+            # the CPUs are shared among the frame renderers of the datasets being analyzed at the same time
+            render_workers = max(1, (os.cpu_count() or 1) // workers)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [
+                    executor.submit(_analyze, ds, update, render_workers, profile, profile_stage)
+                    for ds in self.datasets
+                ]
+                results = []
+                for ds, future in zip(self.datasets, futures):
+                    try:
+                        results.append(future.result())
+                    except Exception as ex:
+                        results.append((ds, f"worker failed, msg = {ex}", 0., None))
+
+        elapsed_s = time.perf_counter() - start
+        self.summary(results, elapsed_s)
+        if profile or profile_stage is not None:
+            self.profile_summary(results, elapsed_s)
+        return results
+
+    def summary(self, results, elapsed_s):
+        """
+        This method logs the summary of the analysis of several datasets, as returned by analyze_all, and
+        returns its totals: number of datasets, ok, failed and elapsed_s.
+        """
+        for ds, error, _, _ in results:
+            if error is not None:
+                self._l.error(f"Exception while processing dataset {ds}, msg = {error}")
+
+        failed = sum(1 for _, error, _, _ in results if error is not None)
+        self._l.info(
+            f"Analyzed {len(results)} datasets in {elapsed_s:.3f} (s), ok = {len(results) - failed}, failed = {failed}\n\t" +
+            "\n\t".join([
+                "{:6} {:10.3f} (s) {}".format("ok" if error is None else "FAILED", ds_elapsed_s, ds[2])
+                for ds, error, ds_elapsed_s, _ in results
+            ])
+        )
+        return dict(datasets=len(results), ok=len(results) - failed, failed=failed, elapsed_s=elapsed_s)
+
+    def profile_summary(self, results, elapsed_s):
+        """
+        This method aggregates the profiles of the datasets, as returned by analyze_all, adding up the times
+        and counters of each stage. The aggregate is logged and written, together with the profile of each
+        dataset, into profile.json under the base directory.
+        """
+        reports = {os.path.basename(ds[2]): report for ds, _, _, report in results if report is not None}
 
-    def analyze_all(self, update=False):
-        for ds_index in range(len(self.datasets)):
-            try:
-                self.analyze(ds_index, update=update)
-            except Exception as ex:
-                self._l.error(f"Exception while processing dataset {self.datasets[ds_index]}, msg = {ex}")
+        stages, counters = {}, {}
+        for report in reports.values():
+            for name, stage in report['stages'].items():
+                total = stages.setdefault(name, dict(calls=0, wall_s=0., cpu_s=0., children_cpu_s=0.))
+                for key, value in stage.items():
+                    total[key] += value
+            for name, value in report['counters'].items():
+                counters[name] = counters.get(name, 0) + value
+
+        aggregate = dict(
+            wall_s=elapsed_s, peak_rss_mb=max([r['peak_rss_mb'] for r in reports.values()], default=0.),
+            stages=stages, counters=counters
+        )
+        with open(os.path.join(self.basedir, profiling.StageProfiler.REPORT_FILENAME), 'w') as f:
+            json.dump(dict(total=aggregate, datasets=reports), f, indent=1)
+
+        self._l.info(f"Profile of {len(reports)} datasets:\n\t{profiling.StageProfiler.format(aggregate)}")
 
     @staticmethod
     def create(argv):
@@ -85,9 +240,9 @@ class DatasetsManager(logger.LoggingClass):
         )
         parser.add_argument(
             "-d", "--directory",
-            type=files.is_writable_dir, required=True,
+            type=files.is_writable_dir, required=True, nargs='+',
             metavar="FILE", default=os.getcwd(),
-            help="Directory with the datasets"
+            help="Directory with the datasets, or several of them"
         )
         parser.add_argument(
             "-a", "--analyze",
@@ -95,16 +250,88 @@ class DatasetsManager(logger.LoggingClass):
             help="Analyzes the dataset whose index is given as a parameter of the call"
         )
 
+        parser.add_argument(
+            "-w", "--workers",
+            type=int, required=False, default=1,
+            help="Number of datasets analyzed in parallel with '-a -1', each in its own process"
+        )
+
+        parser.add_argument(
+            "-P", "--profile",
+            action='store_true', required=False,
+            help="Writes a report with the time spent on each stage, per dataset and aggregated (profile.json)"
+        )
+        parser.add_argument(
+            "--profile-stage",
+            choices=processor.MLX90640Processor.STAGES, required=False,
+            help="Profiles the given stage of each dataset with cProfile (profile-STAGE.prof)"
+        )
+
+        parser.add_argument(
+            "-q", "--query",
+            type=str, required=False, metavar="NAME",
+            help="Shows the given result (max_dT_value, diff...) of every dataset already analyzed"
+        )
+        parser.add_argument(
+            "--date",
+            type=str, required=False,
+            help="Only considers the datasets whose date starts as given (2020, 202005...)"
+        )
+        parser.add_argument(
+            "--distance-mm",
+            type=int, required=False,
+            help="Only considers the datasets taken at the given distance"
+        )
+        parser.add_argument(
+            "--description",
+            type=str, required=False,
+            help="Only considers the datasets whose description starts as given"
+        )
+        parser.add_argument(
+            "--pending",
+            action='store_true', required=False,
+            help="Only considers the datasets that were not analyzed yet"
+        )
+
+        parser.add_argument(
+            "--set-fps",
+            nargs=2, required=False, metavar=("NAME", "FPS"),
+            help="Overrides the frames per second of the dataset with the given name ('-' to remove it)"
+        )
+        parser.add_argument(
+            "--no-hash",
+            action='store_true', required=False,
+            help="Does not calculate the SHA-256 of the new or modified datasets for the catalog"
+        )
+
         args = parser.parse_args(argv)
 
+        manager = DatasetsManager(args.directory, hashes=not args.no_hash)
+        if args.set_fps is not None:
+            name, fps = args.set_fps
+            if not manager.catalog.set_fps(name, None if fps == '-' else int(fps)):
+                raise ValueError(f"Dataset {name} not found")
+            manager = DatasetsManager(args.directory, hashes=not args.no_hash)
+        manager.select(
+            date=args.date, distance_mm=args.distance_mm, description=args.description,
+            processed=False if args.pending else None
+        )
+
         if 'list' in args and args.list:
-            DatasetsManager(args.directory).list()
-        if 'analyze' in args and args.analyze:
+            manager.list()
+        if 'analyze' in args and args.analyze is not None:
             index = args.analyze
             if (index == -1):
-                DatasetsManager(args.directory).analyze_all(update=args.update)
+                manager.analyze_all(
+                    update=args.update, workers=args.workers, profile=args.profile, profile_stage=args.profile_stage
+                )
             else:
-                DatasetsManager(args.directory).analyze(args.analyze, update=args.update)
+                manager.analyze(
+                    args.analyze, update=args.update, profile=args.profile, profile_stage=args.profile_stage
+                )
+        if 'query' in args and args.query is not None:
+            manager.query(args.query)
+        return manager
 
 
 if __name__ == "__main__":
@@ -0,0 +1,319 @@
+"""Incremental analysis of a RAW file that is still being written by the streamer."""
+
+import argparse
+import json
+import numpy as np
+import os
+import sys
+import time
+
+from xpython.common import logger
+
+from processor import analysis, processor, rawdataset, results, temporal
+
+
+class MLX90640Follower(logger.LoggingClass):
+    """RAW file follower
+    This class follows (tails) a RAW file while rawrgb keeps appending frames to it, as streamer.sh does
+    with $DATASETBIN during an experiment. Only complete frames are read; a partially written frame is left
+    in the file until the rest of it arrives. Every block of new frames is analyzed at once and appended to
+    the time-dependent vectors, whose storage grows geometrically, hence the memory needed per frame is
+    constant. The maximum dT and T2REF are kept up to date with every block, as are the temporal analytics
+    of the reference pixels and their difference (see temporal.OnlineTemporalAnalysis), and a summary of
+    the results is written periodically into a JSON file.
+
+    If the file is removed and created again (streamer.sh removes it when it starts), the results are
+    reset and the new file is followed from its beginning.
+    """
+
+    VECTORS         = ('t0', 't1', 't2', 'diff', 'min', 'max')
+    CAPACITY        = 4096
+
+    def __init__(
+        self,
+        fps, distance_mm, raw_filepath,
+        px_distance_mm=20,
+        summary_filepath=None, summary_interval_s=10.,
+        poll_interval_s=0.5, idle_timeout_s=None,
+        window_s=temporal.TemporalAnalysis.WINDOW_S
+    ):
+        """Default constructor
+        fps                     - frames per second, necessary to calculate the timeline
+        distance_mm             - mm of distance from the camera to the target material
+        raw_filepath            - path to the binary file with the RAW frames, being written
+        px_distance_mm=20       - mm of distance from P0 to P1 or P2
+        summary_filepath=None   - path to the JSON file with the live summary, None for <raw_filepath>.json
+        summary_interval_s=10   - seconds in between updates of the live summary
+        poll_interval_s=0.5     - seconds to wait before checking again for new frames
+        idle_timeout_s=None     - seconds without new frames after which the file is considered complete,
+                                    None to follow the file until interrupted
+        window_s=10             - seconds of the trailing window for the moving averages and slopes
+        """
+        super(MLX90640Follower, self).__init__()
+
+        self.fps = fps
+        self.distance_mm = distance_mm
+        self.raw_filepath = raw_filepath
+        self.px_distance_mm = px_distance_mm
+        self.summary_filepath = summary_filepath or raw_filepath + '.json'
+        self.summary_interval_s = summary_interval_s
+        self.poll_interval_s = poll_interval_s
+        self.idle_timeout_s = idle_timeout_s
+        self.window_s = window_s
+
+        _, _, self.ref_pixels = processor.MLX90640Processor.reference_pixels(distance_mm, px_distance_mm)
+
+        self._file = None
+        self._inode = None
+        self.reset()
+
+    def reset(self):
+        """Discards all the results, to start over from the beginning of the file"""
+        self.offset = 0
+        self.no_read = 0
+        self.no_frames = 0
+        self.no_skipped = 0
+        self._vectors = {name: np.zeros(self.CAPACITY) for name in self.VECTORS}
+
+        self.max_dT_value = self.max_T2REF_value = -np.inf
+        self.max_dT_index = self.max_T2REF_index = -1
+
+        self.temporal = temporal.OnlineTemporalAnalysis(
+            self.fps, ('t0', 't1', 't2', 'diff'), window_s=self.window_s
+        )
+
+    def __getattr__(self, name):
+        """The time-dependent vectors (t0, t1, t2, diff, min, max) only include the frames analyzed so far"""
+        if name in MLX90640Follower.VECTORS:
+            return self.__dict__['_vectors'][name][:self.no_frames]
+        raise AttributeError(name)
+
+    @property
+    def duration(self):
+        return self.no_frames / self.fps
+
+    @property
+    def t(self):
+        return np.linspace(0., self.duration, num=self.no_frames)
+
+    @property
+    def max_dT_time(self):
+        return self.max_dT_index / self.fps
+
+    @property
+    def max_T2REF_time(self):
+        return self.max_T2REF_index / self.fps
+
+    def _open(self):
+        """Opens the file, if it exists; whenever it is replaced by a new file, the results are reset"""
+        try:
+            inode = os.stat(self.raw_filepath).st_ino
+        except FileNotFoundError:
+            return False
+
+        if self._file is not None and inode == self._inode:
+            return True
+        if self._file is not None:
+            self._l.warning(f"File {self.raw_filepath} was replaced, starting over")
+            self._file.close()
+            self.reset()
+
+        self._file = open(self.raw_filepath, 'rb')
+        self._inode = inode
+        return True
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _append(self, block):
+        """Appends the results of the analysis of a block of frames to the vectors"""
+        size = self.no_frames + block.no_frames
+        capacity = self._vectors['diff'].shape[0]
+        if size > capacity:
+            capacity = max(size, 2 * capacity)
+            for name in self.VECTORS:
+                vector = np.zeros(capacity)
+                vector[:self.no_frames] = self._vectors[name][:self.no_frames]
+                self._vectors[name] = vector
+
+        for name in self.VECTORS:
+            self._vectors[name][self.no_frames:size] = getattr(block, name)
+        for values in np.stack([block.t0, block.t1, block.t2, block.diff], axis=1):
+            self.temporal.update(values)
+
+        # the first occurrence of the maximum is kept, as postprocess() does for the whole dataset
+        index = np.argmax(block.diff)
+        if block.diff[index] > self.max_dT_value:
+            self.max_dT_value = float(block.diff[index])
+            self.max_dT_index = self.no_frames + int(index)
+        index = np.argmax(block.t2)
+        if block.t2[index] > self.max_T2REF_value:
+            self.max_T2REF_value = float(block.t2[index])
+            self.max_T2REF_index = self.no_frames + int(index)
+
+        self.no_frames = size
+
+    def poll(self):
+        """
+        This method reads and analyzes the complete frames appended to the file since the last call, at most
+        CHUNK_FRAMES at a time. Frames with NaN values are skipped, as the processor does.
+        Returns the number of frames read.
+        """
+        if not self._open():
+            return 0
+
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self.offset:
+            self._l.warning(f"File {self.raw_filepath} was truncated, starting over")
+            self.reset()
+
+        count = min((size - self.offset) // rawdataset.RawDataset.SIZE_FRAME, rawdataset.RawDataset.CHUNK_FRAMES)
+        if count == 0:
+            return 0
+
+        self._file.seek(self.offset)
+        frames = np.frombuffer(
+            self._file.read(count * rawdataset.RawDataset.SIZE_FRAME), dtype=rawdataset.RawDataset.DTYPE
+        ).reshape(count, rawdataset.RawDataset.PIXELS_Y, rawdataset.RawDataset.PIXELS_X)
+        self.offset += count * rawdataset.RawDataset.SIZE_FRAME
+        self.no_read += count
+
+        valid = ~np.isnan(frames).any(axis=(1, 2))
+        if not valid.all():
+            self.no_skipped += int(count - valid.sum())
+            self._l.warning(f"Skipping {count - valid.sum()} frames with NaN values")
+            frames = frames[valid]
+
+        if frames.shape[0] > 0:
+            self._append(analysis.MLX90640Analysis(frames, self.ref_pixels))
+        return count
+
+    def summary(self):
+        """Dictionary with the summary of the results of the frames analyzed so far"""
+        summary = dict(
+            raw_filepath=self.raw_filepath, updated=time.time(),
+            no_read=self.no_read, no_frames=self.no_frames, no_skipped=self.no_skipped, duration=self.duration
+        )
+        if self.no_frames > 0:
+            summary.update(
+                last={name: float(self._vectors[name][self.no_frames - 1]) for name in self.VECTORS},
+                max_dT_value=self.max_dT_value, max_dT_index=self.max_dT_index, max_dT_time=self.max_dT_time,
+                max_T2REF_value=self.max_T2REF_value, max_T2REF_index=self.max_T2REF_index,
+                max_T2REF_time=self.max_T2REF_time, temporal=self.temporal.summary()
+            )
+        return summary
+
+    def write_summary(self):
+        """Writes the summary into the JSON file, replacing the previous one atomically"""
+        tmp_filepath = self.summary_filepath + '.tmp'
+        with open(tmp_filepath, 'w') as f:
+            json.dump(self.summary(), f, indent=1)
+        os.replace(tmp_filepath, self.summary_filepath)
+
+    def save_results(self, filepath):
+        """
+        This method stores the results in the same columnar format as the processor, so that the dataset
+        does not need to be processed again just to query them.
+        """
+        results.DatasetResults.save(
+            filepath,
+            columns=dict(t=self.t, **{name: getattr(self, name) for name in self.VECTORS}),
+            scalars={name: getattr(self, name) for name in results.DatasetResults.SCALARS},
+            metadata=dict(
+                name=os.path.splitext(os.path.basename(self.raw_filepath))[0], fps=self.fps,
+                distance_mm=self.distance_mm, px_distance_mm=self.px_distance_mm, ref_pixels=self.ref_pixels
+            )
+        )
+
+    def follow(self):
+        """
+        This method follows the file until no new frames are read for idle_timeout_s or until interrupted,
+        writing the summary every summary_interval_s and once more at the end.
+        """
+        self._l.info(f"Following {self.raw_filepath}, summary = {self.summary_filepath}")
+        last_frame = last_summary = time.monotonic()
+
+        try:
+            while True:
+                count = self.poll()
+                now = time.monotonic()
+                if count > 0:
+                    last_frame = now
+                elif self.idle_timeout_s is not None and now - last_frame >= self.idle_timeout_s:
+                    self._l.info(f"No new frames for {self.idle_timeout_s} (s), stopping")
+                    break
+
+                if now - last_summary >= self.summary_interval_s:
+                    self.write_summary()
+                    last_summary = now
+                    self._l.info(
+                        f"{self.no_frames} frames, {self.duration:.1f} (s), max dT = {self.max_dT_value:2.3f} (degC)"
+                    )
+
+                if count < rawdataset.RawDataset.CHUNK_FRAMES:
+                    time.sleep(self.poll_interval_s)
+        except KeyboardInterrupt:
+            self._l.info("Interrupted, stopping")
+        finally:
+            self.close()
+            self.write_summary()
+
+    @staticmethod
+    def create(argv):
+        """Factory method to instantiate the class using the arguments from the CLI"""
+
+        parser = argparse.ArgumentParser(description="Follows a file with raw data from MLX90640 being written")
+        parser.add_argument(
+            "-r", "--raw_file",
+            type=str, metavar="FILE", required=True,
+            help="Path to the binary file to be followed, it might not exist yet"
+        )
+        parser.add_argument(
+            "-f", "--fps", type=int, required=True,
+            help="Frames per second, required for timing calculation"
+        )
+        parser.add_argument(
+            "-d", "--distance", type=float, required=True,
+            help="Distance in mm from the output of the lens' telescope to the target material"
+        )
+        parser.add_argument(
+            "-x", "--px-distance", type=float, required=False, default=20,
+            help="Distance in mm from the reference pixel P0 to P1 or P2"
+        )
+        parser.add_argument(
+            "-s", "--summary", type=str, metavar="FILE", required=False,
+            help="Path to the JSON file with the live summary, <raw_file>.json by default"
+        )
+        parser.add_argument(
+            "-i", "--interval", type=float, required=False, default=10.,
+            help="Seconds in between updates of the live summary"
+        )
+        parser.add_argument(
+            "-t", "--timeout", type=float, required=False,
+            help="Stops after this many seconds without new frames, follows until interrupted by default"
+        )
+        parser.add_argument(
+            "-w", "--window", type=float, required=False, default=temporal.TemporalAnalysis.WINDOW_S,
+            help="Seconds of the trailing window for the moving averages and the slopes"
+        )
+        parser.add_argument(
+            "-o", "--results", type=str, metavar="FILE", required=False,
+            help="Path to the .npz file where the results are stored when following stops"
+        )
+
+        args = parser.parse_args(argv)
+        follower = MLX90640Follower(
+            args.fps, args.distance, args.raw_file, px_distance_mm=args.px_distance,
+            summary_filepath=args.summary, summary_interval_s=args.interval, idle_timeout_s=args.timeout,
+            window_s=args.window
+        )
+        follower.follow()
+        if args.results is not None and follower.no_frames > 0:
+            follower.save_results(args.results)
+        return follower
+
+
+if __name__ == "__main__":
+    follower = MLX90640Follower.create(sys.argv[1:])
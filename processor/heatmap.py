@@ -0,0 +1,133 @@
+"""False-colour rendering of frames from MLX90640 with NumPy, as done by the streamer."""
+
+import numpy as np
+
+from xpython.common import logger
+
+
+class HeatmapRenderer(logger.LoggingClass):
+    """Heatmap renderer
+    This class converts batches of frames into false-colour RGB images with the same 7 colour heatmap that
+    pixel2colour/raw2rgb use in src/streamer.cpp (black, blue, green, yellow, red, magenta and white for
+    the temperatures within [VMIN, VMAX]). Instead of interpolating the colours for every pixel, the
+    colours are precomputed in a lookup table, indexed by the quantized temperatures.
+
+    The images can be upscaled either with nearest or bilinear interpolation; the bilinear interpolation
+    is applied to the temperatures, before the lookup table.
+    """
+
+    COLOURS         = np.array([[0, 0, 0], [0, 0, 1], [0, 1, 0], [1, 1, 0], [1, 0, 0], [1, 0, 1], [1, 1, 1]])
+
+    VMIN            = -15.
+    VMAX            = +120.
+    LUT_SIZE        = 4096
+    LUT_SIZE_MAX    = np.iinfo(np.uint16).max + 1
+    SIZE            = (480, 640)
+    INTERPOLATIONS  = ('nearest', 'bilinear')
+
+    def __init__(self, vmin=VMIN, vmax=VMAX, size=SIZE, interpolation='nearest', flip=True, lut_size=LUT_SIZE):
+        """Default constructor
+        vmin=VMIN               - temperature for the first colour of the heatmap (black)
+        vmax=VMAX               - temperature for the last colour of the heatmap (white)
+        size=SIZE               - (height, width) of the output images, None to keep the sensor resolution
+        interpolation='nearest' - interpolation for the upscaling, 'nearest' or 'bilinear'
+        flip=True               - whether to flip the rows of the frames, as raw2rgb does with the sensor data
+        lut_size=LUT_SIZE       - number of entries of the lookup table
+        """
+        super(HeatmapRenderer, self).__init__()
+
+        if interpolation not in self.INTERPOLATIONS:
+            raise ValueError(f"Interpolation <{interpolation}> not supported, choose one of {self.INTERPOLATIONS}")
+        if lut_size > self.LUT_SIZE_MAX:
+            raise ValueError(f"Lookup table size {lut_size} exceeds the maximum of {self.LUT_SIZE_MAX}")
+
+        self.vmin = vmin
+        self.vmax = vmax
+        self.size = size
+        self.interpolation = interpolation
+        self.flip = flip
+        self.lut = self.lookup_table(lut_size)
+
+        self._weights = {}
+
+    def lookup_table(self, lut_size):
+        """
+        This method calculates the RGB colours for lut_size temperatures evenly distributed within
+        [vmin, vmax], with the same linear interpolation in between colours as pixel2colour.
+        """
+        v = np.linspace(0., 1., lut_size) * (len(self.COLOURS) - 1)
+        idx1 = np.minimum(np.floor(v).astype(int), len(self.COLOURS) - 1)
+        idx2 = np.minimum(idx1 + 1, len(self.COLOURS) - 1)
+        fract = (v - idx1)[:, np.newaxis]
+
+        colours = (self.COLOURS[idx2] - self.COLOURS[idx1]) * fract + self.COLOURS[idx1]
+        return (colours * 255.).astype(np.uint8)
+
+    def indexes(self, frames):
+        """
+        This method quantizes the given temperatures into indexes for the lookup table. Temperatures out
+        of [vmin, vmax] are saturated and NaN values are rendered with the first colour.
+        """
+        scale = np.float32((self.lut.shape[0] - 1) / (self.vmax - self.vmin))
+        indexes = np.nan_to_num((frames - np.float32(self.vmin)) * scale, nan=0.)
+        np.clip(indexes, 0, self.lut.shape[0] - 1, out=indexes)
+        return indexes.astype(np.uint16)
+
+    @staticmethod
+    def _bilinear_weights(length, source_length):
+        """(length, source_length) matrix with the weights for a bilinear interpolation along one axis"""
+        position = np.clip((np.arange(length) + 0.5) * source_length / length - 0.5, 0, source_length - 1)
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, source_length - 1)
+        fract = position - lower
+
+        weights = np.zeros((length, source_length), dtype=np.float32)
+        weights[np.arange(length), lower] += 1. - fract
+        weights[np.arange(length), upper] += fract
+        return weights
+
+    def upscale(self, frames):
+        """
+        This method upscales the given (N, PIXELS_Y, PIXELS_X) temperatures to (N, height, width). The nearest
+        interpolation also accepts (N, PIXELS_Y, PIXELS_X, 3) RGB images.
+        """
+        height, width = self.size
+        rows, columns = frames.shape[1:3]
+
+        if self.interpolation == 'nearest':
+            if height % rows == 0 and width % columns == 0:
+                # integer factors (640x480 from 32x24): each pixel is just repeated along both axes
+                return frames.repeat(height // rows, axis=1).repeat(width // columns, axis=2)
+            return frames[:, (np.arange(height) * rows) // height][:, :, (np.arange(width) * columns) // width]
+
+        key = (rows, columns)
+        if key not in self._weights:
+            self._weights[key] = (
+                self._bilinear_weights(height, rows), self._bilinear_weights(width, columns).T
+            )
+        weights_y, weights_x = self._weights[key]
+        return weights_y @ np.nan_to_num(frames.astype(np.float32), nan=self.vmin) @ weights_x
+
+    def render(self, frames):
+        """
+        This method renders the given frames as false-colour RGB images.
+        frames  - (N, PIXELS_Y, PIXELS_X) array with the temperatures, or a single (PIXELS_Y, PIXELS_X) frame
+        returns - (N, height, width, 3) uint8 array with the RGB images, or (height, width, 3) for one frame
+        """
+        frames = np.asarray(frames)
+        single = frames.ndim == 2
+        if single:
+            frames = frames[np.newaxis]
+
+        if self.flip:
+            frames = frames[:, ::-1]
+
+        if self.size is not None and self.interpolation == 'bilinear':
+            images = self.lut[self.indexes(self.upscale(frames))]
+        else:
+            images = self.lut[self.indexes(frames)]
+            if self.size is not None:
+                images = self.upscale(images)
+
+        images = np.ascontiguousarray(images)
+        return images[0] if single else images
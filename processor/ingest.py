@@ -0,0 +1,368 @@
+"""Asyncio ingest server for the framed UDP streams of several MLX90640 sensors at once."""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import numpy as np
+import os
+import sys
+import time
+
+from xpython.common import logger
+
+from processor import analysis, processor, protocol, rawdataset, receiver, temporal
+
+
+class IngestSource(logger.LoggingClass):
+    """Ingested sensor
+    This class receives the framed stream of one sensor on its own UDP port (see receiver.MLX90640Receiver)
+    and passes its RAW frames, through a queue of at most queue_frames frames, to a writer task that writes
+    them into the RAW file of the sensor and keeps its live statistics.
+
+    The writer takes all the frames waiting in the queue at once, analyzes them as a block and writes them
+    with a single call, run in the executor so that a slow disk never blocks the event loop. Each source
+    has at most one write in progress: when its disk falls behind, its queue fills up and the new frames
+    of that source are dropped (overflow), while the rest of the sources go on. The frames that are not
+    written, either dropped by the network or by an overflow, are written as frames of NaN values (as the
+    receiver does), so that the position of each frame in the file still gives its capture time. A sequence
+    number that goes backwards (the streamer restarted) or jumps more than MAX_GAP ahead starts a new stream
+    (as in the assembler of the receiver) and nothing is filled in for it.
+    """
+
+    QUEUE_FRAMES    = 256
+    BATCH_FRAMES    = 64
+    MAX_GAP         = receiver.FrameAssembler.MAX_GAP
+
+    def __init__(
+        self, name, port, raw_filepath, ref_pixels, fps,
+        queue_frames=QUEUE_FRAMES, fill_dropped=True, window_s=temporal.TemporalAnalysis.WINDOW_S
+    ):
+        """Default constructor
+        name                - name of the sensor, for the logs and the statistics
+        port                - UDP port where the stream of the sensor is received
+        raw_filepath        - path to the file where the RAW frames are written, None to not write them
+        ref_pixels          - (REF_PIXEL_0, REF_PIXEL_1, REF_PIXEL_2), for the live statistics
+        fps                 - frames per second of the sensor, for the live temporal analytics
+        queue_frames=256    - maximum number of frames waiting to be written
+        fill_dropped=True   - whether to write a frame of NaN values in place of each frame not received
+        window_s=10         - seconds of the trailing window for the moving averages and slopes
+        """
+        super(IngestSource, self).__init__()
+
+        self.name = name
+        self.port = port
+        self.raw_filepath = raw_filepath
+        self.ref_pixels = ref_pixels
+        self.fill_dropped = fill_dropped
+
+        self.receiver = receiver.MLX90640Receiver(on_frame=self._on_frame)
+        self.queue = asyncio.Queue(maxsize=queue_frames)
+        self.temporal = temporal.OnlineTemporalAnalysis(fps, ('t0', 't1', 't2', 'diff'), window_s=window_s)
+        self._file = open(raw_filepath, 'wb') if raw_filepath is not None else None
+        self._nan_frame = np.full(rawdataset.RawDataset.PIXELS_FRAME, np.nan, dtype=rawdataset.RawDataset.DTYPE)
+        self._next_sequence = None
+        self._transport = None
+
+        self.no_queued = 0
+        self.no_overflow = 0
+        self.no_written = 0
+        self.no_filled = 0
+        self.no_writes = 0
+        self.no_restarts = 0
+        self.max_queued = 0
+        self.write_s = 0.
+        self.latest = None
+        self.max_dT_value = -np.inf
+
+    def _on_frame(self, payload_type, sequence, timestamp_us, payload):
+        """Queues the received RAW frames, the dropped ones are filled in by the writer out of the gaps"""
+        if payload_type != protocol.TYPE_RAW or payload is None:
+            return
+        try:
+            self.queue.put_nowait((sequence, payload))
+        except asyncio.QueueFull:
+            self.no_overflow += 1
+            return
+        self.no_queued += 1
+        self.max_queued = max(self.max_queued, self.queue.qsize())
+
+    async def listen(self, host):
+        """Starts receiving the datagrams of this sensor"""
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: receiver._DatagramProtocol(self.receiver), local_addr=(host, self.port)
+        )
+        self._l.info(f"Receiving <{self.name}> on <{host}:{self.port}>, output = {self.raw_filepath}")
+
+    async def stop(self):
+        """Stops receiving, delivers the pending frames and tells the writer to finish"""
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        self.receiver.close()
+        await self.queue.put(None)
+
+    def analyze(self, frames):
+        """Updates the live statistics with the given (N, PIXELS_Y, PIXELS_X) block of received frames"""
+        block = analysis.MLX90640Analysis(frames, self.ref_pixels)
+        for values in zip(block.t0, block.t1, block.t2, block.diff):
+            self.temporal.update(values)
+        index = int(np.argmax(block.diff))
+        self.max_dT_value = max(self.max_dT_value, float(block.diff[index]))
+        self.latest = dict(
+            t0=float(block.t0[-1]), t1=float(block.t1[-1]), t2=float(block.t2[-1]), diff=float(block.diff[-1]),
+            min=float(block.min[-1]), max=float(block.max[-1])
+        )
+
+    def _write(self, data):
+        self._file.write(data)
+        self._file.flush()
+
+    async def run(self, executor):
+        """
+        This method is the writer task of this source: it writes and analyzes the queued frames in batches,
+        until stop() is called and the queue is drained. The file is closed at the end.
+        """
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            items = [await self.queue.get()]
+            while len(items) < self.BATCH_FRAMES and not self.queue.empty():
+                items.append(self.queue.get_nowait())
+            if items[-1] is None:
+                items.pop()
+                done = True
+            if not items:
+                continue
+
+            chunks = []
+            for sequence, payload in items:
+                gap = 0 if self._next_sequence is None else sequence - self._next_sequence
+                if gap < 0 or gap > self.MAX_GAP:
+                    self._l.warning(f"<{self.name}> sequence jumps from {self._next_sequence - 1} to {sequence}")
+                    self.no_restarts += 1
+                elif gap > 0 and self.fill_dropped:
+                    chunks.append(self._nan_frame.tobytes() * gap)
+                    self.no_filled += gap
+                chunks.append(payload)
+                self._next_sequence = sequence + 1
+
+            frames = np.frombuffer(b''.join(payload for _, payload in items), dtype=rawdataset.RawDataset.DTYPE)
+            self.analyze(frames.reshape(-1, rawdataset.RawDataset.PIXELS_Y, rawdataset.RawDataset.PIXELS_X))
+
+            if self._file is not None:
+                started = time.perf_counter()
+                try:
+                    await loop.run_in_executor(executor, self._write, b''.join(chunks))
+                except OSError as ex:
+                    # the stream is still received and analyzed, so that the rest of the sensors go on
+                    self._l.error(f"Could not write into {self.raw_filepath}, not writing anymore, msg = {ex}")
+                    self._file.close()
+                    self._file = None
+                    continue
+                self.write_s += time.perf_counter() - started
+                self.no_writes += 1
+                self.no_written += len(items)
+
+        if self._file is not None:
+            await loop.run_in_executor(executor, self._file.close)
+            self._file = None
+
+    def stats(self):
+        """Dictionary with the counters of the stream, of the queue and of the writes, and the live statistics"""
+        stream = self.receiver.stats()
+        raw = stream['types'].get(protocol.TYPE_RAW, {})
+        elapsed_s = stream['elapsed_s']
+        stats = dict(
+            port=self.port, raw_filepath=self.raw_filepath, datagrams=stream['datagrams'],
+            invalid=stream['invalid'], frames=raw.get('frames', 0), dropped=raw.get('dropped', 0),
+            queued=self.no_queued, overflow=self.no_overflow, written=self.no_written, filled=self.no_filled,
+            restarts=self.no_restarts, pending=self.queue.qsize(), max_pending=self.max_queued,
+            frames_s=self.temporal.no_frames / elapsed_s, bytes_s=stream['bytes_s'],
+            write_ms=1e3 * self.write_s / self.no_writes if self.no_writes else None,
+            latest=self.latest, max_dT_value=self.max_dT_value if self.latest is not None else None,
+            temporal=self.temporal.summary()['diff'] if self.temporal.no_frames else None
+        )
+        if 'latency_ms' in stream:
+            stats['latency_ms'] = stream['latency_ms']
+        return stats
+
+    def __str__(self):
+        stats = self.stats()
+        latest = stats['latest'] or {}
+        return (
+            f"{self.name}: {stats['frames_s']:.2f} frames/s, written = {stats['written']}, "
+            f"dropped = {stats['dropped']}, overflow = {stats['overflow']}, pending = {stats['pending']}" +
+            (f", dT = {latest['diff']:.3f} (max {stats['max_dT_value']:.3f})" if latest else "")
+        )
+
+
+class MLX90640Ingest(logger.LoggingClass):
+    """Multi-sensor ingest server
+    This class receives the framed streams (see protocol) of several sensors at once, each of them on its
+    own UDP port, from a single asyncio event loop. Every sensor is an IngestSource, with its own RAW file
+    in the output directory (<name>.raw), queue, writer task and live statistics; the writes of all of them
+    are run in a shared pool of threads with one thread per sensor (up to MAX_WORKERS), so that a slow disk
+    only delays the sensors that write into it. The counters and the live statistics of every sensor are
+    logged periodically and written into a JSON summary.
+    """
+
+    MAX_WORKERS = 32
+
+    def __init__(
+        self, sources, output_dirpath='.', fps=16, distance_mm=55, px_distance_mm=20,
+        queue_frames=IngestSource.QUEUE_FRAMES, fill_dropped=True, workers=None, summary_filepath=None,
+        window_s=temporal.TemporalAnalysis.WINDOW_S
+    ):
+        """Default constructor
+        sources                 - list of (name, port) or (name, port, distance_mm) tuples, one per sensor
+        output_dirpath='.'      - directory where the RAW files are written, None to not write them
+        fps=16                  - frames per second of the sensors
+        distance_mm=55          - mm of distance from the cameras to the target material, unless given per sensor
+        px_distance_mm=20       - mm of distance from P0 to P1 or P2
+        queue_frames=256        - maximum number of frames waiting to be written, per sensor
+        fill_dropped=True       - whether to write a frame of NaN values in place of each frame not received
+        workers=None            - number of threads for the writes, one per sensor (up to MAX_WORKERS) by default
+        summary_filepath=None   - path to the JSON summary, None for ingest.json in the output directory
+        window_s=10             - seconds of the trailing window for the moving averages and slopes
+        """
+        super(MLX90640Ingest, self).__init__()
+
+        names = [source[0] for source in sources]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Duplicated names of sources: {names}")
+
+        self.output_dirpath = output_dirpath
+        self.workers = workers or min(len(sources), self.MAX_WORKERS)
+        self.summary_filepath = summary_filepath
+        if summary_filepath is None and output_dirpath is not None:
+            self.summary_filepath = os.path.join(output_dirpath, 'ingest.json')
+
+        self.sources = []
+        for source in sources:
+            name, port = source[0], source[1]
+            _, _, ref_pixels = processor.MLX90640Processor.reference_pixels(
+                source[2] if len(source) > 2 else distance_mm, px_distance_mm
+            )
+            raw_filepath = os.path.join(output_dirpath, name + '.raw') if output_dirpath is not None else None
+            self.sources.append(IngestSource(
+                name, port, raw_filepath, ref_pixels, fps,
+                queue_frames=queue_frames, fill_dropped=fill_dropped, window_s=window_s
+            ))
+
+    def stats(self):
+        """Dictionary with the statistics of every sensor, by name"""
+        return {source.name: source.stats() for source in self.sources}
+
+    def __str__(self):
+        return "\n\t".join(str(source) for source in self.sources)
+
+    def write_summary(self):
+        """Writes the statistics of every sensor into the JSON summary, replacing the previous one atomically"""
+        if self.summary_filepath is None:
+            return
+        with open(self.summary_filepath + '.tmp', 'w') as f:
+            json.dump(self.stats(), f, indent=1)
+        os.replace(self.summary_filepath + '.tmp', self.summary_filepath)
+
+    async def serve(self, host='0.0.0.0', duration_s=None, stats_interval_s=5.):
+        """
+        This method receives the streams of all the sensors until duration_s elapses (forever when None) or
+        until cancelled, logging the statistics and writing the summary every stats_interval_s. All the
+        frames received are written before returning.
+        """
+        loop = asyncio.get_running_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ingest')
+        writers = [asyncio.ensure_future(source.run(executor)) for source in self.sources]
+
+        try:
+            for source in self.sources:
+                await source.listen(host)
+            deadline = None if duration_s is None else loop.time() + duration_s
+            while deadline is None or loop.time() < deadline:
+                interval_s = stats_interval_s if deadline is None else min(stats_interval_s, deadline - loop.time())
+                await asyncio.sleep(max(interval_s, 0.))
+                self._l.info(f"Ingest:\n\t{self}")
+                self.write_summary()
+        finally:
+            for source in self.sources:
+                await source.stop()
+            await asyncio.gather(*writers)
+            executor.shutdown(wait=True)
+            self.write_summary()
+            self._l.info(f"Ingest:\n\t{self}")
+
+    @staticmethod
+    def parse_source(definition):
+        """Parses the definition of a source from the CLI, NAME:PORT or NAME:PORT:DISTANCE_MM"""
+        fields = definition.split(':')
+        if len(fields) not in (2, 3):
+            raise argparse.ArgumentTypeError(f"Source <{definition}> is not NAME:PORT[:DISTANCE_MM]")
+        try:
+            return (fields[0], int(fields[1])) + tuple(float(field) for field in fields[2:])
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Source <{definition}> is not NAME:PORT[:DISTANCE_MM]")
+
+    @staticmethod
+    def create(argv):
+        """Factory method to instantiate the class using the arguments from the CLI"""
+
+        parser = argparse.ArgumentParser(description="Receives the framed UDP streams of several MLX90640 sensors")
+        parser.add_argument(
+            "-s", "--source", type=MLX90640Ingest.parse_source, nargs='+', required=True,
+            help="Sensors to be received, as NAME:PORT or NAME:PORT:DISTANCE_MM, written as NAME.raw"
+        )
+        parser.add_argument(
+            "-H", "--host", type=str, required=False, default='0.0.0.0',
+            help="Address to listen on"
+        )
+        parser.add_argument(
+            "-o", "--output", type=str, metavar="DIR", required=False, default='.',
+            help="Directory where the RAW files and the summary (ingest.json) are written"
+        )
+        parser.add_argument(
+            "-f", "--fps", type=int, required=False, default=16,
+            help="Frames per second of the sensors"
+        )
+        parser.add_argument(
+            "-d", "--distance", type=float, required=False, default=55,
+            help="Distance in mm from the output of the lens' telescope to the target material"
+        )
+        parser.add_argument(
+            "-q", "--queue", type=int, required=False, default=IngestSource.QUEUE_FRAMES,
+            help="Maximum number of frames waiting to be written, per sensor"
+        )
+        parser.add_argument(
+            "-w", "--workers", type=int, required=False,
+            help="Number of threads for the writes, one per sensor by default"
+        )
+        parser.add_argument(
+            "-t", "--timeout", type=float, required=False,
+            help="Seconds to receive for, until interrupted by default"
+        )
+        parser.add_argument(
+            "-i", "--interval", type=float, required=False, default=5.,
+            help="Seconds in between logs of the statistics"
+        )
+        parser.add_argument(
+            "-n", "--no-fill",
+            action='store_true', required=False,
+            help="Does not write frames of NaN values in place of the frames not received"
+        )
+
+        args = parser.parse_args(argv)
+        os.makedirs(args.output, exist_ok=True)
+        ingest = MLX90640Ingest(
+            args.source, output_dirpath=args.output, fps=args.fps, distance_mm=args.distance,
+            queue_frames=args.queue, fill_dropped=not args.no_fill, workers=args.workers
+        )
+        try:
+            asyncio.run(ingest.serve(args.host, duration_s=args.timeout, stats_interval_s=args.interval))
+        except KeyboardInterrupt:
+            pass
+        return ingest
+
+
+if __name__ == "__main__":
+    ingest = MLX90640Ingest.create(sys.argv[1:])
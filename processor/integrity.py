@@ -0,0 +1,552 @@
+"""Integrity scanner for the RAW files from MLX90640: damaged frames and pixels, and their repair."""
+
+import argparse
+import json
+import numpy as np
+import os
+import sys
+import time
+import warnings
+
+from xpython.common import files, logger
+
+from processor import rawdataset
+
+
+NAN         = 0x01
+INF         = 0x02
+RANGE       = 0x04
+ZERO        = 0x08
+DUPLICATE   = 0x10
+JUMP        = 0x20
+
+FLAGS = dict(nan=NAN, inf=INF, range=RANGE, zero=ZERO, duplicate=DUPLICATE, jump=JUMP)
+# frames that cannot be analyzed, the rest of the flags are only reported
+BAD = NAN | INF | RANGE | ZERO
+
+MODES = ('drop', 'interpolate')
+
+
+def runs(mask):
+    """List with the [start, stop) ranges of consecutive set elements of the given boolean vector"""
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    return edges.reshape(-1, 2).tolist()
+
+
+class IntegrityScanner(logger.LoggingClass):
+    """Integrity scanner
+    This class validates a RAW file in a single vectorized pass over its memory map, in chunks of
+    CHUNK_FRAMES frames, and reports:
+
+        tail        - the bytes of an incomplete frame at the end of the file
+        shifts      - the places where a partial write (a crash or a power cut of the streamer) left an
+                        incomplete frame within the file, shifting all the frames after it
+        frames      - the frames with NaN or infinite values, with values out of the range of the sensor,
+                        with all their values set to zero (as left by a power cut), identical to the previous
+                        one (duplicate) or with a sudden change of the whole frame (jump)
+        pixels      - the dead pixels (invalid in most of the frames), the stuck ones (whose value never
+                        changes) and the outliers (that keep away from all their neighbours), which are
+                        only reported, since they may be part of the scene as well
+
+    A shift is found when a jump (or the start of a run of invalid frames) goes away by rotating the next
+    frame by some bytes, which are those of the incomplete frame, and it is confirmed by the frame split by
+    the partial write and by the frames that follow it (a scene that moves by some rows, or the start of
+    another recording, can also be matched by a rotation). The file is realigned from there on, as
+    a sequence of aligned segments, and the incomplete frame is dropped; the indexes of the frames in the
+    report and in the repaired copy are those of the realigned sequence.
+
+    The repaired copy (repair) is a RAW file with the frames realigned, the bad frames dropped or linearly
+    interpolated out of the closest good ones and, only when requested, the bad pixels replaced by the mean
+    of their good neighbours.
+    """
+
+    PIXELS_Y        = rawdataset.RawDataset.PIXELS_Y
+    PIXELS_X        = rawdataset.RawDataset.PIXELS_X
+    PIXELS_FRAME    = rawdataset.RawDataset.PIXELS_FRAME
+    SIZE_FRAME      = rawdataset.RawDataset.SIZE_FRAME
+    DTYPE           = rawdataset.RawDataset.DTYPE
+    CHUNK_FRAMES    = rawdataset.RawDataset.CHUNK_FRAMES
+
+    # measurement range of MLX90640
+    T_MIN_C         = -40.
+    T_MAX_C         = 300.
+    # a jump is a mean absolute change larger than both JUMP_MIN_C and JUMP_FACTOR times the median one
+    JUMP_MIN_C      = 1.
+    JUMP_FACTOR     = 10.
+    # a shift is accepted when the rotated frame is that much closer to the previous one than the original
+    SHIFT_RATIO     = 0.5
+    # and confirmed when the realigned frames stay that much closer for the next SHIFT_FRAMES frames
+    SHIFT_FRAMES    = 4
+    # pixels invalid in more than this fraction of the frames are dead
+    DEAD_FRACTION   = 0.5
+    # minimum number of frames for the stuck pixels to be reported
+    STUCK_FRAMES    = 16
+    # median absolute difference (in degrees) with the closest neighbour above which a pixel is an outlier,
+    # the pixels within OUTLIER_BORDER pixels of the edges are not checked (vignetting)
+    OUTLIER_C       = 5.
+    OUTLIER_BORDER  = 3
+    OUTLIER_SAMPLES = 256
+
+    def __init__(self, raw_filepath, t_min_c=T_MIN_C, t_max_c=T_MAX_C, chunk_frames=CHUNK_FRAMES):
+        """Default constructor
+        raw_filepath            - path to the RAW file to be scanned
+        t_min_c=T_MIN_C         - minimum valid temperature (in degrees)
+        t_max_c=T_MAX_C         - maximum valid temperature (in degrees)
+        chunk_frames=4096       - number of frames scanned at once
+        """
+        super(IntegrityScanner, self).__init__()
+
+        self.raw_filepath = raw_filepath
+        self.t_min_c = t_min_c
+        self.t_max_c = t_max_c
+        self.chunk_frames = chunk_frames
+
+        self.size = os.path.getsize(raw_filepath)
+        self.segments = []
+        self.shifts = []
+        self.flags = None
+        self.report = None
+
+    def __len__(self):
+        """Number of frames of the realigned sequence"""
+        return sum(no_frames for _, no_frames in self.segments)
+
+    def _map(self, offset, no_frames):
+        """Read-only memory map of no_frames frames from the given offset (in bytes)"""
+        if no_frames <= 0:
+            return np.empty((0, self.PIXELS_Y, self.PIXELS_X), dtype=self.DTYPE)
+        return np.memmap(
+            self.raw_filepath, dtype=self.DTYPE, mode='r', offset=offset,
+            shape=(no_frames, self.PIXELS_Y, self.PIXELS_X)
+        )
+
+    def read(self, indexes):
+        """Frames of the realigned sequence with the given indexes, as a (N, PIXELS_Y, PIXELS_X) array"""
+        indexes = np.asarray(indexes)
+        starts = np.cumsum([0] + [no_frames for _, no_frames in self.segments])
+        segment = np.searchsorted(starts, indexes, side='right') - 1
+        frames = np.empty((indexes.size, self.PIXELS_Y, self.PIXELS_X), dtype=self.DTYPE)
+        for s in np.unique(segment):
+            selected = segment == s
+            frames[selected] = self._maps[s][indexes[selected] - starts[s]]
+        return frames
+
+    def _valid(self, chunk):
+        """Per pixel validity of the given frames: finite and within the range of the sensor"""
+        return (chunk >= self.t_min_c) & (chunk <= self.t_max_c)
+
+    def _flags(self, chunk, valid=None):
+        """
+        Flags NAN, INF, RANGE and ZERO of the given frames, given the validity of their pixels when already
+        calculated. The details are only looked for in the invalid frames, and the zero frames among those
+        whose first pixel is zero.
+        """
+        flags = np.zeros(chunk.shape[0], dtype=np.uint8)
+        flat = chunk.reshape(chunk.shape[0], -1)
+        valid = self._valid(flat) if valid is None else valid
+        invalid = np.flatnonzero(~valid.all(axis=1))
+        if invalid.size:
+            frames = flat[invalid]
+            flags[invalid] |= np.where(np.isnan(frames).any(axis=1), NAN, 0).astype(np.uint8)
+            flags[invalid] |= np.where(np.isinf(frames).any(axis=1), INF, 0).astype(np.uint8)
+            out = (np.isfinite(frames) & ((frames < self.t_min_c) | (frames > self.t_max_c))).any(axis=1)
+            flags[invalid] |= np.where(out, RANGE, 0).astype(np.uint8)
+        zero = np.flatnonzero(flat[:, 0] == 0.)
+        flags[zero[(flat[zero] == 0.).all(axis=1)]] |= ZERO
+        return flags
+
+    def _scan_segment(self, offset, no_frames, previous, sample_step):
+        """
+        This method scans the given number of frames from the given offset (in bytes). Returns a dictionary
+        with the flags of every frame, the mean absolute difference of every valid frame with the previous
+        valid one (NaN for the rest), the per pixel counters and the sampled frames for the outliers.
+        """
+        frames = self._map(offset, no_frames)
+        scan = dict(
+            offset=offset, no_frames=no_frames,
+            flags=np.zeros(no_frames, dtype=np.uint8), diff=np.full(no_frames, np.nan),
+            invalid=np.zeros(self.PIXELS_FRAME, dtype=np.int64), considered=0,
+            min=np.full(self.PIXELS_FRAME, np.inf, dtype=self.DTYPE),
+            max=np.full(self.PIXELS_FRAME, -np.inf, dtype=self.DTYPE), samples=[]
+        )
+
+        for start in range(0, no_frames, self.chunk_frames):
+            chunk = np.asarray(frames[start:start + self.chunk_frames]).reshape(-1, self.PIXELS_FRAME)
+            valid = self._valid(chunk)
+            flags = self._flags(chunk, valid)
+            scan['flags'][start:start + chunk.shape[0]] = flags
+
+            # per pixel counters, over the frames that are not entirely invalid (nor zero)
+            if not (flags & BAD).any():
+                scan['considered'] += chunk.shape[0]
+                scan['min'] = np.minimum(scan['min'], chunk.min(axis=0))
+                scan['max'] = np.maximum(scan['max'], chunk.max(axis=0))
+            else:
+                partial = (flags & ZERO == 0) & valid.any(axis=1)
+                chunk_p, valid = chunk[partial], valid[partial]
+                scan['considered'] += chunk_p.shape[0]
+                scan['invalid'] += chunk_p.shape[0] - valid.sum(axis=0)
+                scan['min'] = np.minimum(scan['min'], np.where(valid, chunk_p, np.inf).min(axis=0, initial=np.inf))
+                scan['max'] = np.maximum(scan['max'], np.where(valid, chunk_p, -np.inf).max(axis=0, initial=-np.inf))
+
+            # differences between consecutive valid frames, across the chunks
+            indexes = np.flatnonzero(flags & BAD == 0)
+            if indexes.size:
+                block = chunk[indexes]
+                if previous is not None:
+                    block = np.concatenate([previous[None], block])
+                    positions = indexes
+                else:
+                    positions = indexes[1:]
+                scan['diff'][start + positions] = np.abs(np.diff(block, axis=0)).mean(axis=1)
+                previous = chunk[indexes[-1]].copy()
+                scan['samples'].append(chunk[indexes[(start + indexes) % sample_step == 0]])
+
+        scan['previous'] = previous
+        scan['flags'][scan['diff'] == 0.] |= DUPLICATE
+        with np.errstate(invalid='ignore'):
+            diffs = scan['diff'][scan['diff'] > 0.]
+            scan['threshold'] = max(self.JUMP_MIN_C, self.JUMP_FACTOR * np.median(diffs)) if diffs.size else np.inf
+            scan['flags'][scan['diff'] > scan['threshold']] |= JUMP
+        return scan
+
+    def _find_shift(self, scan, previous):
+        """
+        This method looks for the first shift within the scanned segment: for every candidate (a jump or
+        the first invalid frame after a valid one), the next frame is read again shifted by 0 to 3 bytes and
+        rotated by every number of pixels, looking for the rotation that best matches the last valid frame
+        before the candidate. Returns the (index of the candidate, offset of the realigned frames) tuple, or
+        None when there is no shift.
+        """
+        flags, offset = scan['flags'], scan['offset']
+        bad = flags & BAD != 0
+        starts = np.flatnonzero(bad & ~np.concatenate([[previous is None], bad[:-1]]))
+        candidates = np.union1d(np.flatnonzero(flags & JUMP), starts)
+
+        for index in candidates:
+            valid = np.flatnonzero(~bad[:index])
+            reference = self._map(offset, index)[valid[-1]] if valid.size else previous
+            if reference is None:
+                continue
+            reference = np.asarray(reference, dtype=np.float64).ravel()
+
+            best, unshifted = None, np.inf
+            frame_offset = offset + (index + 1) * self.SIZE_FRAME
+            for skip in range(4):
+                if frame_offset + skip + self.SIZE_FRAME > self.size:
+                    break
+                with np.errstate(invalid='ignore'):
+                    frame = np.fromfile(
+                        self.raw_filepath, dtype=self.DTYPE, count=self.PIXELS_FRAME, offset=frame_offset + skip
+                    ).astype(np.float64)
+                if not self._valid(frame).all():
+                    continue
+                rotations = np.lib.stride_tricks.sliding_window_view(
+                    np.concatenate([frame, frame]), self.PIXELS_FRAME
+                )[:self.PIXELS_FRAME]
+                errors = np.abs(rotations - reference).mean(axis=1)
+                if skip == 0:
+                    unshifted = errors[0]
+                    errors[0] = np.inf
+                rotation = int(np.argmin(errors))
+                if best is None or errors[rotation] < best[0]:
+                    best = (errors[rotation], skip + rotation * np.dtype(self.DTYPE).itemsize)
+
+            # a jump has to go away, the frames after an invalid one have to be as close as usual
+            if best is None or best[0] >= self.SHIFT_RATIO * unshifted:
+                continue
+            if not flags[index] & JUMP and best[0] > min(scan['threshold'], self.JUMP_FACTOR * self.JUMP_MIN_C):
+                continue
+            # the partial write splits the candidate or, when it is most of a frame, the frame before it
+            for split in (index, index - 1):
+                if split < 0:
+                    continue
+                before = np.flatnonzero(~bad[:split])
+                reference = self._map(offset, split)[before[-1]] if before.size else previous
+                if reference is None:
+                    continue
+                reference = np.asarray(reference, dtype=np.float64).ravel()
+                if self._confirm_shift(offset + split * self.SIZE_FRAME, best[1], reference):
+                    return int(split), offset + split * self.SIZE_FRAME + best[1]
+        return None
+
+    def _confirm_shift(self, start, skipped, reference):
+        """
+        This method confirms the shift of the given bytes at the frame from the given offset (start), as
+        opposed to a scene that moves by some rows or to another recording: the frame has to be split by
+        the partial write, its head closer to the reference frame as it is and the rest (the head of the
+        next frame) closer to the head of the reference; and the realigned frames have to stay closer to the
+        reference than the original ones for SHIFT_FRAMES frames.
+        """
+        no_frames = min(self.SHIFT_FRAMES, (self.size - start) // self.SIZE_FRAME - 1)
+        if no_frames < 1:
+            return False
+
+        def read(offset, no_frames):
+            with np.errstate(invalid='ignore', over='ignore'):
+                return np.fromfile(
+                    self.raw_filepath, dtype=self.DTYPE, count=no_frames * self.PIXELS_FRAME, offset=offset
+                ).astype(np.float64).reshape(no_frames, self.PIXELS_FRAME)
+
+        def error(frames, reference):
+            with np.errstate(invalid='ignore', over='ignore'):
+                errors = np.abs(frames - reference).mean(axis=-1)
+            return np.where(np.isfinite(errors), errors, np.inf)
+
+        original = read(start, no_frames + 1)
+        realigned = read(start + skipped, no_frames)
+
+        # the partial frame, up to the first complete value of the next one
+        itemsize = np.dtype(self.DTYPE).itemsize
+        head, tail = skipped // itemsize, (self.SIZE_FRAME - skipped) // itemsize
+        split = original[0]
+        if head and not error(split[:head], reference[:head]) < error(split[:head], reference[-head:]):
+            return False
+        if tail and not error(realigned[0, :tail], reference[:tail]) < (
+            self.SHIFT_RATIO * error(split[-tail:], reference[-tail:])
+        ):
+            return False
+
+        valid = self._valid(realigned).all(axis=1)
+        if not valid[0]:
+            return False
+        errors = error(realigned[valid], reference)
+        return bool((errors < self.SHIFT_RATIO * error(original[1:][valid], reference)).all())
+
+    def _outliers(self, samples, dead):
+        """
+        Pixels away from the edges whose median absolute difference with the closest of their (valid)
+        neighbours, over the sampled frames, is larger than OUTLIER_C. The pixels on the edge of an object
+        of the scene are close to the neighbours on the same side of it, a faulty pixel to none of them.
+        """
+        if samples.shape[0] == 0:
+            return np.zeros(self.PIXELS_FRAME, dtype=bool)
+        samples = samples.astype(np.float64).reshape(-1, self.PIXELS_Y, self.PIXELS_X)
+        samples[:, dead.reshape(self.PIXELS_Y, self.PIXELS_X)] = np.nan
+        padded = np.pad(samples, ((0, 0), (1, 1), (1, 1)), constant_values=np.nan)
+        windows = np.lib.stride_tricks.sliding_window_view(padded, (3, 3), axis=(1, 2))
+        neighbours = np.delete(windows.reshape(samples.shape + (9,)), 4, axis=3)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            deviation = np.nanmedian(np.nanmin(np.abs(samples[..., None] - neighbours), axis=3), axis=0)
+        border = self.OUTLIER_BORDER
+        interior = np.zeros((self.PIXELS_Y, self.PIXELS_X), dtype=bool)
+        interior[border:self.PIXELS_Y - border, border:self.PIXELS_X - border] = True
+        with np.errstate(invalid='ignore'):
+            return (deviation > self.OUTLIER_C).ravel() & interior.ravel() & ~dead
+
+    def scan(self):
+        """
+        This method scans the whole file, realigning it after every shift, and returns the report (see
+        format). The file is rescanned from the shift on whenever one is found.
+        """
+        started = time.perf_counter()
+        no_grid = self.size // self.SIZE_FRAME
+        sample_step = max(1, no_grid // self.OUTLIER_SAMPLES)
+
+        self.segments, self.shifts, scans = [], [], []
+        offset, previous = 0, None
+        while True:
+            no_frames = (self.size - offset) // self.SIZE_FRAME
+            scan = self._scan_segment(offset, no_frames, previous, sample_step)
+            shift = self._find_shift(scan, previous)
+            if shift is not None:
+                index, realigned = shift
+                self._l.warning(
+                    f"Frames shifted by {realigned - offset - index * self.SIZE_FRAME} bytes after frame "
+                    f"{len(self) + index} of {self.raw_filepath}"
+                )
+                scan = self._scan_segment(offset, index, previous, sample_step)
+                # as Python integers, so that the report can be written as JSON
+                self.shifts.append(dict(
+                    frame=int(len(self) + index), offset=int(offset + index * self.SIZE_FRAME),
+                    skipped=int(realigned - offset - index * self.SIZE_FRAME)
+                ))
+            scans.append(scan)
+            self.segments.append((offset, scan['no_frames']))
+            previous = scan['previous']
+            if shift is None:
+                break
+            offset = realigned
+
+        self._maps = [self._map(offset, no_frames) for offset, no_frames in self.segments]
+        self.flags = np.concatenate([scan['flags'] for scan in scans])
+        considered = sum(scan['considered'] for scan in scans)
+        invalid = sum(scan['invalid'] for scan in scans)
+        good = considered - invalid
+        minimum = np.min([scan['min'] for scan in scans], axis=0)
+        maximum = np.max([scan['max'] for scan in scans], axis=0)
+        samples = np.concatenate(
+            [block for scan in scans for block in scan['samples']] or [np.empty((0, self.PIXELS_FRAME))]
+        )
+
+        self.dead = invalid > self.DEAD_FRACTION * max(considered, 1)
+        self.stuck = (good >= self.STUCK_FRAMES) & (minimum == maximum) & ~self.dead
+        self.outliers = self._outliers(samples, self.dead) & ~self.stuck
+        elapsed = time.perf_counter() - started
+
+        def pixels(mask):
+            ys, xs = np.divmod(np.flatnonzero(mask), self.PIXELS_X)
+            return [[int(x), int(y)] for x, y in zip(xs, ys)]
+
+        bad = self.flags & BAD != 0
+        tail = int((self.size - offset) % self.SIZE_FRAME)
+        self.report = dict(
+            raw_filepath=self.raw_filepath, size=int(self.size), no_frames=int(len(self)), tail=tail,
+            shifts=self.shifts,
+            frames={name: int(np.count_nonzero(self.flags & flag)) for name, flag in FLAGS.items()},
+            no_bad=int(np.count_nonzero(bad)), bad_frames=runs(bad),
+            pixels=dict(dead=pixels(self.dead), stuck=pixels(self.stuck), outliers=pixels(self.outliers)),
+            elapsed_s=float(elapsed), mb_s=float(self.size / 1e6 / elapsed) if elapsed > 0 else None
+        )
+        # the outliers are only reported
+        self.report['ok'] = not bool(tail or self.shifts or bad.any() or self.dead.any() or self.stuck.any())
+        return self.report
+
+    @staticmethod
+    def format(report):
+        """Human readable representation of the given report"""
+        lines = [
+            f"{report['raw_filepath']}: {'OK' if report['ok'] else 'DAMAGED'}, frames = {report['no_frames']}, "
+            f"bad = {report['no_bad']}, scanned at {report['mb_s'] or 0:.1f} (MB/s)"
+        ]
+        if report['tail']:
+            lines.append(f"incomplete frame at the end of the file, {report['tail']} bytes")
+        lines.extend(
+            f"shift of {shift['skipped']} bytes at frame {shift['frame']} (offset {shift['offset']})"
+            for shift in report['shifts']
+        )
+        flagged = {name: count for name, count in report['frames'].items() if count}
+        if flagged:
+            lines.append("frames: " + ", ".join(f"{name} = {count}" for name, count in flagged.items()))
+        if report['bad_frames']:
+            ranges = [
+                f"{start}" if stop == start + 1 else f"{start}-{stop - 1}" for start, stop in report['bad_frames']
+            ]
+            lines.append("bad frames: " + ", ".join(ranges[:20]) + (" ..." if len(ranges) > 20 else ""))
+        lines.extend(
+            f"{name} pixels: " + " ".join(f"({x},{y})" for x, y in pixels)
+            for name, pixels in report['pixels'].items() if pixels
+        )
+        return "\n".join(lines)
+
+    def _pixel_weights(self):
+        """
+        Matrix (PIXELS, BAD_PIXELS) that replaces every bad pixel with the mean of its good neighbours,
+        None when there are no bad pixels.
+        """
+        bad = np.flatnonzero(self.dead | self.stuck | self.outliers)
+        if bad.size == 0:
+            return None, bad
+        good = ~(self.dead | self.stuck | self.outliers).reshape(self.PIXELS_Y, self.PIXELS_X)
+        weights = np.zeros((self.PIXELS_FRAME, bad.size), dtype=np.float32)
+        for column, pixel in enumerate(bad):
+            y, x = divmod(int(pixel), self.PIXELS_X)
+            ys, xs = np.mgrid[max(y - 1, 0):y + 2, max(x - 1, 0):x + 2]
+            ys, xs = ys[good[ys, xs]], xs[good[ys, xs]]
+            if ys.size:
+                weights[ys * self.PIXELS_X + xs, column] = 1. / ys.size
+            else:
+                weights[pixel, column] = 1.
+        return weights, bad
+
+    def repair(self, filepath, mode='drop', fix_pixels=False):
+        """
+        This method writes a repaired copy of the file, realigned after the shifts, with the bad frames
+        dropped or interpolated (mode) and, only when fix_pixels is set, with the dead, stuck and outlier
+        pixels replaced by the mean of their good neighbours. Returns the number of frames written.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown repair mode <{mode}>, expected one of {MODES}")
+        if self.report is None:
+            self.scan()
+
+        weights, pixels = self._pixel_weights() if fix_pixels else (None, None)
+
+        def load(indexes):
+            frames = self.read(indexes).reshape(-1, self.PIXELS_FRAME)
+            if weights is not None:
+                with np.errstate(invalid='ignore'):
+                    frames[:, pixels] = frames @ weights
+            return frames
+
+        # the bad frames are those that are still bad after fixing the pixels
+        no_frames = len(self)
+        bad = np.zeros(no_frames, dtype=bool)
+        for start in range(0, no_frames, self.chunk_frames):
+            indexes = np.arange(start, min(start + self.chunk_frames, no_frames))
+            bad[indexes] = self._flags(load(indexes)) & BAD != 0
+        if bad.all():
+            raise ValueError(f"There are no good frames in {self.raw_filepath}")
+
+        positions = np.arange(no_frames)
+        before = np.maximum.accumulate(np.where(bad, -1, positions))
+        after = np.minimum.accumulate(np.where(bad, no_frames, positions)[::-1])[::-1]
+        before = np.where(before < 0, after, before)
+        after = np.where(after >= no_frames, before, after)
+
+        written = 0
+        with open(filepath, 'wb') as f:
+            for start in range(0, no_frames, self.chunk_frames):
+                indexes = np.arange(start, min(start + self.chunk_frames, no_frames))
+                if mode == 'drop':
+                    indexes = indexes[~bad[indexes]]
+                    frames = load(indexes)
+                else:
+                    frames = load(indexes)
+                    repair = np.flatnonzero(bad[indexes])
+                    if repair.size:
+                        i, b, a = indexes[repair], before[indexes[repair]], after[indexes[repair]]
+                        weight = np.where(a > b, (i - b) / np.maximum(a - b, 1), 0.)[:, None]
+                        frames[repair] = (1. - weight) * load(b) + weight * load(a)
+                frames.astype(self.DTYPE).tofile(f)
+                written += frames.shape[0]
+
+        self._l.info(f"Repaired copy of {self.raw_filepath} written as {filepath}, {written} frames ({mode})")
+        return written
+
+    def close(self):
+        """Releases the mappings of the file"""
+        self._maps = []
+
+    @staticmethod
+    def create(argv):
+        """Factory method that scans (and repairs) the RAW file given by the CLI arguments"""
+
+        parser = argparse.ArgumentParser(description="Checks the integrity of a file with raw data from MLX90640")
+        parser.add_argument(
+            "-r", "--raw_file",
+            type=files.is_readable_file, metavar="FILE", required=True,
+            help="Path to the RAW file to be checked"
+        )
+        parser.add_argument(
+            "-o", "--output", type=str, metavar="FILE", required=False,
+            help="Path to the RAW file where the repaired copy is written"
+        )
+        parser.add_argument(
+            "-m", "--mode", choices=MODES, required=False, default='drop',
+            help="Whether the bad frames are dropped or interpolated in the repaired copy"
+        )
+        parser.add_argument(
+            "--fix-pixels",
+            action='store_true', required=False,
+            help="Replaces the dead, stuck and outlier pixels by the mean of their neighbours in the repaired copy"
+        )
+        parser.add_argument(
+            "-j", "--json",
+            action='store_true', required=False,
+            help="Prints the report as JSON instead of as text"
+        )
+
+        args = parser.parse_args(argv)
+        scanner = IntegrityScanner(args.raw_file)
+        report = scanner.scan()
+        print(json.dumps(report, indent=1) if args.json else IntegrityScanner.format(report))
+        if args.output is not None:
+            scanner.repair(args.output, mode=args.mode, fix_pixels=args.fix_pixels)
+        return scanner
+
+
+if __name__ == "__main__":
+    scanner = IntegrityScanner.create(sys.argv[1:])
+    sys.exit(0 if scanner.report['ok'] else 1)
@@ -0,0 +1,394 @@
+"""Live HTTP preview of the frames from MLX90640: MJPEG stream, snapshots and JSON statistics."""
+
+import argparse
+import asyncio
+import json
+import numpy as np
+import os
+import struct
+import sys
+import time
+import urllib.parse
+import zlib
+
+from xpython.common import logger
+
+from processor import heatmap, processor, protocol, rawdataset, receiver
+
+
+def encode_png(rgb, level=1):
+    """
+    This function encodes a (height, width, 3) uint8 RGB image as PNG with zlib only: 8 bit RGB, without
+    filters (a filter type byte of zero before every row).
+    """
+    height, width = rgb.shape[:2]
+    rows = np.zeros((height, 1 + 3 * width), dtype=np.uint8)
+    rows[:, 1:] = rgb.reshape(height, 3 * width)
+
+    def chunk(name, data):
+        return struct.pack('!I', len(data)) + name + data + struct.pack('!I', zlib.crc32(name + data))
+
+    return (
+        b'\x89PNG\r\n\x1a\n' +
+        chunk(b'IHDR', struct.pack('!IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+        chunk(b'IDAT', zlib.compress(rows.tobytes(), level)) +
+        chunk(b'IEND', b'')
+    )
+
+
+def jpeg_encoder(quality):
+    """
+    This function returns a callable that encodes (height, width, 3) uint8 RGB images as JPEG, with OpenCV
+    or Pillow (whichever is installed), or None when neither of them is.
+    """
+    try:
+        import cv2
+        return lambda rgb: cv2.imencode('.jpg', rgb[:, :, ::-1], [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+    except ImportError:
+        pass
+    try:
+        import io
+        from PIL import Image
+
+        def encode(rgb):
+            output = io.BytesIO()
+            Image.fromarray(rgb).save(output, format='JPEG', quality=quality)
+            return output.getvalue()
+        return encode
+    except ImportError:
+        return None
+
+
+class FrameRing(object):
+    """Ring of frames
+    The last <capacity> frames, with their sequence numbers and timestamps, in preallocated arrays: adding a
+    frame is a copy into its slot.
+    """
+
+    def __init__(self, capacity, shape=(rawdataset.RawDataset.PIXELS_Y, rawdataset.RawDataset.PIXELS_X)):
+        self.capacity = capacity
+        self.frames = np.full((capacity,) + tuple(shape), np.nan, dtype=rawdataset.RawDataset.DTYPE)
+        self.timestamps_us = np.zeros(capacity)
+        self.sequence = -1
+
+    def __len__(self):
+        return min(self.sequence + 1, self.capacity)
+
+    def push(self, frame, timestamp_us):
+        """Adds a frame, replacing the oldest one, returns its sequence number"""
+        self.sequence += 1
+        slot = self.sequence % self.capacity
+        self.frames[slot] = frame
+        self.timestamps_us[slot] = timestamp_us
+        return self.sequence
+
+    def latest(self):
+        """Last frame, None when empty"""
+        return self.frames[self.sequence % self.capacity] if self.sequence >= 0 else None
+
+    def recent(self, count=None):
+        """(frames, timestamps_us) of the last count frames (all the frames in the ring when None), oldest first"""
+        count = len(self) if count is None else max(0, min(count, len(self)))
+        slots = np.arange(self.sequence - count + 1, self.sequence + 1) % self.capacity
+        return self.frames[slots], self.timestamps_us[slots]
+
+
+class MLX90640Preview(logger.LoggingClass):
+    """Live preview server
+    This class serves a live preview of the frames of one sensor over HTTP, from a single asyncio event loop.
+    The frames are taken either from the framed UDP stream (see receiver) or from a RAW file that is still
+    being written (as streamer.sh does), which is only read; they are kept in a ring of recent frames.
+
+        /               - page with the stream and the statistics
+        /stream.mjpg    - multipart stream with every new frame, as JPEG (PNG without OpenCV nor Pillow)
+        /snapshot.png   - last frame, as PNG
+        /snapshot.jpg   - last frame, as JPEG (when available)
+        /stats.json     - temperatures of the last frame (min, max, reference pixels and dT), maximum dT,
+                            frame rate and counters
+        /recent.raw     - last frames of the ring as RAW data (float32), ?frames=N for the last N
+
+    Frames are rendered with the heatmap of the streamer and encoded on demand, at most once per frame and
+    format, no matter how many clients are connected: all of them get the same encoded image. Clients that
+    cannot keep up are not buffered for, they just skip to the last frame.
+    """
+
+    RING_FRAMES     = 64
+    SIZE            = (240, 320)
+    QUALITY         = 80
+    BOUNDARY        = b'mlx90640frame'
+    PAGE            = (
+        "<html><head><title>{name}</title></head><body><h3>{name}</h3>"
+        "<img src='/stream.mjpg' style='image-rendering: pixelated'/><pre id='stats'></pre><script>"
+        "setInterval(() => fetch('/stats.json').then(r => r.json()).then(s => "
+        "document.getElementById('stats').textContent = JSON.stringify(s, null, 1)), 1000);"
+        "</script></body></html>"
+    )
+
+    def __init__(
+        self, distance_mm=55, px_distance_mm=20, name='MLX90640', ring_frames=RING_FRAMES, size=SIZE,
+        vmin=heatmap.HeatmapRenderer.VMIN, vmax=heatmap.HeatmapRenderer.VMAX, quality=QUALITY
+    ):
+        """Default constructor
+        distance_mm=55      - mm of distance from the camera to the target material, for the reference pixels
+        px_distance_mm=20   - mm of distance from P0 to P1 or P2
+        name='MLX90640'     - name shown in the page
+        ring_frames=64      - number of recent frames kept
+        size=(240, 320)     - (height, width) of the images
+        vmin, vmax          - temperatures for the first and the last colours of the heatmap
+        quality=80          - quality of the JPEG images
+        """
+        super(MLX90640Preview, self).__init__()
+
+        self.name = name
+        _, _, self.ref_pixels = processor.MLX90640Processor.reference_pixels(distance_mm, px_distance_mm)
+        self.ring = FrameRing(ring_frames)
+        # the RAW frames written by rawrgb are already flipped
+        self.renderer = heatmap.HeatmapRenderer(vmin=vmin, vmax=vmax, size=size, flip=False)
+        self.encoders = dict(png=encode_png)
+        jpeg = jpeg_encoder(quality)
+        if jpeg is not None:
+            self.encoders['jpeg'] = jpeg
+        self.stream_format = 'jpeg' if jpeg is not None else 'png'
+
+        self._images = {}
+        self._frame_event = asyncio.Event()
+        self.latest = None
+        self.max_dT_value = None
+        self.no_encoded = 0
+        self.no_clients = 0
+        self.no_requests = 0
+
+    def push(self, frame, timestamp_us=None):
+        """Adds a new frame, updating the statistics and waking up the streams"""
+        frame = np.asarray(frame, dtype=rawdataset.RawDataset.DTYPE).reshape(self.ring.frames.shape[1:])
+        sequence = self.ring.push(frame, time.time() * 1e6 if timestamp_us is None else timestamp_us)
+
+        def value(v):
+            return None if np.isnan(v) else float(v)
+
+        t0, t1, t2 = (frame[y, x] for x, y in self.ref_pixels)
+        valid = frame[~np.isnan(frame)]
+        self.latest = dict(
+            sequence=sequence, timestamp_us=float(self.ring.timestamps_us[sequence % self.ring.capacity]),
+            min=value(valid.min()) if valid.size else None, max=value(valid.max()) if valid.size else None,
+            t0=value(t0), t1=value(t1), t2=value(t2), diff=value(abs(t1 - t2))
+        )
+        if self.latest['diff'] is not None:
+            self.max_dT_value = max(self.max_dT_value or 0., self.latest['diff'])
+
+        event, self._frame_event = self._frame_event, asyncio.Event()
+        event.set()
+
+    def image(self, image_format):
+        """Last frame encoded in the given format (png, jpeg), encoded only the first time it is requested"""
+        sequence = self.ring.sequence
+        cached = self._images.get(image_format)
+        if cached is None or cached[0] != sequence:
+            rgb = self.renderer.render(self.ring.latest())
+            cached = self._images[image_format] = (sequence, self.encoders[image_format](rgb))
+            self.no_encoded += 1
+        return cached[1]
+
+    def stats(self):
+        """Dictionary with the statistics of the last frame and of the recent ones, and the counters"""
+        frames, timestamps_us = self.ring.recent()
+        fps = None
+        if len(self.ring) > 1 and timestamps_us[-1] > timestamps_us[0]:
+            fps = (len(self.ring) - 1) / (timestamps_us[-1] - timestamps_us[0]) * 1e6
+        return dict(
+            name=self.name, frames=self.ring.sequence + 1, fps=fps, latest=self.latest,
+            max_dT_value=self.max_dT_value, clients=self.no_clients, requests=self.no_requests,
+            encoded=self.no_encoded, stream_format=self.stream_format
+        )
+
+    async def follow(self, raw_filepath, poll_interval_s=0.1):
+        """
+        This method follows a RAW file that is being written, pushing every complete frame appended to it
+        (up to the size of the ring at a time, the older ones are skipped), until cancelled. The file is only
+        read, and read again from the beginning if it is replaced or truncated.
+        """
+        size_frame = rawdataset.RawDataset.SIZE_FRAME
+        f, inode, offset = None, None, 0
+        try:
+            while True:
+                try:
+                    stat = os.stat(raw_filepath)
+                except FileNotFoundError:
+                    stat = None
+                if stat is not None and (f is None or stat.st_ino != inode or stat.st_size < offset):
+                    if f is not None:
+                        f.close()
+                    f, inode, offset = open(raw_filepath, 'rb'), stat.st_ino, 0
+
+                count = (stat.st_size - offset) // size_frame if stat is not None else 0
+                if count > 0:
+                    skipped = max(count - self.ring.capacity, 0)
+                    f.seek(offset + skipped * size_frame)
+                    frames = np.frombuffer(f.read((count - skipped) * size_frame), dtype=rawdataset.RawDataset.DTYPE)
+                    for frame in frames.reshape(count - skipped, -1):
+                        self.push(frame)
+                    offset += count * size_frame
+                await asyncio.sleep(poll_interval_s)
+        finally:
+            if f is not None:
+                f.close()
+
+    async def listen(self, host='0.0.0.0', port=5000):
+        """Receives the framed UDP stream on the given address, returns the transport"""
+        def on_frame(payload_type, sequence, timestamp_us, payload):
+            if payload_type == protocol.TYPE_RAW and payload is not None:
+                self.push(np.frombuffer(payload, dtype=rawdataset.RawDataset.DTYPE), timestamp_us)
+
+        stream = receiver.MLX90640Receiver(on_frame=on_frame)
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: receiver._DatagramProtocol(stream), local_addr=(host, port)
+        )
+        self._l.info(f"Receiving on <{host}:{port}>")
+        return transport
+
+    @staticmethod
+    def _response(writer, status, content_type, body=b'', headers=()):
+        lines = [f"HTTP/1.0 {status}", f"Content-Type: {content_type}", f"Content-Length: {len(body)}"]
+        lines += ["Cache-Control: no-store"] + list(headers)
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+
+    async def _stream(self, writer):
+        """Writes every new frame into the multipart response, until the client goes away"""
+        content_type = f"image/{self.stream_format}"
+        writer.write(
+            b"HTTP/1.0 200 OK\r\nCache-Control: no-store\r\n"
+            b"Content-Type: multipart/x-mixed-replace; boundary=" + self.BOUNDARY + b"\r\n\r\n"
+        )
+        self.no_clients += 1
+        try:
+            while True:
+                if self.ring.sequence >= 0:
+                    image = self.image(self.stream_format)
+                    writer.write(
+                        b"--" + self.BOUNDARY + b"\r\n" +
+                        f"Content-Type: {content_type}\r\nContent-Length: {len(image)}\r\n\r\n".encode() +
+                        image + b"\r\n"
+                    )
+                    await writer.drain()
+                await self._frame_event.wait()
+        finally:
+            self.no_clients -= 1
+
+    async def handle(self, reader, writer):
+        """Serves one HTTP request"""
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+            self.no_requests += 1
+            method, target = request.split(b'\r\n', 1)[0].decode('latin-1').split(' ')[:2]
+            url = urllib.parse.urlsplit(target)
+            query = urllib.parse.parse_qs(url.query)
+
+            if method != 'GET':
+                self._response(writer, '405 Method Not Allowed', 'text/plain', b'Method not allowed\n')
+            elif url.path == '/':
+                self._response(writer, '200 OK', 'text/html', self.PAGE.format(name=self.name).encode())
+            elif url.path == '/stats.json':
+                self._response(writer, '200 OK', 'application/json', json.dumps(self.stats()).encode())
+            elif url.path == '/stream.mjpg':
+                await self._stream(writer)
+            elif url.path in ('/snapshot.png', '/snapshot.jpg') and self.ring.sequence < 0:
+                self._response(writer, '503 Service Unavailable', 'text/plain', b'No frames yet\n')
+            elif url.path == '/snapshot.png':
+                self._response(writer, '200 OK', 'image/png', self.image('png'))
+            elif url.path == '/snapshot.jpg' and 'jpeg' in self.encoders:
+                self._response(writer, '200 OK', 'image/jpeg', self.image('jpeg'))
+            elif url.path == '/recent.raw':
+                frames, _ = self.ring.recent(int(query['frames'][0]) if 'frames' in query else None)
+                self._response(
+                    writer, '200 OK', 'application/octet-stream', frames.tobytes(),
+                    headers=[f"X-Frames: {frames.shape[0]}", f"X-Sequence: {self.ring.sequence}"]
+                )
+            else:
+                self._response(writer, '404 Not Found', 'text/plain', b'Not found\n')
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError) as ex:
+            self._l.debug(f"Closing connection, reason = {ex}")
+        finally:
+            writer.close()
+
+    async def start(self, host='0.0.0.0', port=8080):
+        """Starts the HTTP server, returns the asyncio server"""
+        server = await asyncio.start_server(self.handle, host, port)
+        self._l.info(f"Serving the preview on <http://{host}:{server.sockets[0].getsockname()[1]}/>")
+        return server
+
+    async def serve(
+        self, host='0.0.0.0', port=8080, raw_filepath=None, udp_host='0.0.0.0', udp_port=None, duration_s=None
+    ):
+        """
+        This method serves the preview of the frames of the given RAW file or UDP port until duration_s
+        elapses (forever when None) or until cancelled.
+        """
+        server = await self.start(host, port)
+        transport = await self.listen(udp_host, udp_port) if udp_port is not None else None
+        follower = asyncio.ensure_future(self.follow(raw_filepath)) if raw_filepath is not None else None
+        try:
+            if duration_s is None:
+                await asyncio.Event().wait()
+            await asyncio.sleep(duration_s)
+        finally:
+            if follower is not None:
+                follower.cancel()
+            if transport is not None:
+                transport.close()
+            server.close()
+
+    @staticmethod
+    def create(argv):
+        """Factory method to instantiate the class using the arguments from the CLI"""
+
+        parser = argparse.ArgumentParser(description="Serves a live preview of the frames from MLX90640 over HTTP")
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument(
+            "-r", "--raw_file", type=str, metavar="FILE",
+            help="Path to the RAW file being written, which is only read"
+        )
+        source.add_argument(
+            "-u", "--udp-port", type=int,
+            help="UDP port where the framed stream is received"
+        )
+        parser.add_argument(
+            "-H", "--host", type=str, required=False, default='0.0.0.0',
+            help="Address to listen on, both for HTTP and for the UDP stream"
+        )
+        parser.add_argument(
+            "-p", "--port", type=int, required=False, default=8080,
+            help="HTTP port to listen on"
+        )
+        parser.add_argument(
+            "-d", "--distance", type=float, required=False, default=55,
+            help="Distance in mm from the output of the lens' telescope to the target material"
+        )
+        parser.add_argument(
+            "-n", "--name", type=str, required=False,
+            help="Name shown in the page, the name of the RAW file by default"
+        )
+        parser.add_argument(
+            "-q", "--quality", type=int, required=False, default=MLX90640Preview.QUALITY,
+            help="Quality of the JPEG images"
+        )
+        parser.add_argument(
+            "-t", "--timeout", type=float, required=False,
+            help="Seconds to serve for, until interrupted by default"
+        )
+
+        args = parser.parse_args(argv)
+        name = args.name or (os.path.basename(args.raw_file) if args.raw_file else f"UDP:{args.udp_port}")
+        preview = MLX90640Preview(distance_mm=args.distance, name=name, quality=args.quality)
+        try:
+            asyncio.run(preview.serve(
+                args.host, args.port, raw_filepath=args.raw_file, udp_host=args.host, udp_port=args.udp_port,
+                duration_s=args.timeout
+            ))
+        except KeyboardInterrupt:
+            pass
+        return preview
+
+
+if __name__ == "__main__":
+    preview = MLX90640Preview.create(sys.argv[1:])
@@ -1,8 +1,6 @@
 """This is the processor that digests the raw data from MLX90640 and analyzes it."""
 
 import argparse
-import matplotlib as mp
-import matplotlib.pyplot as pl
 import numpy as np
 import os
 import pathlib
@@ -12,14 +10,19 @@ import sys
 
 from xpython.common import files, logger
 
+from processor import (
+    analysis, cache, container, heatmap, integrity, profiling, renderer, results, rois, selection, temporal, video
+)
+
 
 class MLX90640Frame(logger.LoggingClass):
     """RAW binary frame straight out from MLX90640
     This is an array of floats, with 32x24 elements (MLX90640 pixels)
     """
 
-    def __init__(self, frame, time_us, read_no, plot_frame=True, plot_no=0):
+    def __init__(self, processor, frame, time_us, read_no, plot_frame=True, plot_no=0):
         """Default constructor
+        processor   - MLX90640Processor with the dataset this frame belongs to
         frame       - array with the pixel data
         time_us     - timestamp (in microseconds) at which the image was taken
         read_no     - index in which it was read from the raw file
@@ -28,14 +31,15 @@ class MLX90640Frame(logger.LoggingClass):
         """
         super(MLX90640Frame, self).__init__()
 
+        self.processor = processor
         self.frame = frame
         self.time_us = time_us
         self.read_no = read_no
         self.plot_frame = plot_frame
         self.plot_no = plot_no
 
-        self.image_filename = "-".join([MLX90640Processor.dataset_name, "{:04d}".format(self.plot_no)]) + '.png'
-        self.image_filepath = os.path.join(MLX90640Processor.dataset_dirpath, self.image_filename)
+        self.image_filename = "-".join([self.processor.dataset_name, "{:04d}".format(self.plot_no)]) + '.png'
+        self.image_filepath = os.path.join(self.processor.dataset_dirpath, self.image_filename)
 
         self.process()
 
@@ -81,31 +85,33 @@ class MLX90640Frame(logger.LoggingClass):
         This method plots the frame in a 2D diagram, representing the values of the temperature for each of the pixels.
         """
 
+        pl = self.processor.pyplot()
         fig, ax = pl.subplots()
-        fig.suptitle(f"{MLX90640Processor.dataset_name}@{self.time_us/1e6:3.3f} (s), dT = {self.diff_t_12:2.3f} (degC)")
+        fig.suptitle(f"{self.processor.dataset_name}@{self.time_us/1e6:3.3f} (s), dT = {self.diff_t_12:2.3f} (degC)")
 
         self._plot_frame(fig, ax)
 
         pl.savefig(self.image_filepath)
         pl.close()
 
-    def _plot_frame(self, fig, ax, cmap='jet'):
+    def _plot_frame(self, fig, ax, cmap=None):
         """Plot Method (PRIVATE)
         This method plots the 2D diagram with the frame in the given figure and axis.
         fig - Matplotlib figure where to plot the frame
         ax - Axes of the Matplotlib figure where to plot the frame
-        cmap='jet' - Colormap used for the representation of the temperature values, 'nipy_spectral'
+        cmap=None - Colormap used for the representation of the temperature values, COLORMAP of the processor
+                    when None ('jet', 'nipy_spectral'...)
         """
 
         image = ax.imshow(
-            self.frame, aspect='auto', cmap=pl.get_cmap(cmap),
-            vmin=MLX90640Processor.T_MIN_C, vmax=MLX90640Processor.T_MAX_C
+            self.frame, aspect='auto', cmap=cmap or self.processor.COLORMAP,
+            vmin=self.processor.T_MIN_C, vmax=self.processor.T_MAX_C
         )
         fig.colorbar(image, ax=ax, fraction=0.0825, aspect=100)
 
-        self._annotateTemperature(ax, MLX90640Processor.REF_PIXEL_0, self.ref_t_0)
-        self._annotateTemperature(ax, MLX90640Processor.REF_PIXEL_1, self.ref_t_1)
-        self._annotateTemperature(ax, MLX90640Processor.REF_PIXEL_2, self.ref_t_2)
+        self._annotateTemperature(ax, self.processor.REF_PIXEL_0, self.ref_t_0)
+        self._annotateTemperature(ax, self.processor.REF_PIXEL_1, self.ref_t_1)
+        self._annotateTemperature(ax, self.processor.REF_PIXEL_2, self.ref_t_2)
         self._annotateTemperature(ax, self.min_pixel, self.min_value, label="min")
         self._annotateTemperature(ax, self.max_pixel, self.max_value, label="max")
 
@@ -113,11 +119,11 @@ class MLX90640Frame(logger.LoggingClass):
         """
         This method processes the given frame in order to analyze the thermal resistance of the image.
         """
-        self._l.debug(f"> Processing: {MLX90640Processor.dataset_name}@{self.time_us:.0f}")
+        self._l.debug(f"> Processing: {self.processor.dataset_name}@{self.time_us:.0f}")
 
-        self.ref_t_0 = self.temperature(MLX90640Processor.REF_PIXEL_0)
-        self.ref_t_1 = self.temperature(MLX90640Processor.REF_PIXEL_1)
-        self.ref_t_2 = self.temperature(MLX90640Processor.REF_PIXEL_2)
+        self.ref_t_0 = self.temperature(self.processor.REF_PIXEL_0)
+        self.ref_t_1 = self.temperature(self.processor.REF_PIXEL_1)
+        self.ref_t_2 = self.temperature(self.processor.REF_PIXEL_2)
 
         self.diff_t_12 = np.abs(self.ref_t_1 - self.ref_t_2)
 
@@ -170,35 +176,52 @@ class MLX90640Processor(logger.LoggingClass):
     T_MAX_C         = 100.
     T_MIN_C         = -15.
     T_RANGE         = T_MAX_C - T_MIN_C
+    COLORMAP        = 'jet'
 
-    def calculate_reference_pixels(self):
+    HEATMAP_BATCH   = 64
+    STAGES          = ('read', 'analyze', 'render', 'overall', 'ffmpeg')
+
+    @classmethod
+    def reference_pixels(cls, distance_mm, px_distance_mm):
         """
-        This function calculates the position within the matrix of the pixels to be used as a reference
-        for the calculation of the thermal resistance. It uses the given target physical distance, and
-        it calculates which pixels correspond to that distance.
+        This function calculates the GSD at the given distance and, with it, the position within the matrix
+        of the pixels that are at the given physical distance from the center of the frame.
+        Returns a (gsd_mm, ref_pixels_distance, (REF_PIXEL_0, REF_PIXEL_1, REF_PIXEL_2)) tuple.
         """
-
-        self.gsd_mm = (
-            self.PIXEL_XSIDE_MM * self.distance_mm / self.FOCAL_LENGTH_MM,
-            self.PIXEL_YSIDE_MM * self.distance_mm / self.FOCAL_LENGTH_MM
+        gsd_mm = (
+            cls.PIXEL_XSIDE_MM * distance_mm / cls.FOCAL_LENGTH_MM,
+            cls.PIXEL_YSIDE_MM * distance_mm / cls.FOCAL_LENGTH_MM
         )
-        self.ref_pixels_distance = (
-            int(self.px_distance_mm / self.gsd_mm[0]),
-            int(self.px_distance_mm / self.gsd_mm[1])
+        ref_pixels_distance = (
+            int(px_distance_mm / gsd_mm[0]),
+            int(px_distance_mm / gsd_mm[1])
         )
 
-        MLX90640Processor.REF_PIXEL_0 = (
-            int(self.PIXELS_X * 0.5),
-            int(self.PIXELS_Y * 0.5)
+        ref_pixel_0 = (
+            int(cls.PIXELS_X * 0.5),
+            int(cls.PIXELS_Y * 0.5)
         )
-        MLX90640Processor.REF_PIXEL_1 = (
-            int(self.PIXELS_X * 0.5) + self.ref_pixels_distance[0],
-            int(self.PIXELS_Y * 0.5)
+        ref_pixel_1 = (
+            int(cls.PIXELS_X * 0.5) + ref_pixels_distance[0],
+            int(cls.PIXELS_Y * 0.5)
         )
-        MLX90640Processor.REF_PIXEL_2 = (
-            int(self.PIXELS_X * 0.5) - self.ref_pixels_distance[0],
-            int(self.PIXELS_Y * 0.5)
+        ref_pixel_2 = (
+            int(cls.PIXELS_X * 0.5) - ref_pixels_distance[0],
+            int(cls.PIXELS_Y * 0.5)
         )
+        return gsd_mm, ref_pixels_distance, (ref_pixel_0, ref_pixel_1, ref_pixel_2)
+
+    def calculate_reference_pixels(self):
+        """
+        This function calculates the position within the matrix of the pixels to be used as a reference
+        for the calculation of the thermal resistance. It uses the given target physical distance, and
+        it calculates which pixels correspond to that distance.
+        """
+
+        self.gsd_mm, self.ref_pixels_distance, ref_pixels = self.reference_pixels(
+            self.distance_mm, self.px_distance_mm
+        )
+        self.REF_PIXEL_0, self.REF_PIXEL_1, self.REF_PIXEL_2 = ref_pixels
 
         self._l.debug(f"gsd (mm) = {self.gsd_mm}")
         self._l.debug(f"PIXEL_XSIDE_MM = {self.PIXEL_XSIDE_MM}")
@@ -207,13 +230,93 @@ class MLX90640Processor(logger.LoggingClass):
         self._l.debug(f"> r_pix_1 = ({self.REF_PIXEL_1})")
         self._l.debug(f"> r_pix_2 = ({self.REF_PIXEL_2})")
 
+    def calculate_rois(self):
+        """
+        This function converts the definitions of the regions of interest, in mm, into the pixels of the
+        frame with the GSD calculated for the reference pixels.
+        """
+        if not self.rois:
+            return
+
+        definitions, percentiles = self.rois, self.roi_percentiles
+        if isinstance(definitions, str):
+            definitions, file_percentiles = rois.load(definitions)
+            percentiles = file_percentiles if percentiles is None else percentiles
+
+        self.roi_analysis = rois.ROIAnalysis(definitions, self.gsd_mm, self.FRAME_SHAPE, percentiles=percentiles)
+        for roi, pixels in zip(self.roi_analysis.rois, self.roi_analysis.pixels):
+            self._l.debug(f"> roi {roi.name} ({roi.shape}) = {pixels.size} pixels")
+
+    def calculate_cache_keys(self):
+        """
+        This function calculates the keys of the cache for each stage, out of the parameters that the
+        results of each stage depend on. The frames only depend on the reference pixels and not on the
+        distances used to calculate them, so that they are not rendered again if the pixels do not change;
+        they do depend on the validation, which decides the frames that are analyzed and hence selected.
+        """
+        if self.cache is None:
+            return
+
+        validated = dict(validate=True) if self.validate else {}
+        ref_pixels = (self.REF_PIXEL_0, self.REF_PIXEL_1, self.REF_PIXEL_2)
+        self.cache_keys = {}
+        self.cache_keys['analysis'] = self.cache.key(
+            distance_mm=self.distance_mm, px_distance_mm=self.px_distance_mm, **validated
+        )
+        figures = dict(
+            t_min=self.T_MIN_C, t_max=self.T_MAX_C, cmap=self.COLORMAP, fontsize=self.fontsize, fps=self.fps
+        )
+        selected = dict(jump_frames=self.jump_frames) if self.selector is None else self.selector.definition()
+        selected.update(validated)
+        self.cache_keys['frames'] = self.cache.key(ref_pixels=ref_pixels, **selected, **figures)
+        self.cache_keys['overall'] = self.cache.key(analysis=self.cache_keys['analysis'], **figures)
+        if self.roi_analysis is not None:
+            self.cache_keys['rois'] = self.cache.key(
+                analysis=self.cache_keys['analysis'], **self.roi_analysis.definition()
+            )
+        if self.heatmap:
+            # the adaptive selection depends on the analyzed values, hence on the reference pixels
+            analyzed = {} if self.selector is None else dict(ref_pixels=ref_pixels)
+            self.cache_keys['video'] = self.cache.key(heatmap=True, fps=self.fps, **selected, **analyzed)
+        else:
+            self.cache_keys['video'] = self.cache.key(heatmap=False, frames=self.cache_keys['frames'])
+
+    def cached(self, stage):
+        """Whether the results of the given stage are cached and still valid"""
+        if self.cache is None:
+            return False
+        if self.cache.valid(stage, self.cache_keys[stage]):
+            self._l.debug(f"Reusing cached results for stage <{stage}>")
+            self.profiler.count('stages_cached')
+            return True
+        self.cache.invalidate(stage)
+        return False
+
+    def cache_update(self, stage, filepaths):
+        """Records the files generated by the given stage in the cache"""
+        if self.cache is not None:
+            self.cache.update(stage, self.cache_keys[stage], filepaths)
+
     def __init__(
         self,
         fps, distance_mm, raw_filepath,
         px_distance_mm=20,
         plot_frames=True, plot_general=True, jump_frames=4,
         update=False,
-        fontsize=9
+        fontsize=9,
+        vectorized=True,
+        workers=None,
+        save_frames=True,
+        stream_video=True,
+        heatmap=False,
+        use_cache=True,
+        profile=False,
+        profile_stage=None,
+        rois=None,
+        roi_percentiles=None,
+        window_s=temporal.TemporalAnalysis.WINDOW_S,
+        validate=False,
+        adaptive=None
     ):
         """Default constructor
         fps                 - frames per second, necessary to calculate the timeline
@@ -224,9 +327,31 @@ class MLX90640Processor(logger.LoggingClass):
         jump_frames=4       - fraction of frames to be plot
         update=False        - whether to update datasets whose results already exists
         fontsize=9          - default fontsize for the generated figures
+        vectorized=True     - whether to analyze all the frames at once (True) or frame by frame (False)
+        workers=None        - number of processes for rendering the frames (vectorized), None for one per CPU
+        save_frames=True    - whether to save the rendered frames as PNG images (vectorized)
+        stream_video=True   - whether to stream the rendered frames directly into ffmpeg (vectorized)
+        heatmap=False       - whether to encode the video with the heatmap of the streamer, not the figures
+        use_cache=True      - whether to reuse the results of the stages whose inputs did not change (vectorized)
+        profile=False       - whether to write a report with the time spent on each stage (profile.json)
+        profile_stage=None  - stage to be profiled with cProfile (read, analyze, render, overall, ffmpeg)
+        rois=None           - regions of interest to be analyzed: list with their definitions (see rois.ROI)
+                                or path to the JSON file with them (see rois.load), None for none
+        roi_percentiles=None- percentiles to be calculated for every region, those of the file or the default
+                                ones (rois.ROIAnalysis.PERCENTILES) when None
+        window_s=10         - seconds of the trailing window for the moving averages and slopes (temporal)
+        validate=False      - whether to check the integrity of the RAW file first (see integrity), skipping
+                                all the bad frames and not only those with NaN values (vectorized)
+        adaptive=None       - whether to select the frames to be plot by the changes of the scene and its events
+                                instead of one out of every jump_frames (vectorized): True or a dictionary with
+                                the options of selection.FrameSelector (as budget), None for jump_frames
         """
         super(MLX90640Processor, self).__init__()
 
+        if not vectorized and raw_filepath.endswith(container.EXTENSION):
+            self._l.warning(f"Compressed containers are not supported frame by frame, {raw_filepath} is vectorized")
+            vectorized = True
+
         self.fps = fps
         self.distance_mm = distance_mm
         self.raw_filepath = raw_filepath
@@ -236,40 +361,292 @@ class MLX90640Processor(logger.LoggingClass):
         self.jump_frames = jump_frames
         self.update = update
         self.fontsize = fontsize
+        self.vectorized = vectorized
+        self.workers = workers
+        self.save_frames = save_frames
+        self.stream_video = stream_video and vectorized
+        self.heatmap = heatmap
+        self.use_cache = use_cache and vectorized
+        self.profiler = profiling.StageProfiler(
+            enabled=profile or profile_stage is not None, profile_stage=profile_stage
+        )
+        self.rois = rois
+        self.roi_percentiles = roi_percentiles
+        self.roi_analysis = None
+        self.window_s = window_s
+        self.temporal = None
+        self.validate = validate and vectorized and not raw_filepath.endswith(container.EXTENSION)
+        if validate and not self.validate:
+            self._l.warning("Validation is only supported for RAW files, vectorized, not validating")
+        self.integrity_report = None
+        if adaptive and not vectorized:
+            self._l.warning("Adaptive selection of frames is not supported frame by frame, using jump_frames")
+        self.selector = None
+        if adaptive and vectorized:
+            self.selector = selection.FrameSelector(fps, **(adaptive if isinstance(adaptive, dict) else {}))
 
         self.timestep_us = 1e6 / self.fps
+        self.video_fps = self.fps / self.jump_frames
         self.frames = []
+        self.dataset = None
+        self.indexes = None
+        self.analysis = None
+        self.selected = None
 
-        font = {'family': 'normal', 'weight': 'bold', 'size': self.fontsize}
-        mp.rc('font', **font)
-        mp.rcParams.update({'savefig.dpi': 150})
-
-        MLX90640Processor.dataset_name = pathlib.Path(self.raw_filepath).stem
-        MLX90640Processor.dataset_dirpath = os.path.join(
+        self.dataset_name = pathlib.Path(self.raw_filepath).stem
+        self.dataset_dirpath = os.path.join(
             os.path.dirname(os.path.abspath(self.raw_filepath)), self.dataset_name
         )
 
+        self.cache = cache.ResultsCache(self.dataset_dirpath, self.raw_filepath) if self.use_cache else None
+
         if os.path.isdir(self.dataset_dirpath) and os.path.exists(self.dataset_dirpath):
-            if not self.update:
+            if self.update:
+                self._l.debug(f"Updating results for dataset {self.dataset_name}")
+                shutil.rmtree(self.dataset_dirpath, ignore_errors=True)
+                os.mkdir(self.dataset_dirpath)
+                if self.cache is not None:
+                    self.cache = cache.ResultsCache(self.dataset_dirpath, self.raw_filepath)
+            elif self.cache is None or not self.cache.exists():
                 raise Exception(f"Results already exists for dataset {self.dataset_name}, skipping")
-            self._l.debug(f"Updating results for dataset {self.dataset_name}")
-            shutil.rmtree(self.dataset_dirpath, ignore_errors=True)
-        os.mkdir(self.dataset_dirpath)
+            else:
+                self._l.debug(f"Reusing the cached results for dataset {self.dataset_name}")
+        else:
+            os.mkdir(self.dataset_dirpath)
 
         self.image_filepath = os.path.join(self.dataset_dirpath, 'overall.png')
         self.video_filepath = os.path.join(self.dataset_dirpath, 'overall.mp4')
         self.image_wildcard = "{}-%04d.png".format(self.dataset_name)
+        self.analysis_filepath = os.path.join(self.dataset_dirpath, 'analysis.npz')
+        self.results_filepath = os.path.join(self.dataset_dirpath, results.DatasetResults.FILENAME)
+        self.rois_filepath = os.path.join(self.dataset_dirpath, 'rois.npz')
+        self.temporal_filepath = os.path.join(self.dataset_dirpath, 'temporal.npz')
 
         self.calculate_reference_pixels()
+        self.calculate_rois()
+        self.calculate_cache_keys()
         self.process()
+        self.analyze_rois()
+        self.render()
         self.postprocess()
 
+        self.profile_report = None
+        if self.profiler.enabled:
+            self.profile_report = self.profiler.write(self.dataset_dirpath)
+            self._l.info(f"Profile of dataset {self.dataset_name}:\n\t{self.profiler.format(self.profile_report)}")
+
     def process(self):
         """
         This method reads the frames from the given file, where the RAW data is supposed to be stored.
             > The image frames are to be stored as a sequence of float32 numbers, in binary format.
             > The data is to be stored as 24 arrays of 32 consecutive float32 numbers.
         """
+        if self.vectorized:
+            self._process_vectorized()
+        else:
+            # frames are read, analyzed and plotted one by one, all of it is accounted as the analysis
+            with self.profiler.stage('analyze'):
+                self._process_frames()
+            self.profiler.count('frames_read', self.no_frames)
+            self.profiler.count('frames_analyzed', self.no_frames)
+            self.profiler.count('frames_plotted', sum(1 for f in self.frames if f.plot_frame))
+
+    def load(self):
+        """
+        This method maps the RAW file in memory as a (N, PIXELS_Y, PIXELS_X) block of frames and selects the
+        indexes of the frames to be analyzed. An incomplete frame at the end of the file is discarded and
+        so are the frames with NaN values, as the frame by frame processing does. When validating, all the
+        bad frames found by the integrity scanner are discarded, and shifted files are refused.
+        """
+        with self.profiler.stage('read'):
+            self.dataset = container.open_dataset(self.raw_filepath, fps=self.fps)
+
+            if self.validate:
+                self.indexes = self.check_integrity()
+            else:
+                valid = self.dataset.valid()
+                self.indexes = np.flatnonzero(valid)
+
+        self.profiler.count('frames_read', len(self.dataset))
+        self.profiler.count('frames_skipped', len(self.dataset) - self.indexes.size)
+        if self.indexes.size < len(self.dataset):
+            self._l.warning(f"Skipping {len(self.dataset) - self.indexes.size} frames with invalid values")
+
+    def check_integrity(self):
+        """
+        This method scans the RAW file for damaged frames and pixels (see integrity.IntegrityScanner) and
+        returns the indexes of the good frames. The files with frames shifted by a partial write cannot be
+        analyzed as they are, they have to be repaired first.
+        """
+        scanner = integrity.IntegrityScanner(self.raw_filepath)
+        self.integrity_report = scanner.scan()
+        scanner.close()
+        if not self.integrity_report['ok']:
+            self._l.warning(f"Integrity of dataset {self.dataset_name}:\n\t{scanner.format(self.integrity_report)}")
+        if self.integrity_report['shifts']:
+            raise Exception(
+                f"Frames shifted by a partial write in dataset {self.dataset_name}, repair it first with: "
+                f"python -m processor.integrity -r {self.raw_filepath} -o REPAIRED_FILE"
+            )
+        return np.flatnonzero(scanner.flags & integrity.BAD == 0)
+
+    def _process_vectorized(self):
+        """
+        This method analyzes all the frames from the RAW file at once, unless the results of a previous
+        analysis with the same inputs are still in the cache.
+        """
+        ref_pixels = (self.REF_PIXEL_0, self.REF_PIXEL_1, self.REF_PIXEL_2)
+
+        if self.cached('analysis'):
+            with self.profiler.stage('analyze'):
+                self.dataset = container.open_dataset(self.raw_filepath, fps=self.fps)
+                self.analysis = analysis.MLX90640Analysis(None, ref_pixels)
+                self.indexes = self.analysis.restore(self.analysis_filepath)['indexes']
+                self.no_frames = self.analysis.no_frames
+            return
+
+        self.load()
+        with self.profiler.stage('analyze'):
+            self.analysis = analysis.MLX90640Analysis(None, ref_pixels)
+            self.analysis.process_dataset(self.dataset)
+            if self.indexes.size < len(self.dataset):
+                self.analysis.select(self.indexes)
+            self.no_frames = self.analysis.no_frames
+
+            if self.cache is not None:
+                self.analysis.save(self.analysis_filepath, indexes=self.indexes)
+                self.cache_update('analysis', [self.analysis_filepath])
+        self.profiler.count('frames_analyzed', self.no_frames)
+
+    def analyze_rois(self):
+        """
+        This method analyzes the regions of interest over all the analyzed frames, in a single batched pass
+        over the dataset (see rois.ROIAnalysis), and saves their results as rois.npz. Since the regions
+        are cached as a stage of their own, adding a region does not analyze the dataset again.
+        """
+        if self.roi_analysis is None:
+            return
+
+        if self.cached('rois'):
+            self.roi_analysis.restore(self.rois_filepath)
+            return
+
+        with self.profiler.stage('analyze'):
+            if self.dataset is None:
+                # the frame by frame processing does not map the dataset
+                self.dataset = container.open_dataset(self.raw_filepath, fps=self.fps)
+                self.indexes = np.flatnonzero(self.dataset.valid())
+            self.roi_analysis.process(self.dataset, self.indexes)
+            self.roi_analysis.save(self.rois_filepath)
+        self.cache_update('rois', [self.rois_filepath])
+        self._l.debug(f"Results of the ROIs saved as: {self.rois_filepath}")
+
+    def select(self):
+        """
+        This method returns the positions of the analyzed frames to be plot: those chosen by the adaptive
+        selector (see selection.FrameSelector) or one out of every jump_frames.
+        """
+        if self.selected is None:
+            if self.selector is None:
+                self.selected = np.arange(0, self.no_frames, self.jump_frames)
+            else:
+                self.selected = self.selector.select(self.analysis)
+            self.profiler.count('frames_selected', self.selected.size)
+        return self.selected
+
+    def render(self):
+        """
+        This method renders the selected analyzed frames (see select), once the analysis is complete. The
+        frames are distributed over a pool of processes, where each process reuses a single figure for all
+        the frames that it renders. The frames are saved as images (save_frames) and/or streamed in order
+        into ffmpeg to encode the video (stream_video), without reading back the images. The frames are only
+        saved when plotting them (plot_frames), but they are still rendered for the video (plot_general).
+        """
+        if not self.vectorized:
+            return
+
+        encode = self.plot_general and self.stream_video and not self.cached('video')
+        save = self.plot_frames and self.save_frames and not self.cached('frames')
+        if encode and self.heatmap:
+            with self.profiler.stage('ffmpeg'):
+                self.encode_heatmap()
+            self.cache_update('video', [self.video_filepath])
+            encode = False
+        if not (save or encode):
+            return
+
+        a = self.analysis
+        jobs = [
+            (
+                self.indexes[i],
+                os.path.join(
+                    self.dataset_dirpath, "-".join([self.dataset_name, "{:04d}".format(plot_no)]) + '.png'
+                ) if save else None,
+                f"{self.dataset_name}@{i * self.timestep_us / 1e6:3.3f} (s), dT = {a.diff[i]:2.3f} (degC)",
+                [
+                    (self.REF_PIXEL_0, a.t0[i], ""),
+                    (self.REF_PIXEL_1, a.t1[i], ""),
+                    (self.REF_PIXEL_2, a.t2[i], ""),
+                    (tuple(a.min_pixel[i]), a.min[i], "min"),
+                    (tuple(a.max_pixel[i]), a.max[i], "max")
+                ]
+            )
+            for plot_no, i in enumerate(self.select(), start=1)
+        ]
+        renderer_args = dict(
+            shape=self.FRAME_SHAPE, t_min=self.T_MIN_C, t_max=self.T_MAX_C, cmap=self.COLORMAP,
+            fontsize=self.fontsize
+        )
+
+        self._l.debug(f"Rendering {len(jobs)} frames, workers = {self.workers}, images = {save}, video = {encode}")
+        self.profiler.count('frames_plotted', len(jobs))
+        with self.profiler.stage('render'):
+            if not encode:
+                renderer.render_frames(self.raw_filepath, jobs, workers=self.workers, **renderer_args)
+            else:
+                # the frames are encoded while they are rendered, ffmpeg is accounted within this stage
+                with video.VideoEncoder(self.video_filepath, self.video_fps) as encoder:
+                    for rgb in renderer.iter_frames(
+                        self.raw_filepath, jobs, workers=self.workers, rgb=True, **renderer_args
+                    ):
+                        encoder.write(rgb)
+        if encode:
+            self.cache_update('video', [self.video_filepath])
+
+        if save:
+            self.cache_update('frames', [job[1] for job in jobs])
+
+    def encode_heatmap(self):
+        """
+        This method encodes the video with the selected analyzed frames (see select), rendered with the
+        false-colour heatmap of the streamer in batches, instead of with the figures. The frames from the
+        RAW files written by rawrgb are already flipped, hence they are not flipped again.
+        """
+        indexes = self.indexes[self.select()]
+        heatmap_renderer = heatmap.HeatmapRenderer(flip=False)
+
+        self._l.debug(f"Encoding {indexes.size} frames as heatmaps")
+        with video.VideoEncoder(self.video_filepath, self.video_fps) as encoder:
+            for start in range(0, indexes.size, self.HEATMAP_BATCH):
+                for rgb in heatmap_renderer.render(self.dataset[indexes[start:start + self.HEATMAP_BATCH]]):
+                    encoder.write(rgb)
+
+    def frame(self, index, plot_frame=False, plot_no=0):
+        """
+        This method returns the MLX90640Frame object for the frame analyzed in the given position.
+        """
+        if not self.vectorized:
+            return self.frames[index]
+        index = range(self.no_frames)[index]
+        return MLX90640Frame(
+            self, self.dataset[self.indexes[index]], index * self.timestep_us, index,
+            plot_frame=plot_frame, plot_no=plot_no
+        )
+
+    def _process_frames(self):
+        """
+        This method reads and processes the frames one by one, creating a MLX90640Frame object for each.
+        """
         time_us = 0.0
         i = 0
         plot_frame = False
@@ -288,7 +665,7 @@ class MLX90640Processor(logger.LoggingClass):
                     else:
                         plot_frame = False
 
-                    frame = MLX90640Frame(array, time_us, i, plot_frame=plot_frame, plot_no=plot_no)
+                    frame = MLX90640Frame(self, array, time_us, i, plot_frame=plot_frame, plot_no=plot_no)
                     self.frames.append(frame)
 
                     if self.plot_frames and (i % self.jump_frames == 0):
@@ -304,12 +681,23 @@ class MLX90640Processor(logger.LoggingClass):
                     print(f"[warn] Error processing frame, skipping...")
                     continue
 
+        self.no_frames = len(self.frames)
+
     def frames2vectors(self):
         """
         This method postprocesses the read frames and generates the vectors with the time dependent results.
         NOTE: to be invoked after self.no_frames variable has been set.
         """
 
+        if self.vectorized:
+            self.t0     = self.analysis.t0.astype(np.float64)
+            self.t1     = self.analysis.t1.astype(np.float64)
+            self.t2     = self.analysis.t2.astype(np.float64)
+            self.diff   = self.analysis.diff.astype(np.float64)
+            self.max    = self.analysis.max.astype(np.float64)
+            self.min    = self.analysis.min.astype(np.float64)
+            return
+
         self.t0     = np.zeros([self.no_frames])
         self.t1     = np.zeros([self.no_frames])
         self.t2     = np.zeros([self.no_frames])
@@ -334,7 +722,6 @@ class MLX90640Processor(logger.LoggingClass):
         This method post-processes the read frames in order to create time-driven behavior variables.
         """
 
-        self.no_frames = len(self.frames)
         self.duration = self.no_frames / self.fps
         self.t = np.linspace(0., self.duration, num=self.no_frames)
 
@@ -348,15 +735,85 @@ class MLX90640Processor(logger.LoggingClass):
         self.max_T2REF_index = np.where(self.t2 == self.max_T2REF_value)[0][0]
         self.max_T2REF_time  = self.max_T2REF_index / self.fps
 
+        self.analyze_temporal()
+        self.save_results()
+
         if self.plot_general:
-            self.plot()
-            self.video()
+            if not self.cached('overall'):
+                with self.profiler.stage('overall'):
+                    self.plot()
+                self.cache_update('overall', [self.image_filepath])
+            if not self.stream_video and not self.cached('video'):
+                with self.profiler.stage('ffmpeg'):
+                    self.video()
+                self.cache_update('video', [self.video_filepath])
+
+    def analyze_temporal(self):
+        """
+        This method calculates the temporal analytics (moving averages, slopes, steady state and exponential
+        fits, see temporal.TemporalAnalysis) of the reference pixels, their difference and the mean of each
+        region of interest, and saves them as temporal.npz.
+        """
+        names = ['t0', 't1', 't2', 'diff']
+        series = [self.t0, self.t1, self.t2, self.diff]
+        if self.roi_analysis is not None:
+            names += [f"roi_{name}" for name in self.roi_analysis.names]
+            series += list(self.roi_analysis.results['mean'].T)
+
+        self.temporal = temporal.TemporalAnalysis(self.fps, names, window_s=self.window_s)
+        self.temporal.process(np.stack(series, axis=1))
+        self.temporal.save(self.temporal_filepath)
+
+        diff = self.temporal.summary()['diff']
+        self._l.debug(
+            f"dT: max slope = {diff['max_slope']} (degC/s) @ {diff['max_slope_time']} (s), "
+            f"steady @ {diff['steady_time']} (s), tau = {diff['fit_tau_s']} (s), final = {diff['fit_t_inf']} (degC)"
+        )
+
+    def pyplot(self):
+        """
+        This method imports pyplot and configures the fonts and the resolution of the figures. Matplotlib is
+        only imported when something has to be plotted, since importing it takes longer than analyzing
+        most of the datasets.
+        """
+        import matplotlib as mp
+        import matplotlib.pyplot as pl
+
+        font = {'family': 'normal', 'weight': 'bold', 'size': self.fontsize}
+        mp.rc('font', **font)
+        mp.rcParams.update({'savefig.dpi': 150})
+        return pl
+
+    def save_results(self):
+        """
+        This method stores the time-dependent variables and the summary values of the dataset in columnar
+        format, so that they can be queried across datasets without reading the RAW files again. The results
+        of the temporal analytics of each probe are stored as scalars too (<probe>_<result>, NaN when not
+        available), as diff_fit_tau_s or t2_steady_time.
+        """
+        scalars = {name: getattr(self, name) for name in results.DatasetResults.SCALARS}
+        for probe, summary in self.temporal.summary().items():
+            for name in temporal.TemporalAnalysis.RESULTS:
+                scalars[f"{probe}_{name}"] = np.nan if summary[name] is None else summary[name]
+
+        results.DatasetResults.save(
+            self.results_filepath,
+            columns={name: getattr(self, name) for name in results.DatasetResults.COLUMNS},
+            scalars=scalars,
+            metadata=dict(
+                name=self.dataset_name, fps=self.fps, distance_mm=self.distance_mm,
+                px_distance_mm=self.px_distance_mm,
+                ref_pixels=(self.REF_PIXEL_0, self.REF_PIXEL_1, self.REF_PIXEL_2)
+            )
+        )
+        self._l.debug(f"Results saved as: {self.results_filepath}")
 
     def plot(self):
         """
         This method plots the resulting time-dependent variables.
         NOTICE: it requires of postprocess() to have been correctly executed.
         """
+        pl = self.pyplot()
         fig = pl.figure(constrained_layout=True, figsize=(11.69,8.27))
         gs  = fig.add_gridspec(2, 2)
         ax1 = fig.add_subplot(gs[:, 0])
@@ -369,8 +826,8 @@ class MLX90640Processor(logger.LoggingClass):
         ax3.set_title(f"@{self.t[-1]:3.3f}, FINAL")
 
         self._plot_overall(ax1)
-        self.frames[self.max_dT_index]._plot_frame(fig, ax2)
-        self.frames[-1]._plot_frame(fig, ax3)
+        self.frame(self.max_dT_index)._plot_frame(fig, ax2)
+        self.frame(-1)._plot_frame(fig, ax3)
 
         self._l.info(f"Saving general figure as: {self.image_filepath}")
         pl.savefig(self.image_filepath)
@@ -433,20 +890,19 @@ class MLX90640Processor(logger.LoggingClass):
 
         ffmpeg_call = [
             "ffmpeg",
-            "-r 4", "-f image2 -s 640x480",
-            "-i {}".format(self.image_wildcard),
-            "-vcodec libx264",
-            "-crf 25",
-            "-pix_fmt yuv420p",
-            "{}".format(self.video_filepath),
+            "-r", f"{self.video_fps}", "-f", "image2",
+            "-i", self.image_wildcard,
+            "-vcodec", "libx264",
+            "-crf", "25",
+            "-pix_fmt", "yuv420p",
+            self.video_filepath,
             "-y"
         ]
-        ffmpeg_shell_call = ' '.join(ffmpeg_call)
 
-        self._l.debug(f"Calling <ffmpeg> as follows (SHELL): {ffmpeg_shell_call}")
+        self._l.debug(f"Calling <ffmpeg> as follows: {' '.join(ffmpeg_call)}")
         self._l.debug(f"Calling <ffmpeg> with cwd = {self.dataset_dirpath}")
 
-        output = subprocess.check_output(ffmpeg_shell_call, shell=True, cwd=self.dataset_dirpath)
+        output = subprocess.check_output(ffmpeg_call, cwd=self.dataset_dirpath)
 
     @staticmethod
     def create(argv):
@@ -466,9 +922,117 @@ class MLX90640Processor(logger.LoggingClass):
             "-d", "--distance", type=float, required=True,
             help="Distance in mm from the output of the lens' telescope to the target material"
         )
+        parser.add_argument(
+            "-x", "--px-distance", type=float, required=False, default=20,
+            help="Distance in mm from the reference pixel P0 to P1 or P2"
+        )
+        parser.add_argument(
+            "-u", "--update",
+            action='store_true', required=False,
+            help="Discards all the existing (or cached) results for the dataset and processes it again"
+        )
+        parser.add_argument(
+            "-p", "--per-frame",
+            action='store_true', required=False,
+            help="Processes the frames one by one, instead of analyzing all of them at once"
+        )
+
+        parser.add_argument(
+            "-w", "--workers", type=int, required=False,
+            help="Number of processes for rendering the frames, one per CPU by default"
+        )
+        parser.add_argument(
+            "-n", "--no-pngs",
+            action='store_true', required=False,
+            help="Does not save the rendered frames as PNG images, they are only streamed into the video"
+        )
+
+        parser.add_argument(
+            "-m", "--heatmap",
+            action='store_true', required=False,
+            help="Encodes the video with the false-colour heatmap of the streamer, instead of the figures"
+        )
+
+        parser.add_argument(
+            "--no-frames",
+            action='store_true', required=False,
+            help="Does not render the frames (nor the video made out of them)"
+        )
+        parser.add_argument(
+            "--no-general",
+            action='store_true', required=False,
+            help="Does not plot the overall figure with the time-dependent variables"
+        )
+
+        parser.add_argument(
+            "-s", "--stats",
+            action='store_true', required=False,
+            help="Only prints the summary of the dataset: no figures, no videos and no output directory"
+        )
+        parser.add_argument(
+            "--summary", type=str, metavar="FILE", required=False,
+            help="Writes the summary of the stats-only mode as JSON into the given file"
+        )
+
+        parser.add_argument(
+            "--window", type=float, required=False, default=temporal.TemporalAnalysis.WINDOW_S,
+            help="Seconds of the trailing window for the moving averages and the slopes"
+        )
+        parser.add_argument(
+            "--rois", type=files.is_readable_file, metavar="FILE", required=False,
+            help="JSON file with the regions of interest to be analyzed, their results are saved as rois.npz"
+        )
+        parser.add_argument(
+            "--validate",
+            action='store_true', required=False,
+            help="Checks the integrity of the RAW file first, skipping all its bad frames"
+        )
+
+        parser.add_argument(
+            "-a", "--adaptive",
+            action='store_true', required=False,
+            help="Selects the frames to be rendered by the changes of the scene and its events, not 1 every N"
+        )
+        parser.add_argument(
+            "-b", "--budget", type=int, required=False,
+            help="Maximum number of frames to be rendered with the adaptive selection"
+        )
+        parser.add_argument(
+            "--change", type=float, required=False, default=selection.FrameSelector.CHANGE_C,
+            help="Degrees of change of the scene in between the frames selected adaptively"
+        )
+        parser.add_argument(
+            "--slope", type=float, required=False,
+            help="Degrees per second of dT above which all the frames are selected adaptively"
+        )
+
+        parser.add_argument(
+            "-P", "--profile",
+            action='store_true', required=False,
+            help="Writes a report with the time spent on each stage into the output directory (profile.json)"
+        )
+        parser.add_argument(
+            "--profile-stage",
+            choices=MLX90640Processor.STAGES, required=False,
+            help="Profiles the given stage with cProfile, into the output directory (profile-STAGE.prof)"
+        )
 
         args = parser.parse_args(argv)
-        return MLX90640Processor(args.fps, args.distance, args.raw_file)
+        if args.stats:
+            from processor import stats
+            return stats.MLX90640Stats.run(
+                args.fps, args.distance, args.raw_file, px_distance_mm=args.px_distance,
+                summary_filepath=args.summary, rois=args.rois, window_s=args.window
+            )
+
+        return MLX90640Processor(
+            args.fps, args.distance, args.raw_file, px_distance_mm=args.px_distance, update=args.update,
+            plot_frames=not args.no_frames, plot_general=not args.no_general,
+            vectorized=not args.per_frame, workers=args.workers, save_frames=not args.no_pngs, heatmap=args.heatmap,
+            profile=args.profile, profile_stage=args.profile_stage, rois=args.rois, window_s=args.window,
+            validate=args.validate,
+            adaptive=dict(budget=args.budget, change_c=args.change, slope_c_s=args.slope) if args.adaptive else None
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+"""Instrumentation of the stages of the processor: times, counters, peak memory and profiles."""
+
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import time
+
+from xpython.common import logger
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process and of its finished children, in MB. The peak of this process is
+    read from /proc (VmHWM), since ru_maxrss is preserved across exec and would include the parent process.
+    """
+    peak_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    peak_kb = max(peak_kb, int(line.split()[1]))
+    except OSError:
+        peak_kb = max(peak_kb, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    return peak_kb / 1024.
+
+
+def _children_cpu_s():
+    """CPU time (user + system) of the finished children of this process"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageProfiler(logger.LoggingClass):
+    """Stage profiler
+    This class accounts the wall time and the CPU time spent on each stage of a run, together with the
+    CPU time of the processes that the stage launched and waited for (the pool of renderers, ffmpeg).
+    Stages executed several times are accumulated. It also keeps counters (frames read, skipped...)
+    and, optionally, profiles one of the stages with cProfile.
+
+    When disabled, stage() and count() do nothing, so that the instrumentation can stay in place.
+    """
+
+    REPORT_FILENAME = 'profile.json'
+
+    def __init__(self, enabled=True, profile_stage=None):
+        """Default constructor
+        enabled=True        - whether to account the stages
+        profile_stage=None  - name of the stage to be profiled with cProfile, None for none
+        """
+        super(StageProfiler, self).__init__()
+
+        self.enabled = enabled
+        self.profile_stage = profile_stage
+        self.profile = None
+
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager that accounts the code executed within it for the given stage"""
+        if not self.enabled:
+            yield
+            return
+
+        profile = None
+        if name == self.profile_stage:
+            profile = self.profile = self.profile or cProfile.Profile()
+            profile.enable()
+
+        wall_s, cpu_s, children_cpu_s = time.perf_counter(), time.process_time(), _children_cpu_s()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+
+            stage = self.stages.setdefault(name, dict(calls=0, wall_s=0., cpu_s=0., children_cpu_s=0.))
+            stage['calls'] += 1
+            stage['wall_s'] += time.perf_counter() - wall_s
+            stage['cpu_s'] += time.process_time() - cpu_s
+            stage['children_cpu_s'] += _children_cpu_s() - children_cpu_s
+
+    def count(self, name, value=1):
+        """Adds the given value to the counter with the given name"""
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def report(self):
+        """Dictionary with the accounted stages and counters, the total wall time and the peak memory"""
+        return dict(
+            wall_s=time.perf_counter() - self.start, peak_rss_mb=peak_rss_mb(),
+            stages=self.stages, counters=self.counters
+        )
+
+    def write(self, dirpath):
+        """
+        This method writes the report as JSON into the given directory and, if a stage was profiled, the
+        profile as profile-<stage>.prof (to be read with pstats or snakeviz). Returns the report.
+        """
+        report = self.report()
+        with open(os.path.join(dirpath, self.REPORT_FILENAME), 'w') as f:
+            json.dump(report, f, indent=1)
+
+        if self.profile is not None:
+            profile_filepath = os.path.join(dirpath, f"profile-{self.profile_stage}.prof")
+            self.profile.dump_stats(profile_filepath)
+            self._l.info(f"Profile of stage <{self.profile_stage}> saved as: {profile_filepath}")
+        return report
+
+    @staticmethod
+    def format(report):
+        """Human readable table with the stages of the given report"""
+        total_s = max(report['wall_s'], 1e-9)
+        return "\n\t".join(
+            ["{:12} {:>6} {:>10} {:>10} {:>13} {:>6}".format(
+                'stage', 'calls', 'wall (s)', 'cpu (s)', 'child cpu (s)', '%'
+            )] +
+            [
+                "{:12} {:6} {:10.3f} {:10.3f} {:13.3f} {:6.1f}".format(
+                    name, s['calls'], s['wall_s'], s['cpu_s'], s['children_cpu_s'], 100. * s['wall_s'] / total_s
+                )
+                for name, s in report['stages'].items()
+            ] +
+            ["{:12} {:6} {:10.3f}, peak RSS = {:.1f} MB, {}".format(
+                'total', '', report['wall_s'], report['peak_rss_mb'],
+                ", ".join(f"{name} = {value}" for name, value in report['counters'].items())
+            )]
+        )
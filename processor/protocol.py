@@ -0,0 +1,78 @@
+"""Framed transport for the frames of MLX90640 over UDP.
+
+Every frame is split into fragments of up to FRAGMENT_SIZE bytes, each of them sent in its own datagram
+after a header with the following fields (network byte order):
+
+    magic       2s  - b'MX', identifies the datagrams of this protocol
+    version     B   - VERSION of the protocol
+    type        B   - type of the payload, TYPE_RGB (32x24 RGB888) or TYPE_RAW (32x24 float32)
+    sequence    I   - sequence number of the frame, incremented by one with every frame
+    timestamp   Q   - capture timestamp of the frame, microseconds since the epoch
+    fragment    B   - index of this fragment within the frame
+    fragments   B   - number of fragments of the frame
+    length      H   - number of bytes of the payload of this fragment
+
+All the fragments of a frame carry the same header but for the fragment index and its length. The
+datagrams always have the same size (HEADER_SIZE + FRAGMENT_SIZE, the last fragment is padded), so that
+they can be relayed by gst-launch fdsrc with a fixed blocksize, as the unframed RGB stream is.
+"""
+
+import struct
+
+import numpy as np
+
+
+MAGIC           = b'MX'
+VERSION         = 1
+
+TYPE_RGB        = 1
+TYPE_RAW        = 2
+PAYLOAD_SIZES   = {TYPE_RGB: 32 * 24 * 3, TYPE_RAW: 32 * 24 * np.dtype(np.float32).itemsize}
+
+HEADER          = struct.Struct('!2sBBIQBBH')
+HEADER_SIZE     = HEADER.size
+FRAGMENT_SIZE   = 1024
+DATAGRAM_SIZE   = HEADER_SIZE + FRAGMENT_SIZE
+
+
+class ProtocolError(ValueError):
+    """Datagram that does not follow the protocol"""
+    pass
+
+
+def encode(payload_type, sequence, timestamp_us, payload, fragment_size=FRAGMENT_SIZE):
+    """
+    This function splits the payload of a frame into fragments and returns the list of datagrams, each one
+    with its header and padded up to the size of a fragment.
+    """
+    if len(payload) != PAYLOAD_SIZES[payload_type]:
+        raise ProtocolError(f"Payload of {len(payload)} bytes, expected {PAYLOAD_SIZES[payload_type]}")
+
+    payload = bytes(payload)
+    fragments = -(-len(payload) // fragment_size)
+    datagrams = []
+    for fragment in range(fragments):
+        chunk = payload[fragment * fragment_size:(fragment + 1) * fragment_size]
+        header = HEADER.pack(
+            MAGIC, VERSION, payload_type, sequence & 0xFFFFFFFF, timestamp_us, fragment, fragments, len(chunk)
+        )
+        datagrams.append(header + chunk.ljust(fragment_size, b'\0'))
+    return datagrams
+
+
+def decode(datagram):
+    """
+    This function parses a datagram, returning a (payload_type, sequence, timestamp_us, fragment, fragments,
+    chunk) tuple, where chunk is the (unpadded) payload of the fragment.
+    """
+    if len(datagram) < HEADER_SIZE:
+        raise ProtocolError(f"Datagram of {len(datagram)} bytes, shorter than the header")
+
+    magic, version, payload_type, sequence, timestamp_us, fragment, fragments, length = HEADER.unpack_from(datagram)
+    if magic != MAGIC or version != VERSION:
+        raise ProtocolError(f"Unknown datagram, magic = {magic}, version = {version}")
+    if payload_type not in PAYLOAD_SIZES or fragment >= fragments or HEADER_SIZE + length > len(datagram):
+        raise ProtocolError(
+            f"Malformed datagram, type = {payload_type}, fragment = {fragment}/{fragments}, length = {length}"
+        )
+    return payload_type, sequence, timestamp_us, fragment, fragments, datagram[HEADER_SIZE:HEADER_SIZE + length]
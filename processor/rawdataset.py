@@ -0,0 +1,112 @@
+"""Random access reader for the RAW files with frames from MLX90640."""
+
+import numpy as np
+import os
+
+from xpython.common import logger
+
+
+class RawDataset(logger.LoggingClass):
+    """Memory mapped RAW dataset
+    The RAW files are a plain sequence of frames, each of them stored as 24 arrays of 32 consecutive
+    float32 numbers. This class maps the file in memory as a read-only (N, PIXELS_Y, PIXELS_X) array,
+    so that any frame or range of frames can be accessed without reading or copying the whole file.
+    The number of frames is calculated from the size of the file, an incomplete frame at the end of the
+    file is ignored.
+    """
+
+    PIXELS_X        = 32
+    PIXELS_Y        = 24
+    PIXELS_FRAME    = PIXELS_X * PIXELS_Y
+    DTYPE           = np.float32
+    SIZE_FRAME      = PIXELS_FRAME * np.dtype(DTYPE).itemsize
+
+    CHUNK_FRAMES    = 4096
+
+    def __init__(self, raw_filepath, fps=1):
+        """Default constructor
+        raw_filepath    - path to the binary file with the RAW frames
+        fps=1           - frames per second, necessary for the time based indexing
+        """
+        super(RawDataset, self).__init__()
+
+        self.raw_filepath = raw_filepath
+        self.fps = fps
+
+        self.size = os.path.getsize(self.raw_filepath)
+        self.no_frames = self.size // self.SIZE_FRAME
+        self.tail = self.size % self.SIZE_FRAME
+
+        if self.tail:
+            self._l.warning(f"Ignoring {self.tail} bytes of an incomplete frame at the end of {self.raw_filepath}")
+
+        if self.no_frames > 0:
+            self.frames = np.memmap(
+                self.raw_filepath, dtype=self.DTYPE, mode='r',
+                shape=(self.no_frames, self.PIXELS_Y, self.PIXELS_X)
+            )
+        else:
+            # mmap does not support empty files
+            self.frames = np.empty((0, self.PIXELS_Y, self.PIXELS_X), dtype=self.DTYPE)
+
+    def __str__(self):
+        """Human readable representation of this dataset"""
+        return f"{self.raw_filepath}, frames = {self.no_frames}, fps = {self.fps}, duration = {self.duration:.3f} (s)"
+
+    def __len__(self):
+        return self.no_frames
+
+    def __getitem__(self, key):
+        """Frames at the given index, slice or array of indexes (views for integers and slices)"""
+        return self.frames[key]
+
+    def __iter__(self):
+        return iter(self.frames)
+
+    @property
+    def duration(self):
+        """Duration of the dataset (in seconds)"""
+        return self.no_frames / self.fps
+
+    def close(self):
+        """
+        Releases the mapping of the file, which is unmapped once no view of it (as returned by __getitem__) is
+        left. A view of the memmap would still keep it mapped, hence the frames are replaced by an empty array.
+        """
+        self.frames = np.empty((0, self.PIXELS_Y, self.PIXELS_X), dtype=self.DTYPE)
+
+    def every(self, step, start=0):
+        """View with one out of every <step> frames, starting at the frame with index <start>"""
+        return self[start::step]
+
+    def time(self, index):
+        """Time (in seconds) at which the frame with the given index was taken"""
+        return index / self.fps
+
+    def index(self, time_s):
+        """Index of the frame taken at the given time (in seconds)"""
+        index = int(round(time_s * self.fps))
+        if index < 0 or index >= self.no_frames:
+            raise IndexError(f"Time {time_s} (s) out of the dataset, duration = {self.duration} (s)")
+        return index
+
+    def at(self, time_s):
+        """Frame taken at the given time (in seconds)"""
+        return self[self.index(time_s)]
+
+    def between(self, start_s, stop_s, step=1):
+        """View with the frames taken within the interval [start_s, stop_s) (in seconds)"""
+        start = max(int(round(start_s * self.fps)), 0)
+        stop = min(int(round(stop_s * self.fps)), self.no_frames)
+        return self[start:stop:step]
+
+    def valid(self):
+        """
+        This method returns a boolean vector with one element per frame, set to False for the frames with
+        NaN values. The file is scanned in chunks, to keep the memory bounded for long recordings.
+        """
+        valid = np.empty(self.no_frames, dtype=bool)
+        for start in range(0, self.no_frames, self.CHUNK_FRAMES):
+            chunk = self[start:start + self.CHUNK_FRAMES]
+            valid[start:start + chunk.shape[0]] = ~np.isnan(chunk).any(axis=(1, 2))
+        return valid
@@ -0,0 +1,323 @@
+"""Asyncio receiver for the framed UDP stream of frames from MLX90640."""
+
+import argparse
+import asyncio
+import numpy as np
+import sys
+import time
+
+from xpython.common import logger
+
+from processor import protocol, rawdataset
+
+
+class FrameAssembler(logger.LoggingClass):
+    """Frame assembler
+    This class reassembles the frames of one type of payload out of their fragments and delivers them in
+    order of sequence number. Frames that arrive out of order are kept until the missing ones arrive; a
+    frame is declared as dropped once a frame WINDOW sequence numbers ahead has been seen, or when the
+    assembler is flushed. Fragments of frames already delivered or dropped are discarded as late.
+
+    A sequence number more than WINDOW behind the next one to be delivered (the streamer restarted, its
+    sequence starts again at 0) or more than MAX_GAP ahead of the highest one (a bogus or a long jump) starts
+    a new stream: the pending frames are flushed and the assembler starts over, so that neither every later
+    frame is discarded as late nor a frame is dropped for every sequence number skipped. The sequence numbers
+    skipped by a jump ahead are not delivered as dropped, they are counted apart as skipped instead.
+    """
+
+    WINDOW  = 8
+    MAX_GAP = 256
+
+    def __init__(self, payload_type, deliver, window=WINDOW, max_gap=MAX_GAP):
+        """Default constructor
+        payload_type    - type of the payload of the frames (protocol.TYPE_RGB, protocol.TYPE_RAW)
+        deliver         - callable(payload_type, sequence, timestamp_us, payload), payload is None if dropped
+        window=WINDOW   - number of sequence numbers to wait for a missing frame before dropping it
+        max_gap=MAX_GAP - largest jump ahead of the sequence numbers within the same stream
+        """
+        super(FrameAssembler, self).__init__()
+
+        self.payload_type = payload_type
+        self.deliver = deliver
+        self.window = window
+        self.max_gap = max_gap
+
+        self.next_sequence = None
+        self.highest_sequence = None
+        self.partial = {}
+        self.complete = {}
+
+        self.no_frames = 0
+        self.no_dropped = 0
+        self.no_reordered = 0
+        self.no_late = 0
+        self.no_duplicated = 0
+        self.no_restarts = 0
+        self.no_skipped = 0
+
+    def push(self, sequence, timestamp_us, fragment, fragments, chunk):
+        """Adds a fragment, delivering all the frames that are complete and in order"""
+        if self.next_sequence is None:
+            self.next_sequence = self.highest_sequence = sequence
+        elif sequence < self.next_sequence - self.window or sequence > self.highest_sequence + self.max_gap:
+            skipped = max(sequence - self.highest_sequence - 1, 0)
+            self._l.warning(
+                f"Sequence jumps from {self.highest_sequence} to {sequence}, starting a new stream, "
+                f"{skipped} frames skipped"
+            )
+            self.no_skipped += skipped
+            self.restart(sequence)
+
+        if sequence < self.next_sequence:
+            self.no_late += 1
+            return
+        if sequence in self.complete:
+            self.no_duplicated += 1
+            return
+
+        if sequence not in self.partial:
+            if sequence < self.highest_sequence:
+                self.no_reordered += 1
+            self.partial[sequence] = (timestamp_us, fragments, {})
+        self.highest_sequence = max(self.highest_sequence, sequence)
+
+        _, _, chunks = self.partial[sequence]
+        if fragment in chunks:
+            self.no_duplicated += 1
+            return
+        chunks[fragment] = chunk
+
+        if len(chunks) == fragments:
+            del self.partial[sequence]
+            payload = b''.join(chunks[i] for i in range(fragments))
+            if len(payload) == protocol.PAYLOAD_SIZES[self.payload_type]:
+                self.complete[sequence] = (timestamp_us, payload)
+            else:
+                self._l.warning(f"Frame {sequence} with {len(payload)} bytes, discarding")
+
+        self._flush(force=False)
+
+    def flush(self):
+        """Delivers the frames still pending, the missing ones up to the highest sequence are dropped"""
+        if self.next_sequence is not None:
+            self._flush(force=True)
+
+    def restart(self, sequence):
+        """Flushes the pending frames and starts over a new stream at the given sequence number"""
+        self._flush(force=True)
+        self.partial.clear()
+        self.complete.clear()
+        self.next_sequence = self.highest_sequence = sequence
+        self.no_restarts += 1
+
+    def _flush(self, force):
+        while self.next_sequence <= self.highest_sequence:
+            if self.next_sequence in self.complete:
+                timestamp_us, payload = self.complete.pop(self.next_sequence)
+                self.deliver(self.payload_type, self.next_sequence, timestamp_us, payload)
+                self.no_frames += 1
+            elif force or self.highest_sequence - self.next_sequence >= self.window:
+                timestamp_us = self.partial.pop(self.next_sequence, (None,))[0]
+                self.deliver(self.payload_type, self.next_sequence, timestamp_us, None)
+                self.no_dropped += 1
+            else:
+                break
+            self.next_sequence += 1
+
+    def stats(self):
+        return dict(
+            frames=self.no_frames, dropped=self.no_dropped, reordered=self.no_reordered, late=self.no_late,
+            duplicated=self.no_duplicated, restarts=self.no_restarts, skipped=self.no_skipped
+        )
+
+
+class MLX90640Receiver(logger.LoggingClass):
+    """Framed stream receiver
+    This class receives the datagrams of the framed stream (see protocol), reassembles the frames of each
+    type of payload and keeps the counters of the stream: drops, reordering, throughput and latency (from
+    the capture timestamp, hence only meaningful if the clocks of both hosts are synchronized).
+
+    The RAW frames are written in order into a file with the same format as the datasets; the frames that
+    are dropped are written as frames of NaN values, which the processor skips, so that the position of
+    each frame in the file still gives its capture time. This only holds between the restarts of the stream
+    (see FrameAssembler): the frames skipped by a restart are not filled, their number is only counted in
+    the stats. The last frame of each type is kept in latest.
+    """
+
+    def __init__(
+        self, raw_filepath=None, fill_dropped=True, window=FrameAssembler.WINDOW, on_frame=None,
+        max_gap=FrameAssembler.MAX_GAP
+    ):
+        """Default constructor
+        raw_filepath=None   - path to the file where the RAW frames are written, None to not write them
+        fill_dropped=True   - whether to write a frame of NaN values in place of each dropped RAW frame
+        window=WINDOW       - number of sequence numbers to wait for a missing frame before dropping it
+        on_frame=None       - callable(payload_type, sequence, timestamp_us, payload) for every frame
+        max_gap=MAX_GAP     - largest jump ahead of the sequence numbers within the same stream
+        """
+        super(MLX90640Receiver, self).__init__()
+
+        self.raw_filepath = raw_filepath
+        self.fill_dropped = fill_dropped
+        self.on_frame = on_frame
+
+        self.assemblers = {
+            payload_type: FrameAssembler(payload_type, self._deliver, window=window, max_gap=max_gap)
+            for payload_type in protocol.PAYLOAD_SIZES
+        }
+        self.latest = {}
+        self._file = open(raw_filepath, 'wb') if raw_filepath is not None else None
+        self._nan_frame = np.full(rawdataset.RawDataset.PIXELS_FRAME, np.nan, dtype=rawdataset.RawDataset.DTYPE)
+
+        self.start = time.monotonic()
+        self.no_datagrams = 0
+        self.no_bytes = 0
+        self.no_invalid = 0
+        self.no_written = 0
+        self.latency_us = dict(count=0, sum=0., min=np.inf, max=-np.inf)
+
+    def datagram(self, data, received_us=None):
+        """Processes a received datagram, received_us is its reception time (now, by default)"""
+        self.no_datagrams += 1
+        self.no_bytes += len(data)
+        try:
+            payload_type, sequence, timestamp_us, fragment, fragments, chunk = protocol.decode(data)
+        except protocol.ProtocolError as ex:
+            self.no_invalid += 1
+            self._l.debug(f"Discarding datagram, reason = {ex}")
+            return
+
+        if fragment == fragments - 1:
+            received_us = time.time() * 1e6 if received_us is None else received_us
+            latency_us = received_us - timestamp_us
+            self.latency_us['count'] += 1
+            self.latency_us['sum'] += latency_us
+            self.latency_us['min'] = min(self.latency_us['min'], latency_us)
+            self.latency_us['max'] = max(self.latency_us['max'], latency_us)
+        self.assemblers[payload_type].push(sequence, timestamp_us, fragment, fragments, chunk)
+
+    def _deliver(self, payload_type, sequence, timestamp_us, payload):
+        if payload is not None:
+            self.latest[payload_type] = (sequence, timestamp_us, payload)
+        if self._file is not None and payload_type == protocol.TYPE_RAW:
+            if payload is not None:
+                self._file.write(payload)
+                self.no_written += 1
+            elif self.fill_dropped:
+                self._file.write(self._nan_frame.tobytes())
+                self.no_written += 1
+        if self.on_frame is not None:
+            self.on_frame(payload_type, sequence, timestamp_us, payload)
+
+    def close(self):
+        """Delivers the pending frames and closes the file"""
+        for assembler in self.assemblers.values():
+            assembler.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self):
+        """Dictionary with the counters of the stream"""
+        elapsed_s = max(time.monotonic() - self.start, 1e-9)
+        frames = sum(a.no_frames for a in self.assemblers.values())
+        stats = dict(
+            elapsed_s=elapsed_s, datagrams=self.no_datagrams, bytes=self.no_bytes, invalid=self.no_invalid,
+            written=self.no_written, frames_s=frames / elapsed_s, bytes_s=self.no_bytes / elapsed_s,
+            types={
+                payload_type: a.stats() for payload_type, a in self.assemblers.items() if a.next_sequence is not None
+            }
+        )
+        if self.latency_us['count'] > 0:
+            latency = self.latency_us
+            stats['latency_ms'] = dict(
+                min=latency['min'] / 1e3, mean=latency['sum'] / latency['count'] / 1e3, max=latency['max'] / 1e3
+            )
+        return stats
+
+    def __str__(self):
+        stats = self.stats()
+        latency = stats.get('latency_ms', {})
+        return (
+            f"{stats['frames_s']:.2f} frames/s, {stats['bytes_s']:.0f} bytes/s, invalid = {stats['invalid']}, " +
+            ", ".join([
+                f"type {t}: {s['frames']} frames, {s['dropped']} dropped, {s['reordered']} reordered, {s['late']} late"
+                for t, s in stats['types'].items()
+            ]) +
+            (f", latency (ms) = {latency['mean']:.1f} [{latency['min']:.1f}, {latency['max']:.1f}]" if latency else "")
+        )
+
+    async def serve(self, host='0.0.0.0', port=5000, duration_s=None, stats_interval_s=5.):
+        """
+        This method receives datagrams on the given address until duration_s elapses (forever when None) or
+        until cancelled, logging the counters every stats_interval_s. The receiver is closed at the end.
+        """
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), local_addr=(host, port)
+        )
+        self._l.info(f"Receiving on <{host}:{port}>, output = {self.raw_filepath}")
+
+        try:
+            deadline = None if duration_s is None else loop.time() + duration_s
+            while deadline is None or loop.time() < deadline:
+                interval_s = stats_interval_s if deadline is None else min(stats_interval_s, deadline - loop.time())
+                await asyncio.sleep(max(interval_s, 0.))
+                self._l.info(str(self))
+        finally:
+            transport.close()
+            self.close()
+            self._l.info(str(self))
+
+    @staticmethod
+    def create(argv):
+        """Factory method to instantiate the class using the arguments from the CLI"""
+
+        parser = argparse.ArgumentParser(description="Receives the framed UDP stream from MLX90640")
+        parser.add_argument(
+            "-H", "--host", type=str, required=False, default='0.0.0.0',
+            help="Address to listen on"
+        )
+        parser.add_argument(
+            "-p", "--port", type=int, required=False, default=5000,
+            help="UDP port to listen on"
+        )
+        parser.add_argument(
+            "-o", "--output", type=str, metavar="FILE", required=False,
+            help="Path to the file where the RAW frames are written"
+        )
+        parser.add_argument(
+            "-t", "--timeout", type=float, required=False,
+            help="Seconds to receive for, until interrupted by default"
+        )
+        parser.add_argument(
+            "-i", "--interval", type=float, required=False, default=5.,
+            help="Seconds in between logs of the counters of the stream"
+        )
+        parser.add_argument(
+            "-n", "--no-fill",
+            action='store_true', required=False,
+            help="Does not write frames of NaN values in place of the dropped RAW frames"
+        )
+
+        args = parser.parse_args(argv)
+        receiver = MLX90640Receiver(raw_filepath=args.output, fill_dropped=not args.no_fill)
+        try:
+            asyncio.run(receiver.serve(args.host, args.port, duration_s=args.timeout, stats_interval_s=args.interval))
+        except KeyboardInterrupt:
+            pass
+        return receiver
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    """Relays the received datagrams to the receiver"""
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+
+    def datagram_received(self, data, addr):
+        self.receiver.datagram(data)
+
+
+if __name__ == "__main__":
+    receiver = MLX90640Receiver.create(sys.argv[1:])
@@ -0,0 +1,138 @@
+"""Parallel rendering of the frames from MLX90640 as images."""
+
+import multiprocessing
+import os
+
+import numpy as np
+
+from xpython.common import logger
+
+from processor import container
+
+
+class FrameRenderer(logger.LoggingClass):
+    """Reusable figure for the frames
+    The figure, the image, its colorbar and the annotations are created only once. Rendering a frame
+    just updates the data of the image, the title and the annotations before saving the figure, which
+    is much faster than building a new figure for every frame.
+    """
+
+    NO_ANNOTATIONS = 5
+
+    def __init__(self, shape, t_min, t_max, cmap='jet', fontsize=9, dpi=150):
+        """Default constructor
+        shape       - (PIXELS_Y, PIXELS_X), shape of the frames to be rendered
+        t_min       - temperature for the lower limit of the colormap
+        t_max       - temperature for the upper limit of the colormap
+        cmap='jet'  - colormap used for the representation of the temperature values
+        fontsize=9  - default fontsize for the figure
+        dpi=150     - resolution for the saved images
+        """
+        super(FrameRenderer, self).__init__()
+
+        # matplotlib is imported on demand, so that importing this module (and the processor) stays cheap
+        import matplotlib as mp
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        self.dpi = dpi
+
+        font = {'family': 'normal', 'weight': 'bold', 'size': fontsize}
+        mp.rc('font', **font)
+
+        self.fig = Figure(dpi=self.dpi)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(1, 1, 1)
+
+        self.title = self.fig.suptitle("")
+        self.image = self.ax.imshow(
+            np.zeros(shape, dtype=np.float32), aspect='auto', cmap=cmap, vmin=t_min, vmax=t_max
+        )
+        self.fig.colorbar(self.image, ax=self.ax, fraction=0.0825, aspect=100)
+
+        self.annotations = []
+        for i in range(self.NO_ANNOTATIONS):
+            text = self.ax.text(0, 0, "", horizontalalignment='right', verticalalignment='center')
+            marker, = self.ax.plot(0, 0, 'X')
+            self.annotations.append((text, marker))
+
+    def update(self, frame, title, annotations):
+        """
+        This method updates the figure with the data from a new frame.
+        frame       - (PIXELS_Y, PIXELS_X) array with the temperatures
+        title       - title for the figure
+        annotations - list with (coordinates, temperature, label) tuples, one per annotated pixel
+        """
+        self.image.set_data(frame)
+        self.title.set_text(title)
+
+        for (text, marker), (coordinates, temperature, label) in zip(self.annotations, annotations):
+            text.set_position((coordinates[0] + 2, coordinates[1]))
+            text.set_text(f"{label}:{temperature:.1f}")
+            marker.set_data([coordinates[0]], [coordinates[1]])
+
+    def render(self, frame, title, annotations, filepath=None, rgb=False):
+        """
+        This method updates the figure with the given frame and saves it as an image in the given path.
+        rgb=False   - whether to return the rendered figure as a (height, width, 3) uint8 RGB array
+        """
+        self.update(frame, title, annotations)
+
+        if filepath:
+            self.fig.savefig(filepath, dpi=self.dpi)
+        elif rgb:
+            self.fig.canvas.draw()
+
+        if rgb:
+            return np.asarray(self.fig.canvas.buffer_rgba())[..., :3].copy()
+
+
+_worker = None
+
+
+def _init_worker(raw_filepath, renderer_args):
+    """Initializes the dataset and the figure that each process of the pool reuses for all its frames"""
+    global _worker
+    _worker = (container.open_dataset(raw_filepath), FrameRenderer(**renderer_args))
+
+
+def _render_job(job):
+    """Renders the frame described by the given job: (index, filepath, title, annotations, rgb)"""
+    dataset, renderer = _worker
+    index, filepath, title, annotations, rgb = job
+    return renderer.render(dataset[index], title, annotations, filepath=filepath, rgb=rgb)
+
+
+def iter_frames(raw_filepath, jobs, workers=None, rgb=False, **renderer_args):
+    """
+    This generator renders the frames from the given RAW file over a pool of processes. Each of the jobs
+    is a tuple (index, filepath, title, annotations): the frame with the given index within the RAW file
+    is rendered with the given title and annotations, and saved as an image at the given filepath, unless
+    it is None. The rest of the arguments are passed to the FrameRenderer of each process.
+    raw_filepath    - path to the binary file with the RAW frames
+    jobs            - list with the frames to be rendered
+    workers=None    - number of processes, as many as CPUs when None, rendering is sequential when 1
+    rgb=False       - whether to yield the RGB arrays of the rendered frames, in the order of the jobs
+    """
+    workers = workers or os.cpu_count()
+    jobs = [job + (rgb,) for job in jobs]
+
+    if workers == 1 or len(jobs) <= 1:
+        dataset, renderer = container.open_dataset(raw_filepath), FrameRenderer(**renderer_args)
+        for index, filepath, title, annotations, rgb in jobs:
+            yield renderer.render(dataset[index], title, annotations, filepath=filepath, rgb=rgb)
+        return
+
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(raw_filepath, renderer_args)) as pool:
+        yield from pool.imap(_render_job, jobs, chunksize=chunksize)
+
+
+def render_frames(raw_filepath, jobs, workers=None, **renderer_args):
+    """
+    This function renders and saves the frames described by the given jobs (see iter_frames), returning
+    the paths to the saved images.
+    """
+    for _ in iter_frames(raw_filepath, jobs, workers=workers, **renderer_args):
+        pass
+    return [job[1] for job in jobs]
@@ -0,0 +1,275 @@
+"""Replay of the datasets over UDP, as the streamer sends them, to load-test the receivers."""
+
+import argparse
+import numpy as np
+import socket
+import sys
+import threading
+import time
+
+from xpython.common import logger
+
+from processor import container, heatmap, protocol, rawdataset
+
+
+class MLX90640Replayer(logger.LoggingClass):
+    """Dataset replayer
+    This class sends the frames of a RAW file over UDP, as rawrgb and gst-launch do from the Raspberry Pi:
+    either the 2304-byte false-colour RGB images (with the same 0-25 degC heatmap as rawrgb), the raw
+    float32 frames, or both. Unframed, every frame is sent in a single datagram, the RGB images to the
+    given port and, with both, the raw frames to the next port; framed, the datagrams follow the protocol
+    of rawrgb with a second argument (see protocol) and both payloads are sent to the same port.
+
+    The frames are sent at the given rate (the FPS of the dataset by default, 0 for as fast as possible),
+    looping over the dataset the given number of times. Several streams can be sent in parallel, each
+    from its own thread and to its own port(s), so that the saturation point of the receiver can be found.
+    """
+
+    PAYLOADS     = ('rgb', 'raw', 'both')
+    RGB_VMIN     = 0.
+    RGB_VMAX     = 25.
+    CHUNK_FRAMES = rawdataset.RawDataset.CHUNK_FRAMES
+
+    def __init__(
+        self,
+        raw_filepath,
+        host='127.0.0.1', port=5000,
+        payload='rgb', framed=False,
+        fps=16, rate=None, loops=1, streams=1, duration_s=None
+    ):
+        """Default constructor
+        raw_filepath        - path to the binary file with the RAW frames
+        host='127.0.0.1'    - host where the frames are sent to
+        port=5000           - UDP port of the first stream, the rest of the streams use the following ones
+        payload='rgb'       - frames to send, 'rgb' images, 'raw' float32 frames or 'both'
+        framed=False        - whether to send the frames with the framed protocol
+        fps=16              - frames per second of the dataset
+        rate=None           - frames per second to send, the fps of the dataset when None, 0 for unthrottled
+        loops=1             - number of times that the dataset is sent, 0 to loop until duration_s
+        streams=1           - number of streams sent in parallel
+        duration_s=None     - seconds after which the streams are stopped, None to stop after the loops
+        """
+        super(MLX90640Replayer, self).__init__()
+
+        if payload not in self.PAYLOADS:
+            raise ValueError(f"Payload <{payload}> not supported, choose one of {self.PAYLOADS}")
+        if loops == 0 and duration_s is None:
+            raise ValueError("Looping forever requires a duration")
+
+        self.raw_filepath = raw_filepath
+        self.host = host
+        self.port = port
+        self.payload = payload
+        self.framed = framed
+        self.fps = fps
+        self.rate = fps if rate is None else rate
+        self.loops = loops
+        self.streams = streams
+        self.duration_s = duration_s
+
+        self.payloads = self.load()
+        self.stats = []
+
+    def load(self):
+        """
+        This method reads all the frames and prepares the payloads to be sent for each one of them, a list
+        of (payload_type, bytes) tuples per frame. The RGB images are rendered a block of CHUNK_FRAMES frames at
+        a time, so that a compressed dataset is never decoded at once.
+        """
+        dataset = container.open_dataset(self.raw_filepath, fps=self.fps)
+
+        payloads = []
+        for start in range(0, len(dataset), self.CHUNK_FRAMES):
+            frames = np.asarray(dataset[start:start + self.CHUNK_FRAMES])
+            types = []
+            if self.payload in ('rgb', 'both'):
+                types.append((protocol.TYPE_RGB, self.rgb(frames)))
+            if self.payload in ('raw', 'both'):
+                types.append((protocol.TYPE_RAW, frames))
+            payloads += [
+                [(payload_type, data[i].tobytes()) for payload_type, data in types] for i in range(len(frames))
+            ]
+        dataset.close()
+
+        self._l.debug(f"Loaded {len(payloads)} frames from {self.raw_filepath}, payload = {self.payload}")
+        return payloads
+
+    @classmethod
+    def rgb(cls, frames):
+        """
+        This method renders the given (N, PIXELS_Y, PIXELS_X) frames into (N, PIXELS_Y, PIXELS_X, 3) RGB images
+        exactly as put_pixel_false_colour in rawrgb does, with the same mix of float and double arithmetic.
+        The frames of the RAW files written by rawrgb are already flipped, as its images, so they are not.
+        """
+        colours = heatmap.HeatmapRenderer.COLOURS.astype(np.float32)
+
+        v = (frames.astype(np.float64) - np.float32(cls.RGB_VMIN)) / np.float32(cls.RGB_VMAX - cls.RGB_VMIN)
+        v = np.nan_to_num(v, nan=0.) * (len(colours) - 1)
+        idx1 = np.clip(np.floor(v), 0, len(colours) - 1).astype(int)
+        idx2 = np.minimum(idx1 + 1, len(colours) - 1)
+        fract = (v - idx1).astype(np.float32)[..., np.newaxis]
+        saturated = v >= len(colours) - 1
+        fract[(v <= 0) | saturated] = 0.
+        idx1[saturated] = idx2[saturated] = len(colours) - 1
+
+        rgb = ((colours[idx2] - colours[idx1]) * fract + colours[idx1]).astype(np.float64) * 255.
+        return rgb.astype(np.int32).astype(np.uint8)
+
+    def ports(self, stream):
+        """Ports where the given stream is sent, one per type of payload unless framed"""
+        if self.framed or self.payload != 'both':
+            return {protocol.TYPE_RGB: self.port + stream, protocol.TYPE_RAW: self.port + stream}
+        return {protocol.TYPE_RGB: self.port + 2 * stream, protocol.TYPE_RAW: self.port + 2 * stream + 1}
+
+    def datagrams(self, frame, sequence, ports):
+        """List of (datagram, address) tuples to send the given frame"""
+        if not self.framed:
+            return [(data, (self.host, ports[payload_type])) for payload_type, data in frame]
+
+        timestamp_us = int(time.time() * 1e6)
+        return [
+            (datagram, (self.host, ports[payload_type]))
+            for payload_type, data in frame
+            for datagram in protocol.encode(payload_type, sequence, timestamp_us, data)
+        ]
+
+    def _send(self, stream, stop):
+        """Sends one stream, to be run in its own thread"""
+        ports = self.ports(stream)
+        stats = self.stats[stream]
+        period_s = 1. / self.rate if self.rate > 0 else 0.
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            start = time.perf_counter()
+            sequence = 0
+            loop = 0
+            while (self.loops == 0 or loop < self.loops) and not stop.is_set():
+                for frame in self.payloads:
+                    if stop.is_set():
+                        break
+                    if period_s > 0:
+                        delay_s = start + sequence * period_s - time.perf_counter()
+                        if delay_s > 0:
+                            time.sleep(delay_s)
+
+                    for datagram, address in self.datagrams(frame, sequence, ports):
+                        try:
+                            s.sendto(datagram, address)
+                        except OSError:
+                            stats['errors'] += 1
+                            continue
+                        stats['datagrams'] += 1
+                        stats['bytes'] += len(datagram)
+                    stats['frames'] += 1
+                    sequence += 1
+                loop += 1
+            stats['elapsed_s'] = time.perf_counter() - start
+
+    def run(self):
+        """
+        This method sends all the streams in parallel and waits for them to finish, returning a list with
+        the counters of each stream (frames, datagrams, bytes, errors, elapsed_s, frames_s and bytes_s).
+        """
+        self.stats = [dict(frames=0, datagrams=0, bytes=0, errors=0, elapsed_s=0.) for _ in range(self.streams)]
+        stop = threading.Event()
+        threads = [threading.Thread(target=self._send, args=(i, stop), daemon=True) for i in range(self.streams)]
+
+        self._l.info(
+            f"Replaying {self.raw_filepath} to <{self.host}:{self.port}>, streams = {self.streams}, " +
+            f"rate = {self.rate or 'unthrottled'}, payload = {self.payload}, framed = {self.framed}"
+        )
+        for thread in threads:
+            thread.start()
+        try:
+            deadline = None if self.duration_s is None else time.monotonic() + self.duration_s
+            for thread in threads:
+                thread.join(None if deadline is None else max(deadline - time.monotonic(), 0.))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        for stats in self.stats:
+            elapsed_s = max(stats['elapsed_s'], 1e-9)
+            stats['frames_s'] = stats['frames'] / elapsed_s
+            stats['bytes_s'] = stats['bytes'] / elapsed_s
+        self.report()
+        return self.stats
+
+    def report(self):
+        """Logs the counters of each stream and their totals"""
+        self._l.info(
+            "Replayed\n\t" +
+            "\n\t".join([
+                "stream {:2}: {:8} frames, {:10.1f} frames/s, {:12.0f} bytes/s, errors = {}".format(
+                    i, s['frames'], s['frames_s'], s['bytes_s'], s['errors']
+                )
+                for i, s in enumerate(self.stats)
+            ]) +
+            "\n\ttotal    : {:8} frames, {:10.1f} frames/s, {:12.0f} bytes/s".format(
+                sum(s['frames'] for s in self.stats), sum(s['frames_s'] for s in self.stats),
+                sum(s['bytes_s'] for s in self.stats)
+            )
+        )
+
+    @staticmethod
+    def create(argv):
+        """Factory method to instantiate the class using the arguments from the CLI"""
+
+        parser = argparse.ArgumentParser(description="Replays a file with raw data from MLX90640 over UDP")
+        parser.add_argument(
+            "-r", "--raw_file",
+            type=str, metavar="FILE", required=True,
+            help="Path to the binary file to be replayed"
+        )
+        parser.add_argument(
+            "-H", "--host", type=str, required=False, default='127.0.0.1',
+            help="Host where the frames are sent to"
+        )
+        parser.add_argument(
+            "-p", "--port", type=int, required=False, default=5000,
+            help="UDP port of the first stream, the rest of the streams use the following ones"
+        )
+        parser.add_argument(
+            "-t", "--payload", choices=MLX90640Replayer.PAYLOADS, required=False, default='rgb',
+            help="Frames to send: RGB images as rawrgb, raw float32 frames or both"
+        )
+        parser.add_argument(
+            "-F", "--framed",
+            action='store_true', required=False,
+            help="Sends the frames with the framed protocol (sequence numbers, timestamps and fragments)"
+        )
+        parser.add_argument(
+            "-f", "--fps", type=int, required=False, default=16,
+            help="Frames per second of the dataset"
+        )
+        parser.add_argument(
+            "-R", "--rate", type=float, required=False,
+            help="Frames per second to send, the FPS of the dataset by default, 0 for unthrottled"
+        )
+        parser.add_argument(
+            "-l", "--loops", type=int, required=False, default=1,
+            help="Number of times that the dataset is sent, 0 to loop until the duration elapses"
+        )
+        parser.add_argument(
+            "-s", "--streams", type=int, required=False, default=1,
+            help="Number of streams sent in parallel"
+        )
+        parser.add_argument(
+            "-d", "--duration", type=float, required=False,
+            help="Seconds after which the streams are stopped"
+        )
+
+        args = parser.parse_args(argv)
+        replayer = MLX90640Replayer(
+            args.raw_file, host=args.host, port=args.port, payload=args.payload, framed=args.framed,
+            fps=args.fps, rate=args.rate, loops=args.loops, streams=args.streams, duration_s=args.duration
+        )
+        replayer.run()
+        return replayer
+
+
+if __name__ == "__main__":
+    replayer = MLX90640Replayer.create(sys.argv[1:])
@@ -0,0 +1,116 @@
+"""Columnar storage of the results of each dataset and queries across datasets."""
+
+import numpy as np
+
+from xpython.common import logger
+
+
+class DatasetResults(logger.LoggingClass):
+    """Results of a dataset
+    The time series (columns) and the summary values (scalars) calculated for a dataset are stored in a
+    compressed .npz file, next to the rest of the results of the dataset. The file is only opened when any
+    of the stored values is accessed, and closed right after reading it, so no file is kept open; the
+    metadata given to the constructor (parsed from the name of the dataset, for instance) is available
+    without opening the file.
+    """
+
+    FILENAME    = 'results.npz'
+    COLUMNS     = ('t', 't0', 't1', 't2', 'diff', 'min', 'max')
+    SCALARS     = (
+        'no_frames', 'duration',
+        'max_dT_value', 'max_dT_index', 'max_dT_time', 'max_T2REF_value', 'max_T2REF_index', 'max_T2REF_time'
+    )
+
+    def __init__(self, filepath, **metadata):
+        """Default constructor
+        filepath    - path to the .npz file with the results
+        metadata    - values known about the dataset without opening the file (name, fps, distance_mm...)
+        """
+        super(DatasetResults, self).__init__()
+
+        self.filepath = filepath
+        self.metadata = metadata
+        self._files = None
+
+    def __str__(self):
+        return f"{self.metadata.get('name', self.filepath)}"
+
+    def __contains__(self, name):
+        return name in self.metadata or name in self.files
+
+    def __getitem__(self, name):
+        """Value with the given name, either from the metadata or from the file (scalars as Python types)"""
+        if name in self.metadata:
+            return self.metadata[name]
+        with np.load(self.filepath) as data:
+            value = data[name]
+        return value.item() if value.ndim == 0 else value
+
+    @property
+    def files(self):
+        """Lazily read names of the values stored in the file"""
+        if self._files is None:
+            with np.load(self.filepath) as data:
+                self._files = tuple(data.files)
+        return self._files
+
+    @staticmethod
+    def save(filepath, columns, scalars, metadata):
+        """
+        This method stores the given columns (time series), scalars and metadata of a dataset.
+        """
+        arrays = {name: np.asarray(value) for name, value in metadata.items()}
+        arrays.update({name: np.asarray(value) for name, value in scalars.items()})
+        arrays.update({name: np.asarray(value) for name, value in columns.items()})
+        np.savez_compressed(filepath, **arrays)
+
+
+class ResultsQuery(logger.LoggingClass):
+    """Query over the results of several datasets
+    Filters select the datasets whose values meet the given conditions; the values of the selected datasets
+    can then be retrieved by name. Filtering by metadata never opens the files with the results.
+
+        > query.filter(distance_mm=185).values('max_dT_value')
+        > query.filter(description=lambda d: d.startswith('DSN200u')).values('diff')
+    """
+
+    def __init__(self, results):
+        """Default constructor
+        results     - list with the DatasetResults to be queried
+        """
+        super(ResultsQuery, self).__init__()
+        self.results = list(results)
+
+    def __len__(self):
+        return len(self.results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    @staticmethod
+    def _matches(value, condition):
+        """Conditions are either callables, evaluated with the value, or values that must be equal"""
+        return condition(value) if callable(condition) else value == condition
+
+    def filter(self, **conditions):
+        """
+        This method returns a new query with the datasets that meet all the given conditions, one per name
+        of value. Datasets without any of the values are discarded.
+        """
+        return ResultsQuery([
+            r for r in self.results
+            if all(name in r and self._matches(r[name], condition) for name, condition in conditions.items())
+        ])
+
+    def values(self, name, key='name'):
+        """
+        This method returns a dictionary with the value with the given name of each dataset, indexed by the
+        value of the given key (the name of the dataset, by default).
+        """
+        return {r[key]: r[name] for r in self.results if name in r}
+
+    def table(self, *names):
+        """
+        This method returns a list with a tuple per dataset, with the values of the given names.
+        """
+        return [tuple(r[name] for name in names) for r in self.results]
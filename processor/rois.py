@@ -0,0 +1,255 @@
+"""Regions of interest (probes) over the frames from MLX90640, analyzed all at once."""
+
+import json
+import numpy as np
+
+from xpython.common import logger
+
+
+class ROI(object):
+    """Region of interest
+    A set of pixels of the frame, defined in mm over the surface of the target through the GSD (ground
+    sample distance), with the origin at the center of the frame (the reference pixel P0), x to the right
+    and y downwards. The supported shapes and their parameters are the following ones:
+
+        point   - x_mm, y_mm: the pixel at that position, as the reference pixels are calculated
+        rect    - x_mm, y_mm, width_mm, height_mm: the pixels whose centers lie within the rectangle
+                    centered at (x_mm, y_mm)
+        circle  - x_mm, y_mm, radius_mm: the pixels whose centers lie within the circle
+        line    - x0_mm, y0_mm, x1_mm, y1_mm: the pixels crossed by the segment, in order from its start,
+                    which also gives the temperature profile along the line
+        mask    - pixels: list with the [x, y] pixel coordinates, or mask: PIXELS_Y lists of PIXELS_X
+                    booleans (masks are defined in pixels and not in mm)
+    """
+
+    SHAPES = ('point', 'rect', 'circle', 'line', 'mask')
+
+    def __init__(self, name, shape, **params):
+        """Default constructor
+        name    - name of the region, unique within an analysis
+        shape   - one of SHAPES
+        params  - parameters of the shape, as explained above
+        """
+        if shape not in self.SHAPES:
+            raise ValueError(f"ROI <{name}>: unknown shape <{shape}>, expected one of {self.SHAPES}")
+        self.name = name
+        self.shape = shape
+        self.params = params
+
+    def __repr__(self):
+        return f"ROI({self.name}, {self.shape}, {self.params})"
+
+    @staticmethod
+    def from_dict(definition):
+        """Creates a region out of its definition: a dictionary with its name, shape and parameters"""
+        definition = dict(definition)
+        return ROI(definition.pop('name'), definition.pop('shape'), **definition)
+
+    def to_dict(self):
+        """Definition of this region, as accepted by from_dict"""
+        return dict(name=self.name, shape=self.shape, **self.params)
+
+    def pixels(self, gsd_mm, frame_shape):
+        """
+        This method returns the flat indexes (row-major) of the pixels of this region within a frame with
+        the given (PIXELS_Y, PIXELS_X) shape, for the given (x, y) GSD in mm. Pixels out of the frame are
+        discarded, a region without any pixel within the frame is an error.
+        """
+        pixels_y, pixels_x = frame_shape
+        center_x, center_y = int(pixels_x * 0.5), int(pixels_y * 0.5)
+        p = self.params
+
+        if self.shape == 'point':
+            xs = np.array([center_x + int(p['x_mm'] / gsd_mm[0])])
+            ys = np.array([center_y + int(p['y_mm'] / gsd_mm[1])])
+        elif self.shape in ('rect', 'circle'):
+            ys, xs = np.mgrid[0:pixels_y, 0:pixels_x]
+            dx = (xs - center_x) * gsd_mm[0] - p['x_mm']
+            dy = (ys - center_y) * gsd_mm[1] - p['y_mm']
+            if self.shape == 'rect':
+                inside = (np.abs(dx) <= 0.5 * p['width_mm']) & (np.abs(dy) <= 0.5 * p['height_mm'])
+            else:
+                inside = dx ** 2 + dy ** 2 <= p['radius_mm'] ** 2
+            xs, ys = xs[inside], ys[inside]
+        elif self.shape == 'line':
+            # sampled every half pixel along the segment, consecutive samples in the same pixel are merged
+            x0, y0 = p['x0_mm'] / gsd_mm[0], p['y0_mm'] / gsd_mm[1]
+            x1, y1 = p['x1_mm'] / gsd_mm[0], p['y1_mm'] / gsd_mm[1]
+            steps = int(np.ceil(2 * max(abs(x1 - x0), abs(y1 - y0)))) + 1
+            xs = center_x + np.rint(np.linspace(x0, x1, steps)).astype(int)
+            ys = center_y + np.rint(np.linspace(y0, y1, steps)).astype(int)
+            keep = np.ones(steps, dtype=bool)
+            keep[1:] = (xs[1:] != xs[:-1]) | (ys[1:] != ys[:-1])
+            xs, ys = xs[keep], ys[keep]
+        elif 'mask' in p:
+            ys, xs = np.nonzero(np.asarray(p['mask'], dtype=bool).reshape(frame_shape))
+        else:
+            xs, ys = np.asarray(p['pixels'], dtype=int).reshape(-1, 2).T
+
+        within = (xs >= 0) & (xs < pixels_x) & (ys >= 0) & (ys < pixels_y)
+        if not within.any():
+            raise ValueError(f"ROI <{self.name}> does not cover any pixel of the frame")
+        return ys[within] * pixels_x + xs[within]
+
+
+def load(filepath):
+    """
+    This function reads the regions of interest from a JSON file, either a list with their definitions or a
+    dictionary with them under "rois" and, optionally, the percentiles to be calculated under "percentiles".
+    Returns a (rois, percentiles) tuple, percentiles is None when not given.
+    """
+    with open(filepath) as f:
+        config = json.load(f)
+    if isinstance(config, list):
+        config = dict(rois=config)
+    return [ROI.from_dict(definition) for definition in config['rois']], config.get('percentiles')
+
+
+class ROIAnalysis(logger.LoggingClass):
+    """Analysis of the regions of interest
+    This class calculates the mean, minimum, maximum and percentiles of the temperature within every region
+    for every frame, for all the regions and frames of a block at once. The pixels of all the regions are
+    gathered into a single (N, REGIONS, MAX_PIXELS) array, padded with NaN, which is sorted along its last
+    axis (NaN values are sorted last). Since the number of pixels of each region is known, the minimum,
+    the maximum and the percentiles (linear interpolation, as numpy.percentile) are read straight from the
+    sorted values. The cost is that of a single sort, no matter how many regions there are.
+
+    The temperatures along the line regions are kept as well, as their profiles.
+    """
+
+    STATS           = ('mean', 'min', 'max')
+    PERCENTILES     = (5, 50, 95)
+    CHUNK_FRAMES    = 4096
+
+    def __init__(self, rois, gsd_mm, frame_shape=(24, 32), percentiles=None):
+        """Default constructor
+        rois                - list with the regions (ROI objects or their definitions as dictionaries)
+        gsd_mm              - (x, y) GSD in mm, to convert the definitions of the regions into pixels
+        frame_shape=(24,32) - (PIXELS_Y, PIXELS_X), shape of the frames
+        percentiles=None    - percentiles to be calculated for every region, PERCENTILES when None
+        """
+        super(ROIAnalysis, self).__init__()
+
+        self.rois = [roi if isinstance(roi, ROI) else ROI.from_dict(roi) for roi in rois]
+        self.names = [roi.name for roi in self.rois]
+        if len(set(self.names)) != len(self.names):
+            raise ValueError(f"Duplicated names of ROIs: {self.names}")
+
+        self.percentiles = tuple(self.PERCENTILES if percentiles is None else percentiles)
+        self.fields = self.STATS + tuple(self.percentile_name(q) for q in self.percentiles)
+        self.frame_shape = tuple(frame_shape)
+        self.pixels = [roi.pixels(gsd_mm, self.frame_shape) for roi in self.rois]
+        self.sizes = np.array([pixels.size for pixels in self.pixels])
+
+        # padding pixels point to an extra NaN pixel after the last one of the frame
+        self.no_pixels = self.frame_shape[0] * self.frame_shape[1]
+        self.index = np.full((len(self.rois), self.sizes.max(initial=1)), self.no_pixels)
+        for row, pixels in enumerate(self.pixels):
+            self.index[row, :pixels.size] = pixels
+
+        # positions within the sorted values of each percentile of each region, (PERCENTILES, REGIONS)
+        positions = np.outer(np.asarray(self.percentiles, dtype=float) / 100., self.sizes - 1)
+        self._lower = np.floor(positions).astype(int)
+        self._upper = np.ceil(positions).astype(int)
+        self._weight = positions - self._lower
+
+        self.results = None
+
+    @staticmethod
+    def percentile_name(q):
+        return f"p{q:g}"
+
+    def definition(self):
+        """Definition of the analysis, for the keys of the cache: the pixels of each region and the percentiles"""
+        return dict(
+            rois={roi.name: pixels.tolist() for roi, pixels in zip(self.rois, self.pixels)},
+            percentiles=self.percentiles
+        )
+
+    def analyze(self, frames):
+        """
+        This method analyzes the given (N, PIXELS_Y, PIXELS_X) block of frames, returns a dictionary with a
+        (N, REGIONS) array for each of the fields (mean, min, max, p5...) and a (N, PIXELS) array with the
+        profile of each line region (profile_<name>).
+        """
+        no_frames = frames.shape[0]
+        pixels = np.empty((no_frames, self.no_pixels + 1), dtype=np.float32)
+        pixels[:, :-1] = frames.reshape(no_frames, self.no_pixels)
+        pixels[:, -1] = np.nan
+
+        values = np.sort(pixels[:, self.index], axis=2)
+        regions = np.arange(len(self.rois))
+
+        results = dict(
+            mean=np.nansum(values, axis=2) / self.sizes,
+            min=values[:, :, 0],
+            max=values[:, regions, self.sizes - 1]
+        )
+        for row, q in enumerate(self.percentiles):
+            lower = values[:, regions, self._lower[row]]
+            upper = values[:, regions, self._upper[row]]
+            results[self.percentile_name(q)] = lower + (upper - lower) * self._weight[row]
+
+        for roi, roi_pixels in zip(self.rois, self.pixels):
+            if roi.shape == 'line':
+                results[f"profile_{roi.name}"] = pixels[:, roi_pixels]
+        return results
+
+    def process(self, frames, indexes=None):
+        """
+        This method analyzes the frames with the given indexes (all when None) in blocks of CHUNK_FRAMES, so
+        that the memory needed does not depend on the number of frames. The frames can be any object that
+        can be indexed with arrays of indexes, as a RawDataset. Returns the results, as analyze() does.
+        """
+        if indexes is None:
+            indexes = np.arange(len(frames))
+
+        blocks = [
+            self.analyze(np.asarray(frames[indexes[start:start + self.CHUNK_FRAMES]]))
+            for start in range(0, len(indexes), self.CHUNK_FRAMES)
+        ]
+        if blocks:
+            self.results = {name: np.concatenate([block[name] for block in blocks]) for name in blocks[0]}
+        else:
+            self.results = self.analyze(np.empty((0,) + self.frame_shape, dtype=np.float32))
+        return self.results
+
+    def __getitem__(self, key):
+        """Vector with the given field (mean, min, max, p5...) of the region with the given name, per frame"""
+        field, name = key
+        return self.results[field][:, self.names.index(name)]
+
+    def summary(self, results=None):
+        """
+        This method summarizes the results: for each region and field, the minimum, mean, maximum and last
+        value over time.
+        """
+        results = self.results if results is None else results
+        summary = {}
+        for column, roi in enumerate(self.rois):
+            summary[roi.name] = dict(pixels=int(self.sizes[column]))
+            if results['mean'].shape[0] == 0:
+                continue
+            for field in self.fields:
+                vector = results[field][:, column]
+                summary[roi.name][field] = dict(
+                    min=float(vector.min()), mean=float(vector.mean()), max=float(vector.max()),
+                    last=float(vector[-1])
+                )
+        return summary
+
+    def save(self, filepath, **arrays):
+        """
+        This method saves the results into a .npz file, together with the names and the definitions of the
+        regions (as JSON) and any other given arrays.
+        """
+        np.savez(
+            filepath, names=np.array(self.names), percentiles=np.array(self.percentiles),
+            rois=json.dumps([roi.to_dict() for roi in self.rois]), **self.results, **arrays
+        )
+
+    def restore(self, filepath):
+        """This method restores the results saved by save(), for the same regions"""
+        with np.load(filepath) as data:
+            self.results = {name: data[name] for name in data.files if name not in ('names', 'percentiles', 'rois')}
+        return self.results
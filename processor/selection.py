@@ -0,0 +1,193 @@
+"""Adaptive selection of the frames to be rendered, driven by the changes of the scene and its events."""
+
+import numpy as np
+
+from xpython.common import logger
+
+
+def moving_average(series, window):
+    """Trailing moving average along the first axis over window samples, shorter for the first samples"""
+    sums = np.cumsum(series, axis=0, dtype=np.float64)
+    counts = np.minimum(np.arange(1, series.shape[0] + 1), window).reshape((-1,) + (1,) * (series.ndim - 1))
+    sums[window:] = sums[window:] - sums[:-window]
+    return sums / counts
+
+
+class FrameSelector(logger.LoggingClass):
+    """Adaptive frame selector
+    This class selects, out of the results of the analysis of a whole dataset (see MLX90640Analysis), the
+    frames worth rendering, instead of one out of every jump_frames frames. All of it is calculated with
+    array operations over the whole dataset. The probes (reference pixels, dT, minimum and maximum) are
+    smoothed with a moving average over smooth_s seconds first, so that the noise of the sensor does not
+    count as changes. The frames selected are:
+
+        change      - a frame every time that the change of the probes accumulated over time grows by another
+                        change_c degrees, hence many of them while heating and none during the steady state;
+                        changes below change_c over the last lag_s seconds are noise
+        slope       - the frames where the slope of dT over the last lag_s seconds is larger (in absolute
+                        value) than slope_c_s, if given
+        keyframe    - a frame every max_gap_s seconds, so that the steady state is still visible
+        events      - the first and last frames, the maximum of dT and of the temperature of P2, the first
+                        frames where dT reaches the given fractions of its range (if larger than change_c),
+                        those where the hottest pixel moves somewhere else for at least hotspot_hold_s;
+                        together with the frames within context_s seconds around each of them
+
+    With a budget of frames, the events are kept first (in the order above) and the rest of the budget is
+    spread evenly over the change accumulated by the other frames selected.
+    """
+
+    CHANGE_C        = 0.5
+    SMOOTH_S        = 0.5
+    LAG_S           = 2.
+    MAX_GAP_S       = 10.
+    CONTEXT_S       = 0.5
+    CROSSINGS       = (0.5, 0.9)
+    HOTSPOT_PX      = 2
+    HOTSPOT_HOLD_S  = 1.
+
+    PROBES = ('t0', 't1', 't2', 'diff', 'min', 'max')
+    EVENTS = ('first', 'last', 'max_dT', 'max_t2', 'crossing', 'hotspot')
+
+    def __init__(
+        self, fps,
+        change_c=CHANGE_C, slope_c_s=None, budget=None, max_gap_s=MAX_GAP_S, context_s=CONTEXT_S,
+        crossings=CROSSINGS, hotspot_px=HOTSPOT_PX, hotspot_hold_s=HOTSPOT_HOLD_S, smooth_s=SMOOTH_S,
+        lag_s=LAG_S
+    ):
+        """Default constructor
+        fps                 - frames per second of the dataset
+        change_c=0.5        - degrees of change of any probe in between the frames selected
+        slope_c_s=None      - degrees per second of dT above which all the frames are selected, None for none
+        budget=None         - maximum number of frames to be selected, None for no limit
+        max_gap_s=10        - seconds in between keyframes, None for no keyframes
+        context_s=0.5       - seconds of frames selected before and after each event
+        crossings=(.5, .9)  - fractions of the range of dT whose first crossings are events
+        hotspot_px=2        - pixels that the hottest pixel has to move to be a new hotspot
+        hotspot_hold_s=1    - seconds that a new hotspot has to stay to be an event
+        smooth_s=0.5        - seconds of the moving average applied to the probes
+        lag_s=2             - seconds over which the change of the probes is measured
+        """
+        super(FrameSelector, self).__init__()
+
+        self.fps = fps
+        self.change_c = change_c
+        self.slope_c_s = slope_c_s
+        self.budget = budget
+        self.max_gap_s = max_gap_s
+        self.context_s = context_s
+        self.crossings = tuple(crossings)
+        self.hotspot_px = hotspot_px
+        self.hotspot_hold_s = hotspot_hold_s
+        self.smooth_s = smooth_s
+        self.lag_s = lag_s
+
+        self.reasons = {}
+
+    def definition(self):
+        """Parameters of the selection, for the keys of the cache"""
+        return dict(
+            change_c=self.change_c, slope_c_s=self.slope_c_s, budget=self.budget, max_gap_s=self.max_gap_s,
+            context_s=self.context_s, crossings=list(self.crossings), hotspot_px=self.hotspot_px,
+            hotspot_hold_s=self.hotspot_hold_s, smooth_s=self.smooth_s,
+            lag_s=self.lag_s
+        )
+
+    def frames(self, seconds):
+        """Number of frames (at least one) in the given seconds"""
+        return max(int(round(seconds * self.fps)), 1)
+
+    def events(self, analysis, smoothed):
+        """
+        This method returns a dictionary with the positions of the frames of each event, in the order of
+        EVENTS; the crossings and hotspots in chronological order.
+        """
+        no_frames = analysis.no_frames
+        diff = smoothed[:, self.PROBES.index('diff')]
+        events = dict(
+            first=np.array([0]), last=np.array([no_frames - 1]),
+            max_dT=np.array([np.argmax(analysis.diff)]), max_t2=np.array([np.argmax(analysis.t2)])
+        )
+
+        # the first frames where dT reaches each fraction of its range, if it changes at all
+        low, high = np.min(diff), np.max(diff)
+        events['crossing'] = np.zeros(0, dtype=np.int64)
+        if high - low >= self.change_c:
+            above = diff[None, :] >= low + np.array(self.crossings)[:, None] * (high - low)
+            events['crossing'] = np.unique(np.argmax(above, axis=1))
+
+        # the hottest pixel moves and then stays there (within hotspot_px) for hotspot_hold_s
+        hottest = analysis.max_pixel.astype(np.int64)
+        moved = np.zeros(no_frames, dtype=bool)
+        moved[1:] = np.abs(hottest[1:] - hottest[:-1]).max(axis=1) > self.hotspot_px
+        stays = np.ones(no_frames, dtype=bool)
+        for shift in range(1, self.frames(self.hotspot_hold_s) + 1):
+            later = hottest[np.minimum(np.arange(no_frames) + shift, no_frames - 1)]
+            stays &= np.abs(later - hottest).max(axis=1) <= self.hotspot_px
+        events['hotspot'] = np.flatnonzero(moved & stays)
+        return events
+
+    def select(self, analysis):
+        """
+        This method returns the sorted positions (within the results of the analysis) of the frames selected,
+        the positions selected for each reason are kept in self.reasons.
+        """
+        no_frames = analysis.no_frames
+        if no_frames == 0:
+            self.reasons = {}
+            return np.zeros(0, dtype=np.int64)
+
+        probes = np.stack([getattr(analysis, name) for name in self.PROBES], axis=1)
+        smoothed = moving_average(probes, self.frames(self.smooth_s))
+        # change of the probes in between consecutive frames, ignored while they change less than change_c
+        # over the last lag_s seconds, and a frame every time that it accumulates another change_c degrees
+        lag = min(self.frames(self.lag_s), no_frames - 1)
+        changing = np.zeros(no_frames, dtype=bool)
+        if lag:
+            changing[lag:] = np.abs(smoothed[lag:] - smoothed[:-lag]).max(axis=1) >= self.change_c
+        activity = np.zeros(no_frames)
+        activity[1:] = np.abs(np.diff(smoothed, axis=0)).max(axis=1)
+        accumulated = np.cumsum(np.where(changing, activity, 0.)) / self.change_c
+        levels = np.floor(accumulated)
+
+        self.reasons = dict(change=np.flatnonzero(np.diff(levels) > 0) + 1)
+        if self.slope_c_s is not None:
+            diff = smoothed[:, self.PROBES.index('diff')]
+            slope = np.zeros(no_frames)
+            slope[lag:] = (diff[lag:] - diff[:-lag]) * self.fps / max(lag, 1) if lag else 0.
+            self.reasons['slope'] = np.flatnonzero(np.abs(slope) >= self.slope_c_s)
+        if self.max_gap_s is not None:
+            self.reasons['keyframe'] = np.arange(0, no_frames, self.frames(self.max_gap_s))
+
+        events = self.events(analysis, smoothed)
+        self.reasons.update(events)
+        context = self.frames(self.context_s)
+        around = np.concatenate([positions for positions in events.values()])
+        around = np.clip(around[:, None] + np.arange(-context, context + 1), 0, no_frames - 1).ravel()
+        self.reasons['context'] = np.unique(around)
+
+        # by priority: the events, the frames around them, the rest
+        priority = np.concatenate([events[name] for name in self.EVENTS] + [around])
+        _, first = np.unique(priority, return_index=True)
+        priority = priority[np.sort(first)]
+        others = [self.reasons[name] for name in ('change', 'slope', 'keyframe') if name in self.reasons]
+        others = np.setdiff1d(np.concatenate(others), priority)
+
+        if self.budget is not None:
+            priority = priority[:self.budget]
+            remaining = self.budget - priority.size
+            if remaining <= 0:
+                others = others[:0]
+            elif others.size > remaining:
+                span = accumulated[others]
+                if span[-1] > span[0]:
+                    picks = np.searchsorted(span, np.linspace(span[0], span[-1], remaining))
+                else:
+                    picks = np.linspace(0, others.size - 1, remaining).round().astype(np.int64)
+                others = others[np.unique(np.minimum(picks, others.size - 1))]
+
+        selected = np.union1d(priority, others).astype(np.int64)
+        self._l.debug(
+            f"Selected {selected.size} out of {no_frames} frames: "
+            + ", ".join(f"{name} = {positions.size}" for name, positions in self.reasons.items())
+        )
+        return selected
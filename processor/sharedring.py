@@ -0,0 +1,369 @@
+"""Shared memory ring buffer to fan out the frames from MLX90640 to several processes without copies."""
+
+import argparse
+import numpy as np
+import sys
+import time
+
+from multiprocessing import resource_tracker, shared_memory
+
+from xpython.common import logger
+
+from processor import container, rawdataset
+
+
+MAGIC = 0x4d4c5852494e4731      # 'MLXRING1'
+VERSION = 1
+
+# fields of the control block, int64 each
+CONTROL_MAGIC, CONTROL_VERSION, CONTROL_CAPACITY, CONTROL_PIXELS_Y, CONTROL_PIXELS_X = range(5)
+CONTROL_PUBLISHED, CONTROL_CLOSED = 5, 6
+CONTROL_SIZE = 8
+
+
+class SharedFrameRing(logger.LoggingClass):
+    """Shared memory ring of frames
+    This class keeps the last <capacity> frames in a block of shared memory, written by a single producer
+    and read by any number of processes (see RingReader), each of them at its own pace. The block holds a
+    control block (with the number of frames published so far), a stamp and a timestamp per slot and the
+    (capacity, PIXELS_Y, PIXELS_X) float32 frames, so that readers access the frames in place.
+
+    Every slot is protected by a sequence lock: before writing the frame with sequence number n into its
+    slot (n % capacity), the producer sets the stamp of the slot to 2n + 1, and to 2n + 2 once the frame
+    is complete. The frames are published afterwards, by updating the number of published frames. A reader
+    knows that a frame it used is intact if the stamp of its slot still is 2n + 2 afterwards; otherwise,
+    the producer overran the reader. The producer never waits for the readers nor knows about them, so
+    adding a reader costs nothing to the producer.
+    """
+
+    CAPACITY = 256
+
+    def __init__(self, name=None, capacity=CAPACITY, create=True):
+        """Default constructor
+        name=None       - name of the block of shared memory, a random one when None (only when creating it)
+        capacity=256    - number of frames kept, when creating the block
+        create=True     - whether to create the block (producer) or to attach to an existing one (see attach)
+        """
+        super(SharedFrameRing, self).__init__()
+
+        shape = (rawdataset.RawDataset.PIXELS_Y, rawdataset.RawDataset.PIXELS_X)
+        if create:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=self.size(capacity, shape))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # only the producer owns the block, the readers must not remove it when they exit
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+
+        self.name = self.shm.name
+        self.owner = create
+        self.control = np.ndarray((CONTROL_SIZE,), dtype=np.int64, buffer=self.shm.buf)
+        if create:
+            self.control[:] = 0
+            self.control[[CONTROL_VERSION, CONTROL_CAPACITY, CONTROL_PIXELS_Y, CONTROL_PIXELS_X]] = (
+                VERSION, capacity, shape[0], shape[1]
+            )
+            # the last one, readers attaching meanwhile find no ring yet
+            self.control[CONTROL_MAGIC] = MAGIC
+        elif self.control[CONTROL_MAGIC] != MAGIC or self.control[CONTROL_VERSION] != VERSION:
+            self.shm.close()
+            raise ValueError(f"Shared memory <{name}> is not a ring of frames of version {VERSION}")
+
+        self.capacity = int(self.control[CONTROL_CAPACITY])
+        self.shape = (int(self.control[CONTROL_PIXELS_Y]), int(self.control[CONTROL_PIXELS_X]))
+        offset = CONTROL_SIZE * 8
+        self.stamps = np.ndarray((self.capacity,), dtype=np.int64, buffer=self.shm.buf, offset=offset)
+        offset += self.capacity * 8
+        self.timestamps_us = np.ndarray((self.capacity,), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+        offset += self.capacity * 8
+        self.frames = np.ndarray(
+            (self.capacity,) + self.shape, dtype=rawdataset.RawDataset.DTYPE, buffer=self.shm.buf, offset=offset
+        )
+        if create:
+            self.stamps[:] = 0
+
+    @staticmethod
+    def size(capacity, shape):
+        """Size in bytes of the block of shared memory for the given capacity and shape of the frames"""
+        size_frame = shape[0] * shape[1] * np.dtype(rawdataset.RawDataset.DTYPE).itemsize
+        return CONTROL_SIZE * 8 + capacity * (16 + size_frame)
+
+    @staticmethod
+    def attach(name, timeout_s=0, poll_interval_s=0.05):
+        """
+        This method attaches to the ring created by the producer with the given name, waiting up to
+        timeout_s seconds (forever when None) for the producer to create it.
+        """
+        deadline = None if timeout_s is None else time.monotonic() + timeout_s
+        while True:
+            try:
+                return SharedFrameRing(name, create=False)
+            except (FileNotFoundError, ValueError):
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise
+            time.sleep(poll_interval_s)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def published(self):
+        """Number of frames published so far, which is also the sequence number of the next frame"""
+        return int(self.control[CONTROL_PUBLISHED])
+
+    @property
+    def closed(self):
+        """Whether the producer finished, no more frames are published after it"""
+        return bool(self.control[CONTROL_CLOSED])
+
+    def write(self, frames, timestamps_us=None):
+        """
+        This method publishes the given (N, PIXELS_Y, PIXELS_X) frames (or a single frame), with their
+        timestamps (now, when None). All of them are written at once; out of a block larger than the ring
+        only the last <capacity> frames are written, the rest are lost for every reader.
+        """
+        frames = np.asarray(frames, dtype=rawdataset.RawDataset.DTYPE).reshape((-1,) + self.shape)
+        count = frames.shape[0]
+        if timestamps_us is None:
+            timestamps_us = np.full(count, time.time() * 1e6)
+
+        published = self.published
+        keep = min(count, self.capacity)
+        sequences = np.arange(published + count - keep, published + count)
+        slots = sequences % self.capacity
+
+        self.stamps[slots] = 2 * sequences + 1
+        self.frames[slots] = frames[count - keep:]
+        self.timestamps_us[slots] = np.broadcast_to(timestamps_us, (count,))[count - keep:]
+        self.stamps[slots] = 2 * sequences + 2
+        self.control[CONTROL_PUBLISHED] = published + count
+        return published + count
+
+    def intact(self, sequences):
+        """Boolean vector telling which of the frames with the given sequence numbers are still in the ring"""
+        sequences = np.asarray(sequences)
+        return self.stamps[sequences % self.capacity] == 2 * sequences + 2
+
+    def close(self):
+        """
+        Detaches from the ring. The producer marks the ring as closed and removes the block of shared memory,
+        the readers that are attached to it keep their mapping until they close it too.
+        """
+        if self.shm is None:
+            return
+        if self.owner:
+            self.control[CONTROL_CLOSED] = 1
+        self.control = self.stamps = self.timestamps_us = self.frames = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+
+class RingReader(logger.LoggingClass):
+    """Reader of a shared memory ring
+    This class follows the frames published into a SharedFrameRing, from its own process. The frames are
+    returned as views of the shared memory (poll), valid until the producer overwrites them: the reader has
+    to check that they are still intact after using them (done), or get them copied (read). When the reader
+    falls more than <capacity> frames behind, the frames overwritten are counted as overrun and the reader
+    goes on from the oldest frame in the ring. Waiting for new frames is done by polling, so the producer
+    never makes a system call on behalf of the readers.
+    """
+
+    def __init__(self, ring, start='latest', poll_interval_s=0.005):
+        """Default constructor
+        ring                    - SharedFrameRing or name of its block of shared memory
+        start='latest'          - whether to start after the frames published so far ('latest') or with the
+                                    oldest frame still in the ring ('oldest')
+        poll_interval_s=0.005   - seconds in between checks for new frames, when waiting for them
+        """
+        super(RingReader, self).__init__()
+
+        self.ring = SharedFrameRing.attach(ring) if isinstance(ring, str) else ring
+        self.poll_interval_s = poll_interval_s
+        published = self.ring.published
+        self.next_sequence = published if start == 'latest' else max(published - self.ring.capacity, 0)
+
+        self.no_read = 0
+        self.no_overrun = 0
+
+    def available(self):
+        """Number of frames published and not read yet (including those already overwritten)"""
+        return self.ring.published - self.next_sequence
+
+    def _skip_overrun(self, published):
+        lost = published - self.ring.capacity - self.next_sequence
+        if lost > 0:
+            self._l.warning(f"Reader overrun, {lost} frames lost")
+            self.no_overrun += lost
+            self.next_sequence += lost
+
+    def poll(self, max_frames=None):
+        """
+        This method returns the next frames published, without copying them nor waiting for them, as a
+        (sequences, frames, timestamps_us) tuple of views, with up to max_frames frames (all the available
+        ones when None) contiguous within the ring, hence fewer when they wrap around. The frames are
+        considered read, done() tells whether they were still intact after using them.
+        """
+        published = self.ring.published
+        self._skip_overrun(published)
+
+        start = self.next_sequence % self.ring.capacity
+        count = min(published - self.next_sequence, self.ring.capacity - start)
+        if max_frames is not None:
+            count = min(count, max_frames)
+
+        sequences = np.arange(self.next_sequence, self.next_sequence + count)
+        self.next_sequence += count
+        self.no_read += count
+        return sequences, self.ring.frames[start:start + count], self.ring.timestamps_us[start:start + count]
+
+    def done(self, sequences):
+        """
+        This method checks whether the frames with the given sequence numbers, returned by poll(), were still
+        intact after using them; those that were overwritten meanwhile are counted as overrun. Returns the
+        boolean vector with the intact ones.
+        """
+        intact = self.ring.intact(sequences)
+        lost = int(intact.size - np.count_nonzero(intact))
+        if lost:
+            self.no_read -= lost
+            self.no_overrun += lost
+        return intact
+
+    def read(self, max_frames=None):
+        """
+        This method returns the next frames published, as poll() does, but copied and only the ones that
+        were intact once copied.
+        """
+        sequences, frames, timestamps_us = self.poll(max_frames)
+        frames, timestamps_us = frames.copy(), timestamps_us.copy()
+        intact = self.done(sequences)
+        if not intact.all():
+            return sequences[intact], frames[intact], timestamps_us[intact]
+        return sequences, frames, timestamps_us
+
+    def wait(self, timeout_s=None):
+        """
+        This method waits until there are new frames, the producer closes the ring or timeout_s elapses
+        (forever when None). Returns whether there are new frames.
+        """
+        deadline = None if timeout_s is None else time.monotonic() + timeout_s
+        while self.available() == 0:
+            if self.ring.closed or (deadline is not None and time.monotonic() >= deadline):
+                return False
+            time.sleep(self.poll_interval_s)
+        return True
+
+    def stats(self):
+        return dict(read=self.no_read, overrun=self.no_overrun, pending=self.available())
+
+    def close(self):
+        self.ring.close()
+
+
+class SharedRingTool(logger.LoggingClass):
+    """Producer and recorder for the shared memory ring, from the command line"""
+
+    @staticmethod
+    def produce(name, raw_filepath, capacity=SharedFrameRing.CAPACITY, fps=16, rate=None, linger_s=1.):
+        """
+        This method publishes the frames of a RAW file (or container) at the given rate (the fps of the
+        dataset when None, 0 for as fast as possible), or those of a stream of RAW frames read from the
+        standard input ('-', as rawrgb writes them) as they arrive. The ring is kept for linger_s seconds
+        after the last frame, for the readers to catch up, before removing it. Returns the number of frames
+        published.
+        """
+        ring = SharedFrameRing(name, capacity=capacity)
+        size_frame = rawdataset.RawDataset.SIZE_FRAME
+        try:
+            if raw_filepath == '-':
+                stream = sys.stdin.buffer
+                while True:
+                    data = stream.read(size_frame)
+                    if len(data) < size_frame:
+                        break
+                    ring.write(np.frombuffer(data, dtype=rawdataset.RawDataset.DTYPE))
+            else:
+                dataset = container.open_dataset(raw_filepath, fps=fps)
+                rate = fps if rate is None else rate
+                start = time.perf_counter()
+                for index in range(len(dataset)):
+                    if rate > 0:
+                        delay_s = start + index / rate - time.perf_counter()
+                        if delay_s > 0:
+                            time.sleep(delay_s)
+                    ring.write(dataset[index])
+                dataset.close()
+            time.sleep(linger_s)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            published = ring.published
+            ring._l.info(f"Published {published} frames into <{ring.name}>")
+            ring.close()
+        return published
+
+    @staticmethod
+    def record(name, raw_filepath, start='oldest', timeout_s=None):
+        """
+        This method writes the frames published into the ring with the given name into a RAW file, until
+        the producer closes it, waiting up to timeout_s seconds (forever when None) for the producer to
+        create the ring. Returns the reader, with its counters.
+        """
+        reader = RingReader(SharedFrameRing.attach(name, timeout_s=timeout_s), start=start)
+        try:
+            with open(raw_filepath, 'wb') as f:
+                while reader.wait() or reader.available():
+                    _, frames, _ = reader.read()
+                    f.write(frames.tobytes())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            reader._l.info(f"Recorded <{name}> into {raw_filepath}: {reader.stats()}")
+            reader.close()
+        return reader
+
+    @staticmethod
+    def create(argv):
+        """Factory method that runs the producer or the recorder given by the CLI arguments"""
+
+        parser = argparse.ArgumentParser(description="Shared memory ring of frames from MLX90640")
+        parser.add_argument(
+            "-n", "--name", type=str, required=True,
+            help="Name of the block of shared memory"
+        )
+        mode = parser.add_mutually_exclusive_group(required=True)
+        mode.add_argument(
+            "-r", "--raw_file", type=str, metavar="FILE",
+            help="Publishes the frames of the given RAW file, or those read from the standard input with '-'"
+        )
+        mode.add_argument(
+            "-o", "--output", type=str, metavar="FILE",
+            help="Records the frames published into the ring into the given RAW file"
+        )
+        parser.add_argument(
+            "-c", "--capacity", type=int, required=False, default=SharedFrameRing.CAPACITY,
+            help="Number of frames kept in the ring"
+        )
+        parser.add_argument(
+            "-f", "--fps", type=int, required=False, default=16,
+            help="Frames per second of the RAW file"
+        )
+        parser.add_argument(
+            "--rate", type=float, required=False,
+            help="Frames per second to publish the RAW file at, its fps by default, 0 for unthrottled"
+        )
+
+        args = parser.parse_args(argv)
+        if args.raw_file is not None:
+            return SharedRingTool.produce(
+                args.name, args.raw_file, capacity=args.capacity, fps=args.fps, rate=args.rate
+            )
+        return SharedRingTool.record(args.name, args.output)
+
+
+if __name__ == "__main__":
+    SharedRingTool.create(sys.argv[1:])
@@ -0,0 +1,244 @@
+"""Stats-only analysis of the datasets from MLX90640: no figures, no videos and no output directory."""
+
+import argparse
+import json
+import numpy as np
+import os
+import sys
+
+from xpython.common import files, logger
+
+from processor import analysis, container, processor, temporal
+from processor import rois as rois_module
+
+
+class MLX90640Stats(logger.LoggingClass):
+    """Stats-only analysis
+    This class analyzes a dataset exactly as the processor does, but it only calculates the time-dependent
+    variables and their summary: it does not import matplotlib, it does not call ffmpeg and it does not
+    create the output directory of the dataset. The frames are analyzed in chunks, so the memory needed
+    does not depend on the length of the recording. It is meant for the short analyses that are run from
+    scripts, where the startup time of the processor would dominate.
+    """
+
+    VECTORS = ('t0', 't1', 't2', 'diff', 'min', 'max')
+
+    def __init__(
+        self, fps, distance_mm, raw_filepath,
+        px_distance_mm=20, rois=None, window_s=temporal.TemporalAnalysis.WINDOW_S
+    ):
+        """Default constructor
+        fps                 - frames per second, necessary to calculate the timeline
+        distance_mm         - mm of distance from the camera to the target material
+        raw_filepath        - path to the RAW file (or compressed container) with the frames
+        px_distance_mm=20   - mm of distance from P0 to P1 or P2
+        rois=None           - regions of interest to be summarized too, as for the processor
+        window_s=10         - seconds of the trailing window for the temporal analytics
+        """
+        super(MLX90640Stats, self).__init__()
+
+        self.fps = fps
+        self.distance_mm = distance_mm
+        self.raw_filepath = raw_filepath
+        self.px_distance_mm = px_distance_mm
+        self.window_s = window_s
+
+        gsd_mm, _, self.ref_pixels = processor.MLX90640Processor.reference_pixels(distance_mm, px_distance_mm)
+
+        self.roi_analysis = None
+        if rois:
+            percentiles = None
+            if isinstance(rois, str):
+                rois, percentiles = rois_module.load(rois)
+            self.roi_analysis = rois_module.ROIAnalysis(
+                rois, gsd_mm, processor.MLX90640Processor.FRAME_SHAPE, percentiles=percentiles
+            )
+
+    def analyze(self):
+        """
+        This method analyzes all the frames of the dataset, skipping those with NaN values, and returns a
+        dictionary with the time-dependent vectors (t, t0, t1, t2, diff, min, max) and the number of
+        frames read, plus the results of the regions of interest (rois), if any.
+        """
+        dataset = container.open_dataset(self.raw_filepath, fps=self.fps)
+        blocks = {name: [] for name in self.VECTORS}
+        roi_blocks = []
+        for start in range(0, len(dataset), dataset.CHUNK_FRAMES):
+            frames = dataset[start:start + dataset.CHUNK_FRAMES]
+            frames = frames[~np.isnan(frames).any(axis=(1, 2))]
+            if frames.shape[0] == 0:
+                continue
+            block = analysis.MLX90640Analysis(frames, self.ref_pixels)
+            for name in self.VECTORS:
+                blocks[name].append(getattr(block, name))
+            if self.roi_analysis is not None:
+                roi_blocks.append(self.roi_analysis.analyze(frames))
+
+        vectors = {name: np.concatenate(blocks[name] or [np.empty(0)]) for name in self.VECTORS}
+        no_frames = vectors['diff'].shape[0]
+        vectors['t'] = np.linspace(0., no_frames / self.fps, num=no_frames)
+        vectors['no_read'] = len(dataset)
+        if roi_blocks:
+            vectors['rois'] = {
+                name: np.concatenate([block[name] for block in roi_blocks]) for name in roi_blocks[0]
+            }
+        dataset.close()
+        return vectors
+
+    def summary(self, series=False):
+        """
+        This method returns the summary of the dataset: the number of frames, the duration, the maximum dT
+        and T2REF (as the processor calculates them) and the minimum, mean, maximum and last value of each
+        of the time-dependent variables, with their temporal analytics (temporal.TemporalAnalysis). When
+        series is set, the variables themselves are included too.
+        """
+        vectors = self.analyze()
+        no_read = vectors.pop('no_read')
+        roi_results = vectors.pop('rois', None)
+        no_frames = vectors['diff'].shape[0]
+
+        summary = dict(
+            name=os.path.splitext(os.path.basename(self.raw_filepath))[0], raw_filepath=self.raw_filepath,
+            fps=self.fps, distance_mm=self.distance_mm, px_distance_mm=self.px_distance_mm,
+            ref_pixels=[list(pixel) for pixel in self.ref_pixels],
+            no_read=no_read, no_frames=no_frames, no_skipped=no_read - no_frames, duration=no_frames / self.fps
+        )
+        if no_frames == 0:
+            return summary
+
+        for name, vector in (('dT', vectors['diff']), ('T2REF', vectors['t2'])):
+            index = int(np.argmax(vector))
+            summary[f"max_{name}_value"] = float(vector[index])
+            summary[f"max_{name}_index"] = index
+            summary[f"max_{name}_time"] = index / self.fps
+
+        summary['vectors'] = {
+            name: dict(
+                min=float(vectors[name].min()), mean=float(vectors[name].mean()),
+                max=float(vectors[name].max()), last=float(vectors[name][-1])
+            )
+            for name in self.VECTORS
+        }
+        names, columns = list(self.VECTORS), [vectors[name] for name in self.VECTORS]
+        if roi_results is not None:
+            summary['rois'] = self.roi_analysis.summary(roi_results)
+            names += [f"roi_{name}" for name in self.roi_analysis.names]
+            columns += list(roi_results['mean'].T)
+        analytics = temporal.TemporalAnalysis(self.fps, names, window_s=self.window_s)
+        summary['temporal'] = analytics.process(np.stack(columns, axis=1)).summary()
+        if series:
+            summary['series'] = {name: vector.tolist() for name, vector in vectors.items()}
+        return summary
+
+    @staticmethod
+    def format(summary):
+        """Human readable representation of the given summary"""
+        lines = [
+            f"{summary['name']}: frames = {summary['no_frames']} (skipped = {summary['no_skipped']}), "
+            f"duration = {summary['duration']:.3f} (s)"
+        ]
+        if summary['no_frames'] > 0:
+            lines.append(
+                f"max dT = {summary['max_dT_value']:2.3f} (degC) @ {summary['max_dT_time']:.3f} (s), "
+                f"max T2REF = {summary['max_T2REF_value']:2.3f} (degC) @ {summary['max_T2REF_time']:.3f} (s)"
+            )
+            lines.append("{:6} {:>9} {:>9} {:>9} {:>9}".format('', 'min', 'mean', 'max', 'last'))
+            lines.extend(
+                "{:6} {:9.3f} {:9.3f} {:9.3f} {:9.3f}".format(name, v['min'], v['mean'], v['max'], v['last'])
+                for name, v in summary['vectors'].items()
+            )
+            lines.extend(
+                "{:6} {:9.3f} {:9.3f} {:9.3f} {:9.3f} (mean of {} pixels)".format(
+                    name, v['mean']['min'], v['mean']['mean'], v['mean']['max'], v['mean']['last'], v['pixels']
+                )
+                for name, v in summary.get('rois', {}).items()
+            )
+
+            def value(v):
+                return "{:>9}".format('-') if v is None else "{:9.3f}".format(v)
+
+            lines.append("{:10} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+                '', 'slope/s', 'at (s)', 'steady(s)', 'tau (s)', 'final'
+            ))
+            lines.extend(
+                "{:10} {} {} {} {} {}".format(name, *(value(v[key]) for key in (
+                    'max_slope', 'max_slope_time', 'steady_time', 'fit_tau_s', 'fit_t_inf'
+                )))
+                for name, v in summary['temporal'].items()
+            )
+        return "\n".join(lines)
+
+    @staticmethod
+    def create(argv):
+        """Factory method that analyzes the dataset given by the CLI arguments and prints its summary"""
+
+        parser = argparse.ArgumentParser(description="Calculates the summary of a file with raw data from MLX90640")
+        parser.add_argument(
+            "-r", "--raw_file",
+            type=files.is_readable_file, metavar="FILE", required=True,
+            help="Path to the binary file (RAW or compressed container) to be analyzed"
+        )
+        parser.add_argument(
+            "-f", "--fps", type=int, required=True,
+            help="Frames per second, required for timing calculation"
+        )
+        parser.add_argument(
+            "-d", "--distance", type=float, required=True,
+            help="Distance in mm from the output of the lens' telescope to the target material"
+        )
+        parser.add_argument(
+            "-x", "--px-distance", type=float, required=False, default=20,
+            help="Distance in mm from the reference pixel P0 to P1 or P2"
+        )
+        parser.add_argument(
+            "--rois", type=files.is_readable_file, metavar="FILE", required=False,
+            help="JSON file with the regions of interest to be summarized too"
+        )
+        parser.add_argument(
+            "--window", type=float, required=False, default=temporal.TemporalAnalysis.WINDOW_S,
+            help="Seconds of the trailing window for the moving averages and the slopes"
+        )
+        parser.add_argument(
+            "-j", "--json",
+            action='store_true', required=False,
+            help="Prints the summary as JSON instead of as a table"
+        )
+        parser.add_argument(
+            "-S", "--series",
+            action='store_true', required=False,
+            help="Includes the time-dependent variables in the JSON summary"
+        )
+        parser.add_argument(
+            "-o", "--output", type=str, metavar="FILE", required=False,
+            help="Path to the JSON file where the summary is written, the only file written"
+        )
+
+        args = parser.parse_args(argv)
+        return MLX90640Stats.run(
+            args.fps, args.distance, args.raw_file, px_distance_mm=args.px_distance,
+            series=args.series, as_json=args.json, summary_filepath=args.output, rois=args.rois,
+            window_s=args.window
+        )
+
+    @staticmethod
+    def run(
+        fps, distance_mm, raw_filepath,
+        px_distance_mm=20, series=False, as_json=False, summary_filepath=None, rois=None,
+        window_s=temporal.TemporalAnalysis.WINDOW_S
+    ):
+        """
+        This method calculates the summary of the given dataset, prints it (as a table or as JSON) and,
+        when a path is given, writes it as JSON. Returns the summary.
+        """
+        summary = MLX90640Stats(
+            fps, distance_mm, raw_filepath, px_distance_mm=px_distance_mm, rois=rois, window_s=window_s
+        ).summary(series)
+        print(json.dumps(summary, indent=1) if as_json else MLX90640Stats.format(summary))
+        if summary_filepath is not None:
+            with open(summary_filepath, 'w') as f:
+                json.dump(summary, f, indent=1)
+        return summary
+
+
+if __name__ == "__main__":
+    summary = MLX90640Stats.create(sys.argv[1:])
@@ -0,0 +1,259 @@
+"""Rolling-window temporal analytics of the time-dependent variables: averages, slopes, steady state and fits."""
+
+import json
+import numpy as np
+
+from xpython.common import logger
+
+
+def slope(n, sy, sky, fps):
+    """
+    Least squares slope (per second) of windows with n samples, given the sum of the samples (sy) and the
+    sum of the samples weighted by their position within the window (sky). NaN for windows with n < 2.
+    """
+    sk = n * (n - 1) / 2.
+    skk = (n - 1) * n * (2 * n - 1) / 6.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(n >= 2, fps * (n * sky - sk * sy) / (n * skk - sk * sk), np.nan)
+
+
+def exponential_fit(n, sx, sz, sxx, sxz, szz, t_start, fps):
+    """
+    This function fits the first order response T(t) = T_inf - (T_inf - T_start) exp(-t / tau) out of the
+    sums of the consecutive pairs of samples: sampled every 1/fps seconds, such a response satisfies
+    T[i+1] = alpha T[i] + beta, with alpha = exp(-1 / (fps tau)) and beta = T_inf (1 - alpha), which is
+    fitted by linear least squares. The samples are shifted by the first one (t_start) for accuracy:
+    x = T[i] - t_start, z = T[i+1] - t_start, n is the number of pairs.
+    Returns a dictionary with tau_s, t_inf, t_start, alpha and the rms of the residuals; tau_s and t_inf
+    are NaN when the samples do not approach a final value (alpha outside (0, 1)).
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = n * sxx - sx * sx
+        alpha = np.where(variance > 0, (n * sxz - sx * sz) / variance, np.nan)
+        beta = (sz - alpha * sx) / n
+        residuals = (
+            szz - 2 * alpha * sxz - 2 * beta * sz + alpha * alpha * sxx + 2 * alpha * beta * sx + n * beta * beta
+        )
+        converges = (alpha > 0) & (alpha < 1)
+        return dict(
+            tau_s=np.where(converges, -1. / (fps * np.log(np.where(converges, alpha, 0.5))), np.nan),
+            t_inf=np.where(converges, t_start + beta / (1 - np.where(converges, alpha, 0.5)), np.nan),
+            t_start=t_start, alpha=alpha, rms=np.sqrt(np.maximum(residuals, 0.) / n)
+        )
+
+
+class TemporalAnalysis(logger.LoggingClass):
+    """Temporal analytics
+    This class analyzes the evolution over time of a set of probes (the reference pixels, the regions of
+    interest...), given as a (N, PROBES) array with one row per frame. For every frame and probe, it
+    calculates the moving average and the slope (dT/dt, least squares) over a trailing window of
+    window_s seconds; shorter windows are used for the first frames. Out of them it calculates, per probe:
+
+        max_slope       - the maximum slope (heating rate) and when it happened
+        steady_time     - the time at which the steady state is reached: the first frame after which the
+                            absolute slope (over complete windows) keeps below steady_slope for steady_hold_s
+        fit             - the first order (exponential) response fitted to the whole series: time constant,
+                            final value and residuals (see exponential_fit)
+
+    This class analyzes complete series at once (vectorized); OnlineTemporalAnalysis calculates the same
+    results frame by frame, in constant time per frame.
+    """
+
+    RESULTS         = ('max_slope', 'max_slope_time', 'steady_time', 'fit_tau_s', 'fit_t_inf', 'fit_rms')
+    WINDOW_S        = 10.
+    STEADY_SLOPE    = 0.01
+    STEADY_HOLD_S   = 30.
+
+    def __init__(self, fps, names, window_s=WINDOW_S, steady_slope=STEADY_SLOPE, steady_hold_s=STEADY_HOLD_S):
+        """Default constructor
+        fps                         - frames per second of the series
+        names                       - names of the probes, one per column of the series
+        window_s=WINDOW_S           - length (in seconds) of the trailing window, at least 2 frames
+        steady_slope=STEADY_SLOPE   - absolute slope (degrees per second) below which the probe is steady
+        steady_hold_s=STEADY_HOLD_S - time (in seconds) that the slope has to keep below steady_slope
+        """
+        super(TemporalAnalysis, self).__init__()
+
+        self.fps = fps
+        self.names = list(names)
+        self.window_s = window_s
+        self.steady_slope = steady_slope
+        self.steady_hold_s = steady_hold_s
+
+        self.window = max(2, int(round(window_s * fps)))
+        self.hold = max(1, int(round(steady_hold_s * fps)))
+
+        self.no_frames = 0
+        self.mean = self.slope = None
+
+    def process(self, series):
+        """
+        This method analyzes the given (N, PROBES) series at once, setting the moving averages (mean) and
+        the slopes (slope) of every frame, as (N, PROBES) arrays, together with the results per probe.
+        """
+        series = np.asarray(series, dtype=np.float64).reshape(-1, len(self.names))
+        n_frames, window = series.shape[0], self.window
+
+        # sums of the samples and of the samples weighted by their position within each window
+        k = np.arange(window, dtype=np.float64)
+        n = np.minimum(np.arange(1, n_frames + 1), window)[:, None]
+        sy = np.empty_like(series)
+        sky = np.empty_like(series)
+        partial = min(window - 1, n_frames)
+        sy[:partial] = np.cumsum(series[:partial], axis=0)
+        sky[:partial] = np.cumsum(k[:partial, None] * series[:partial], axis=0)
+        if n_frames >= window:
+            windows = np.lib.stride_tricks.sliding_window_view(series, window, axis=0)
+            sy[window - 1:] = windows.sum(axis=2)
+            sky[window - 1:] = windows @ k
+
+        self.no_frames = n_frames
+        self.mean = sy / n
+        self.slope = slope(n, sy, sky, self.fps)
+
+        with np.errstate(invalid='ignore'):
+            steady = (np.abs(self.slope) < self.steady_slope) & (n >= window)
+        runs = np.cumsum(np.concatenate([np.zeros((1, steady.shape[1])), steady]), axis=0)
+        held = runs[self.hold:] - runs[:-self.hold] == self.hold
+        self.steady_index = np.full(len(self.names), -1)
+        if held.shape[0] > 0:
+            self.steady_index = np.where(held.any(axis=0), np.argmax(held, axis=0), -1)
+
+        # the first occurrence of the maximum, as the online version keeps it
+        self.max_slope_index = np.full(len(self.names), -1)
+        self.max_slope = np.full(len(self.names), np.nan)
+        if n_frames >= 2:
+            self.max_slope_index = np.argmax(self.slope[1:], axis=0) + 1
+            self.max_slope = self.slope[self.max_slope_index, np.arange(len(self.names))]
+
+        t_start = series[0] if n_frames else np.full(len(self.names), np.nan)
+        x, z = series[:-1] - t_start, series[1:] - t_start
+        self.fit = exponential_fit(
+            n_frames - 1, x.sum(axis=0), z.sum(axis=0), (x * x).sum(axis=0), (x * z).sum(axis=0),
+            (z * z).sum(axis=0), t_start, self.fps
+        )
+        self.last_mean = self.mean[-1] if n_frames else np.full(len(self.names), np.nan)
+        self.last_slope = self.slope[-1] if n_frames else np.full(len(self.names), np.nan)
+        return self
+
+    def summary(self):
+        """Dictionary with the results per probe, times in seconds and None for the values not available"""
+        def value(v):
+            return None if np.isnan(v) else float(v)
+
+        return {
+            name: dict(
+                mean=value(self.last_mean[p]), slope=value(self.last_slope[p]),
+                max_slope=value(self.max_slope[p]),
+                max_slope_time=float(self.max_slope_index[p] / self.fps) if self.max_slope_index[p] >= 0 else None,
+                steady_time=float(self.steady_index[p] / self.fps) if self.steady_index[p] >= 0 else None,
+                **{f"fit_{key}": value(self.fit[key][p]) for key in ('tau_s', 't_inf', 't_start', 'rms')}
+            )
+            for p, name in enumerate(self.names)
+        }
+
+    def save(self, filepath):
+        """
+        This method saves the moving averages and the slopes (as mean_<probe> and slope_<probe>) into a .npz
+        file, together with the summary as JSON.
+        """
+        arrays = {}
+        for p, name in enumerate(self.names):
+            arrays[f"mean_{name}"] = self.mean[:, p]
+            arrays[f"slope_{name}"] = self.slope[:, p]
+        np.savez(filepath, summary=json.dumps(self.summary()), window_s=self.window_s, **arrays)
+
+
+class OnlineTemporalAnalysis(TemporalAnalysis):
+    """Online temporal analytics
+    Same results as TemporalAnalysis, updated one frame at a time in constant time, for live streams. The
+    samples of the trailing window are kept in a ring buffer together with their running sums, which are
+    calculated again from the buffer every RESYNC frames so that rounding errors do not accumulate. The
+    fit uses running sums of the consecutive pairs of samples, the same sums that the batch version uses.
+    Only the last moving average and slope are kept (last_mean, last_slope).
+    """
+
+    RESYNC = 4096
+
+    def __init__(self, fps, names, **kwargs):
+        """Default constructor, with the same arguments as TemporalAnalysis"""
+        super(OnlineTemporalAnalysis, self).__init__(fps, names, **kwargs)
+        self.reset()
+
+    def reset(self):
+        """Discards all the frames, to start over"""
+        probes = len(self.names)
+        self.no_frames = 0
+        self._buffer = np.zeros((self.window, probes))
+        self._position = 0
+        self._count = 0
+        self._sy = np.zeros(probes)
+        self._sky = np.zeros(probes)
+        self._run = np.zeros(probes, dtype=int)
+        self._fit_sums = np.zeros((5, probes))
+        self._previous = None
+
+        self.t_start = np.full(probes, np.nan)
+        self.last_mean = np.full(probes, np.nan)
+        self.last_slope = np.full(probes, np.nan)
+        self.max_slope = np.full(probes, np.nan)
+        self.max_slope_index = np.full(probes, -1)
+        self.steady_index = np.full(probes, -1)
+
+    @property
+    def fit(self):
+        """Exponential fit of all the frames so far, calculated on demand out of the running sums"""
+        return exponential_fit(self.no_frames - 1, *self._fit_sums, self.t_start, self.fps)
+
+    def _resync(self):
+        """Calculates the running sums of the window again from the ring buffer"""
+        if self._count == self.window:
+            ordered = np.roll(self._buffer, -self._position, axis=0)
+        else:
+            ordered = self._buffer[:self._count]
+        self._sy = ordered.sum(axis=0)
+        self._sky = np.arange(self._count, dtype=np.float64) @ ordered
+
+    def update(self, values):
+        """
+        This method adds the values of the probes for a new frame, updating the results. Returns the moving
+        average and the slope of every probe at this frame.
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(len(self.names))
+        if self._count == self.window:
+            oldest = self._buffer[self._position]
+            self._sky += oldest - self._sy + (self.window - 1) * values
+            self._sy += values - oldest
+        else:
+            self._sky += self._count * values
+            self._sy += values
+            self._count += 1
+        self._buffer[self._position] = values
+        self._position = (self._position + 1) % self.window
+
+        index = self.no_frames
+        self.no_frames += 1
+        if self.no_frames % self.RESYNC == 0:
+            self._resync()
+
+        self.last_mean = self._sy / self._count
+        self.last_slope = slope(self._count, self._sy, self._sky, self.fps)
+
+        if self._count >= 2:
+            larger = np.isnan(self.max_slope) | (self.last_slope > self.max_slope)
+            self.max_slope = np.where(larger, self.last_slope, self.max_slope)
+            self.max_slope_index = np.where(larger, index, self.max_slope_index)
+
+        steady = (np.abs(self.last_slope) < self.steady_slope) & (self._count >= self.window)
+        self._run = np.where(steady, self._run + 1, 0)
+        reached = (self._run >= self.hold) & (self.steady_index < 0)
+        self.steady_index = np.where(reached, index - self.hold + 1, self.steady_index)
+
+        if self._previous is None:
+            self.t_start = values.copy()
+        else:
+            x, z = self._previous - self.t_start, values - self.t_start
+            self._fit_sums += (x, z, x * x, x * z, z * z)
+        self._previous = values
+
+        return self.last_mean, self.last_slope
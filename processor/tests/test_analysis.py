@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from processor import analysis
+
+
+class MLX90640Analysis(unittest.TestCase):
+
+    REF_PIXELS = ((16, 12), (18, 12), (14, 12))
+
+    def setUp(self):
+        self.frames = np.random.default_rng(0).normal(25., 5., size=(64, 24, 32)).astype(np.float32)
+        self.frames[3, 0, 0] = self.frames[3].max()
+        self.frames[5] = 10.
+
+    def test_per_frame_equivalence(self):
+        test_object = analysis.MLX90640Analysis(self.frames, self.REF_PIXELS)
+        self.assertEqual(test_object.no_frames, self.frames.shape[0])
+
+        for i, frame in enumerate(self.frames):
+            t1 = frame[self.REF_PIXELS[1][1], self.REF_PIXELS[1][0]]
+            t2 = frame[self.REF_PIXELS[2][1], self.REF_PIXELS[2][0]]
+            self.assertEqual(test_object.t0[i], frame[self.REF_PIXELS[0][1], self.REF_PIXELS[0][0]])
+            self.assertEqual(test_object.diff[i], np.abs(t1 - t2))
+
+            result = np.where(frame == np.min(frame))
+            self.assertEqual(test_object.min[i], np.min(frame))
+            self.assertEqual(tuple(test_object.min_pixel[i]), (result[1][0], result[0][0]))
+
+            result = np.where(frame == np.max(frame))
+            self.assertEqual(test_object.max[i], np.max(frame))
+            self.assertEqual(tuple(test_object.max_pixel[i]), (result[1][0], result[0][0]))
+
+    def test_process_dataset(self):
+        expected = analysis.MLX90640Analysis(self.frames, self.REF_PIXELS)
+        test_object = analysis.MLX90640Analysis(None, self.REF_PIXELS)
+        test_object.process_dataset(self.frames, chunk_frames=10)
+        for name in analysis.MLX90640Analysis.FIELDS:
+            np.testing.assert_array_equal(getattr(test_object, name), getattr(expected, name), name)
+
+        test_object.process_dataset(self.frames[:0])
+        self.assertEqual(test_object.no_frames, 0)
@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import benchmark, rawdataset
+
+
+class MLX90640Benchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_synthetic(self):
+        test_object = benchmark.MLX90640Benchmark(workdir=self.workdir, synthetic_fps=(16,), synthetic_hours=0.01)
+        (name, fps, raw_filepath), = test_object.datasets()
+        self.assertEqual((name, fps), ('ds-16-55-00000000-synthetic0.01h', 16))
+
+        dataset = rawdataset.RawDataset(raw_filepath, fps=fps)
+        self.assertEqual(len(dataset), 576)
+        self.assertLess(dataset[0].max(), 21.)
+        self.assertGreater(dataset[-1].max(), 50.)
+        dataset.close()
+
+        mtime_ns = os.stat(raw_filepath).st_mtime_ns
+        test_object.datasets()
+        self.assertEqual(os.stat(raw_filepath).st_mtime_ns, mtime_ns)
+
+    def test_run(self):
+        test_object = benchmark.MLX90640Benchmark(
+            workdir=self.workdir, synthetic_fps=(16,), synthetic_hours=0.01, stages=('read', 'analysis')
+        )
+        report = test_object.run()
+        result = report['results']['ds-16-55-00000000-synthetic0.01h']
+        self.assertEqual(sorted(result), ['analysis', 'read'])
+        self.assertEqual(result['analysis']['frames'], 576)
+        self.assertGreater(result['read']['peak_rss_mb'], 0.)
+
+    def test_compare(self):
+        baseline = {'results': {'ds': {
+            'read': {'frames_s': 100., 'peak_rss_mb': 100.}, 'render': {'frames_s': 10., 'peak_rss_mb': 100.}
+        }}}
+        current = {'results': {
+            'ds': {'read': {'frames_s': 95., 'peak_rss_mb': 150.}, 'render': {'frames_s': 5., 'peak_rss_mb': 100.}},
+            'new': {'read': {'frames_s': 1., 'peak_rss_mb': 1.}}
+        }}
+        regressions = benchmark.MLX90640Benchmark.compare(baseline, current, threshold=0.1)
+        self.assertEqual(
+            [(name, stage, metric) for name, stage, metric, _, _, _ in regressions],
+            [('ds', 'read', 'peak_rss_mb'), ('ds', 'render', 'frames_s')]
+        )
+        self.assertAlmostEqual(regressions[1][5], -0.5)
+
+        # a stage without frames in the baseline has no throughput to compare against
+        baseline['results']['ds']['read'] = {'frames_s': 0., 'peak_rss_mb': 0.}
+        regressions = benchmark.MLX90640Benchmark.compare(baseline, current, threshold=0.1)
+        self.assertEqual([(name, stage) for name, stage, _, _, _, _ in regressions], [('ds', 'render')])
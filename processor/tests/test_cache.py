@@ -0,0 +1,116 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import cache, processor
+from processor.tests import test_video
+
+
+class ResultsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'ds-16-55-20200101-1-test.raw')
+        with open(self.raw_filepath, 'wb') as f:
+            f.write(b'\0' * 3072 * 4)
+
+        self.dirpath = os.path.join(self.basedir, 'ds-16-55-20200101-1-test')
+        os.mkdir(self.dirpath)
+        self.result_filepath = os.path.join(self.dirpath, 'result.png')
+        with open(self.result_filepath, 'wb') as f:
+            f.write(b'png')
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_stages(self):
+        test_object = cache.ResultsCache(self.dirpath, self.raw_filepath)
+        self.assertFalse(test_object.exists())
+
+        key = test_object.key(fps=16, jump_frames=4)
+        self.assertEqual(key, test_object.key(jump_frames=4, fps=16))
+        self.assertNotEqual(key, test_object.key(fps=16, jump_frames=8))
+        self.assertFalse(test_object.valid('frames', key))
+
+        test_object.update('frames', key, [self.result_filepath])
+        self.assertTrue(test_object.exists())
+
+        test_object = cache.ResultsCache(self.dirpath, self.raw_filepath)
+        self.assertTrue(test_object.valid('frames', key))
+        self.assertFalse(test_object.valid('frames', test_object.key(fps=16, jump_frames=8)))
+
+        test_object.invalidate('frames')
+        self.assertFalse(os.path.exists(self.result_filepath))
+        self.assertFalse(test_object.valid('frames', key))
+
+    def test_content_hash(self):
+        test_object = cache.ResultsCache(self.dirpath, self.raw_filepath)
+        key = test_object.key(fps=16)
+        test_object.update('analysis', key, [])
+
+        with open(self.raw_filepath, 'ab') as f:
+            f.write(b'\1' * 3072)
+
+        test_object = cache.ResultsCache(self.dirpath, self.raw_filepath)
+        self.assertNotEqual(test_object.key(fps=16), key)
+        self.assertFalse(test_object.valid('analysis', test_object.key(fps=16)))
+
+
+class MLX90640Processor(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'ds-4-55-20200101-1-cache.raw')
+        frames = 25. + np.random.default_rng(0).normal(0., 0.1, (40, 24, 32)).astype(np.float32)
+        frames[:, 10:14, 14:18] += np.arange(40, dtype=np.float32)[:, None, None]
+        # only discarded when validating
+        frames[5, 3, 3] = np.inf
+        frames.tofile(self.raw_filepath)
+
+        self.environ = test_video.fake_ffmpeg(os.path.join(self.basedir, 'bin'))
+        self.environ.start()
+        os.environ.pop('FAKE_FFMPEG_FAIL', None)
+
+    def tearDown(self):
+        self.environ.stop()
+        shutil.rmtree(self.basedir)
+
+    def run_processor(self, distance_mm=55, plot_general=False, **kwargs):
+        test_object = processor.MLX90640Processor(
+            4, distance_mm, self.raw_filepath, plot_frames=True, plot_general=plot_general, workers=1, profile=True,
+            **kwargs
+        )
+        return test_object.profile_report['counters']
+
+    def test_stages(self):
+        counters = self.run_processor(plot_general=True)
+        self.assertEqual((counters['frames_analyzed'], counters['frames_plotted']), (40, 10))
+        self.assertEqual(self.run_processor(plot_general=True), dict(stages_cached=4))
+
+        # the same reference pixels: the analysis and the overall figure change, the frames and video do not
+        counters = self.run_processor(56, plot_general=True)
+        self.assertEqual(counters['stages_cached'], 2)
+        self.assertEqual(counters['frames_analyzed'], 40)
+        self.assertNotIn('frames_plotted', counters)
+
+        # other reference pixels: everything is generated again
+        counters = self.run_processor(185, plot_general=True)
+        self.assertNotIn('stages_cached', counters)
+        self.assertEqual(counters['frames_plotted'], 10)
+        self.assertEqual(self.run_processor(185, plot_general=True), dict(stages_cached=4))
+
+        # more frames to plot: only the frames and the video
+        counters = self.run_processor(185, plot_general=True, jump_frames=2)
+        self.assertEqual((counters['stages_cached'], counters['frames_plotted']), (2, 20))
+
+    def test_validate(self):
+        self.assertEqual(self.run_processor()['frames_analyzed'], 40)
+        self.assertEqual(self.run_processor(), dict(stages_cached=2))
+
+        # validating drops the frame, hence the frames to be rendered change as well
+        counters = self.run_processor(validate=True)
+        self.assertNotIn('stages_cached', counters)
+        self.assertEqual((counters['frames_analyzed'], counters['frames_plotted']), (39, 10))
+        self.assertEqual(self.run_processor(validate=True), dict(stages_cached=2))
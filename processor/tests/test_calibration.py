@@ -0,0 +1,194 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import calibration
+
+
+def synthetic_eeprom(seed=0, chess_calibrated=False):
+    """EEPROM with plausible calibration parameters, with pixel 100 broken and pixel 200 an outlier"""
+    rng = np.random.default_rng(seed)
+    ee = np.zeros(calibration.EEPROM_WORDS, dtype=np.int64)
+    ee[10] = 0x0000 if chess_calibrated else 0x0800
+    ee[16] = 0x4232
+    ee[17] = -50 & 0xFFFF
+    ee[18:32] = rng.integers(0, 1 << 16, 14) & 0x3333
+    ee[32] = 0x7432
+    ee[33] = 30000
+    ee[34:48] = rng.integers(0, 1 << 16, 14) & 0x3333
+    ee[48] = 6000
+    ee[49] = 12200
+    ee[50] = (9 << 10) | 340
+    ee[51] = (0x9D << 8) | 0x6A
+    ee[52] = 0x2312
+    ee[53] = (2 << 11) | (3 << 6) | 5
+    ee[54], ee[55] = 0x3C38, 0x3A36
+    ee[56] = 0x2351
+    ee[57] = (4 << 10) | 70
+    ee[58] = (2 << 10) | (-70 & 0x3FF)
+    ee[59] = (0x05 << 8) | 0x02
+    ee[60] = (0xF0 << 8) | 0x08
+    ee[61], ee[62] = 0xE2E2, 0xE0E4
+    ee[63] = 0x2889
+    offsets = rng.integers(-8, 8, 768) & 0x3F
+    alphas = rng.integers(-8, 8, 768) & 0x3F
+    ktas = rng.integers(-2, 2, 768) & 0x7
+    ee[64:] = (offsets << 10) | (alphas << 4) | (ktas << 1)
+    ee[64:][ee[64:] == 0] = 1 << 10
+    ee[64 + 100] = 0
+    ee[64 + 200] |= 1
+    return ee.astype(np.uint16)
+
+
+def synthetic_frames(no_frames, seed=0, chess=True):
+    """Frames of words alternating the subpages, with a hot spot at the pixels 300 to 310"""
+    rng = np.random.default_rng(seed)
+    frames = np.zeros((no_frames, calibration.FRAME_WORDS), dtype=np.int64)
+    frames[:, :768] = rng.integers(-60, 400, (no_frames, 768))
+    frames[:, 300:310] += 2500
+    frames[:, 768] = 21228
+    frames[:, 776] = rng.integers(-80, -60, no_frames)
+    frames[:, 808] = rng.integers(-80, -60, no_frames)
+    frames[:, 778] = 6000 + rng.integers(-20, 20, no_frames)
+    frames[:, 800] = 1700 + rng.integers(-5, 5, no_frames)
+    frames[:, 810] = -12992 + rng.integers(-30, 30, no_frames)
+    frames[:, 832] = 0x0801 | (0x1000 if chess else 0)
+    frames[:, 833] = np.arange(no_frames) % 2
+    return (frames & 0xFFFF).astype(np.uint16)
+
+
+class MLX90640Calibration(unittest.TestCase):
+
+    # temperatures calculated by MLX90640_CalculateTo (after MLX90640_InterpolateOutliers, as rawrgb does)
+    # out of synthetic_eeprom() and synthetic_frames(4), in sensor order; pixel 100 is broken
+    PIXELS = [0, 1, 100, 300, 301, 767]
+    REFERENCE = {
+        0.8: [
+            [41.727592, 0.0, 0.0, 0.0, 113.41131, 29.10113],
+            [41.727592, 43.598289, 37.622581, 123.12621, 113.41131, 29.10113],
+            [28.051416, 43.598289, 37.622581, 123.12621, 120.48632, 28.20138],
+            [28.051416, 35.985741, 302.34274, 124.82568, 120.48632, 28.20138],
+        ],
+        1.0: [
+            [38.496422, 0.0, 0.0, 0.0, 100.04324, 28.197565],
+            [38.496422, 40.213676, 35.306328, 108.76138, 100.04324, 28.197565],
+            [27.437128, 40.213676, 35.306328, 108.76138, 106.35995, 27.557825],
+            [27.437128, 33.777122, 272.72147, 110.17135, 106.35995, 27.557825],
+        ],
+    }
+
+    def setUp(self):
+        self.eeprom = synthetic_eeprom()
+        self.frames = synthetic_frames(64)
+        self.test_object = calibration.MLX90640Calibration(self.eeprom)
+
+    def test_parameters(self):
+        test_object = self.test_object
+        self.assertEqual(test_object.kVdd, -3168)
+        self.assertEqual(test_object.vdd25, -12992)
+        self.assertAlmostEqual(test_object.KtPTAT, 42.5)
+        self.assertAlmostEqual(test_object.alphaPTAT, 9.)
+        self.assertEqual(test_object.ct.tolist(), [-40, 0, 160, 320])
+        self.assertEqual(test_object.calibrationModeEE, 0)
+        self.assertEqual(test_object.broken.tolist(), [100])
+        self.assertEqual(test_object.outliers.tolist(), [200])
+        self.assertEqual(test_object.alpha.shape, (768,))
+        self.assertTrue(np.all(test_object.alpha > 0))
+
+        invalid = self.eeprom.copy()
+        invalid[10] |= 0x0040
+        with self.assertRaises(ValueError):
+            calibration.MLX90640Calibration(invalid)
+
+    def test_ambient(self):
+        vdd = self.test_object.vdd(self.frames)
+        self.assertTrue(np.all(np.abs(vdd - 3.3) < 0.01))
+        ta = self.test_object.ta(self.frames)
+        self.assertEqual(ta.shape, (64,))
+        self.assertTrue(np.all((ta > 20) & (ta < 30)))
+
+    def test_interpolate_outliers(self):
+        frames = self.test_object.interpolate_outliers(self.frames)
+        neighbours = self.frames[:, [67, 69, 133, 131]].astype(np.float32).sum(axis=1) / 4
+        np.testing.assert_array_equal(frames[:, 100], (neighbours * 1.0003).astype(np.uint16))
+        np.testing.assert_array_equal(np.delete(frames, 100, axis=1), np.delete(self.frames, 100, axis=1))
+
+    def test_reference(self):
+        for emissivity, reference in self.REFERENCE.items():
+            to = self.test_object.temperatures(synthetic_frames(4), emissivity=emissivity, flip=False)
+            np.testing.assert_allclose(to.reshape(4, 768)[:, self.PIXELS], reference, atol=2e-3)
+
+    def test_subpages(self):
+        to, mask = self.test_object.calculate(self.frames[:2])
+        # chess pattern, each subpage with half of the pixels
+        np.testing.assert_array_equal(mask[0], ~mask[1])
+        self.assertEqual(np.count_nonzero(mask[0]), 384)
+
+        temperatures = self.test_object.temperatures(self.frames, flip=False).reshape(64, 768)
+        np.testing.assert_array_equal(temperatures[0][~mask[0]], 0.)
+        np.testing.assert_allclose(temperatures[1][mask[0]], to[0][mask[0]], rtol=1e-6)
+
+        # in chunks, carrying over the other subpage
+        previous = temperatures[31]
+        chunk = self.test_object.temperatures(self.frames[32:], previous=previous, flip=False).reshape(32, 768)
+        np.testing.assert_array_equal(chunk, temperatures[32:])
+
+        flipped = self.test_object.temperatures(self.frames)
+        np.testing.assert_array_equal(flipped, temperatures.reshape(64, 24, 32)[:, ::-1])
+
+    def test_emissivity(self):
+        # with a lower emissivity, the targets hotter than the sensor are even hotter for the same radiation
+        low = self.test_object.temperatures(self.frames, emissivity=0.5)[2:]
+        high = self.test_object.temperatures(self.frames, emissivity=1.)[2:]
+        hot = high > self.test_object.ta(self.frames).max() + 1
+        self.assertGreater(np.count_nonzero(hot), 1000)
+        self.assertTrue(np.all(low[hot] > high[hot]))
+
+
+class WordsRecording(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.words_filepath = os.path.join(self.basedir, 'ds-16-55-20200101-words.mlxw')
+        self.raw_filepath = os.path.join(self.basedir, 'ds-16-55-20200101-1-e95.raw')
+        self.eeprom = synthetic_eeprom()
+        self.frames = synthetic_frames(100)
+
+        header = np.zeros(1, dtype=calibration.HEADER)
+        header['magic'], header['version'], header['fps'], header['eeprom'] = b'MLXW', 1, 16, self.eeprom
+        records = np.zeros(100, dtype=calibration.RECORD)
+        records['timestamp_us'] = 1_600_000_000_000_000 + np.arange(100) * 62500
+        records['words'] = self.frames
+        with open(self.words_filepath, 'wb') as f:
+            f.write(header.tobytes())
+            f.write(records.tobytes())
+            # partial write
+            f.write(records[:1].tobytes()[:100])
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_convert(self):
+        test_object = calibration.WordsRecording.create(
+            ['-w', self.words_filepath, '-o', self.raw_filepath, '-e', '0.95', '-c', '16']
+        )
+        self.assertEqual(len(test_object), 100)
+        self.assertEqual(test_object.fps, 16)
+        self.assertEqual(test_object.timestamps_us[1] - test_object.timestamps_us[0], 62500)
+        np.testing.assert_array_equal(test_object.eeprom, self.eeprom)
+
+        raw = np.fromfile(self.raw_filepath, dtype=np.float32).reshape(-1, 24, 32)
+        expected = calibration.MLX90640Calibration(self.eeprom).temperatures(self.frames, emissivity=0.95)
+        np.testing.assert_array_equal(raw, expected)
+
+    def test_invalid(self):
+        with open(self.raw_filepath, 'wb') as f:
+            f.write(np.zeros(1000, dtype=np.float32).tobytes())
+        with self.assertRaises(ValueError):
+            calibration.WordsRecording(self.raw_filepath)
+
+
+if __name__ == '__main__':
+    unittest.main()
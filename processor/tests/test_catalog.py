@@ -0,0 +1,82 @@
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import catalog, dataset, results
+
+
+class DatasetCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.basedirs = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+        self.write(0, 'ds-16-55-20200521-1-DSN200uA.raw', 10)
+        self.write(0, 'ds-16-185-20200628-1-DSN200uB.raw', 5)
+        self.write(1, 'ds-8-55-20200701-DSN12uC.raw', 3)
+        with open(os.path.join(self.basedirs[1], 'notes.txt'), 'w') as f:
+            f.write('not a dataset')
+
+    def tearDown(self):
+        for basedir in self.basedirs:
+            shutil.rmtree(basedir)
+
+    def write(self, directory, filename, no_frames):
+        filepath = os.path.join(self.basedirs[directory], filename)
+        np.random.default_rng(no_frames).uniform(20., 40., (no_frames, 24, 32)).astype(np.float32).tofile(filepath)
+        return filepath
+
+    def test_refresh(self):
+        test_object = catalog.DatasetCatalog(self.basedirs)
+        entries = test_object.entries()
+        self.assertEqual([e['name'] for e in entries], [
+            'ds-16-185-20200628-1-DSN200uB', 'ds-16-55-20200521-1-DSN200uA', 'ds-8-55-20200701-DSN12uC'
+        ])
+        self.assertEqual([e['no_frames'] for e in entries], [5, 10, 3])
+        self.assertEqual([e['fps'] for e in entries], [1, 1, 1])
+        self.assertEqual(entries[2]['name_fps'], 8)
+        self.assertEqual(len(entries[0]['sha256']), 64)
+        self.assertTrue(os.path.isfile(os.path.join(self.basedirs[1], catalog.DatasetCatalog.INDEX_FILENAME)))
+
+        # nothing changed, nothing is read again
+        self.assertEqual(catalog.DatasetCatalog(self.basedirs).refresh(), 0)
+
+        self.write(0, 'ds-16-55-20200521-1-DSN200uA.raw', 12)
+        os.remove(os.path.join(self.basedirs[1], 'ds-8-55-20200701-DSN12uC.raw'))
+        test_object = catalog.DatasetCatalog(self.basedirs, refresh=False)
+        self.assertEqual(test_object.refresh(), 2)
+        self.assertEqual([e['no_frames'] for e in test_object.entries()], [5, 12])
+
+    def test_results(self):
+        dirpath = os.path.join(self.basedirs[0], 'ds-16-55-20200521-1-DSN200uA')
+        os.mkdir(dirpath)
+        results.DatasetResults.save(
+            os.path.join(dirpath, results.DatasetResults.FILENAME), columns=dict(diff=np.zeros(3)),
+            scalars=dict(max_dT_value=2.5, diff_fit_tau_s=np.nan), metadata=dict(name='x')
+        )
+
+        test_object = catalog.DatasetCatalog(self.basedirs)
+        entry, = test_object.filter(processed=True)
+        self.assertEqual(entry['summary'], dict(max_dT_value=2.5, diff_fit_tau_s=None))
+
+        self.assertEqual(len(test_object.filter(date='202005')), 1)
+        self.assertEqual(len(test_object.filter(date=('20200601', '20200701'))), 2)
+        self.assertEqual(len(test_object.filter(distance_mm=55)), 2)
+        self.assertEqual(len(test_object.filter(distance_mm=55, description='DSN200u')), 1)
+        self.assertEqual(len(test_object.filter(processed=False)), 2)
+
+    def test_fps(self):
+        test_object = catalog.DatasetCatalog(self.basedirs)
+        self.assertTrue(test_object.set_fps('ds-8-55-20200701-DSN12uC', 8))
+        self.assertFalse(test_object.set_fps('ds-unknown', 8))
+
+        manager = dataset.DatasetsManager(self.basedirs)
+        self.assertEqual([ds[0] for ds in manager.datasets], [1, 1, 8])
+        self.assertEqual(manager.select(distance_mm=55), 2)
+        self.assertEqual(manager.datasets[1], (8, 55, os.path.join(self.basedirs[1], 'ds-8-55-20200701-DSN12uC.raw')))
+
+        with open(os.path.join(self.basedirs[1], catalog.DatasetCatalog.INDEX_FILENAME)) as f:
+            self.assertEqual(json.load(f)['fps'], {'ds-8-55-20200701-DSN12uC': 8})
+        test_object.set_fps('ds-8-55-20200701-DSN12uC', None)
+        self.assertEqual([ds[0] for ds in dataset.DatasetsManager(self.basedirs).datasets], [1, 1, 1])
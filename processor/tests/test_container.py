@@ -0,0 +1,103 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import analysis, container, dataset, processor, rawdataset
+
+
+class CompressedDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'ds-16-55-20200101-1-test.raw')
+
+        t = np.arange(1000, dtype=np.float32)[:, None, None] / 16
+        ys, xs = np.mgrid[0:24, 0:32]
+        noise = np.random.default_rng(0).normal(0., 0.1, (1000, 24, 32))
+        self.frames = (20. + 30. * np.exp(-((xs - 16) ** 2 + (ys - 12) ** 2) / 50.) * (1 - np.exp(-t / 20.)) + noise)
+        self.frames = self.frames.astype(np.float32)
+        self.frames[10, 3, 4] = np.nan
+        self.frames.tofile(self.raw_filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_convert(self):
+        filepath = container.convert(self.raw_filepath, fps=16, chunk_frames=128)
+        self.assertTrue(filepath.endswith('ds-16-55-20200101-1-test.mlxz'))
+        self.assertGreater(os.path.getsize(self.raw_filepath) / os.path.getsize(filepath), 2.)
+
+        test_object = container.open_dataset(filepath)
+        self.assertIsInstance(test_object, container.CompressedDataset)
+        self.assertEqual((len(test_object), test_object.fps, len(test_object.chunks)), (1000, 16, 8))
+
+        np.testing.assert_allclose(test_object.frames, self.frames, atol=0.005)
+        self.assertTrue(np.isnan(test_object[10][3, 4]))
+        np.testing.assert_array_equal(test_object.valid(), ~np.isnan(self.frames).any(axis=(1, 2)))
+        np.testing.assert_array_equal(test_object.timestamps_us, np.rint(np.arange(1000) * 1e6 / 16))
+        test_object.close()
+
+    def test_random_access(self):
+        filepath = container.convert(self.raw_filepath, fps=16, chunk_frames=128)
+        test_object = container.CompressedDataset(filepath, fps=8)
+        self.assertEqual(test_object.fps, 8)
+
+        np.testing.assert_allclose(test_object[999], self.frames[999], atol=0.005)
+        np.testing.assert_allclose(test_object[-1], self.frames[-1], atol=0.005)
+        np.testing.assert_allclose(test_object.every(100, start=5), self.frames[5::100], atol=0.005)
+        np.testing.assert_allclose(test_object[[900, 3, 129]], self.frames[[900, 3, 129]], atol=0.005)
+        np.testing.assert_allclose(test_object.at(10.), self.frames[80], atol=0.005)
+        self.assertEqual(len(list(test_object)), 1000)
+        self.assertIsNone(test_object._frames)
+        test_object.close()
+
+    def test_unclosed(self):
+        filepath = os.path.join(self.basedir, 'unclosed.mlxz')
+        writer = container.CompressedWriter(filepath, fps=16, chunk_frames=100)
+        writer.write(self.frames[:250], timestamps_us=np.arange(250) * 1000 + 5)
+        writer._file.flush()
+
+        with open(filepath, 'ab') as f:
+            f.write(b'CHNK\x10')
+        test_object = container.CompressedDataset(filepath)
+        self.assertEqual(len(test_object), 200)
+        np.testing.assert_array_equal(test_object.timestamps_us, np.arange(200) * 1000 + 5)
+        np.testing.assert_allclose(test_object[150], self.frames[150], atol=0.005)
+        test_object.close()
+        writer._file.close()
+
+    def test_analysis(self):
+        filepath = container.convert(self.raw_filepath, fps=16, chunk_frames=128)
+        os.remove(self.raw_filepath)
+
+        # the processor analyzes the container one block at a time, never decoding all the frames at once
+        test_object = processor.MLX90640Processor(16, 55, filepath, plot_frames=False, plot_general=False)
+        self.assertIsNone(test_object.dataset._frames)
+        self.assertEqual(test_object.no_frames, 999)
+
+        dataset = container.CompressedDataset(filepath)
+        frames = dataset[np.arange(len(dataset))]
+        expected = analysis.MLX90640Analysis(np.delete(frames, 10, axis=0), test_object.analysis.ref_pixels)
+        for name in analysis.MLX90640Analysis.FIELDS:
+            np.testing.assert_array_equal(getattr(test_object.analysis, name), getattr(expected, name), name)
+        dataset.close()
+
+    def test_converter(self):
+        container.CompressedConverter.create(['-r', self.raw_filepath, '-f', '16', '-l', '1', '-v'])
+        test_object = container.open_dataset(os.path.join(self.basedir, 'ds-16-55-20200101-1-test.mlxz'))
+        self.assertEqual((len(test_object), test_object.fps), (1000, 16))
+        test_object.close()
+
+    def test_datasets(self):
+        container.convert(self.raw_filepath, fps=16)
+        shutil.copy(
+            os.path.join(self.basedir, 'ds-16-55-20200101-1-test.mlxz'),
+            os.path.join(self.basedir, 'ds-16-55-20200102-1-converted.mlxz')
+        )
+        self.assertEqual(
+            [os.path.basename(f) for _, _, f in dataset.DatasetsManager(self.basedir).datasets],
+            ['ds-16-55-20200101-1-test.raw', 'ds-16-55-20200102-1-converted.mlxz']
+        )
+        self.assertIsInstance(container.open_dataset(self.raw_filepath), rawdataset.RawDataset)
@@ -0,0 +1,65 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import dataset
+from processor.tests import test_video
+
+
+class DatasetsManager(unittest.TestCase):
+
+    NAMES = ('ds-16-55-20200521-1-DSN200uA', 'ds-16-185-20200628-2-DSN200uB', 'ds-16-55-20200701-3-DSN12uC')
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.frames = {}
+        for no_frames, name in enumerate(self.NAMES, start=6):
+            t = np.arange(no_frames, dtype=np.float32)[:, None, None]
+            frames = 20. + np.random.default_rng(no_frames).normal(0., 0.1, (no_frames, 24, 32)).astype(np.float32)
+            frames[:, 10:14, 14:18] += t
+            frames.tofile(os.path.join(self.basedir, name + '.raw'))
+            self.frames[name] = frames
+        # the results of the last dataset already exist, hence its analysis fails
+        os.mkdir(os.path.join(self.basedir, self.NAMES[2]))
+
+        # the videos are encoded by a fake ffmpeg, see test_video
+        self.bindir = tempfile.mkdtemp()
+        self.environ = test_video.fake_ffmpeg(self.bindir)
+        self.environ.start()
+        os.environ.pop('FAKE_FFMPEG_FAIL', None)
+
+    def tearDown(self):
+        self.environ.stop()
+        shutil.rmtree(self.bindir)
+        shutil.rmtree(self.basedir)
+
+    def test_analyze_all(self):
+        test_object = dataset.DatasetsManager(self.basedir, hashes=False)
+        self.assertEqual(len(test_object.datasets), 3)
+
+        analyzed = test_object.analyze_all(workers=2, profile=True)
+        self.assertEqual([ds for ds, _, _, _ in analyzed], test_object.datasets)
+        errors = {os.path.basename(ds[2])[:-4]: error for ds, error, _, _ in analyzed}
+        self.assertIsNone(errors[self.NAMES[0]])
+        self.assertIsNone(errors[self.NAMES[1]])
+        self.assertIn('already exists', errors[self.NAMES[2]])
+        self.assertTrue(all(elapsed_s > 0. for _, _, elapsed_s, _ in analyzed))
+        self.assertTrue(all((report is None) == (error is not None) for _, error, _, report in analyzed))
+
+        # the results of each dataset, analyzed in its own process
+        query = test_object.results()
+        for name in self.NAMES[:2]:
+            frames = self.frames[name]
+            self.assertEqual(query.values('no_frames')[name], frames.shape[0])
+            np.testing.assert_allclose(query.values('max')[name], frames.reshape(frames.shape[0], -1).max(axis=1))
+        self.assertNotIn(self.NAMES[2], query.values('no_frames'))
+        self.assertTrue(os.path.isfile(os.path.join(self.basedir, 'profile.json')))
+
+        summary = test_object.summary(analyzed, 1.5)
+        self.assertEqual(summary, dict(datasets=3, ok=2, failed=1, elapsed_s=1.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
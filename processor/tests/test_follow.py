@@ -0,0 +1,63 @@
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import analysis, follow, rawdataset
+
+
+class MLX90640Follower(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'dataset.bin')
+
+        rng = np.random.default_rng(0)
+        self.frames = rng.uniform(20., 60., (20, 24, 32)).astype(np.float32)
+        self.frames[7] = np.nan
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def write(self, data):
+        with open(self.raw_filepath, 'ab') as f:
+            f.write(data)
+
+    def test_incremental(self):
+        test_object = follow.MLX90640Follower(1, 55, self.raw_filepath)
+        self.assertEqual(test_object.poll(), 0)
+
+        data = self.frames.tobytes()
+        self.write(data[:5 * rawdataset.RawDataset.SIZE_FRAME + 100])
+        self.assertEqual(test_object.poll(), 5)
+        self.assertEqual(test_object.poll(), 0)
+
+        self.write(data[5 * rawdataset.RawDataset.SIZE_FRAME + 100:])
+        self.assertEqual(test_object.poll(), 15)
+        self.assertEqual((test_object.no_read, test_object.no_frames, test_object.no_skipped), (20, 19, 1))
+
+        expected = analysis.MLX90640Analysis(np.delete(self.frames, 7, axis=0), test_object.ref_pixels)
+        for name in follow.MLX90640Follower.VECTORS:
+            np.testing.assert_array_equal(getattr(test_object, name), getattr(expected, name))
+        self.assertEqual(test_object.max_dT_index, np.argmax(expected.diff))
+        self.assertEqual(test_object.max_T2REF_index, np.argmax(expected.t2))
+
+        test_object.write_summary()
+        with open(test_object.summary_filepath) as f:
+            summary = json.load(f)
+        self.assertEqual(summary['no_frames'], 19)
+        self.assertAlmostEqual(summary['max_dT_value'], float(np.max(expected.diff)))
+        test_object.close()
+
+    def test_replaced(self):
+        test_object = follow.MLX90640Follower(1, 55, self.raw_filepath)
+        self.write(self.frames[:5].tobytes())
+        self.assertEqual(test_object.poll(), 5)
+
+        os.remove(self.raw_filepath)
+        self.write(self.frames[10:12].tobytes())
+        self.assertEqual(test_object.poll(), 2)
+        self.assertEqual(test_object.no_frames, 2)
+        test_object.close()
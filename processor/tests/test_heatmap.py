@@ -0,0 +1,59 @@
+import math
+import unittest
+
+import numpy as np
+
+from processor import heatmap
+
+
+def pixel2colour(v, vmin=heatmap.HeatmapRenderer.VMIN, vmax=heatmap.HeatmapRenderer.VMAX):
+    """Reference implementation, as in src/streamer.cpp"""
+    colours = heatmap.HeatmapRenderer.COLOURS
+    v = (v - vmin) / (vmax - vmin)
+    fract = 0.
+
+    if v <= 0:
+        idx1 = idx2 = 0
+    elif v >= 1:
+        idx1 = idx2 = len(colours) - 1
+    else:
+        v *= len(colours) - 1
+        idx1 = math.floor(v)
+        idx2 = idx1 + 1
+        fract = v - idx1
+
+    return [int(((colours[idx2][c] - colours[idx1][c]) * fract + colours[idx1][c]) * 255.) for c in range(3)]
+
+
+class HeatmapRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = np.random.default_rng(0).uniform(-30., 140., size=(4, 24, 32)).astype(np.float32)
+
+    def test_raw2rgb(self):
+        images = heatmap.HeatmapRenderer(size=None).render(self.frames)
+        self.assertEqual(images.shape, (4, 24, 32, 3))
+        self.assertEqual(images.dtype, np.uint8)
+
+        expected = np.array([
+            [[pixel2colour(frame[23 - y, x]) for x in range(32)] for y in range(24)] for frame in self.frames
+        ])
+        self.assertLessEqual(np.abs(images.astype(int) - expected).max(), 1)
+
+    def test_upscaling(self):
+        small = heatmap.HeatmapRenderer(size=None).render(self.frames[0])
+        nearest = heatmap.HeatmapRenderer().render(self.frames[0])
+        self.assertEqual(nearest.shape, (480, 640, 3))
+        np.testing.assert_array_equal(nearest[::20, ::20], small)
+        np.testing.assert_array_equal(nearest[19::20, 19::20], small)
+
+        bilinear = heatmap.HeatmapRenderer(interpolation='bilinear', size=(50, 70)).render(self.frames)
+        self.assertEqual(bilinear.shape, (4, 50, 70, 3))
+
+        uniform = np.full((1, 24, 32), 40., dtype=np.float32)
+        bilinear = heatmap.HeatmapRenderer(interpolation='bilinear').render(uniform)
+        self.assertEqual(len(np.unique(bilinear.reshape(-1, 3), axis=0)), 1)
+
+    def test_nan(self):
+        frame = np.full((24, 32), np.nan, dtype=np.float32)
+        self.assertFalse(heatmap.HeatmapRenderer().render(frame).any())
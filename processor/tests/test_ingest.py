@@ -0,0 +1,120 @@
+import asyncio
+import json
+import numpy as np
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from processor import ingest, protocol, rawdataset
+
+
+class MLX90640Ingest(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.frames = 20. + np.arange(12 * 768, dtype=np.float32).reshape(12, 24, 32) / 768
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def datagrams(self, sequence, frames=None):
+        frames = self.frames if frames is None else frames
+        return protocol.encode(protocol.TYPE_RAW, sequence, 1000 * sequence, frames[sequence].tobytes())
+
+    @staticmethod
+    def free_port():
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.bind(('127.0.0.1', 0))
+            return s.getsockname()[1]
+
+    def test_serve(self):
+        ports = [self.free_port(), self.free_port()]
+        test_object = ingest.MLX90640Ingest(
+            [('bench-a', ports[0]), ('bench-b', ports[1], 185.)], output_dirpath=self.basedir
+        )
+        other = self.frames[::-1].copy()
+
+        async def send():
+            await asyncio.sleep(0.1)
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                for sequence in range(12):
+                    if sequence != 5:
+                        for datagram in self.datagrams(sequence):
+                            s.sendto(datagram, ('127.0.0.1', ports[0]))
+                    if sequence < 4:
+                        for datagram in self.datagrams(sequence, other):
+                            s.sendto(datagram, ('127.0.0.1', ports[1]))
+                    await asyncio.sleep(0.005)
+
+        async def main():
+            await asyncio.gather(test_object.serve('127.0.0.1', duration_s=0.5, stats_interval_s=0.2), send())
+
+        asyncio.run(main())
+
+        dataset = rawdataset.RawDataset(os.path.join(self.basedir, 'bench-a.raw'))
+        self.assertEqual(len(dataset), 12)
+        self.assertTrue(np.isnan(dataset[5]).all())
+        np.testing.assert_array_equal(np.delete(dataset.frames, 5, axis=0), np.delete(self.frames, 5, axis=0))
+        dataset.close()
+        np.testing.assert_array_equal(
+            np.fromfile(os.path.join(self.basedir, 'bench-b.raw'), dtype=np.float32).reshape(-1, 24, 32), other[:4]
+        )
+
+        with open(os.path.join(self.basedir, 'ingest.json')) as f:
+            stats = json.load(f)
+        self.assertEqual(
+            [stats['bench-a'][key] for key in ('frames', 'dropped', 'written', 'filled', 'overflow')], [11, 1, 11, 1, 0]
+        )
+        self.assertEqual(stats['bench-b']['written'], 4)
+        self.assertAlmostEqual(stats['bench-b']['latest']['t0'], float(other[3, 12, 16]))
+
+    def test_overflow(self):
+        raw_filepath = os.path.join(self.basedir, 'overflow.raw')
+
+        async def main():
+            source = ingest.IngestSource(
+                'overflow', 0, raw_filepath, ((16, 12), (17, 12), (15, 12)), 16, queue_frames=4
+            )
+            for sequence in range(12):
+                source._on_frame(protocol.TYPE_RAW, sequence, 0, self.frames[sequence].tobytes())
+            # the writer is not running, hence only the first frames are queued
+            self.assertEqual((source.no_queued, source.no_overflow), (4, 8))
+
+            writer = asyncio.ensure_future(source.run(None))
+            await asyncio.sleep(0.1)
+            source._on_frame(protocol.TYPE_RAW, 11, 0, self.frames[11].tobytes())
+            await source.stop()
+            await writer
+            return source
+
+        source = asyncio.run(main())
+        self.assertEqual((source.no_written, source.no_filled), (5, 7))
+        written = np.fromfile(raw_filepath, dtype=np.float32).reshape(-1, 24, 32)
+        self.assertEqual(written.shape[0], 12)
+        np.testing.assert_array_equal(written[[0, 1, 2, 3, 11]], self.frames[[0, 1, 2, 3, 11]])
+        self.assertTrue(np.isnan(written[4:11]).all())
+        self.assertEqual(source.stats()['latest']['t0'], float(self.frames[11, 12, 16]))
+
+    def test_restart(self):
+        raw_filepath = os.path.join(self.basedir, 'restart.raw')
+
+        async def main():
+            source = ingest.IngestSource('restart', 0, raw_filepath, ((16, 12), (17, 12), (15, 12)), 16)
+            writer = asyncio.ensure_future(source.run(None))
+            # the streamer restarts (the sequence starts again at 0) and then jumps far ahead
+            for sequence in [100, 101, 103, 0, 1, 2, 4_000_000_000]:
+                for datagram in protocol.encode(protocol.TYPE_RAW, sequence, 0, self.frames[sequence % 12].tobytes()):
+                    source.receiver.datagram(datagram)
+            await source.stop()
+            await writer
+            return source
+
+        source = asyncio.run(main())
+        stats = source.stats()
+        self.assertEqual([stats[key] for key in ('frames', 'written', 'filled', 'restarts')], [7, 7, 1, 2])
+        written = np.fromfile(raw_filepath, dtype=np.float32).reshape(-1, 24, 32)
+        self.assertEqual(written.shape[0], 8)
+        self.assertTrue(np.isnan(written[2]).all())
+        np.testing.assert_array_equal(written[[0, 1, 3, 4, 5, 6, 7]], self.frames[[4, 5, 7, 0, 1, 2, 4]])
@@ -0,0 +1,154 @@
+import contextlib
+import io
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import integrity, processor
+
+
+class IntegrityScanner(unittest.TestCase):
+
+    NO_FRAMES = 600
+    PARTIAL_BYTES = 1234
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'ds-4-55-20200101-1-test.raw')
+
+        t = np.arange(self.NO_FRAMES, dtype=np.float32)[:, None, None] / 4
+        ys, xs = np.mgrid[0:24, 0:32]
+        noise = np.random.default_rng(0).normal(0., 0.1, (self.NO_FRAMES, 24, 32))
+        self.frames = (20. + 30. * np.exp(-((xs - 16) ** 2 + (ys - 12) ** 2) / 50.) * (1 - np.exp(-t / 60.)) + noise)
+        self.frames = self.frames.astype(np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def damage(self):
+        """Damaged frames and pixels, a partial write after frame 400, zeros and an incomplete frame at the end"""
+        frames = self.frames.copy()
+        frames[100] = np.nan
+        frames[200, 5, 5] = np.inf
+        frames[300, 1, 1] = 1e6
+        frames[350] = frames[349]
+        frames[:, 3, 4] = 25.
+        frames[:, 10, 20] += 20.
+        with open(self.raw_filepath, 'wb') as f:
+            f.write(frames[:400].tobytes())
+            f.write(frames[400].tobytes()[:self.PARTIAL_BYTES])
+            f.write(frames[401:].tobytes())
+            f.write(b'\0' * frames[0].nbytes * 2)
+            f.write(b'\0' * 10)
+        return frames
+
+    def test_clean(self):
+        self.frames.tofile(self.raw_filepath)
+        test_object = integrity.IntegrityScanner(self.raw_filepath, chunk_frames=128)
+        report = test_object.scan()
+
+        self.assertTrue(report['ok'])
+        self.assertEqual((report['no_frames'], report['no_bad'], report['shifts']), (self.NO_FRAMES, 0, []))
+        self.assertEqual(report['pixels'], dict(dead=[], stuck=[], outliers=[]))
+        self.assertIn('OK', integrity.IntegrityScanner.format(report))
+
+        # the outliers are only reported, and only replaced on request
+        frames = self.frames.copy()
+        frames[:, 10, 20] += 20.
+        frames.tofile(self.raw_filepath)
+        test_object = integrity.IntegrityScanner(self.raw_filepath)
+        report = test_object.scan()
+        self.assertEqual((report['ok'], report['pixels']['outliers']), (True, [[20, 10]]))
+        repaired_filepath = os.path.join(self.basedir, 'repaired.raw')
+        test_object.repair(repaired_filepath)
+        np.testing.assert_array_equal(np.fromfile(repaired_filepath, dtype=np.float32).reshape(-1, 24, 32), frames)
+
+    def test_scan(self):
+        self.damage()
+        test_object = integrity.IntegrityScanner(self.raw_filepath, chunk_frames=128)
+        report = test_object.scan()
+
+        self.assertFalse(report['ok'])
+        self.assertEqual(report['tail'], 10)
+        self.assertEqual(report['shifts'], [dict(frame=400, offset=400 * 3072, skipped=self.PARTIAL_BYTES)])
+        self.assertEqual(report['no_frames'], self.NO_FRAMES + 1)
+        self.assertEqual(report['bad_frames'], [[100, 101], [200, 201], [300, 301], [599, 601]])
+        self.assertEqual(report['frames'], dict(nan=1, inf=1, range=1, zero=2, duplicate=1, jump=0))
+        self.assertEqual(report['pixels'], dict(dead=[], stuck=[[4, 3]], outliers=[[20, 10]]))
+
+        # the frames after the shift are realigned
+        np.testing.assert_array_equal(test_object.read([400, 598]).reshape(2, -1)[:, 0], self.frames[[401, 599], 0, 0])
+
+    def test_recordings(self):
+        dirpath = os.path.join(os.path.dirname(__file__), '..', '..', 'datasets')
+        with open(os.path.join(dirpath, 'ds-16-55-20200525-DSN12u12uP.raw'), 'rb') as f:
+            first = f.read()
+        with open(os.path.join(dirpath, 'ds-16-55-20200525-DSN200u.raw'), 'rb') as f:
+            second = f.read()
+
+        # the scene moves by one row around frame 24, and then the recording changes
+        with open(self.raw_filepath, 'wb') as f:
+            f.write(first + second)
+        report = integrity.IntegrityScanner(self.raw_filepath).scan()
+        self.assertEqual((report['shifts'], report['no_frames']), ([], (len(first) + len(second)) // 3072))
+        # neither the edges of the objects nor the vignetting are outliers
+        self.assertEqual((report['ok'], report['pixels']['outliers']), (True, []))
+
+        # a partial write within the second recording is still found
+        partial = len(first) + 100 * 3072
+        with open(self.raw_filepath, 'wb') as f:
+            f.write(first + second[:100 * 3072 + self.PARTIAL_BYTES] + second[101 * 3072:])
+        report = integrity.IntegrityScanner(self.raw_filepath).scan()
+        self.assertEqual(report['shifts'], [dict(frame=partial // 3072, offset=partial, skipped=self.PARTIAL_BYTES)])
+
+    def test_repair(self):
+        frames = np.delete(self.damage(), 400, axis=0)
+        repaired_filepath = os.path.join(self.basedir, 'repaired.raw')
+        test_object = integrity.IntegrityScanner(self.raw_filepath, chunk_frames=128)
+
+        self.assertEqual(test_object.repair(repaired_filepath, mode='drop', fix_pixels=False), self.NO_FRAMES - 4)
+        repaired = np.fromfile(repaired_filepath, dtype=np.float32).reshape(-1, 24, 32)
+        np.testing.assert_array_equal(repaired, np.delete(frames[:599], [100, 200, 300], axis=0))
+
+        self.assertEqual(
+            test_object.repair(repaired_filepath, mode='interpolate', fix_pixels=True), self.NO_FRAMES + 1
+        )
+        repaired = np.fromfile(repaired_filepath, dtype=np.float32).reshape(-1, 24, 32)
+        good = np.ones((24, 32), dtype=bool)
+        good[3, 4] = good[10, 20] = False
+        np.testing.assert_allclose(repaired[100][good], 0.5 * (frames[99] + frames[101])[good], atol=1e-4)
+        np.testing.assert_array_equal(repaired[599][good], frames[598][good])
+        # the stuck and outlier pixels are replaced by their neighbours
+        self.assertLess(np.abs(repaired[:599, 10, 20] - np.delete(self.frames, 400, axis=0)[:, 10, 20]).max(), 1.)
+        self.assertGreater(repaired[:, 3, 4].std(), 0.)
+
+        rescan = integrity.IntegrityScanner(repaired_filepath).scan()
+        self.assertEqual((rescan['no_bad'], rescan['shifts'], rescan['tail']), (0, [], 0))
+
+    def test_processor(self):
+        self.damage()
+        with self.assertRaises(Exception):
+            processor.MLX90640Processor(
+                4, 55, self.raw_filepath, plot_frames=False, plot_general=False, validate=True
+            )
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            scanner = integrity.IntegrityScanner.create(
+                ['-r', self.raw_filepath, '-o', os.path.join(self.basedir, 'ds-4-55-20200101-2-test.raw')]
+            )
+        self.assertIn('shift of 1234 bytes', output.getvalue())
+
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            integrity.IntegrityScanner.create(['-r', self.raw_filepath, '-j'])
+        report = json.loads(output.getvalue())
+        self.assertEqual(report['shifts'], [dict(frame=400, offset=400 * 3072, skipped=self.PARTIAL_BYTES)])
+        self.assertEqual((report['ok'], report['tail'], report['no_frames']), (False, 10, self.NO_FRAMES + 1))
+
+        test_object = processor.MLX90640Processor(
+            4, 55, os.path.join(self.basedir, 'ds-4-55-20200101-2-test.raw'),
+            plot_frames=False, plot_general=False, validate=True
+        )
+        self.assertEqual(test_object.no_frames, len(scanner) - scanner.report['no_bad'])
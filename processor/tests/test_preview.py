@@ -0,0 +1,124 @@
+import asyncio
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+
+from processor import preview
+
+
+class MLX90640Preview(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.frames = 20. + np.arange(10 * 768, dtype=np.float32).reshape(10, 24, 32) / 768
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    @staticmethod
+    async def get(port, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f"GET {path} HTTP/1.0\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        headers, body = response.split(b'\r\n\r\n', 1)
+        return headers.decode(), body
+
+    @staticmethod
+    async def parts(port, count):
+        """First <count> images of the stream"""
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b"GET /stream.mjpg HTTP/1.0\r\n\r\n")
+        await reader.readuntil(b'\r\n\r\n')
+        images = []
+        for _ in range(count):
+            headers = (await reader.readuntil(b'\r\n\r\n')).decode()
+            length = int(headers.split('Content-Length: ')[1].split('\r\n')[0])
+            images.append(await reader.readexactly(length))
+        writer.close()
+        return images
+
+    def test_png(self):
+        rgb = np.random.default_rng(0).integers(0, 255, (24, 32, 3), dtype=np.uint8)
+        png = preview.encode_png(rgb)
+        self.assertEqual(png[:8], b'\x89PNG\r\n\x1a\n')
+        idat = png[png.index(b'IDAT') + 4:png.index(b'IEND') - 8]
+        rows = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(24, 1 + 32 * 3)
+        np.testing.assert_array_equal(rows[:, 1:].reshape(24, 32, 3), rgb)
+
+    def test_ring(self):
+        ring = preview.FrameRing(4)
+        self.assertIsNone(ring.latest())
+        for i in range(6):
+            ring.push(self.frames[i], i * 1000)
+        frames, timestamps_us = ring.recent()
+        np.testing.assert_array_equal(frames, self.frames[2:6])
+        np.testing.assert_array_equal(timestamps_us, [2000, 3000, 4000, 5000])
+        np.testing.assert_array_equal(ring.recent(2)[0], self.frames[4:6])
+
+    def test_server(self):
+        async def main():
+            test_object = preview.MLX90640Preview(distance_mm=55, ring_frames=8)
+            server = await test_object.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+
+            _, snapshot = await self.get(port, '/snapshot.png')
+            self.assertEqual(snapshot, b'No frames yet\n')
+
+            clients = [asyncio.ensure_future(self.parts(port, 3)) for _ in range(3)]
+            await asyncio.sleep(0.1)
+            for i in range(3):
+                test_object.push(self.frames[i], i * 62500)
+                await asyncio.sleep(0.05)
+            images = await asyncio.gather(*clients)
+
+            headers, stats = await self.get(port, '/stats.json')
+            headers_png, png = await self.get(port, '/snapshot.png')
+            headers_raw, raw = await self.get(port, '/recent.raw?frames=2')
+            _, missing = await self.get(port, '/missing')
+            server.close()
+            await server.wait_closed()
+            return test_object, images, json.loads(stats), png, headers_raw, raw, missing
+
+        test_object, images, stats, png, headers_raw, raw, missing = asyncio.run(main())
+
+        # every client got every frame, and every frame was encoded once for all of them
+        self.assertTrue(all(client == images[0] for client in images))
+        self.assertEqual(len(set(images[0])), 3)
+        self.assertEqual(test_object.no_encoded, 3 if test_object.stream_format == 'png' else 4)
+
+        self.assertEqual(stats['frames'], 3)
+        self.assertAlmostEqual(stats['fps'], 16.)
+        (x1, y1), (x2, y2) = test_object.ref_pixels[1:]
+        diff = abs(float(self.frames[2, y1, x1] - self.frames[2, y2, x2]))
+        self.assertAlmostEqual(stats['latest']['diff'], diff, places=5)
+        self.assertEqual(stats['latest']['max'], float(self.frames[2].max()))
+        self.assertEqual(png[:4], b'\x89PNG')
+        self.assertIn('X-Frames: 2', headers_raw)
+        np.testing.assert_array_equal(np.frombuffer(raw, dtype=np.float32).reshape(2, 24, 32), self.frames[1:3])
+        self.assertEqual(missing, b'Not found\n')
+
+    def test_follow(self):
+        raw_filepath = os.path.join(self.basedir, 'growing.raw')
+        test_object = preview.MLX90640Preview(ring_frames=4)
+
+        async def main():
+            follower = asyncio.ensure_future(test_object.follow(raw_filepath, poll_interval_s=0.01))
+            await asyncio.sleep(0.05)
+            with open(raw_filepath, 'wb') as f:
+                f.write(self.frames[:6].tobytes())
+                f.write(self.frames[6].tobytes()[:100])
+                f.flush()
+                await asyncio.sleep(0.05)
+                self.assertEqual(test_object.ring.sequence, 3)
+                f.write(self.frames[6].tobytes()[100:])
+                f.flush()
+                await asyncio.sleep(0.05)
+            follower.cancel()
+
+        asyncio.run(main())
+        np.testing.assert_array_equal(test_object.ring.recent()[0], self.frames[3:7])
@@ -0,0 +1,47 @@
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+from processor import profiling
+
+
+class StageProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.dirpath = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dirpath)
+
+    def test_stages(self):
+        test_object = profiling.StageProfiler(profile_stage='analyze')
+        with test_object.stage('read'):
+            time.sleep(0.01)
+        for _ in range(2):
+            with test_object.stage('analyze'):
+                sum(range(10000))
+        test_object.count('frames_read', 10)
+        test_object.count('frames_read', 5)
+
+        self.assertEqual(test_object.stages['analyze']['calls'], 2)
+        self.assertGreaterEqual(test_object.stages['read']['wall_s'], 0.01)
+        self.assertLess(test_object.stages['read']['cpu_s'], 0.01)
+
+        report = test_object.write(self.dirpath)
+        self.assertEqual(report['counters'], {'frames_read': 15})
+        self.assertGreater(report['peak_rss_mb'], 0.)
+        with open(os.path.join(self.dirpath, 'profile.json')) as f:
+            self.assertEqual(sorted(json.load(f)['stages']), ['analyze', 'read'])
+        pstats.Stats(os.path.join(self.dirpath, 'profile-analyze.prof'))
+        self.assertIn('analyze', profiling.StageProfiler.format(report))
+
+    def test_disabled(self):
+        test_object = profiling.StageProfiler(enabled=False)
+        with test_object.stage('read'):
+            pass
+        test_object.count('frames_read')
+        self.assertEqual((test_object.stages, test_object.counters), ({}, {}))
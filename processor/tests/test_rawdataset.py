@@ -0,0 +1,64 @@
+import gc
+import os
+import tempfile
+import unittest
+import weakref
+
+import numpy as np
+
+from processor import rawdataset
+
+
+class RawDataset(unittest.TestCase):
+
+    FPS = 16
+    NO_FRAMES = 40
+
+    def setUp(self):
+        self.frames = np.arange(self.NO_FRAMES * 24 * 32, dtype=np.float32).reshape(self.NO_FRAMES, 24, 32)
+        self.frames[7, 3, 3] = np.nan
+
+        descriptor, self.raw_filepath = tempfile.mkstemp(suffix='.raw')
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(self.frames.tobytes())
+            f.write(b'\0' * 10)
+
+        self.test_object = rawdataset.RawDataset(self.raw_filepath, fps=self.FPS)
+
+    def tearDown(self):
+        self.test_object.close()
+        os.remove(self.raw_filepath)
+
+    def test_close(self):
+        mapping = weakref.ref(self.test_object.frames._mmap)
+        self.test_object.close()
+        gc.collect()
+        self.assertIsNone(mapping())
+        self.assertEqual(self.test_object.frames.shape, (0, 24, 32))
+
+    def test_access(self):
+        self.assertEqual(len(self.test_object), self.NO_FRAMES)
+        self.assertEqual(self.test_object.tail, 10)
+        self.assertEqual(self.test_object.duration, self.NO_FRAMES / self.FPS)
+
+        np.testing.assert_array_equal(self.test_object[3], self.frames[3])
+        np.testing.assert_array_equal(self.test_object[-1], self.frames[-1])
+        np.testing.assert_array_equal(self.test_object[5:9], self.frames[5:9])
+        np.testing.assert_array_equal(self.test_object.every(4, start=1), self.frames[1::4])
+
+        with self.assertRaises(ValueError):
+            self.test_object[0][0, 0] = 0.
+
+    def test_time_indexing(self):
+        self.assertEqual(self.test_object.index(1.), self.FPS)
+        self.assertEqual(self.test_object.time(self.FPS * 2), 2.)
+        np.testing.assert_array_equal(self.test_object.at(0.5), self.frames[self.FPS // 2])
+        np.testing.assert_array_equal(self.test_object.between(1., 2., step=2), self.frames[self.FPS:2 * self.FPS:2])
+
+        with self.assertRaises(IndexError):
+            self.test_object.at(self.NO_FRAMES / self.FPS)
+
+    def test_valid(self):
+        valid = self.test_object.valid()
+        self.assertEqual(valid.shape, (self.NO_FRAMES,))
+        self.assertEqual(list(np.flatnonzero(~valid)), [7])
@@ -0,0 +1,131 @@
+import asyncio
+import numpy as np
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from processor import protocol, rawdataset, receiver
+
+
+class Protocol(unittest.TestCase):
+
+    def test_encode_decode(self):
+        payload = np.arange(768, dtype=np.float32).tobytes()
+        datagrams = protocol.encode(protocol.TYPE_RAW, 5, 123456, payload)
+        self.assertEqual(len(datagrams), 3)
+        self.assertTrue(all(len(d) == protocol.DATAGRAM_SIZE for d in datagrams))
+
+        decoded = [protocol.decode(d) for d in datagrams]
+        self.assertEqual(decoded[1][:5], (protocol.TYPE_RAW, 5, 123456, 1, 3))
+        self.assertEqual(b''.join(d[5] for d in decoded), payload)
+
+        self.assertEqual(len(protocol.encode(protocol.TYPE_RGB, 0, 0, bytes(2304))), 3)
+        with self.assertRaises(protocol.ProtocolError):
+            protocol.encode(protocol.TYPE_RGB, 0, 0, bytes(100))
+        with self.assertRaises(protocol.ProtocolError):
+            protocol.decode(b'XX' + datagrams[0][2:])
+        with self.assertRaises(protocol.ProtocolError):
+            protocol.decode(datagrams[0][:10])
+
+
+class MLX90640Receiver(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'received.raw')
+        self.frames = np.arange(12 * 768, dtype=np.float32).reshape(12, 24, 32)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def datagrams(self, sequence):
+        return protocol.encode(protocol.TYPE_RAW, sequence, 1000 * sequence, self.frames[sequence].tobytes())
+
+    def test_drops_and_reordering(self):
+        test_object = receiver.MLX90640Receiver(self.raw_filepath, window=4)
+
+        order = [0, 2, 1, 3, 5, 6, 7, 8, 9, 10, 11]
+        for sequence in order:
+            datagrams = self.datagrams(sequence)
+            if sequence == 11:
+                datagrams.insert(1, datagrams[0])
+            for datagram in datagrams:
+                test_object.datagram(datagram, received_us=1000 * sequence + 500)
+        # late, within the window (further behind it would be a new stream)
+        test_object.datagram(self.datagrams(9)[0])
+        test_object.datagram(b'garbage')
+        test_object.close()
+
+        stats = test_object.stats()
+        self.assertEqual(
+            stats['types'][protocol.TYPE_RAW],
+            dict(frames=11, dropped=1, reordered=1, late=1, duplicated=1, restarts=0, skipped=0)
+        )
+        self.assertEqual(stats['invalid'], 1)
+        self.assertAlmostEqual(stats['latency_ms']['mean'], 0.5)
+
+        dataset = rawdataset.RawDataset(self.raw_filepath)
+        self.assertEqual(len(dataset), 12)
+        self.assertTrue(np.isnan(dataset[4]).all())
+        np.testing.assert_array_equal(np.delete(dataset.frames, 4, axis=0), np.delete(self.frames, 4, axis=0))
+        dataset.close()
+
+    def test_restart(self):
+        delivered = []
+        test_object = receiver.FrameAssembler(
+            protocol.TYPE_RAW, lambda *args: delivered.append((args[1], args[3] is not None)), window=4
+        )
+        payload = self.frames[0].tobytes()
+        # the streamer restarts, its sequence starts again at 0
+        for sequence in list(range(100, 110)) + list(range(50)):
+            test_object.push(sequence, 0, 0, 1, payload)
+        # a fragment a bit behind is still late
+        test_object.push(46, 0, 0, 1, payload)
+        test_object.flush()
+
+        self.assertEqual(delivered, [(sequence, True) for sequence in list(range(100, 110)) + list(range(50))])
+        self.assertEqual(
+            test_object.stats(), dict(frames=60, dropped=0, reordered=0, late=1, duplicated=0, restarts=1, skipped=0)
+        )
+
+    def test_jump(self):
+        delivered = []
+        test_object = receiver.FrameAssembler(
+            protocol.TYPE_RAW, lambda *args: delivered.append((args[1], args[3] is not None)), window=4, max_gap=16
+        )
+        payload = self.frames[0].tobytes()
+        # a gap within max_gap is dropped, a larger jump starts a new stream instead of dropping every frame
+        for sequence in [0, 1, 10, 11, 4_000_000_000, 4_000_000_001]:
+            test_object.push(sequence, 0, 0, 1, payload)
+        test_object.flush()
+
+        self.assertEqual(
+            delivered,
+            [(0, True), (1, True)] + [(sequence, False) for sequence in range(2, 10)]
+            + [(10, True), (11, True), (4_000_000_000, True), (4_000_000_001, True)]
+        )
+        self.assertEqual(test_object.stats()['dropped'], 8)
+        self.assertEqual(test_object.stats()['restarts'], 1)
+        self.assertEqual(test_object.stats()['skipped'], 4_000_000_000 - 11 - 1)
+
+    def test_serve(self):
+        test_object = receiver.MLX90640Receiver(self.raw_filepath)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+
+        async def send():
+            await asyncio.sleep(0.1)
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                for sequence in range(3):
+                    for datagram in self.datagrams(sequence):
+                        s.sendto(datagram, ('127.0.0.1', port))
+
+        async def main():
+            await asyncio.gather(test_object.serve('127.0.0.1', port, duration_s=0.5), send())
+
+        asyncio.run(main())
+        self.assertEqual(test_object.stats()['types'][protocol.TYPE_RAW]['frames'], 3)
+        self.assertEqual(os.path.getsize(self.raw_filepath), 3 * rawdataset.RawDataset.SIZE_FRAME)
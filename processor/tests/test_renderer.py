@@ -0,0 +1,78 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import renderer
+
+
+class FrameRenderer(unittest.TestCase):
+
+    ARGS = dict(shape=(24, 32), t_min=20., t_max=40., dpi=40)
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'ds-4-55-20200101-1-render.raw')
+        self.frames = 20. + np.arange(6, dtype=np.float32)[:, None, None] * 4 + np.zeros((6, 24, 32), np.float32)
+        self.frames[:, 5:10, 5:10] = 40.
+        self.frames.tofile(self.raw_filepath)
+        self.jobs = [
+            (index, None, f"frame@{index}", [((16, 12), self.frames[index, 12, 16], ""), ((7, 7), 40., "max")])
+            for index in (3, 0, 5, 1)
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_render(self):
+        test_object = renderer.FrameRenderer(**self.ARGS)
+        first = test_object.render(self.frames[0], "first", [((16, 12), 20., "")], rgb=True)
+        self.assertEqual(first.dtype, np.uint8)
+        self.assertEqual(first.ndim, 3)
+        self.assertEqual(first.shape[2], 3)
+
+        # the figure is reused, the image only depends on the last frame
+        test_object.render(self.frames[5], "last", [((16, 12), 40., "")], rgb=True)
+        np.testing.assert_array_equal(
+            test_object.render(self.frames[0], "first", [((16, 12), 20., "")], rgb=True), first
+        )
+
+        filepath = os.path.join(self.basedir, 'frame.png')
+        self.assertIsNone(test_object.render(self.frames[0], "first", [], filepath=filepath))
+        self.assertTrue(os.path.exists(filepath))
+
+    def test_worker(self):
+        renderer._init_worker(self.raw_filepath, self.ARGS)
+        try:
+            job = self.jobs[0] + (True,)
+            expected = renderer.FrameRenderer(**self.ARGS).render(self.frames[3], *job[2:4], rgb=True)
+            np.testing.assert_array_equal(renderer._render_job(job), expected)
+        finally:
+            renderer._worker[0].close()
+            renderer._worker = None
+
+    def test_iter_frames(self):
+        sequential = list(renderer.iter_frames(self.raw_filepath, self.jobs, workers=1, rgb=True, **self.ARGS))
+        parallel = list(renderer.iter_frames(self.raw_filepath, self.jobs, workers=2, rgb=True, **self.ARGS))
+
+        self.assertEqual(len(parallel), len(self.jobs))
+        for expected, rgb in zip(sequential, parallel):
+            np.testing.assert_array_equal(rgb, expected)
+        # in the order of the jobs, every frame looks different
+        self.assertEqual(len({rgb.tobytes() for rgb in parallel}), len(self.jobs))
+        single = renderer.FrameRenderer(**self.ARGS).render(self.frames[5], *self.jobs[2][2:4], rgb=True)
+        np.testing.assert_array_equal(parallel[2], single)
+
+    def test_render_frames(self):
+        jobs = [
+            (index, os.path.join(self.basedir, f"{i:04d}.png"), title, annotations)
+            for i, (index, _, title, annotations) in enumerate(self.jobs)
+        ]
+        filepaths = renderer.render_frames(self.raw_filepath, jobs, workers=2, **self.ARGS)
+        self.assertEqual(filepaths, [job[1] for job in jobs])
+        self.assertTrue(all(os.path.getsize(filepath) > 0 for filepath in filepaths))
+
+
+if __name__ == '__main__':
+    unittest.main()
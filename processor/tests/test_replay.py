@@ -0,0 +1,63 @@
+import numpy as np
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from processor import protocol, receiver, replay
+
+
+class MLX90640Replayer(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'ds-16-55-20200101-1-test.raw')
+        self.frames = np.random.default_rng(0).uniform(-5., 30., (10, 24, 32)).astype(np.float32)
+        self.frames.tofile(self.raw_filepath)
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.settimeout(1.)
+        self.port = self.socket.getsockname()[1]
+
+    def tearDown(self):
+        self.socket.close()
+        shutil.rmtree(self.basedir)
+
+    def receive(self, count):
+        return [self.socket.recv(65536) for _ in range(count)]
+
+    def test_rgb(self):
+        images = replay.MLX90640Replayer.rgb(self.frames)
+        self.assertEqual(images.shape, (10, 24, 32, 3))
+        self.assertEqual(tuple(replay.MLX90640Replayer.rgb(np.full((1, 1, 1), -1.))[0, 0, 0]), (0, 0, 0))
+        self.assertEqual(tuple(replay.MLX90640Replayer.rgb(np.full((1, 1, 1), 99.))[0, 0, 0]), (255, 255, 255))
+        # half way in between blue and green
+        self.assertEqual(tuple(replay.MLX90640Replayer.rgb(np.full((1, 1, 1), 25. * 1.5 / 6))[0, 0, 0]), (0, 127, 127))
+
+        test_object = replay.MLX90640Replayer(self.raw_filepath, port=self.port, payload='rgb', rate=0)
+        stats = test_object.run()
+        self.assertEqual((stats[0]['frames'], stats[0]['bytes']), (10, 10 * 2304))
+        self.assertEqual(self.receive(10), [image.tobytes() for image in images])
+
+    def test_framed(self):
+        test_object = replay.MLX90640Replayer(
+            self.raw_filepath, port=self.port, payload='both', framed=True, rate=200, loops=2
+        )
+        stats = test_object.run()
+        self.assertEqual(stats[0]['frames'], 20)
+        self.assertLess(stats[0]['frames_s'], 250)
+
+        frames = []
+        test_object = receiver.MLX90640Receiver(
+            on_frame=lambda t, s, ts, payload: frames.append((t, s, payload))
+        )
+        for datagram in self.receive(stats[0]['datagrams']):
+            test_object.datagram(datagram)
+        test_object.close()
+
+        raw = [payload for t, _, payload in frames if t == protocol.TYPE_RAW]
+        self.assertEqual(len(frames), 40)
+        self.assertEqual(raw, [frame.tobytes() for frame in self.frames] * 2)
@@ -0,0 +1,72 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import dataset, results
+
+
+class ResultsQuery(unittest.TestCase):
+
+    NAMES = ('ds-16-55-20200101-1-DSN200uA', 'ds-16-185-20200102-DSN200uB', 'ds-16-185-20200103-DSN12uA')
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        for i, name in enumerate(self.NAMES):
+            with open(os.path.join(self.basedir, name + '.raw'), 'wb') as f:
+                f.write(b'\0' * 3072)
+            os.mkdir(os.path.join(self.basedir, name))
+            results.DatasetResults.save(
+                os.path.join(self.basedir, name, results.DatasetResults.FILENAME),
+                columns={'diff': np.arange(4.) * (i + 1)},
+                scalars={'max_dT_value': 3. * (i + 1), 'max_dT_index': 3},
+                metadata={'name': name}
+            )
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_parse_name(self):
+        self.assertEqual(
+            dataset.DatasetsManager.parse_name('/tmp/ds-16-55-20200101-1-DSN200uA.raw'),
+            dict(name='ds-16-55-20200101-1-DSN200uA', fps=16, distance_mm=55, date='20200101', description='DSN200uA')
+        )
+        self.assertEqual(dataset.DatasetsManager.parse_name('ds-16-185-20200102-DSN200uB')['description'], 'DSN200uB')
+        for filepath in ('ds-16-55-20200101-1-DSN-200uA.raw', 'ds-16-55-20200101-DSN-200uA.raw'):
+            self.assertEqual(dataset.DatasetsManager.parse_name(filepath)['description'], 'DSN-200uA')
+        self.assertEqual(dataset.DatasetsManager.parse_name('ds-16-55-20200101')['description'], '')
+
+    def test_query(self):
+        query = dataset.DatasetsManager(self.basedir).results()
+        self.assertEqual(len(query), 3)
+
+        self.assertEqual(
+            query.filter(distance_mm=185).values('max_dT_value'),
+            {'ds-16-185-20200102-DSN200uB': 6., 'ds-16-185-20200103-DSN12uA': 9.}
+        )
+
+        diffs = query.filter(description=lambda d: d.startswith('DSN200u')).values('diff')
+        self.assertEqual(sorted(diffs), sorted(self.NAMES[:2]))
+        np.testing.assert_array_equal(diffs['ds-16-185-20200102-DSN200uB'], np.arange(4.) * 2)
+
+        self.assertEqual(query.filter(max_dT_value=lambda v: v > 5.).table('distance_mm'), [(185,), (185,)])
+        self.assertEqual(len(query.filter(missing=1)), 0)
+
+    def test_lazy(self):
+        query = dataset.DatasetsManager(self.basedir).results()
+        query.filter(distance_mm=55)
+        self.assertTrue(all(r._files is None for r in query))
+
+    def test_closed(self):
+        filepath = os.path.join(self.basedir, self.NAMES[0], results.DatasetResults.FILENAME)
+        test_object = results.DatasetResults(filepath, name=self.NAMES[0])
+        self.assertIn('diff', test_object)
+        np.testing.assert_array_equal(test_object['diff'], np.arange(4.))
+        self.assertEqual(test_object['max_dT_value'], 3.)
+
+        # no file is kept open after reading, so the results can be replaced
+        os.remove(filepath)
+        self.assertIn('max_dT_index', test_object)
+        with self.assertRaises(FileNotFoundError):
+            test_object['diff']
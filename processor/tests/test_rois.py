@@ -0,0 +1,96 @@
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import processor, rois, stats
+
+
+class ROIAnalysis(unittest.TestCase):
+
+    GSD_MM = (2., 2.)
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.frames = np.random.default_rng(0).uniform(20., 60., (30, 24, 32)).astype(np.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_pixels(self):
+        gsd_mm, _, ref_pixels = processor.MLX90640Processor.reference_pixels(55, 20)
+        point = rois.ROI('p1', 'point', x_mm=20, y_mm=0)
+        self.assertEqual(point.pixels(gsd_mm, (24, 32)).tolist(), [ref_pixels[1][1] * 32 + ref_pixels[1][0]])
+
+        rect = rois.ROI('rect', 'rect', x_mm=0, y_mm=0, width_mm=4, height_mm=2)
+        self.assertEqual(rect.pixels(self.GSD_MM, (24, 32)).tolist(), [12 * 32 + 15, 12 * 32 + 16, 12 * 32 + 17])
+        circle = rois.ROI('circle', 'circle', x_mm=0, y_mm=0, radius_mm=2)
+        self.assertEqual(circle.pixels(self.GSD_MM, (24, 32)).size, 5)
+
+        line = rois.ROI('line', 'line', x0_mm=-6, y0_mm=0, x1_mm=6, y1_mm=0)
+        self.assertEqual(line.pixels(self.GSD_MM, (24, 32)).tolist(), list(range(12 * 32 + 13, 12 * 32 + 20)))
+        reverse = rois.ROI('line', 'line', x0_mm=6, y0_mm=0, x1_mm=-100, y1_mm=0)
+        self.assertEqual(reverse.pixels(self.GSD_MM, (24, 32)).tolist(), list(range(12 * 32 + 19, 12 * 32 - 1, -1)))
+
+        mask = np.zeros((24, 32), dtype=bool)
+        mask[0, :2] = True
+        self.assertEqual(rois.ROI('mask', 'mask', mask=mask.tolist()).pixels(self.GSD_MM, (24, 32)).tolist(), [0, 1])
+        self.assertEqual(rois.ROI('mask', 'mask', pixels=[[31, 23]]).pixels(self.GSD_MM, (24, 32)).tolist(), [767])
+
+        with self.assertRaises(ValueError):
+            rois.ROI('out', 'point', x_mm=1000, y_mm=0).pixels(self.GSD_MM, (24, 32))
+        with self.assertRaises(ValueError):
+            rois.ROI('unknown', 'triangle')
+
+    def test_analyze(self):
+        definitions = [
+            dict(name='p0', shape='point', x_mm=0, y_mm=0),
+            dict(name='rect', shape='rect', x_mm=-10, y_mm=4, width_mm=12, height_mm=8),
+            dict(name='circle', shape='circle', x_mm=6, y_mm=-6, radius_mm=7),
+            dict(name='line', shape='line', x0_mm=-20, y0_mm=-10, x1_mm=20, y1_mm=10),
+        ]
+        test_object = rois.ROIAnalysis(definitions, self.GSD_MM, percentiles=(0, 10, 50, 99.5))
+        test_object.CHUNK_FRAMES = 7
+        results = test_object.process(self.frames, indexes=np.arange(1, 30))
+
+        pixels = self.frames[1:].reshape(29, -1)
+        for column, roi_pixels in enumerate(test_object.pixels):
+            values = pixels[:, roi_pixels]
+            np.testing.assert_allclose(results['mean'][:, column], values.mean(axis=1), rtol=1e-6)
+            np.testing.assert_array_equal(results['min'][:, column], values.min(axis=1))
+            np.testing.assert_array_equal(results['max'][:, column], values.max(axis=1))
+            for q in (0, 10, 50, 99.5):
+                np.testing.assert_allclose(
+                    results[rois.ROIAnalysis.percentile_name(q)][:, column], np.percentile(values, q, axis=1),
+                    rtol=1e-6
+                )
+        np.testing.assert_array_equal(results['profile_line'], pixels[:, test_object.pixels[3]])
+        np.testing.assert_array_equal(test_object['max', 'p0'], self.frames[1:, 12, 16])
+
+        summary = test_object.summary()
+        self.assertEqual(summary['p0']['pixels'], 1)
+        self.assertEqual(summary['rect']['max']['last'], float(results['max'][-1, 1]))
+
+        filepath = os.path.join(self.basedir, 'rois.npz')
+        test_object.save(filepath)
+        restored = rois.ROIAnalysis(definitions, self.GSD_MM, percentiles=(0, 10, 50, 99.5))
+        np.testing.assert_array_equal(restored.restore(filepath)['p99.5'], results['p99.5'])
+
+    def test_processor(self):
+        raw_filepath = os.path.join(self.basedir, 'ds-1-55-20200101-1-test.raw')
+        self.frames[3] = np.nan
+        self.frames.tofile(raw_filepath)
+        rois_filepath = os.path.join(self.basedir, 'rois.json')
+        with open(rois_filepath, 'w') as f:
+            json.dump(dict(percentiles=[50], rois=[dict(name='center', shape='circle', x_mm=0, y_mm=0, radius_mm=3)]), f)
+
+        p = processor.MLX90640Processor(1, 55, raw_filepath, plot_frames=False, plot_general=False, rois=rois_filepath)
+        with np.load(os.path.join(self.basedir, 'ds-1-55-20200101-1-test', 'rois.npz')) as data:
+            self.assertEqual(data['names'].tolist(), ['center'])
+            self.assertEqual(data['p50'].shape, (29, 1))
+            np.testing.assert_array_equal(data['max'][:, 0], p.roi_analysis['max', 'center'])
+
+        summary = stats.MLX90640Stats(1, 55, raw_filepath, rois=rois_filepath).summary()
+        self.assertEqual(summary['rois']['center']['p50']['last'], float(p.roi_analysis['p50', 'center'][-1]))
@@ -0,0 +1,89 @@
+import unittest
+
+import numpy as np
+
+from processor import analysis, selection
+
+
+class FrameSelector(unittest.TestCase):
+
+    REF_PIXELS = ((16, 12), (18, 12), (14, 12))
+    FPS = 16
+
+    def setUp(self):
+        # 2 minutes of steady state at 20 degC, with P1 heating up by 20 degC (tau = 5 s) from t = 30 s and
+        # a hotspot at (3, 3) from t = 80 s
+        no_frames = 120 * self.FPS
+        t = np.arange(no_frames) / self.FPS
+        frames = np.random.default_rng(0).normal(20., 0.1, size=(no_frames, 24, 32)).astype(np.float32)
+        heating = np.where(t >= 30, 20. * (1 - np.exp(-(t - 30) / 5.)), 0.)
+        frames[:, 11:14, 17:20] += heating[:, None, None]
+        frames[t >= 80, 3, 3] = 60.
+        self.hotspot = 80 * self.FPS
+        self.analysis = analysis.MLX90640Analysis(frames, self.REF_PIXELS)
+
+    def test_moving_average(self):
+        series = np.arange(10, dtype=np.float32)[:, None]
+        averages = selection.moving_average(series, 3)
+        np.testing.assert_allclose(averages[:, 0], [0, 0.5, 1, 2, 3, 4, 5, 6, 7, 8])
+
+    def test_select(self):
+        test_object = selection.FrameSelector(self.FPS)
+        selected = test_object.select(self.analysis)
+
+        self.assertTrue(np.all(np.diff(selected) > 0))
+        # far fewer frames than one out of every 4, with the changes only while heating up or at the hotspot
+        self.assertLess(selected.size, self.analysis.no_frames // 8)
+        change = test_object.reasons['change']
+        heating = (change > 30 * self.FPS) & (change < 60 * self.FPS)
+        self.assertTrue(np.all(heating | ((change >= self.hotspot) & (change < self.hotspot + 2 * self.FPS))))
+        self.assertGreater(np.count_nonzero(heating), 30)
+        self.assertTrue(40 <= change.size <= 80)
+
+        reasons = test_object.reasons
+        self.assertEqual(reasons['max_dT'][0], np.argmax(self.analysis.diff))
+        for name in ('first', 'last', 'max_dT', 'max_t2', 'crossing', 'hotspot', 'keyframe'):
+            self.assertTrue(np.isin(reasons[name], selected).all(), name)
+        self.assertEqual(reasons['crossing'].size, 2)
+        # the heated pixels become the hottest ones as soon as the heating starts
+        self.assertEqual(reasons['hotspot'].tolist(), [30 * self.FPS + 1, self.hotspot])
+        self.assertTrue(np.isin(np.arange(self.hotspot - 8, self.hotspot + 9), selected).all())
+        self.assertEqual(reasons['keyframe'].size, 12)
+
+    def test_slope(self):
+        selected = selection.FrameSelector(self.FPS).select(self.analysis)
+        test_object = selection.FrameSelector(self.FPS, slope_c_s=1.)
+        with_slope = test_object.select(self.analysis)
+        self.assertTrue(np.isin(selected, with_slope).all())
+        # dT grows faster than 1 degC/s during the first 5 * ln(4) seconds of the heating
+        slope = test_object.reasons['slope']
+        self.assertLess(abs(slope.size - int(5 * np.log(4) * self.FPS)), self.FPS)
+        self.assertTrue(np.isin(slope, with_slope).all())
+
+    def test_budget(self):
+        unlimited = selection.FrameSelector(self.FPS).select(self.analysis)
+        test_object = selection.FrameSelector(self.FPS, budget=60)
+        selected = test_object.select(self.analysis)
+        self.assertLessEqual(selected.size, 60)
+        self.assertGreater(selected.size, 50)
+        self.assertTrue(np.isin(selected, unlimited).all())
+        for name in selection.FrameSelector.EVENTS:
+            self.assertTrue(np.isin(test_object.reasons[name], selected).all(), name)
+
+        # a budget smaller than the events keeps them by priority
+        selected = selection.FrameSelector(self.FPS, budget=3).select(self.analysis)
+        expected = [0, np.argmax(self.analysis.diff), self.analysis.no_frames - 1]
+        self.assertEqual(selected.tolist(), sorted(expected))
+
+    def test_steady(self):
+        steady = analysis.MLX90640Analysis(
+            np.random.default_rng(1).normal(20., 0.1, size=(600, 24, 32)).astype(np.float32), self.REF_PIXELS
+        )
+        test_object = selection.FrameSelector(self.FPS)
+        selected = test_object.select(steady)
+        self.assertEqual(test_object.reasons['change'].size, 0)
+        self.assertLess(selected.size, 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+import multiprocessing
+import numpy as np
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from processor import sharedring
+
+
+def _reader_sum(name, count, queue):
+    reader = sharedring.RingReader(name, start='oldest', poll_interval_s=0.001)
+    sequences, total = [], 0.
+    while len(sequences) < count and (reader.wait(timeout_s=5.) or reader.available()):
+        seqs, frames, _ = reader.poll()
+        partial = float(frames.sum(dtype=np.float64))
+        intact = reader.done(seqs)
+        if intact.all():
+            sequences.extend(seqs.tolist())
+            total += partial
+    queue.put((sequences, total, reader.stats()))
+    reader.close()
+
+
+class SharedFrameRing(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = sharedring.SharedFrameRing(capacity=8)
+        self.frames = np.random.default_rng(0).uniform(-5., 30., (20, 24, 32)).astype(np.float32)
+
+    def tearDown(self):
+        self.ring.close()
+
+    def test_zero_copy(self):
+        reader = sharedring.RingReader(self.ring.name)
+        self.assertEqual(reader.available(), 0)
+        self.assertEqual(self.ring.write(self.frames[:5], np.arange(5.)), 5)
+
+        sequences, frames, timestamps_us = reader.poll()
+        self.assertEqual(sequences.tolist(), [0, 1, 2, 3, 4])
+        np.testing.assert_array_equal(frames, self.frames[:5])
+        np.testing.assert_array_equal(timestamps_us, np.arange(5.))
+        # the frames are views of the shared memory, from the mapping of the reader
+        self.assertTrue(np.shares_memory(frames, reader.ring.frames))
+        self.assertTrue(reader.done(sequences).all())
+        self.assertEqual(reader.available(), 0)
+        reader.close()
+
+        # a reader attached to a ring can not remove it
+        reader = sharedring.RingReader(self.ring.name, start='oldest')
+        self.assertEqual(reader.available(), 5)
+        reader.close()
+
+    def test_wrap(self):
+        reader = sharedring.RingReader(self.ring)
+        self.ring.write(self.frames[:6])
+        reader.poll()
+        self.ring.write(self.frames[6:10])
+
+        # frames 6 and 7 are in the last slots, 8 and 9 in the first ones
+        sequences, frames, _ = reader.poll()
+        self.assertEqual(sequences.tolist(), [6, 7])
+        sequences, frames, _ = reader.read()
+        self.assertEqual(sequences.tolist(), [8, 9])
+        np.testing.assert_array_equal(frames, self.frames[8:10])
+        self.assertFalse(np.shares_memory(frames, self.ring.frames))
+
+    def test_overrun(self):
+        reader = sharedring.RingReader(self.ring)
+        self.ring.write(self.frames[:3])
+        sequences, frames, _ = reader.poll(max_frames=2)
+        self.assertEqual(sequences.tolist(), [0, 1])
+
+        # the producer overwrites frames 0 and 1 while the reader was using them, and 2 and 3 before reading them
+        self.ring.write(self.frames[3:12])
+        self.assertFalse(reader.done(sequences).any())
+        sequences, frames, _ = reader.read()
+        self.assertEqual(sequences.tolist(), [4, 5, 6, 7])
+        np.testing.assert_array_equal(frames, self.frames[4:8])
+        self.assertEqual(reader.stats(), dict(read=4, overrun=4, pending=4))
+
+        # larger than the ring
+        self.assertEqual(self.ring.write(self.frames), 32)
+        sequences, frames, _ = reader.read()
+        self.assertEqual(sequences.tolist(), list(range(24, 32)))
+        np.testing.assert_array_equal(frames, self.frames[12:])
+        self.assertEqual(reader.no_overrun, 4 + 16)
+
+    def test_closed(self):
+        reader = sharedring.RingReader(self.ring.name, poll_interval_s=0.001)
+        self.assertFalse(reader.wait(timeout_s=0.01))
+        threading.Timer(0.05, self.ring.write, (self.frames[0],)).start()
+        self.assertTrue(reader.wait(timeout_s=5.))
+        reader.poll()
+
+        self.ring.close()
+        self.assertTrue(reader.ring.closed)
+        self.assertFalse(reader.wait())
+        reader.close()
+
+        with self.assertRaises(FileNotFoundError):
+            sharedring.SharedFrameRing.attach(self.ring.name)
+
+    def test_processes(self):
+        ring = sharedring.SharedFrameRing(capacity=32)
+        context = multiprocessing.get_context('fork')
+        queue = context.Queue()
+        readers = [context.Process(target=_reader_sum, args=(ring.name, 20, queue)) for _ in range(3)]
+        for process in readers:
+            process.start()
+        for index in range(20):
+            ring.write(self.frames[index])
+
+        results = [queue.get(timeout=10.) for _ in readers]
+        for process in readers:
+            process.join(timeout=10.)
+        ring.close()
+        for sequences, total, stats in results:
+            self.assertEqual(sequences, list(range(20)))
+            self.assertEqual(stats['overrun'], 0)
+            np.testing.assert_allclose(total, self.frames.sum(dtype=np.float64), rtol=1e-9)
+
+
+class SharedRingTool(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'ds-16-55-20200101-1-test.raw')
+        self.output_filepath = os.path.join(self.basedir, 'output.raw')
+        self.frames = np.random.default_rng(1).uniform(-5., 30., (50, 24, 32)).astype(np.float32)
+        self.frames.tofile(self.raw_filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_produce_record(self):
+        name = f"test-ring-{os.getpid()}"
+        ready = threading.Event()
+
+        def record():
+            sharedring.SharedFrameRing.attach(name, timeout_s=10., poll_interval_s=0.001).close()
+            ready.set()
+            self.reader = sharedring.SharedRingTool.record(name, self.output_filepath)
+
+        thread = threading.Thread(target=record)
+        thread.start()
+        published = sharedring.SharedRingTool.create(
+            ['-n', name, '-r', self.raw_filepath, '-c', '64', '--rate', '400']
+        )
+        thread.join(timeout=10.)
+
+        self.assertTrue(ready.is_set())
+        self.assertEqual(published, 50)
+        recorded = np.fromfile(self.output_filepath, dtype=np.float32).reshape(-1, 24, 32)
+        # the recorder attaches after the first frames may have been published, but never misses the rest
+        self.assertEqual(self.reader.no_overrun, 0)
+        np.testing.assert_array_equal(recorded, self.frames[len(self.frames) - len(recorded):])
+
+
+if __name__ == '__main__':
+    unittest.main()
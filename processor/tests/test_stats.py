@@ -0,0 +1,69 @@
+import contextlib
+import io
+import json
+import numpy as np
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from processor import analysis, processor, stats
+
+
+class MLX90640Stats(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'ds-2-55-20200101-1-test.raw')
+
+        rng = np.random.default_rng(0)
+        self.frames = rng.uniform(20., 60., (50, 24, 32)).astype(np.float32)
+        self.frames[7] = np.nan
+        self.frames.tofile(self.raw_filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_summary(self):
+        test_object = stats.MLX90640Stats(2, 55, self.raw_filepath)
+        summary = test_object.summary(series=True)
+
+        valid = np.delete(self.frames, 7, axis=0)
+        expected = analysis.MLX90640Analysis(valid, test_object.ref_pixels)
+        self.assertEqual((summary['no_read'], summary['no_frames'], summary['no_skipped']), (50, 49, 1))
+        self.assertEqual(summary['duration'], 24.5)
+        self.assertEqual(summary['max_dT_index'], int(np.argmax(expected.diff)))
+        self.assertEqual(summary['max_dT_time'], summary['max_dT_index'] / 2)
+        self.assertAlmostEqual(summary['vectors']['max']['mean'], float(expected.max.mean()), places=5)
+        np.testing.assert_array_equal(summary['series']['t2'], expected.t2)
+
+        # nothing but the RAW file is left in the directory
+        self.assertEqual(os.listdir(self.basedir), [os.path.basename(self.raw_filepath)])
+        json.dumps(summary)
+
+        # the full vectors are only included when requested
+        summary = test_object.summary(series=False)
+        self.assertNotIn('series', summary)
+        self.assertIn('temporal', summary)
+
+    def test_cli(self):
+        summary_filepath = os.path.join(self.basedir, 'summary.json')
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            summary = processor.MLX90640Processor.create(
+                ['-r', self.raw_filepath, '-f', '2', '-d', '55', '--stats', '--summary', summary_filepath]
+            )
+        self.assertIn('max dT', output.getvalue())
+        with open(summary_filepath) as f:
+            self.assertEqual(json.load(f)['max_dT_value'], summary['max_dT_value'])
+        self.assertEqual(sorted(os.listdir(self.basedir)), sorted([os.path.basename(self.raw_filepath), 'summary.json']))
+
+    def test_no_matplotlib(self):
+        code = (
+            "import sys; from processor import stats; "
+            f"stats.MLX90640Stats(2, 55, {self.raw_filepath!r}).summary(); "
+            "print('matplotlib' in sys.modules)"
+        )
+        output = subprocess.check_output([sys.executable, '-c', code], env=os.environ)
+        self.assertEqual(output.strip(), b'False')
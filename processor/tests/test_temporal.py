@@ -0,0 +1,97 @@
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+from processor import follow, processor, results, temporal
+
+
+class TemporalAnalysis(unittest.TestCase):
+
+    FPS = 4
+
+    def setUp(self):
+        t = np.arange(2000) / self.FPS
+        self.series = np.stack([
+            20. + 30. * (1. - np.exp(-t / 40.)),
+            25. - 5. * (1. - np.exp(-t / 100.)),
+            np.full(t.shape, 22.)
+        ], axis=1)
+
+    def test_batch(self):
+        test_object = temporal.TemporalAnalysis(self.FPS, ['heat', 'cool', 'flat'], window_s=5, steady_hold_s=10)
+        test_object.process(self.series)
+
+        self.assertEqual(test_object.mean.shape, (2000, 3))
+        self.assertEqual(test_object.mean[0, 0], 20.)
+        self.assertAlmostEqual(test_object.mean[-1, 0], self.series[-20:, 0].mean())
+        self.assertAlmostEqual(test_object.slope[1, 0], (self.series[1, 0] - self.series[0, 0]) * self.FPS)
+        self.assertAlmostEqual(
+            test_object.slope[-1, 1], np.polyfit(np.arange(20) / self.FPS, self.series[-20:, 1], 1)[0]
+        )
+        self.assertTrue(np.isnan(test_object.slope[0]).all())
+
+        summary = test_object.summary()
+        self.assertAlmostEqual(summary['heat']['fit_tau_s'], 40., places=6)
+        self.assertAlmostEqual(summary['heat']['fit_t_inf'], 50., places=6)
+        self.assertAlmostEqual(summary['cool']['fit_tau_s'], 100., places=6)
+        self.assertAlmostEqual(summary['cool']['fit_t_inf'], 20., places=6)
+        self.assertIsNone(summary['flat']['fit_tau_s'])
+        self.assertEqual(summary['flat']['steady_time'], (20 - 1) / self.FPS)
+        self.assertEqual(summary['heat']['max_slope_time'], 0.25)
+
+        # the slope of the heating falls below 0.01 degC/s at t = 40 ln(75), the trailing window lags it
+        self.assertAlmostEqual(summary['heat']['steady_time'], 40. * np.log(75.) + 2.5, delta=0.5)
+
+    def test_online(self):
+        series = self.series + np.random.default_rng(0).normal(0., 0.05, self.series.shape)
+        batch = temporal.TemporalAnalysis(self.FPS, ['heat', 'cool', 'flat'], steady_slope=0.02).process(series)
+        online = temporal.OnlineTemporalAnalysis(self.FPS, ['heat', 'cool', 'flat'], steady_slope=0.02)
+        online.RESYNC = 300
+
+        for i, values in enumerate(series):
+            mean, slope = online.update(values)
+            np.testing.assert_allclose(mean, batch.mean[i], rtol=1e-12)
+            np.testing.assert_allclose(slope, batch.slope[i], rtol=1e-9, atol=1e-12)
+
+        np.testing.assert_array_equal(online.steady_index, batch.steady_index)
+        np.testing.assert_array_equal(online.max_slope_index, batch.max_slope_index)
+        for key in ('tau_s', 't_inf', 'alpha', 'rms'):
+            np.testing.assert_allclose(online.fit[key], batch.fit[key], rtol=1e-9)
+        self.assertEqual(online.summary().keys(), batch.summary().keys())
+
+        online.reset()
+        self.assertEqual(online.no_frames, 0)
+        self.assertTrue(np.isnan(online.fit['tau_s']).all())
+
+
+class Integration(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.raw_filepath = os.path.join(self.basedir, 'ds-2-55-20200101-1-test.raw')
+
+        t = np.arange(400)[:, None, None] / 2
+        ys, xs = np.mgrid[0:24, 0:32]
+        frames = 20. + 30. * (1. - np.exp(-t / 30.)) * np.exp(-((xs - 16) ** 2 + (ys - 12) ** 2) / 40.)
+        frames.astype(np.float32).tofile(self.raw_filepath)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def test_processor(self):
+        p = processor.MLX90640Processor(2, 55, self.raw_filepath, plot_frames=False, plot_general=False)
+        self.assertAlmostEqual(p.temporal.summary()['t0']['fit_tau_s'], 30., places=3)
+
+        dataset_results = results.DatasetResults(os.path.join(p.dataset_dirpath, results.DatasetResults.FILENAME))
+        self.assertAlmostEqual(dataset_results['t0_fit_t_inf'], 50., places=3)
+        with np.load(p.temporal_filepath) as data:
+            self.assertEqual(data['mean_diff'].shape, (400,))
+
+        follower = follow.MLX90640Follower(2, 55, self.raw_filepath)
+        while follower.poll():
+            pass
+        follower.close()
+        np.testing.assert_allclose(follower.temporal.last_slope, p.temporal.last_slope, rtol=1e-6)
+        self.assertAlmostEqual(follower.summary()['temporal']['t0']['fit_tau_s'], 30., places=3)
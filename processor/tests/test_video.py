@@ -0,0 +1,103 @@
+import json
+import numpy as np
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from processor import processor, video
+
+
+# stands for ffmpeg: reads the whole video from its standard input and writes its arguments and the number of
+# bytes read into the output file (the last argument), or fails right away when FAKE_FFMPEG_FAIL is set
+FAKE_FFMPEG = f"""#!{sys.executable}
+import json, os, sys
+if os.environ.get('FAKE_FFMPEG_FAIL'):
+    sys.exit(1)
+data = sys.stdin.buffer.read()
+with open(sys.argv[-1], 'w') as f:
+    json.dump(dict(args=sys.argv[1:], size=len(data)), f)
+"""
+
+
+def fake_ffmpeg(bindir):
+    """Writes the fake ffmpeg into the given directory and returns the patch of PATH that uses it (to start)"""
+    os.makedirs(bindir, exist_ok=True)
+    with open(os.path.join(bindir, 'ffmpeg'), 'w') as f:
+        f.write(FAKE_FFMPEG)
+    os.chmod(os.path.join(bindir, 'ffmpeg'), 0o755)
+    return mock.patch.dict(os.environ, {'PATH': bindir + os.pathsep + os.environ['PATH']})
+
+
+class VideoEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.environ = fake_ffmpeg(os.path.join(self.basedir, 'bin'))
+        self.environ.start()
+        os.environ.pop('FAKE_FFMPEG_FAIL', None)
+        self.video_filepath = os.path.join(self.basedir, 'video.mp4')
+        self.image = np.arange(4 * 6 * 3, dtype=np.uint8).reshape(4, 6, 3)
+
+    def tearDown(self):
+        self.environ.stop()
+        shutil.rmtree(self.basedir)
+
+    def encoded(self, filepath=None):
+        with open(filepath or self.video_filepath) as f:
+            return json.load(f)
+
+    def test_write(self):
+        with video.VideoEncoder(self.video_filepath, 4) as test_object:
+            for _ in range(3):
+                test_object.write(self.image)
+            with self.assertRaises(ValueError):
+                test_object.write(np.zeros((2, 6, 3), dtype=np.uint8))
+        self.assertEqual(test_object.no_frames, 3)
+        self.assertIsNone(test_object.process)
+
+        encoded = self.encoded()
+        self.assertEqual(encoded['size'], 3 * self.image.nbytes)
+        self.assertIn('6x4', encoded['args'])
+        self.assertEqual(encoded['args'][encoded['args'].index('-r') + 1], '4')
+
+    def test_no_frames(self):
+        with video.VideoEncoder(self.video_filepath, 4):
+            pass
+        self.assertFalse(os.path.exists(self.video_filepath))
+
+    def test_errors(self):
+        os.environ['FAKE_FFMPEG_FAIL'] = '1'
+        test_object = video.VideoEncoder(self.video_filepath, 4)
+        test_object.write(self.image)
+        with self.assertRaises(subprocess.CalledProcessError):
+            test_object.close()
+
+        # the exception that interrupts the encoding is not replaced by the failure of ffmpeg
+        with self.assertRaises(KeyError):
+            with video.VideoEncoder(self.video_filepath, 4) as test_object:
+                test_object.write(self.image)
+                raise KeyError('rendering')
+        self.assertIsNone(test_object.process)
+
+    def test_processor(self):
+        raw_filepath = os.path.join(self.basedir, 'ds-4-55-20200101-1-video.raw')
+        frames = 20. + np.random.default_rng(0).normal(0., 0.1, (12, 24, 32)).astype(np.float32)
+        frames.tofile(raw_filepath)
+
+        # the video is still streamed without plotting the frames
+        test_object = processor.MLX90640Processor(
+            4, 55, raw_filepath, plot_frames=False, plot_general=True, jump_frames=4, workers=1, use_cache=False
+        )
+        encoded = self.encoded(test_object.video_filepath)
+        self.assertGreater(encoded['size'], 0)
+        self.assertEqual(
+            [f for f in os.listdir(test_object.dataset_dirpath) if f.endswith('.png')], ['overall.png']
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
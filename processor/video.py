@@ -0,0 +1,91 @@
+"""Video encoding of rendered frames, streamed directly into ffmpeg."""
+
+import subprocess
+
+from xpython.common import logger
+
+
+class VideoEncoder(logger.LoggingClass):
+    """ffmpeg video encoder
+    The RGB frames are written as rawvideo into the standard input of an ffmpeg process, so that the
+    video is encoded while the frames are rendered, with no intermediate image files. ffmpeg is only
+    launched with the first frame, since the size of the video is taken from it.
+    """
+
+    def __init__(self, video_filepath, fps, vcodec='libx264', crf=25, pix_fmt='yuv420p'):
+        """Default constructor
+        video_filepath      - path to the output video file
+        fps                 - frame rate of the video
+        vcodec='libx264'    - codec for the video
+        crf=25              - constant rate factor (quality) for the encoder
+        pix_fmt='yuv420p'   - pixel format of the output video
+        """
+        super(VideoEncoder, self).__init__()
+
+        self.video_filepath = video_filepath
+        self.fps = fps
+        self.vcodec = vcodec
+        self.crf = crf
+        self.pix_fmt = pix_fmt
+
+        self.process = None
+        self.size = None
+        self.no_frames = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # an exception is already propagating, an error of ffmpeg (most likely caused by it) does not replace it
+        try:
+            self.close()
+        except (OSError, subprocess.CalledProcessError) as ex:
+            self._l.warning(f"Could not finish encoding {self.video_filepath}, msg = {ex}")
+
+    def _launch(self, height, width):
+        """Launches the ffmpeg process, reading frames of the given size from its standard input"""
+        self.size = (height, width)
+        ffmpeg_call = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", f"{self.fps}",
+            "-i", "-",
+            "-vcodec", self.vcodec, "-crf", f"{self.crf}", "-pix_fmt", self.pix_fmt,
+            self.video_filepath
+        ]
+        self._l.debug(f"Calling <ffmpeg> as follows: {' '.join(ffmpeg_call)}")
+        self.process = subprocess.Popen(ffmpeg_call, stdin=subprocess.PIPE)
+
+    def write(self, rgb):
+        """
+        This method writes a new frame into the video.
+        rgb     - (height, width, 3) uint8 array with the RGB image of the frame
+        """
+        if self.process is None:
+            self._launch(*rgb.shape[:2])
+        elif rgb.shape[:2] != self.size:
+            raise ValueError(f"Frame size {rgb.shape[:2]} differs from the video size {self.size}")
+
+        self.process.stdin.write(rgb.tobytes())
+        self.no_frames += 1
+
+    def close(self):
+        """
+        This method closes the standard input of ffmpeg and waits for the encoding to finish.
+        """
+        if self.process is None:
+            return
+
+        process, self.process = self.process, None
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            # ffmpeg already exited, its return code tells why
+            pass
+        returncode = process.wait()
+
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, "ffmpeg")
+        self._l.debug(f"Encoded {self.no_frames} frames into {self.video_filepath}")
@@ -8,6 +8,7 @@
 #include <stdlib.h>
 #include <errno.h>
 #include <syslog.h>
+#include <arpa/inet.h>
 #include "MLX90640_API.h"
 
 /*
@@ -59,6 +60,39 @@
  * valid frame.
  *
  * Note2:
+ * To detect data loss and frame starts, an optional second argument
+ * ("rgb", "raw" or "both") enables the framed output: each frame is
+ * written as fixed-size blocks of FRAMED_BLOCK_SIZE bytes, each one with a
+ * header (magic "MX", version, payload type, sequence number, capture
+ * timestamp in microseconds since the epoch, fragment index, number of
+ * fragments and payload length, all in network byte order) followed by
+ * up to FRAMED_FRAGMENT_SIZE bytes of the RGB image and/or of the raw
+ * float32 temperatures. The blocks are relayed as they are by GStreamer:
+ *
+ * $ ./rawrgb 16 both | gst-launch-1.0 fdsrc blocksize=1044 ! udpsink host=172.16.0.2 port=5000
+ *
+ * and they are received with `python -m processor.receiver`, see
+ * processor/protocol.py for the details of the format.
+ *
+ * Note3:
+ * To recompute the temperatures offline (with another emissivity, for
+ * instance), an optional third argument records the words read from the
+ * sensor into the given file, with the second argument as above or
+ * "plain" for the output without framing:
+ *
+ * $ ./rawrgb 16 plain ds-16-55-20200601-words.mlxw > /dev/null 2> ds-16-55-20200601.raw
+ *
+ * The file starts with a header of WORDS_HEADER_SIZE bytes (magic "MLXW",
+ * version and frame rate as uint16, then the 832 words of the EEPROM)
+ * followed by a record per frame of WORDS_RECORD_SIZE bytes (capture
+ * timestamp in microseconds since the epoch as uint64, then the 834 words
+ * of the frame, with the control register and the subpage as the last
+ * two), all of them little-endian as written by the Raspberry Pi. The
+ * words of the frame are recorded before interpolating the broken pixels.
+ * They are converted with `python -m processor.calibration`, see
+ * processor/calibration.py.
+ *
+ * Note4:
  * The code was tested on a Raspberry Pi 0 W, the bcm2835 driver
  * was used for I2C communication. Unfortunately, the
  * `MLX90640_GetFrameData` command produces CPU load >60% in this setup.
@@ -96,6 +130,71 @@
 #define Y_MAX                 24
 #define IMAGE_PIXELS      X_MAX * Y_MAX
 
+#define FRAMED_MAGIC          "MX"
+#define FRAMED_VERSION        1
+#define FRAMED_TYPE_RGB       1
+#define FRAMED_TYPE_RAW       2
+#define FRAMED_HEADER_SIZE    20
+#define FRAMED_FRAGMENT_SIZE  1024
+#define FRAMED_BLOCK_SIZE     (FRAMED_HEADER_SIZE + FRAMED_FRAGMENT_SIZE)
+
+#define WORDS_MAGIC           "MLXW"
+#define WORDS_VERSION         1
+#define EEPROM_WORDS          832
+#define FRAME_WORDS           834
+#define WORDS_HEADER_SIZE     (8 + 2 * EEPROM_WORDS)
+#define WORDS_RECORD_SIZE     (8 + 2 * FRAME_WORDS)
+
+void write_framed(FILE *out, uint8_t type, uint32_t sequence, uint64_t timestamp_us, const char *payload, size_t size) {
+    // Each fragment is written (and flushed) as a single fixed-size block, the last one padded with zeros
+    static char block[FRAMED_BLOCK_SIZE];
+    uint8_t fragments = (size + FRAMED_FRAGMENT_SIZE - 1) / FRAMED_FRAGMENT_SIZE;
+    uint32_t sequence_n = htonl(sequence);
+    uint32_t timestamp_hi_n = htonl((uint32_t)(timestamp_us >> 32));
+    uint32_t timestamp_lo_n = htonl((uint32_t)(timestamp_us & 0xFFFFFFFF));
+
+    for (uint8_t fragment = 0; fragment < fragments; fragment++) {
+        size_t offset = fragment * FRAMED_FRAGMENT_SIZE;
+        uint16_t length = (size - offset < FRAMED_FRAGMENT_SIZE) ? size - offset : FRAMED_FRAGMENT_SIZE;
+        uint16_t length_n = htons(length);
+
+        memset(block, 0, FRAMED_BLOCK_SIZE);
+        memcpy(block, FRAMED_MAGIC, 2);
+        block[2] = FRAMED_VERSION;
+        block[3] = type;
+        memcpy(block + 4, &sequence_n, 4);
+        memcpy(block + 8, &timestamp_hi_n, 4);
+        memcpy(block + 12, &timestamp_lo_n, 4);
+        block[16] = fragment;
+        block[17] = fragments;
+        memcpy(block + 18, &length_n, 2);
+        memcpy(block + FRAMED_HEADER_SIZE, payload + offset, length);
+
+        fwrite(block, 1, FRAMED_BLOCK_SIZE, out);
+        fflush(out);
+    }
+}
+
+void write_words_header(FILE *out, uint16_t fps, const uint16_t *eeprom) {
+    uint16_t version = WORDS_VERSION;
+
+    fwrite(WORDS_MAGIC, 1, 4, out);
+    fwrite(&version, sizeof(uint16_t), 1, out);
+    fwrite(&fps, sizeof(uint16_t), 1, out);
+    fwrite(eeprom, sizeof(uint16_t), EEPROM_WORDS, out);
+    fflush(out);
+}
+
+void write_words_record(FILE *out, uint64_t timestamp_us, const uint16_t *frame) {
+    // Each record is written at once, a partial record can only be found at the end of the file
+    static char record[WORDS_RECORD_SIZE];
+
+    memcpy(record, &timestamp_us, 8);
+    memcpy(record + 8, frame, 2 * FRAME_WORDS);
+    fwrite(record, 1, WORDS_RECORD_SIZE, out);
+    fflush(out);
+}
+
 void put_pixel_false_colour(char *image, int x, int y, double v) {
     // Heatmap code borrowed from: http://www.andrewnoske.com/wiki/Code_-_heatmaps_and_color_gradients
     const int NUM_COLORS = 7;
@@ -136,9 +235,9 @@ void put_pixel_false_colour(char *image, int x, int y, double v) {
 
 int main(int argc, char *argv[]){
 
-    static uint16_t eeMLX90640[832];
+    static uint16_t eeMLX90640[EEPROM_WORDS];
     float emissivity = 0.8;
-    uint16_t frame[834];
+    uint16_t frame[FRAME_WORDS];
     static char image[IMAGE_SIZE];
     static float pixels[IMAGE_PIXELS];
     static float mlx90640To[IMAGE_PIXELS];
@@ -147,6 +246,9 @@ int main(int argc, char *argv[]){
     static int fps = FPS;
     static long frame_time_micros = FRAME_TIME_MICROS;
     char *p;
+    bool framed_rgb = false, framed_raw = false;
+    uint32_t sequence = 0;
+    FILE *words = NULL;
 
     openlog("rawrgb", LOG_PID, LOG_SYSLOG);
 
@@ -159,6 +261,23 @@ int main(int argc, char *argv[]){
         frame_time_micros = 1000000/fps;
     }
 
+    if(argc > 2){
+        framed_rgb = strcmp(argv[2], "rgb") == 0 || strcmp(argv[2], "both") == 0;
+        framed_raw = strcmp(argv[2], "raw") == 0 || strcmp(argv[2], "both") == 0;
+        if (!framed_rgb && !framed_raw && strcmp(argv[2], "plain") != 0) {
+            syslog(LOG_ERR, "Invalid framed output, choose one of rgb, raw, both or plain\n");
+            return 1;
+        }
+    }
+
+    if(argc > 3){
+        words = fopen(argv[3], "wb");
+        if (words == NULL) {
+            syslog(LOG_ERR, "Could not open the file for the sensor words, %s\n", argv[3]);
+            return 1;
+        }
+    }
+
     MLX90640_SetDeviceMode(MLX_I2C_ADDR, 0);
     MLX90640_SetSubPageRepeat(MLX_I2C_ADDR, 0);
     switch(fps){
@@ -193,6 +312,9 @@ int main(int argc, char *argv[]){
     MLX90640_DumpEE(MLX_I2C_ADDR, eeMLX90640);
     MLX90640_SetResolution(MLX_I2C_ADDR, 0x03);
     MLX90640_ExtractParameters(eeMLX90640, &mlx90640);
+    if (words != NULL) {
+        write_words_header(words, fps, eeMLX90640);
+    }
 
     #ifdef DEB_TIMING
       int frame_no = 0;
@@ -203,7 +325,13 @@ int main(int argc, char *argv[]){
     while (1){
 
         auto start = std::chrono::system_clock::now();
+        uint64_t timestamp_us = std::chrono::duration_cast<std::chrono::microseconds>(
+          start.time_since_epoch()
+        ).count();
         MLX90640_GetFrameData(MLX_I2C_ADDR, frame);
+        if (words != NULL) {
+            write_words_record(words, timestamp_us, frame);
+        }
         MLX90640_InterpolateOutliers(frame, eeMLX90640);
 
         eTa = MLX90640_GetTa(frame, &mlx90640); // Sensor ambient temprature
@@ -220,9 +348,19 @@ int main(int argc, char *argv[]){
             }
         }
 
-        //Write RGB image to stdout
-        fwrite(&image, 1, IMAGE_SIZE, stdout);
-        fflush(stdout); // flush now to stdout
+        //Write RGB image to stdout, either as it is or framed
+        if (framed_rgb || framed_raw) {
+            if (framed_rgb) {
+              write_framed(stdout, FRAMED_TYPE_RGB, sequence, timestamp_us, image, IMAGE_SIZE);
+            }
+            if (framed_raw) {
+              write_framed(stdout, FRAMED_TYPE_RAW, sequence, timestamp_us, (const char *)pixels, sizeof(pixels));
+            }
+            sequence++;
+        } else {
+            fwrite(&image, 1, IMAGE_SIZE, stdout);
+            fflush(stdout); // flush now to stdout
+        }
 
         fwrite(&pixels, sizeof(float), IMAGE_PIXELS, stderr);
         fflush(stderr);  // flush now to file
@@ -255,6 +393,9 @@ int main(int argc, char *argv[]){
 
     }
 
+    if (words != NULL) {
+        fclose(words);
+    }
     closelog();
     return 0;
 